@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import google.generativeai as genai
 from response_handler import HelixResponseHandler
@@ -5,15 +6,17 @@ from typing import List, Dict, Optional
 import os
 import re
 from recruiting_graph import generate_email_sequence, EmailConfig
+from llm_backend import requires_api_key
 
 logger = logging.getLogger(__name__)
 
 class RecruitingAI:
     def __init__(self, api_key: str, live_mode: bool = True):
         self.live_mode = live_mode
-        genai.configure(api_key=api_key)
+        if requires_api_key():
+            genai.configure(api_key=api_key)
         self.response_handler = HelixResponseHandler()
-        logging.info(f"Initialized RecruitingAI in {'live' if live_mode else 'mock'} mode")
+        logger.info("Initialized RecruitingAI in %s mode", 'live' if live_mode else 'mock')
         
     async def generate_response(self, message: str, messages: list, persona: str) -> str:
         """Generate a response based on the conversation context."""
@@ -21,19 +24,13 @@ class RecruitingAI:
             return "Mock response in test mode"
             
         try:
-            response = await self.response_handler.handle_response(
-                message=message,
-                history=messages,
-                persona=persona
-            )
-            
-            if response['type'] == 'error':
-                return "I apologize, but I encountered an error. Please try again."
-                
-            return response['content']
-            
+            history = list(messages)
+            if message and not (history and history[-1].get('content') == message):
+                history.append({'role': 'user', 'content': message})
+            # The handler is synchronous and may call the model, so keep it off the event loop
+            return await asyncio.to_thread(self.response_handler.generate_response, history, persona)
         except Exception as e:
-            logging.error(f"Error generating response: {str(e)}")
+            logger.error("Error generating response: %s", e)
             return "I apologize, but I encountered an error. Please try again."
             
     def reset_conversation(self):
@@ -55,10 +52,11 @@ class RecruitingAI:
         try:
             return generate_email_sequence(config)
         except Exception as e:
-            logging.error(f"Error generating sequence: {str(e)}")
+            logger.error("Error generating sequence: %s", e)
             return self._generate_mock_sequence(role)
             
-    def _extract_role_info(self, message: str) -> Optional[str]:
+    @staticmethod
+    def _extract_role_info(message: str) -> Optional[str]:
         """Extract role information from the message using multiple strategies"""
         if not message:
             return None
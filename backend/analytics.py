@@ -0,0 +1,212 @@
+"""Stored sequence metrics and the daily rollups dashboards read from.
+
+The model's metric estimates arrive as strings like ``"52%"`` or ``"N/A"``;
+:func:`parse_metrics` turns them into numbers for the columns of
+:class:`models.SequenceMetrics`. Every inserted sequence and metrics row adds
+to one :class:`models.MetricsRollup` row per (day, persona, tone,
+sequence_type) with an upsert in the same transaction, so :func:`dashboard`
+aggregates a table whose size depends on days and dimensions, never on how
+many sequences have been generated.
+
+    python analytics.py rebuild     # recompute rollups from stored rows
+"""
+import argparse
+import logging
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, EmailSequence, MetricsRollup, SequenceMetrics
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = ('open_rate', 'response_rate', 'personalization_score', 'quality_score')
+SENTIMENTS = ('positive', 'neutral', 'negative')
+DIMENSIONS = ('persona', 'tone', 'sequence_type')
+GROUP_BY = ('day',) + DIMENSIONS
+COUNTERS = (('sequences', 'scored', 'positive', 'neutral', 'negative', 'suggestions')
+            + tuple(f'{field}_{part}' for field in METRIC_FIELDS for part in ('sum', 'count')))
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def parse_score(value) -> Optional[float]:
+    """``"52%"``, ``"75"`` or ``75`` as a number from 0 to 100; None when unusable."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER.search(str(value or ''))
+        if not match:
+            return None
+        number = float(match.group())
+    return min(max(number, 0.0), 100.0)
+
+
+def parse_sentiment(value) -> Optional[str]:
+    sentiment = str(value or '').strip().lower()
+    return sentiment if sentiment in SENTIMENTS else None
+
+
+def parse_metrics(metrics: Dict, suggestions: Optional[List] = None) -> Dict:
+    """Column values of a :class:`models.SequenceMetrics` row."""
+    metrics = metrics if isinstance(metrics, dict) else {}
+    suggestions = suggestions if isinstance(suggestions, list) else []
+    row = {field: parse_score(metrics.get(field)) for field in METRIC_FIELDS}
+    row['sentiment'] = parse_sentiment(metrics.get('sentiment'))
+    row['suggestions'] = suggestions
+    row['suggestion_count'] = len(suggestions)
+    return row
+
+
+def rollup_key(persona, tone, sequence_type, created_at: Optional[datetime]) -> Dict:
+    return {
+        'day': (created_at or datetime.utcnow()).date(),
+        'persona': persona or '',
+        'tone': tone or '',
+        'sequence_type': sequence_type or '',
+    }
+
+
+def metrics_counts(row: Dict) -> Dict:
+    """Rollup increments for one metrics row."""
+    counts = {'scored': 1, 'suggestions': row.get('suggestion_count') or 0}
+    for field in METRIC_FIELDS:
+        if row.get(field) is not None:
+            counts[f'{field}_sum'] = row[field]
+            counts[f'{field}_count'] = 1
+    if row.get('sentiment'):
+        counts[row['sentiment']] = 1
+    return counts
+
+
+def upsert_counts(connection, table, key_columns, rows: List[Dict]):
+    """Add each row's counters to the row with the same key, creating it if needed.
+
+    Rows must all have the same columns; on Postgres and SQLite they are
+    written with one executemany of an ``ON CONFLICT DO UPDATE`` insert.
+    """
+    if not rows:
+        return
+    counters = [name for name in rows[0] if name not in key_columns]
+    dialect = {'postgresql': postgresql, 'sqlite': sqlite}.get(connection.dialect.name)
+    if dialect is not None:
+        statement = dialect.insert(table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={name: table.c[name] + statement.excluded[name] for name in counters}), rows)
+        return
+    for row in rows:
+        matches = [table.c[name] == row[name] for name in key_columns]
+        result = connection.execute(update(table).where(*matches).values(
+            **{name: table.c[name] + row[name] for name in counters}))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def bump_rollup(connection, key: Dict, counts: Dict):
+    """Add ``counts`` to the rollup row for ``key``, creating it if needed."""
+    upsert_counts(connection, MetricsRollup.__table__, list(key), [dict(key, **counts)])
+
+
+@event.listens_for(EmailSequence, 'after_insert')
+def _count_sequence(mapper, connection, target):
+    bump_rollup(connection, rollup_key(target.persona, target.tone, target.sequence_type, target.created_at),
+                {'sequences': 1})
+
+
+@event.listens_for(SequenceMetrics, 'after_insert')
+def _count_metrics(mapper, connection, target):
+    sequence = target.sequence or connection.execute(
+        select(EmailSequence.persona, EmailSequence.tone, EmailSequence.sequence_type, EmailSequence.created_at)
+        .where(EmailSequence.id == target.sequence_id)).one()
+    row = {column: getattr(target, column) for column in METRIC_FIELDS + ('sentiment', 'suggestion_count')}
+    bump_rollup(connection, rollup_key(sequence.persona, sequence.tone, sequence.sequence_type,
+                                       sequence.created_at), metrics_counts(row))
+
+
+def dashboard(group_by=('persona',), filters: Optional[Dict] = None) -> List[Dict]:
+    """Totals and averages per group, read only from the rollup table.
+
+    ``filters`` may hold persona, tone and sequence_type values and ``since``
+    and ``until`` dates (``until`` exclusive).
+    """
+    group_by = [name for name in GROUP_BY if name in group_by]
+    filters = filters or {}
+    columns = [getattr(MetricsRollup, name) for name in group_by]
+    query = select(*columns, *[func.sum(getattr(MetricsRollup, name)).label(name) for name in COUNTERS])
+    for name in DIMENSIONS:
+        if filters.get(name):
+            query = query.where(getattr(MetricsRollup, name) == filters[name])
+    if filters.get('since'):
+        query = query.where(MetricsRollup.day >= filters['since'])
+    if filters.get('until'):
+        query = query.where(MetricsRollup.day < filters['until'])
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+
+    groups = []
+    for row in db.session.execute(query).mappings():
+        if not row['sequences'] and not row['scored']:
+            continue
+        group = {name: (row[name].isoformat() if isinstance(row[name], date) else row[name] or None)
+                 for name in group_by}
+        group['sequences'] = row['sequences']
+        group['scored'] = row['scored']
+        for field in METRIC_FIELDS:
+            count = row[f'{field}_count']
+            group[field] = round(row[f'{field}_sum'] / count, 1) if count else None
+        group['sentiment'] = {name: row[name] for name in SENTIMENTS}
+        group['suggestions_per_sequence'] = round(row['suggestions'] / row['scored'], 2) if row['scored'] else None
+        groups.append(group)
+    return groups
+
+
+def parse_dashboard_args(params: Dict):
+    """Group-by list and filters from dashboard query args."""
+    group_by = [name.strip() for name in (params.get('group_by') or 'persona').split(',') if name.strip()]
+    unknown = [name for name in group_by if name not in GROUP_BY]
+    if unknown:
+        raise ValueError(f"Cannot group by: {', '.join(unknown)}")
+    filters = {name: params[name] for name in DIMENSIONS if params.get(name)}
+    for name in ('since', 'until'):
+        if params.get(name):
+            filters[name] = date.fromisoformat(params[name])
+    return group_by, filters
+
+
+def rebuild() -> int:
+    """Recompute every rollup row from stored sequences; returns the row count."""
+    totals: Dict[tuple, Dict] = {}
+    query = select(EmailSequence.persona, EmailSequence.tone, EmailSequence.sequence_type,
+                   EmailSequence.created_at, *[getattr(SequenceMetrics, column) for column in
+                                               ('sequence_id',) + METRIC_FIELDS + ('sentiment', 'suggestion_count')]
+                   ).outerjoin(SequenceMetrics, SequenceMetrics.sequence_id == EmailSequence.id)
+    for row in db.session.execute(query.execution_options(yield_per=1000)).mappings():
+        key = rollup_key(row['persona'], row['tone'], row['sequence_type'], row['created_at'])
+        counts = {'sequences': 1}
+        if row['sequence_id'] is not None:
+            counts.update(metrics_counts(row))
+        total = totals.setdefault(tuple(key.values()), dict(key))
+        for name, value in counts.items():
+            total[name] = total.get(name, 0) + value
+    db.session.execute(MetricsRollup.__table__.delete())
+    if totals:
+        db.session.execute(MetricsRollup.__table__.insert(),
+                           [dict({name: 0 for name in COUNTERS}, **total) for total in totals.values()])
+    db.session.commit()
+    return len(totals)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Helix metrics rollups')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        print(f"Rebuilt {rebuild()} rollup rows")
@@ -0,0 +1,530 @@
+"""Native asyncio Socket.IO server.
+
+Serves the same events as ``app.py`` on ``socketio.AsyncServer`` so the
+frontend needs no changes, but every model call is awaited
+(``generate_content_async``) and sequences are stored through an async
+SQLAlchemy engine. A waiting LLM call costs one coroutine instead of a thread
+or greenlet, so a single process can hold thousands of them in flight.
+
+HTTP routes (export, render, campaigns, magic actions) are still served by the
+Flask app, mounted behind the Socket.IO endpoint through asgiref. Campaign
+progress from those routes is sent through this server's rooms (see
+``app.CampaignChannel``).
+
+    cd backend
+    python asgi_app.py
+    uvicorn asgi_app:app --port 3002
+"""
+import asyncio
+import contextvars
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import socketio
+import uvicorn
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import (app as flask_app, campaign_channel, close_chat_turn, company_context, context_extractor,
+                 open_chat_turn, speculator)
+from analytics import bump_rollup, metrics_counts, parse_metrics, rollup_key
+from campaigns import campaign_room
+from chat import TOOL_DONE, ChatTurn, next_action
+from config import Config
+from conversation_log import conversation_log
+from llm_backend import create_model, parse_model_json
+from models import db, Campaign, EmailSequence, SequenceMetrics
+from payloads import negotiate_mode, forget_client, parse_sequence, sequence_update_payload
+from profiling import profiler
+from recruiting_tools import (DEFAULT_METRICS, apply_suggestion_prompt, metrics_prompt, sequence_prompt,
+                               suggestions_prompt, summary_prompt, tone_prompt)
+from scaling import async_socketio_options
+from search import create_search_schema, index_sequence
+from supersession import Superseded, inflight
+from tracing import tracer
+from variants import pick_variant_async, variant_stats
+from versions import record_version
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url: str):
+    """Convert the Flask-SQLAlchemy database URL to its asyncio driver."""
+    parsed = make_url(url)
+    backend = parsed.drivername.split('+')[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver configured for {backend} databases")
+    parsed = parsed.set(drivername=ASYNC_DRIVERS[backend])
+    if 'sslmode' in parsed.query:
+        # asyncpg takes ``ssl`` instead of libpq's ``sslmode``
+        query = dict(parsed.query)
+        query['ssl'] = query.pop('sslmode')
+        parsed = parsed.set(query=query)
+    return parsed
+
+
+def create_engine_for(url: str):
+    parsed = async_database_url(url)
+    if parsed.drivername.startswith('sqlite') and parsed.database in (None, '', ':memory:'):
+        # An in-memory database only exists on its one connection
+        return create_async_engine(parsed, poolclass=StaticPool, connect_args={'check_same_thread': False})
+    return create_async_engine(parsed, pool_pre_ping=True)
+
+
+engine = create_engine_for(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+tracer.instrument(engine.sync_engine)
+model = create_model('gemini-2.0-flash')
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', **async_socketio_options(Config))
+
+
+def on_event(event):
+    """``sio.on`` that makes each received event the root span of a trace and counts it for profiling."""
+    return lambda handler: sio.on(event)(profiler.wrap_event(
+        tracer.wrap_event(event, handler, sid=lambda sid, *args: sid)))
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(db.metadata.create_all)
+        await conn.run_sync(create_search_schema)
+
+
+def _db_threads() -> int:
+    # A SQLite connection cannot be used from two threads at once
+    if flask_app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return 1
+    return Config.ASYNC_DB_THREADS
+
+
+# Sized to the Flask-SQLAlchemy pool so threads never queue for a connection
+db_executor = ThreadPoolExecutor(max_workers=_db_threads(), thread_name_prefix='helix-db')
+
+
+def _in_app_context(fn, *args):
+    with flask_app.app_context():
+        return fn(*args)
+
+
+async def run_db(fn, *args):
+    """Run a Flask-SQLAlchemy call (conversation log, versions) on the DB thread pool."""
+    # Executor threads do not inherit the caller's context, and with it the current span
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, context.run, _in_app_context, fn, *args)
+
+
+async def flush_conversations():
+    while True:
+        await asyncio.sleep(Config.CONVERSATION_FLUSH_SECONDS)
+        await run_db(conversation_log.flush)
+
+
+async def record_sequence_version(sequence, source, parent_id=None, sequence_id=None):
+    """Add a version of the sequence; failures are logged and return None."""
+    def record():
+        try:
+            return record_version(sequence, source, parent_id=parent_id, sequence_id=sequence_id).id
+        except Exception:
+            db.session.rollback()
+            raise
+    try:
+        return await run_db(record)
+    except Exception as e:
+        logger.error("Error recording sequence version: %s", e)
+        return None
+
+
+_background_tasks = set()
+
+
+async def startup():
+    await init_db()
+    campaign_channel.use_async(sio, asyncio.get_running_loop())
+    task = asyncio.create_task(flush_conversations())
+    _background_tasks.add(task)
+
+
+async def shutdown():
+    campaign_channel.close()
+
+
+async def store_sequence(sequence, persona, tone, sequence_type, metrics=None, suggestions=None):
+    """Insert a generated sequence with its metrics and return its ID."""
+    content = json.dumps(sequence, indent=2)
+    created_at = datetime.utcnow()
+    row = parse_metrics(metrics, suggestions)
+    async with engine.begin() as conn:
+        result = await conn.execute(insert(EmailSequence.__table__).values(
+            content=content,
+            persona=persona,
+            tone=tone,
+            sequence_type=sequence_type,
+            created_at=created_at
+        ))
+        sequence_id = result.inserted_primary_key[0]
+        await conn.execute(insert(SequenceMetrics.__table__).values(sequence_id=sequence_id, **row))
+        # Core inserts skip the ORM events that index sequences and update rollups
+        await conn.run_sync(index_sequence, sequence_id, content, persona, tone)
+        await conn.run_sync(bump_rollup, rollup_key(persona, tone, sequence_type, created_at),
+                            dict(metrics_counts(row), sequences=1))
+        return sequence_id
+
+
+# Handler functions
+async def analyze_sequence_metrics(sequence, ticket=None):
+    """Analyze sequence metrics using Gemini."""
+    try:
+        if isinstance(sequence, str):
+            try:
+                sequence_data = parse_model_json(sequence)
+            except json.JSONDecodeError as e:
+                logger.error("Failed to parse sequence JSON: %s", e)
+                sequence_data = sequence
+        else:
+            sequence_data = sequence
+
+        prompt = metrics_prompt(sequence_data)
+        response = await (ticket.call_async(model, prompt) if ticket else model.generate_content_async(prompt))
+        return parse_model_json(response.text)
+    except Superseded:
+        raise
+    except Exception as e:
+        logger.error("Error analyzing sequence metrics: %s", e)
+        return dict(DEFAULT_METRICS)
+
+
+async def generate_suggestions(sequence):
+    """Generate AI suggestions for improving the sequence."""
+    try:
+        response = await model.generate_content_async(suggestions_prompt(sequence))
+        suggestions = parse_model_json(response.text)
+        return suggestions.get('suggestions', [])
+    except Exception as e:
+        logger.error("Error generating suggestions: %s", e)
+        return []
+
+
+async def generate_variant(prompt, temperature):
+    """Text of one sequence variant; ``None`` keeps the model's default temperature."""
+    if temperature is None:
+        return (await model.generate_content_async(prompt)).text
+    return (await model.generate_content_async(prompt, generation_config={'temperature': temperature})).text
+
+
+async def generate_sequence_content(data, messages, tone, sequence_type, ticket=None):
+    """Generate a sequence with its suggestions and metrics; nothing is stored."""
+    company = await run_db(company_context, data) if data.get('company_id') else None
+    prompt = sequence_prompt(messages, tone, sequence_type, company)
+    if Config.SEQUENCE_VARIANTS > 1:
+        sequence, info = await pick_variant_async(
+            generate_variant, prompt, Config.SEQUENCE_VARIANTS, Config.SEQUENCE_VARIANT_BUDGET_SECONDS,
+            Config.SEQUENCE_VARIANT_THRESHOLD, Config.SEQUENCE_VARIANT_GRACE_SECONDS, stats=variant_stats)
+        logger.info("Picked sequence variant", extra={'variant': info})
+    else:
+        response = await (ticket.call_async(model, prompt) if ticket else model.generate_content_async(prompt))
+        sequence = parse_model_json(response.text)
+
+    # Suggestions and metrics only depend on the sequence, so they run concurrently
+    suggestions, metrics = await asyncio.gather(
+        generate_suggestions(sequence),
+        analyze_sequence_metrics(sequence, ticket)
+    )
+    return sequence, suggestions, metrics
+
+
+async def generate_sequence_for_client(data, ticket=None):
+    """Generate a sequence for the ticket's client, serving its speculative result when it matches."""
+    generated = None
+    if ticket:
+        company = await run_db(company_context, data) if data.get('company_id') else None
+        # Waiting on a speculation still running blocks, so it happens off the event loop
+        generated = await asyncio.to_thread(speculator.take, ticket.sid, data.get('messages', []),
+                                            data.get('tone', 'professional'), data.get('sequenceType', 'passive'),
+                                            company, timeout=Config.SPECULATION_WAIT_SECONDS)
+    return await handle_sequence_generation(data, generated, ticket)
+
+
+async def handle_sequence_generation(data, generated=None, ticket=None):
+    """Generate a sequence based on the conversation context.
+
+    ``generated`` is a speculative result (see speculation.py); it is stored
+    like a fresh one.
+    """
+    try:
+        messages = data.get('messages', [])
+        tone = data.get('tone', 'professional')
+        sequence_type = data.get('sequenceType', 'passive')
+        persona = data.get('persona', 'corporate_pro')
+
+        if generated is not None:
+            sequence = generated['sequence']
+            suggestions, metrics = generated['suggestions'], generated['metrics']
+        else:
+            sequence, suggestions, metrics = await generate_sequence_content(data, messages, tone, sequence_type,
+                                                                             ticket)
+
+        version_id = None
+        try:
+            sequence_id = await store_sequence(sequence, persona, tone, sequence_type, metrics, suggestions)
+            logger.info("Stored sequence in database", extra={'sequence_id': sequence_id})
+            version_id = await record_sequence_version(sequence, 'generate', sequence_id=sequence_id)
+        except Exception as e:
+            logger.error("Error storing sequence in database: %s", e)
+
+        return {
+            'message': "I've generated a sequence based on our conversation.",
+            'version_id': version_id,
+            'sequence': sequence,
+            'content': json.dumps(sequence, indent=2),
+            'metrics': metrics,
+            'suggestions': suggestions
+        }
+    except Superseded:
+        raise
+    except Exception as e:
+        logger.error("Error generating sequence: %s", e)
+        return {'error': 'Failed to generate sequence'}
+
+
+async def handle_tone_adjustment(data, ticket=None):
+    """Adjust the tone of the sequence."""
+    try:
+        tone = data.get('tone', 'professional')
+        prompt = tone_prompt(data.get('content', ''), tone)
+        response = await (ticket.call_async(model, prompt) if ticket else model.generate_content_async(prompt))
+        return {
+            'message': f"I've adjusted the tone to be more {tone}.",
+            'content': response.text
+        }
+    except Superseded:
+        raise
+    except Exception as e:
+        logger.error("Error adjusting tone: %s", e)
+        return {'error': 'Failed to adjust tone'}
+
+
+async def handle_context_summary(data, key=None, ticket=None):
+    """Generate a summary of the conversation context; the model only fills in what extraction could not read."""
+    try:
+        messages = data.get('messages', [])
+        extraction = context_extractor.extract(messages, key)
+        if extraction.confident:
+            return extraction.summary
+        logger.info("Summarizing with the model", extra={'uncertain': extraction.uncertain})
+        prompt = summary_prompt(messages)
+        response = await (ticket.call_async(model, prompt) if ticket else model.generate_content_async(prompt))
+        return context_extractor.resolve(extraction, response.text, key)
+    except Superseded:
+        raise
+    except Exception as e:
+        logger.error("Error summarizing context: %s", e)
+        return {'error': 'Failed to summarize context'}
+
+
+tools = {
+    'generate_sequence': generate_sequence_for_client,
+    'adjust_tone': handle_tone_adjustment,
+    'summarize_context': handle_context_summary
+}
+
+
+@on_event('connect')
+async def connect(sid, environ, auth=None):
+    """Handle client connection."""
+    args = {key: values[0] for key, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+    payload_mode = negotiate_mode(sid, auth, args)
+    logger.info("Client connected with %s payloads", payload_mode)
+    await sio.emit('connection_status', {'status': 'connected', 'payload': payload_mode}, to=sid)
+
+
+@on_event('disconnect')
+async def disconnect(sid, *args):
+    forget_client(sid)
+    # Cancels this client's in-flight model calls
+    inflight.forget(sid)
+    speculator.forget(sid)
+    context_extractor.forget(sid)
+    logger.info('Client disconnected')
+
+
+@on_event('test_connection')
+async def handle_test_connection(sid, data):
+    await sio.emit('test_response', {'message': 'Test connection successful'}, to=sid)
+
+
+@on_event('chat_message')
+async def handle_message(sid, data):
+    """Answer a chat message; a disconnect cancels it."""
+    with inflight.begin(sid, 'chat_message', asyncio.current_task()) as ticket:
+        try:
+            turn = ChatTurn(data)
+            if not turn.message:  # If it's an initial message
+                return
+
+            company = await run_db(open_chat_turn, turn, sid, turn.conversation_id or sid)
+            response = await ticket.call_async(model, turn.prompt(company))
+            action = next_action(turn, response.text, tools)
+            if action.tool:
+                result = await tools[action.tool](action.args, ticket=ticket)
+                action = action._replace(reply=result.get('message', TOOL_DONE))
+            if action.reply:
+                await sio.emit('chat_message', {'role': 'assistant', 'content': action.reply}, to=sid)
+                await run_db(close_chat_turn, turn, action.reply)
+        except Superseded:
+            raise
+        except Exception as e:
+            logger.error("Error handling message: %s", e)
+            await sio.emit('error', {'message': 'An error occurred while processing your message'}, to=sid)
+
+
+@on_event('generate_sequence')
+async def handle_sequence_generation_event(sid, data):
+    """Handle sequence generation event."""
+    with inflight.begin(sid, 'generate_sequence', asyncio.current_task()) as ticket:
+        try:
+            result = await generate_sequence_for_client(data, ticket)
+            await sio.emit('sequence_update', sequence_update_payload(
+                sid,
+                sequence=result.get('sequence'),
+                content=result.get('content', ''),
+                metrics=result.get('metrics', {}),
+                suggestions=result.get('suggestions', []),
+                version_id=result.get('version_id')
+            ), to=sid)
+        except Superseded:
+            raise
+        except Exception as e:
+            logger.error("Error handling sequence generation: %s", e)
+            await sio.emit('error', {'message': 'Failed to generate sequence'}, to=sid)
+
+
+@on_event('adjust_tone')
+async def handle_tone_adjustment_event(sid, data):
+    """Handle tone adjustment event; a newer adjustment from the same client cancels it."""
+    with inflight.begin(sid, 'adjust_tone', asyncio.current_task()) as ticket:
+        try:
+            result = await handle_tone_adjustment(data, ticket)
+            content = result.get('content', '')
+            sequence = parse_sequence(content)
+            version_id = await record_sequence_version(sequence, 'adjust_tone', data.get('version_id')) if sequence else None
+            await sio.emit('sequence_update', sequence_update_payload(
+                sid, sequence=sequence, content=content, version_id=version_id), to=sid)
+        except Superseded:
+            raise
+        except Exception as e:
+            logger.error("Error handling tone adjustment: %s", e)
+            await sio.emit('error', {'message': 'Failed to adjust tone'}, to=sid)
+
+
+@on_event('summarize_context')
+async def handle_context_summary_event(sid, data):
+    """Handle context summary event."""
+    try:
+        result = await handle_context_summary(data, data.get('conversation_id') or sid)
+        if data.get('conversation_id') and 'error' not in result:
+            await run_db(conversation_log.cache_summary, data['conversation_id'], result)
+        await sio.emit('context_summary', result, to=sid)
+    except Exception as e:
+        logger.error("Error handling context summary: %s", e)
+        await sio.emit('error', {'message': 'Failed to summarize context'}, to=sid)
+
+
+@on_event('start_conversation')
+async def handle_start_conversation(sid, data):
+    """Resume a stored conversation from its tail, or start a new one."""
+    conversation_id = data.get('conversation_id')
+    if conversation_id:
+        state = await run_db(conversation_log.resume, conversation_id, data.get('tail', 20))
+        if state is not None:
+            await sio.emit('conversation_resumed', state, to=sid)
+            return
+
+    def start():
+        return conversation_log.start(data.get('persona'), data.get('messages', [])).id
+
+    await sio.emit('conversation_started', {'conversation_id': await run_db(start)}, to=sid)
+
+
+
+@on_event('join_campaign')
+async def handle_join_campaign(sid, data):
+    """Subscribe this client to progress events of a campaign."""
+    def load():
+        campaign = db.session.get(Campaign, data.get('campaign_id'))
+        return campaign.to_dict() if campaign else None
+
+    campaign = await run_db(load)
+    if campaign is None:
+        await sio.emit('error', {'message': 'Campaign not found'}, to=sid)
+        return
+    await sio.enter_room(sid, campaign_room(campaign['id']))
+    await sio.emit('campaign_progress', campaign, to=sid)
+
+@on_event('get_sequence_metrics')
+async def handle_sequence_metrics(sid, data):
+    metrics = {
+        'estimated_open_rate': '45%',
+        'estimated_response_rate': '28%',
+        'sequence_quality_score': '92',
+        'personalization_score': '85',
+        'clarity_score': '90'
+    }
+    await sio.emit('sequence_metrics', metrics, to=sid)
+    return {'status': 'success', 'message': 'Metrics calculated'}
+
+
+@on_event('apply_suggestion')
+async def handle_suggestion_application(sid, data):
+    """Handle applying a suggestion to the sequence; a newer suggestion from the same client cancels it."""
+    with inflight.begin(sid, 'apply_suggestion', asyncio.current_task()) as ticket:
+        try:
+            current_sequence = data.get('sequence', '')
+            if not current_sequence:
+                raise ValueError("No sequence provided")
+            sequence = json.loads(current_sequence) if isinstance(current_sequence, str) else current_sequence
+
+            response = await ticket.call_async(model, apply_suggestion_prompt(data.get('suggestion', ''), sequence))
+            improved_sequence = parse_model_json(response.text)
+            metrics = await analyze_sequence_metrics(improved_sequence, ticket)
+
+            await sio.emit('sequence_update', sequence_update_payload(
+                sid,
+                sequence=improved_sequence,
+                metrics=metrics,
+                message='Successfully applied the suggestion!',
+                version_id=await record_sequence_version(improved_sequence, 'apply_suggestion', data.get('version_id'))
+            ), to=sid)
+        except Superseded:
+            raise
+        except Exception as e:
+            logger.error("Error applying suggestion: %s", e)
+            await sio.emit('error', {'message': 'Failed to apply suggestion'}, to=sid)
+
+
+@on_event('update_sequence_from_edit')
+async def handle_sequence_edit(sid, data):
+    with inflight.begin(sid, 'update_sequence_from_edit') as ticket:
+        # Only the last edit of a burst gets past the debounce window
+        await ticket.debounce_async(Config.EDIT_DEBOUNCE_SECONDS)
+        sequence = data.get('sequence', [])
+        version_id = await record_sequence_version(sequence, 'edit', data.get('version_id')) if sequence else None
+        await sio.emit('sequence_update', sequence_update_payload(sid, sequence=sequence, version_id=version_id), to=sid)
+        return {'status': 'success', 'message': 'Sequence updated from edit'}
+    return {'status': 'superseded', 'message': 'A newer edit replaced this one'}
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(flask_app), on_startup=startup, on_shutdown=shutdown)
+
+if __name__ == '__main__':
+    uvicorn.run(app, port=Config.PORT)
@@ -0,0 +1,341 @@
+"""Socket.IO load test with scripted recruiter flows.
+
+Starts the backend with the synthetic model backend (configurable latency),
+runs N concurrent python-socketio clients through a realistic flow and
+reports throughput, per-event latency percentiles and server CPU/memory:
+
+    cd backend
+    python -m benchmarks.loadtest --clients 20 --latency uniform:0.2,0.6 --output results.json
+    python -m benchmarks.loadtest --clients 20 --compare results.json
+
+Each flow is: connect, several ``chat_message`` turns, ``generate_sequence``,
+``apply_suggestion``, ``adjust_tone``, disconnect. Latency is measured from
+emit until the matching response event arrives.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import socketio
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_TURNS = [
+    "Hi! I'm hiring a Senior Backend Engineer for our payments team.",
+    "We're a Series B fintech startup building real-time payment rails.",
+    "They need 5+ years of experience with Go, Postgres and distributed systems.",
+    "It's remote within US time zones with meaningful equity.",
+]
+
+# Client event -> server event that answers it
+RESPONSE_EVENTS = {
+    'chat_message': 'chat_message',
+    'generate_sequence': 'sequence_update',
+    'apply_suggestion': 'sequence_update',
+    'adjust_tone': 'sequence_update',
+}
+
+# Relative increase in p95 latency or drop in throughput flagged by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ProcessSampler:
+    """Sample CPU and RSS of a process from /proc on a background thread."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_samples = []
+        self.rss_samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def _cpu_seconds(self) -> float:
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss_mb(self) -> float:
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+        return 0.0
+
+    def _run(self):
+        try:
+            last_cpu, last_time = self._cpu_seconds(), time.monotonic()
+            while not self._stop.wait(self.interval):
+                cpu, now = self._cpu_seconds(), time.monotonic()
+                self.cpu_samples.append(100.0 * (cpu - last_cpu) / (now - last_time))
+                self.rss_samples.append(self._rss_mb())
+                last_cpu, last_time = cpu, now
+        except (OSError, IndexError):
+            # No /proc (non-Linux) or the process exited
+            pass
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Dict:
+        self._stop.set()
+        self._thread.join()
+        return {
+            'cpu_percent_avg': round(sum(self.cpu_samples) / len(self.cpu_samples), 1) if self.cpu_samples else None,
+            'cpu_percent_peak': round(max(self.cpu_samples), 1) if self.cpu_samples else None,
+            'rss_mb_peak': round(max(self.rss_samples), 1) if self.rss_samples else None,
+        }
+
+
+def start_server(port: int, latency: str, db_path: str) -> subprocess.Popen:
+    """Run app.py against the synthetic model backend and a throwaway database."""
+    env = dict(os.environ,
+               HELIX_LLM_MODE='synthetic',
+               HELIX_LLM_LATENCY=latency,
+               DATABASE_URL=f'sqlite:///{db_path}')
+    code = ("from app import app, socketio; "
+            f"socketio.run(app, port={port}, allow_unsafe_werkzeug=True, log_output=False)")
+    return subprocess.Popen([sys.executable, '-c', code], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class RecruiterClient:
+    """One simulated recruiter running the scripted flow."""
+
+    def __init__(self, url: str, transport: str, timeout: float):
+        self.url = url
+        self.transport = transport
+        self.timeout = timeout
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.responses = defaultdict(queue.Queue)
+
+    def _call(self, client: socketio.Client, event: str, data: Dict):
+        answer = RESPONSE_EVENTS.get(event)
+        start = time.perf_counter()
+        client.emit(event, data)
+        if answer is None:
+            return None
+        try:
+            name, payload = self.responses[answer].get(timeout=self.timeout)
+        except queue.Empty:
+            self.errors[event] += 1
+            return None
+        if name == 'error':
+            self.errors[event] += 1
+            return None
+        self.latencies[event].append(time.perf_counter() - start)
+        return payload
+
+    def run_flow(self):
+        client = socketio.Client(reconnection=False)
+        for event in set(RESPONSE_EVENTS.values()):
+            client.on(event, lambda data, event=event: self.responses[event].put((event, data)))
+        # Errors fail whichever call is waiting
+        client.on('error', lambda data: [q.put(('error', data)) for q in list(self.responses.values())])
+
+        start = time.perf_counter()
+        try:
+            client.connect(self.url, transports=[self.transport], wait_timeout=self.timeout)
+        except socketio.exceptions.ConnectionError:
+            self.errors['connect'] += 1
+            return
+        self.latencies['connect'].append(time.perf_counter() - start)
+
+        messages = []
+        for turn in CHAT_TURNS:
+            messages.append({'role': 'user', 'content': turn})
+            reply = self._call(client, 'chat_message', {'message': turn, 'messages': messages,
+                                                        'persona': 'tech_expert'})
+            if reply:
+                messages.append(reply)
+
+        update = self._call(client, 'generate_sequence', {'messages': messages, 'tone': 'professional',
+                                                          'sequenceType': 'passive', 'persona': 'tech_expert'})
+        sequence = (update or {}).get('content') or '[]'
+        update = self._call(client, 'apply_suggestion', {'sequence': sequence, 'suggestion_index': 0,
+                                                         'suggestion': 'Shorten the first subject line.'})
+        sequence = (update or {}).get('content') or sequence
+        self._call(client, 'adjust_tone', {'content': sequence, 'tone': 'friendly'})
+
+        start = time.perf_counter()
+        client.disconnect()
+        self.latencies['disconnect'].append(time.perf_counter() - start)
+
+
+def run_load(url: str, clients: int, flows: int, transport: str, timeout: float) -> Dict:
+    recruiters = [RecruiterClient(url, transport, timeout) for _ in range(clients)]
+
+    def worker(recruiter):
+        for _ in range(flows):
+            recruiter.run_flow()
+
+    threads = [threading.Thread(target=worker, args=(r,)) for r in recruiters]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies, errors = defaultdict(list), defaultdict(int)
+    for recruiter in recruiters:
+        for event, values in recruiter.latencies.items():
+            latencies[event].extend(values)
+        for event, count in recruiter.errors.items():
+            errors[event] += count
+
+    events = {}
+    for event in sorted(set(latencies) | set(errors)):
+        values = latencies[event]
+        events[event] = {
+            'count': len(values),
+            'errors': errors[event],
+            'mean_ms': round(1000 * sum(values) / len(values), 2) if values else None,
+            'p50_ms': round(1000 * percentile(values, 50), 2) if values else None,
+            'p95_ms': round(1000 * percentile(values, 95), 2) if values else None,
+            'p99_ms': round(1000 * percentile(values, 99), 2) if values else None,
+        }
+    completed = sum(stats['count'] for stats in events.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'flows_per_s': round(clients * flows / elapsed, 3),
+        'events_per_s': round(completed / elapsed, 2),
+        'events': events,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Describe throughput drops and p95 increases beyond ``threshold``."""
+    regressions = []
+    if current['events_per_s'] < baseline['events_per_s'] * (1 - threshold):
+        regressions.append(f"throughput {baseline['events_per_s']} -> {current['events_per_s']} events/s")
+    for event, stats in current['events'].items():
+        before = baseline['events'].get(event, {}).get('p95_ms')
+        after = stats.get('p95_ms')
+        if before and after and after > before * (1 + threshold):
+            regressions.append(f"{event} p95 {before} -> {after} ms")
+    return regressions
+
+
+def print_report(result: Dict):
+    print(f"{result['config']['clients']} clients x {result['config']['flows']} flows "
+          f"in {result['elapsed_s']}s: {result['flows_per_s']} flows/s, {result['events_per_s']} events/s")
+    print(f"{'event':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for event, stats in result['events'].items():
+        print(f"{event:<20}{stats['count']:>7}{stats['errors']:>8}"
+              f"{str(stats['p50_ms']):>10}{str(stats['p95_ms']):>10}{str(stats['p99_ms']):>10}")
+    server = result.get('server') or {}
+    print(f"server cpu avg {server.get('cpu_percent_avg')}% peak {server.get('cpu_percent_peak')}%, "
+          f"rss peak {server.get('rss_mb_peak')} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Helix Socket.IO load test')
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--flows', type=int, default=1, help='flows per client')
+    parser.add_argument('--latency', default='fixed:0.05', help='synthetic model latency distribution')
+    parser.add_argument('--transport', default='polling', choices=['polling', 'websocket'])
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--url', help='target a running server instead of starting one')
+    parser.add_argument('--pid', type=int, help='server pid to sample when using --url')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    args = parser.parse_args(argv)
+
+    server = None
+    pid = args.pid
+    url = args.url
+    db_dir = tempfile.TemporaryDirectory()
+    if not url:
+        port = _free_port()
+        server = start_server(port, args.latency, os.path.join(db_dir.name, 'loadtest.db'))
+        pid = server.pid
+        url = f'http://127.0.0.1:{port}'
+        _wait_for_server(url, args.timeout)
+
+    sampler = ProcessSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+    try:
+        result = run_load(url, args.clients, args.flows, args.transport, args.timeout)
+    finally:
+        server_stats = sampler.stop() if sampler else None
+        if server:
+            server.terminate()
+            server.wait()
+        db_dir.cleanup()
+
+    result.update({
+        'config': {'clients': args.clients, 'flows': args.flows, 'latency': args.latency,
+                   'transport': args.transport},
+        'server': server_stats,
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+    })
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != result['config']:
+            print(f"Note: baseline config {baseline.get('config')} differs from this run")
+        regressions = compare(result, baseline)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+def _wait_for_server(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        probe = socketio.Client(reconnection=False)
+        try:
+            probe.connect(url, transports=['polling'], wait_timeout=2)
+            probe.disconnect()
+            return
+        except socketio.exceptions.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""Save or compare microbenchmark baselines.
+
+    cd backend
+    python -m benchmarks.micro save              # store a new baseline
+    python -m benchmarks.micro compare           # compare against the latest baseline
+    python -m benchmarks.micro compare --fail-over 20
+
+``compare`` exits non-zero when any benchmark's median is slower than the
+baseline by more than ``--fail-over`` percent.
+"""
+import argparse
+import os
+import sys
+
+import pytest
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_STORAGE = os.path.join(BENCHMARK_DIR, 'baselines')
+SUITE = os.path.join(BENCHMARK_DIR, 'test_microbench.py')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Helix microbenchmarks')
+    parser.add_argument('command', choices=['save', 'compare', 'run'])
+    parser.add_argument('--name', default='baseline', help='name for a saved baseline')
+    parser.add_argument('--against', help='baseline id to compare with (defaults to the latest)')
+    parser.add_argument('--fail-over', type=int, default=15, help='allowed median slowdown in percent')
+    parser.add_argument('-k', help='only run matching benchmarks')
+    args = parser.parse_args(argv)
+
+    pytest_args = [SUITE, '-q', '--benchmark-only', f'--benchmark-storage=file://{BASELINE_STORAGE}',
+                   '--benchmark-columns=min,median,mean,ops', '--benchmark-sort=name']
+    if args.k:
+        pytest_args += ['-k', args.k]
+    if args.command == 'save':
+        pytest_args.append(f'--benchmark-save={args.name}')
+    elif args.command == 'compare':
+        pytest_args.append(f'--benchmark-compare={args.against}' if args.against else '--benchmark-compare')
+        pytest_args.append(f'--benchmark-compare-fail=median:{args.fail_over}%')
+    return pytest.main(pytest_args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
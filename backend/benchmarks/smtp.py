@@ -0,0 +1,129 @@
+"""SMTP delivery throughput against a local aiosmtpd server.
+
+Sends the same batch of messages through :class:`delivery.DeliveryPool` at
+several pool sizes and reports messages per second for each:
+
+    cd backend
+    python -m benchmarks.smtp --messages 500 --pool-sizes 1,2,4,8,16 --latency 0.01
+
+``--latency`` is how long the stand-in server takes to accept each message,
+like a real MTA's disk sync and spam scan. Throughput flattens once the pool
+is large enough to hide that latency, or once per-domain limits bind.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiosmtpd.controller import Controller
+
+from delivery import DeliveryPool, SMTPConnection
+
+
+class RecordingHandler:
+    """aiosmtpd handler that advertises PIPELINING, records messages and can refuse recipients.
+
+    ``replies`` maps a recipient to a list of RCPT replies used in order; an
+    exhausted or missing list accepts the recipient.
+    """
+
+    def __init__(self, latency: float = 0.0, replies: Optional[Dict[str, List[str]]] = None):
+        self.latency = latency
+        self.replies = {recipient: list(codes) for recipient, codes in (replies or {}).items()}
+        self.messages = []
+        self.sessions = 0
+        self.lock = threading.Lock()
+        self.active = Counter()
+        self.peak = Counter()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        with self.lock:
+            self.sessions += 1
+        return responses[:-1] + ['250-PIPELINING', responses[-1]]
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        with self.lock:
+            queued = self.replies.get(address)
+            reply = queued.pop(0) if queued else None
+        if reply:
+            return reply
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        domains = {address.rsplit('@', 1)[-1] for address in envelope.rcpt_tos}
+        with self.lock:
+            for domain in domains:
+                self.active[domain] += 1
+                self.peak[domain] = max(self.peak[domain], self.active[domain])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        with self.lock:
+            for domain in domains:
+                self.active[domain] -= 1
+            self.messages.append((envelope.rcpt_tos[0], envelope.content))
+        return '250 Message accepted'
+
+
+def run_batch(port: int, handler: RecordingHandler, messages: int, pool_size: int, domains: int,
+              per_domain: int) -> Dict:
+    data = b'Subject: Benchmark\r\nFrom: recruiter@helix.test\r\n\r\nHello from the benchmark.\r\n'
+    pool = DeliveryPool(lambda: SMTPConnection('127.0.0.1', port), size=pool_size, per_domain=per_domain)
+    before = len(handler.messages)
+    started = time.perf_counter()
+    pool.start()
+    for i in range(messages):
+        pool.submit({'id': i, 'sender': 'recruiter@helix.test', 'recipient': f'candidate{i}@domain{i % domains}.test',
+                     'data': data})
+    pool.join()
+    elapsed = time.perf_counter() - started
+    pool.stop()
+    statuses = Counter(update['status'] for update in pool.drain_updates())
+    return {
+        'pool_size': pool_size,
+        'messages': messages,
+        'delivered': len(handler.messages) - before,
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(messages / elapsed, 1),
+        'statuses': dict(statuses)
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Helix SMTP delivery benchmark')
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--pool-sizes', default='1,2,4,8,16')
+    parser.add_argument('--latency', type=float, default=0.01, help='server seconds per accepted message')
+    parser.add_argument('--domains', type=int, default=20, help='distinct recipient domains')
+    parser.add_argument('--per-domain', type=int, default=4, help='concurrent sends per domain')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    handler = RecordingHandler(latency=args.latency)
+    controller = Controller(handler, hostname='127.0.0.1', port=args.port)
+    controller.start()
+    try:
+        results = [run_batch(args.port, handler, args.messages, int(size), args.domains, args.per_domain)
+                   for size in args.pool_sizes.split(',')]
+    finally:
+        controller.stop()
+
+    print(f"{'pool':>6} {'msgs/s':>10} {'seconds':>9} {'delivered':>10}")
+    for result in results:
+        print(f"{result['pool_size']:>6} {result['messages_per_second']:>10} {result['seconds']:>9} "
+              f"{result['delivered']:>10}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'latency': args.latency, 'domains': args.domains, 'per_domain': args.per_domain,
+                       'results': results}, f, indent=2)
+    return 0 if all(result['delivered'] == result['messages'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
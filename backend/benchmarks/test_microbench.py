@@ -0,0 +1,274 @@
+"""Microbenchmarks for the pure-Python paths that run on every message, and the
+SQLite queries whose cost must not grow with the stored data.
+
+Run through ``python -m benchmarks.micro`` to save or compare baselines.
+"""
+import io
+import json
+import logging
+import random
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+
+pytest.importorskip('pytest_benchmark')
+
+from ai import RecruitingAI
+from candidates import CandidateIndex, match_query
+from engagement import EngagementBuffer, parse_event
+from extraction import FIELDS, ContextExtractor
+from llm_backend import parse_model_json
+from mail_merge import SequenceTemplate
+from models import EmailSequence
+from response_handler import HelixResponseHandler
+from search import create_search_schema, index_sequence, search_sequences
+from structured_logging import CountingHandler, LogPipeline, Sampler, StructuredFormatter
+from variants import score_sequence
+
+HISTORY_LENGTHS = [1, 10, 100, 500]
+STEP_COUNTS = [1, 3, 5]
+CANDIDATES = 20000
+
+TURNS = [
+    "We're hiring a senior backend engineer for our payments team.",
+    "Our startup is on a mission to make cross-border payments instant.",
+    "Requirements: 5+ years of experience with Go and strong system design skills.",
+    "It's a unique chance to own an exciting, cutting-edge platform.",
+    "Sounds good, what else do you need from me?",
+]
+
+
+def make_history(turns: int):
+    return [
+        {'role': 'user' if i % 2 == 0 else 'assistant', 'content': TURNS[i % len(TURNS)]}
+        for i in range(turns)
+    ]
+
+
+def make_sequence(steps: int):
+    return [
+        {'subject': f'Step {i + 1}: Senior Backend Engineer at Acme',
+         'body': 'Hi there,\n\n' + 'We are building real-time payment rails in Go. ' * 8 + '\n\nBest,\nSam'}
+        for i in range(steps)
+    ]
+
+
+@pytest.fixture(scope='module')
+def handler():
+    return HelixResponseHandler()
+
+
+@pytest.fixture(scope='module')
+def recruiting_ai():
+    return RecruitingAI(api_key='offline')
+
+
+@pytest.mark.parametrize('steps', STEP_COUNTS)
+def test_parse_fenced_model_json(benchmark, steps):
+    text = '```json\n' + json.dumps(make_sequence(steps), indent=2) + '\n```'
+    result = benchmark(parse_model_json, text)
+    assert len(result) == steps
+
+
+def test_render_template(benchmark):
+    template = SequenceTemplate([{
+        'subject': '{{first_name | Hi}}, a Staff Engineer role at Acme',
+        'body': 'Hi {{first_name}},\n\n{{#if github_top_repo}}I enjoyed reading {{github_top_repo}}.{{else}}'
+                'Your work stood out.{{/if}} Your experience with {{skills}} over {{years_experience}} years '
+                'at {{current_company}} is a great fit.'
+    }] * 4)
+    candidate = {'first_name': 'Ada', 'skills': ['Python', 'Rust', 'Go'], 'years_experience': 7.0,
+                 'current_company': 'Initech', 'github_top_repo': 'fastqueue'}
+    result = benchmark(template.render, candidate)
+    assert result[0]['subject'].startswith('Ada')
+
+
+@pytest.mark.parametrize('message', [
+    "Looking for a founding engineer with Rust experience.",
+    "We are recruiting for a staff data platform position in Berlin.",
+    "Our company needs someone great; they should have 7 years experience as a product lead.",
+])
+def test_extract_role_info(benchmark, recruiting_ai, message):
+    benchmark(recruiting_ai._extract_role_info, message)
+
+
+@pytest.mark.parametrize('turns', HISTORY_LENGTHS)
+def test_update_required_info_over_history(benchmark, handler, turns):
+    history = make_history(turns)
+
+    def run():
+        handler.reset()
+        for message in history:
+            handler.update_required_info(message['content'])
+    benchmark(run)
+
+
+@pytest.mark.parametrize('turns', HISTORY_LENGTHS)
+def test_should_generate_email(benchmark, handler, turns):
+    handler.conversation_history = make_history(turns)
+    benchmark(handler.should_generate_email)
+
+
+@pytest.mark.parametrize('turns', HISTORY_LENGTHS)
+def test_format_history(benchmark, handler, turns):
+    history = make_history(turns)
+    result = benchmark(handler.format_history, history)
+    assert result.count('\n') == turns - 1
+
+
+@pytest.mark.parametrize('turns', HISTORY_LENGTHS)
+def test_load_prompt(benchmark, handler, turns):
+    context = handler.build_generation_context(make_history(turns), 'tech_expert')
+    prompt = benchmark(handler.load_prompt, 'generate_email_prompt.txt', context)
+    assert '{{persona}}' not in prompt
+
+
+@pytest.mark.parametrize('steps', STEP_COUNTS)
+def test_email_sequence_to_dict(benchmark, steps):
+    sequence = EmailSequence(id=1, content=json.dumps(make_sequence(steps), indent=2),
+                             persona='tech_expert', tone='casual', sequence_type='passive',
+                             created_at=datetime(2024, 1, 1))
+    benchmark(sequence.to_dict)
+
+
+def test_ingest_engagement_event(benchmark):
+    buffer = EngagementBuffer()
+    data = {'type': 'open', 'message_id': '<helix.12.2.0123456789abcdef@helix.test>', 'recipient': 'a@x.com',
+            'timestamp': '2024-05-01T10:00:00Z'}
+    benchmark(lambda: buffer.record_event(parse_event(data)))
+    assert len(buffer.opens) == 1
+
+
+@pytest.mark.parametrize('steps', STEP_COUNTS)
+def test_score_sequence_variant(benchmark, steps):
+    score = benchmark(score_sequence, make_sequence(steps))
+    assert 0 < score <= 1
+
+
+@pytest.fixture(scope='module')
+def candidate_index():
+    rng = random.Random(7)
+    titles = [f'{seniority} {area} {role}'.strip() for seniority in ('', 'Senior', 'Staff', 'Founding')
+              for area in ('Backend', 'Frontend', 'Data', 'Platform', 'Mobile', 'Security')
+              for role in ('Engineer', 'Developer', 'Scientist', 'Manager')]
+    skills = ['python', 'go', 'rust', 'java', 'kubernetes', 'react', 'typescript', 'postgres', 'aws', 'pytorch',
+              'spark', 'swift'] + [f'skill{i}' for i in range(500)]
+    words = [f'word{i}' for i in range(5000)]
+    index = CandidateIndex()
+    index.upsert([{'id': doc, 'current_title': rng.choice(titles), 'skills': rng.sample(skills[:12], 2)
+                   + rng.sample(skills, 3), 'summary': ' '.join(rng.choices(words, k=30))}
+                  for doc in range(1, CANDIDATES + 1)])
+    return index
+
+
+@pytest.mark.parametrize('role, requirements', [
+    ('senior backend engineer', 'python kubernetes postgres aws'),
+    ('data scientist', 'pytorch spark python'),
+    ('founding engineer', 'rust'),
+])
+def test_match_candidates(benchmark, candidate_index, role, requirements):
+    weights = match_query(role, requirements)
+    found = benchmark(candidate_index.search, weights, 10)
+    assert len(found) == 10
+
+
+@pytest.fixture(scope='module')
+def search_connection():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        create_search_schema(connection)
+        for doc in range(1, 5001):
+            index_sequence(connection, doc, json.dumps([{'subject': f'Compiler role {doc}',
+                                                         'body': f'Filler about team {doc}.'}]),
+                           'tech_expert', 'casual')
+        index_sequence(connection, 5001, json.dumps([{'subject': 'Marmoset compiler engineer',
+                                                      'body': 'LLVM backends.'}]), 'tech_expert', 'casual')
+        yield connection
+
+
+def test_search_sequences(benchmark, search_connection):
+    results = benchmark(search_sequences, search_connection, 'marmoset compiler')
+    assert [result['sequence_id'] for result in results] == [5001]
+
+
+class NullStream(io.TextIOBase):
+    def write(self, text):
+        return len(text)
+
+
+def chat_event_payload():
+    history = make_history(10)
+    sequence = make_sequence(3)
+    response = json.dumps({'action': 'tool', 'tool': 'generate_sequence', 'args': {'tone': 'casual'}})
+    return ({'message': TURNS[0], 'messages': history, 'persona': 'tech_expert', 'tone': 'casual'},
+            response, json.loads(response), sequence, json.dumps(sequence, indent=2))
+
+
+def eager_event(logger, data, response, parsed, sequence, sequence_text):
+    """The log calls of one chat_message that generates a sequence, as f-strings at INFO."""
+    logger.info(f"Received chat message: {data}")
+    logger.info(f"Gemini response: {response}")
+    logger.info(f"Parsed response: {parsed}")
+    logger.info(f"Generating sequence with data: {data}")
+    logger.info(f"Generated sequence response: {sequence_text}")
+    logger.info(f"Parsed sequence: {sequence}")
+    logger.info(f"Analyzing sequence: {sequence}")
+    logger.info(f"Stored sequence in database with ID: {42}")
+
+
+def structured_event(logger, data, response, parsed, sequence, sequence_text):
+    """The same event as app.py logs it now."""
+    logger.debug("Received chat message: %s", data)
+    logger.info("Received chat message", extra={'chars': len(data['message']), 'turns': len(data['messages']),
+                                                'persona': data['persona'], 'conversation_id': None})
+    logger.debug("Gemini response: %s", response)
+    logger.info("Parsed response", extra={'action': parsed.get('action'), 'tool': parsed.get('tool')})
+    logger.debug("Generating sequence with data: %s", data)
+    logger.info("Generating sequence", extra={'turns': len(data['messages']), 'tone': 'casual',
+                                              'sequence_type': 'passive', 'speculative': False})
+    logger.debug("Generated sequence response: %s", sequence_text)
+    logger.debug("Parsed sequence: %s", sequence)
+    logger.debug("Analyzing sequence: %s", sequence)
+    logger.info("Stored sequence in database", extra={'sequence_id': 42})
+
+
+@pytest.mark.parametrize('style', ['eager', 'structured'])
+def test_log_chat_event(benchmark, style):
+    logger = logging.getLogger(f'bench.{style}')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    payload = chat_event_payload()
+    if style == 'eager':
+        # The previous setup: basicConfig's stream handler, written on the calling thread
+        sink = CountingHandler(NullStream())
+        sink.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        logger.addHandler(sink)
+        benchmark(eager_event, logger, *payload)
+        logger.removeHandler(sink)
+        records_per_event = 8
+    else:
+        sink = CountingHandler(NullStream())
+        sink.setFormatter(StructuredFormatter())
+        # Sampling would hide most repeats of the same event; bytes are compared unsampled
+        pipeline = LogPipeline(sink, queue_size=100000, sampler=Sampler(burst=0)).install(logger, logging.INFO)
+        benchmark(structured_event, logger, *payload)
+        pipeline.stop()
+        records_per_event = 4
+    assert sink.records % records_per_event == 0 and sink.records
+    benchmark.extra_info['bytes_per_event'] = sink.bytes * records_per_event // sink.records
+
+
+@pytest.mark.parametrize('turns', HISTORY_LENGTHS)
+def test_extract_context_per_turn(benchmark, turns):
+    # A summary after the turns before the last were read: only the last one is new
+    history = make_history(turns)
+    extractor = ContextExtractor()
+
+    def setup():
+        extractor.forget('bench')
+        extractor.extract(history[:-1], key='bench')
+        return (history,), {'key': 'bench'}
+    result = benchmark.pedantic(extractor.extract, setup=setup, rounds=200)
+    assert set(result.summary) == set(FIELDS)
+    benchmark.extra_info['avg_turn_us'] = extractor.stats()['avg_turn_us']
@@ -0,0 +1,273 @@
+"""Bulk campaign generation.
+
+A campaign is a CSV/JSONL file of ``EmailConfig``-like rows. Rows are stored
+up front, generated in parallel through a bounded, rate-limited thread pool
+and committed in batches, so a crashed or stopped campaign resumes with only
+the rows that are not yet done.
+"""
+import csv
+import io
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import or_, update
+
+from models import db, Campaign, CampaignRow, EmailSequence
+from recruiting_graph import request_email_sequence, EmailConfig
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+MAX_STEP_COUNT = 5
+
+
+class RateLimiter:
+    """Token bucket shared by all pool workers."""
+
+    def __init__(self, per_minute: int, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be made; a rate of zero disables limiting."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+def normalize_row(row: Dict) -> Dict:
+    """Validate one input row and fill ``EmailConfig`` defaults."""
+    role = (row.get('role') or '').strip()
+    if not role:
+        raise ValueError("Each campaign row needs a role")
+    try:
+        step_count = int(row.get('step_count') or 3)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid step_count for role {role}: {row.get('step_count')}")
+    return {
+        'role': role,
+        'tone': (row.get('tone') or 'professional').strip(),
+        'company_info': (row.get('company_info') or 'Not provided').strip(),
+        'step_count': min(max(1, step_count), MAX_STEP_COUNT),
+        'persona': (row.get('persona') or 'corporate_pro').strip(),
+        'sequence_type': (row.get('sequence_type') or 'passive').strip()
+    }
+
+
+def parse_campaign_rows(text: str, file_format: str = 'csv') -> List[Dict]:
+    """Parse a CSV (with header) or JSONL campaign file."""
+    if file_format == 'csv':
+        rows = list(csv.DictReader(io.StringIO(text)))
+    elif file_format == 'jsonl':
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        raise ValueError(f"Unsupported campaign format: {file_format}")
+    if not rows:
+        raise ValueError("Campaign file has no rows")
+    return [normalize_row(row) for row in rows]
+
+
+def create_campaign(rows: List[Dict], name: Optional[str] = None) -> Campaign:
+    """Store a campaign and its input rows."""
+    campaign = Campaign(name=name, total_rows=len(rows))
+    db.session.add(campaign)
+    db.session.flush()
+    db.session.add_all([
+        CampaignRow(campaign_id=campaign.id, row_index=index, config=row)
+        for index, row in enumerate(rows)
+    ])
+    db.session.commit()
+    logger.info("Created campaign %s with %s rows", campaign.id, len(rows))
+    return campaign
+
+
+def claim_campaign(campaign_id: int, stale_after: float = 120) -> bool:
+    """Mark a campaign running unless a live runner has it; False when one does.
+
+    A running campaign whose heartbeat is older than ``stale_after`` seconds
+    belongs to a runner that crashed and may be claimed again.
+    """
+    now = datetime.utcnow()
+    result = db.session.execute(update(Campaign).where(
+        Campaign.id == campaign_id,
+        or_(Campaign.status != 'running', Campaign.heartbeat_at.is_(None),
+            Campaign.heartbeat_at < now - timedelta(seconds=stale_after))
+    ).values(status='running', heartbeat_at=now))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def campaign_room(campaign_id: int) -> str:
+    return f"campaign:{campaign_id}"
+
+
+class CampaignRunner:
+    """Generate the unfinished rows of one campaign.
+
+    ``generate`` must raise when it cannot produce a sequence, so the row is
+    marked failed and retried on resume. Workers only call the model; results are handed back to the calling
+    thread, which owns the DB session and commits them ``batch_size`` at a
+    time before reporting per-row progress through ``emit``.
+    """
+
+    def __init__(self, campaign_id: int,
+                 generate: Callable[[EmailConfig], List[Dict]] = request_email_sequence,
+                 emit: Optional[Callable[[str, Dict], None]] = None,
+                 max_workers: int = 8,
+                 requests_per_minute: int = 60,
+                 batch_size: int = 10,
+                 flush_interval: float = 2.0):
+        self.campaign_id = campaign_id
+        self.generate = generate
+        self.emit = emit or (lambda event, data: None)
+        self.max_workers = max(1, max_workers)
+        self.limiter = RateLimiter(requests_per_minute, burst=self.max_workers)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.processed = 0
+        self.started = None
+        self.beat = 0.0
+
+    def _generate(self, config: Dict) -> List[Dict]:
+        self.limiter.acquire()
+        email_config = EmailConfig(
+            role=config['role'],
+            tone=config['tone'],
+            company_info=config['company_info'],
+            step_count=config['step_count']
+        )
+        sequence = self.generate(email_config)
+        if not isinstance(sequence, list) or not sequence:
+            raise ValueError("Model returned an empty sequence")
+        return sequence
+
+    def rows_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return round(self.processed / elapsed * 60, 1) if elapsed > 0 else 0.0
+
+    def _heartbeat(self, campaign: Campaign):
+        """Show other workers this campaign is still being run (see claim_campaign)."""
+        if time.monotonic() - self.beat >= self.flush_interval:
+            campaign.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+            self.beat = time.monotonic()
+
+    def _flush(self, campaign: Campaign, results: List):
+        """Persist a batch of (row, sequence, error) results in one commit."""
+        sequences = {}
+        for row, sequence, error in results:
+            if error is None:
+                sequences[row.id] = EmailSequence(
+                    content=json.dumps(sequence, indent=2),
+                    persona=row.config.get('persona', 'corporate_pro'),
+                    tone=row.config.get('tone'),
+                    sequence_type=row.config.get('sequence_type')
+                )
+        db.session.add_all(sequences.values())
+        db.session.flush()
+
+        now = datetime.utcnow()
+        for row, sequence, error in results:
+            row.attempts += 1
+            row.completed_at = now
+            if error is None:
+                row.status = 'done'
+                row.error = None
+                row.sequence_id = sequences[row.id].id
+                campaign.completed_rows += 1
+            else:
+                row.status = 'failed'
+                row.error = error
+        db.session.commit()
+
+        self.processed += len(results)
+        for row, sequence, error in results:
+            self.emit('campaign_progress', {
+                'campaign_id': campaign.id,
+                'row_index': row.row_index,
+                'status': row.status,
+                'sequence_id': row.sequence_id,
+                'error': row.error,
+                'completed_rows': campaign.completed_rows,
+                'total_rows': campaign.total_rows,
+                'rows_per_minute': self.rows_per_minute()
+            })
+
+    def run(self) -> Dict:
+        """Process every row that is not done yet; must run in an app context."""
+        campaign = db.session.get(Campaign, self.campaign_id)
+        if campaign is None:
+            raise ValueError(f"Campaign {self.campaign_id} not found")
+        rows = CampaignRow.query.filter(
+            CampaignRow.campaign_id == campaign.id,
+            CampaignRow.status != 'done'
+        ).order_by(CampaignRow.row_index).all()
+
+        campaign.status = 'running'
+        campaign.heartbeat_at = datetime.utcnow()
+        campaign.started_at = campaign.started_at or datetime.utcnow()
+        campaign.failed_rows = 0
+        db.session.commit()
+        logger.info("Running campaign %s: %s of %s rows left", campaign.id, len(rows), campaign.total_rows)
+
+        self.started = time.monotonic()
+        results = []
+        last_flush = time.monotonic()
+        pending_rows = iter(rows)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # Keep a bounded window of submitted rows so huge files do not
+            # queue thousands of futures at once
+            def submit_next():
+                row = next(pending_rows, None)
+                if row is not None:
+                    generate = tracer.bind(self._generate, 'campaign.row', **{'campaign.row': row.row_index})
+                    in_flight[pool.submit(generate, row.config)] = row
+
+            for _ in range(self.max_workers * 2):
+                submit_next()
+            while in_flight:
+                done, _ = wait(list(in_flight), timeout=self.flush_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row = in_flight.pop(future)
+                    try:
+                        results.append((row, future.result(), None))
+                    except Exception as e:
+                        logger.error("Campaign %s row %s failed: %s", campaign.id, row.row_index, e)
+                        results.append((row, None, str(e)))
+                    submit_next()
+                self._heartbeat(campaign)
+                if results and (len(results) >= self.batch_size or
+                                time.monotonic() - last_flush >= self.flush_interval):
+                    self._flush(campaign, results)
+                    results = []
+                    last_flush = time.monotonic()
+        if results:
+            self._flush(campaign, results)
+
+        campaign.failed_rows = CampaignRow.query.filter_by(campaign_id=campaign.id, status='failed').count()
+        campaign.status = 'completed' if campaign.failed_rows == 0 else 'completed_with_errors'
+        campaign.finished_at = datetime.utcnow()
+        db.session.commit()
+
+        summary = dict(campaign.to_dict(), rows_per_minute=self.rows_per_minute())
+        logger.info("Campaign %s finished: %s", campaign.id, summary)
+        self.emit('campaign_complete', summary)
+        return summary
@@ -0,0 +1,654 @@
+"""Candidate profiles and BM25 matching of roles to candidates.
+
+Profiles are imported in bulk from CSV or JSONL into ``candidates``. Their
+fields are the mail-merge placeholders, so a matched profile renders a
+:class:`mail_merge.SequenceTemplate` as is. Every write also appends a
+``candidate_changes`` row.
+
+:class:`CandidateIndex` is an in-process BM25 inverted index. It covers
+titles, headlines, skills and summaries, weighted 3, 2, 2 and 1.
+
+- Postings of a term are grouped by quantized impact, the BM25
+  term-frequency and length factor, in ``LEVELS`` levels. Groups holding a
+  fair share of a segment are bitmaps (Python ints, one bit per doc). The
+  others are packed positions. Neither takes more than 4 bytes a posting.
+- A query is a best-first search over bitmaps of docs that agree on their
+  levels for the query terms taken so far, ordered by the most they can
+  score. It is split with ``&`` on whole bitmaps, 64 docs a machine word,
+  and stops once K docs are out. Queries therefore touch far less than
+  their postings, and the top K is exact for the quantized scores.
+- Each batch of writes becomes a new immutable segment. Replaced and
+  deleted docs are masked until their segment is merged.
+
+Each worker holds its own index. It loads the snapshot at
+``CANDIDATE_INDEX_PATH`` and replays ``candidate_changes`` past the
+snapshot's seq. It does this again before a match, at most every
+``CANDIDATE_SYNC_SECONDS``. Seqs are taken when a write starts but become
+visible when it commits, so a seq skipped over is kept as a gap and read
+again on later syncs until it shows up or ``SYNC_GAP_SECONDS`` pass, which
+is how long a rolled-back write leaves it missing.
+
+    python candidates.py snapshot    # merge into one segment and write the snapshot
+"""
+import argparse
+import csv
+import heapq
+import io
+import json
+import logging
+import marshal
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+
+from models import db, Candidate, CandidateChange
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+# Impact levels; more rank closer to exact BM25 but give a query more bitmaps to split
+LEVELS = 8
+FIELD_WEIGHTS = {'current_title': 3, 'linkedin_headline': 2, 'skills': 2, 'summary': 1}
+# Role terms count this many times a requirement term
+ROLE_WEIGHT = 2
+# Level groups holding at least 1/DENSE of a segment are kept as bitmaps
+DENSE = 32
+# Bitmaps made per segment for sparse groups of recent queries
+BITMAP_CACHE_SIZE = 64
+MAX_SEGMENTS = 8
+# Segments with this share of masked docs are rewritten
+MAX_DEAD_RATIO = 0.3
+SNAPSHOT_VERSION = 2
+SYNC_BATCH_SIZE = 5000
+# How long a missing seq is looked for before its write is taken as rolled back
+SYNC_GAP_SECONDS = 300.0
+IMPORT_BATCH_SIZE = 1000
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+TEXT_FIELDS = {
+    'external_id': 200, 'email': 320, 'first_name': 100, 'last_name': 100, 'current_title': 200,
+    'current_company': 200, 'location': 200, 'summary': 5000, 'github_url': 300, 'github_top_repo': 200,
+    'linkedin_url': 300, 'linkedin_headline': 300, 'recent_achievement': 1000,
+}
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it of on or our the to we with you your '
+    'year years experience strong good great'.split())
+
+_ONES = re.compile('1')
+_TOKENS = re.compile(r'[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*')
+_SKILL_SEPARATORS = re.compile(r'[,;|]')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; keeps c++, c# and node.js whole and folds simple plurals."""
+    tokens = []
+    for token in _TOKENS.findall(text.lower()):
+        if token in STOPWORDS or token.isdigit():
+            continue
+        if len(token) > 4 and token.endswith('s') and not token.endswith('ss') and token.isalpha():
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def analyze(candidate: Dict) -> Tuple[Counter, int]:
+    """Field-weighted term frequencies of a profile and its weighted length."""
+    frequencies = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = candidate.get(field)
+        if isinstance(value, list):
+            value = ' '.join(str(item) for item in value)
+        for token in tokenize(value or ''):
+            frequencies[token] += weight
+    return frequencies, sum(frequencies.values())
+
+
+def match_query(role: Optional[str], requirements=None) -> Dict[str, float]:
+    """Query term weights for a role and its requirements (a string or a list)."""
+    weights = Counter()
+    for token in tokenize(role or ''):
+        weights[token] += ROLE_WEIGHT
+    if isinstance(requirements, (list, tuple)):
+        requirements = ' '.join(str(item) for item in requirements)
+    for token in tokenize(requirements or ''):
+        weights[token] += 1
+    return dict(weights)
+
+
+def _level(impact: float) -> int:
+    return max(1, min(LEVELS, math.ceil(impact / (K1 + 1) * LEVELS)))
+
+
+def bitmap(positions: Iterable[int], size: int) -> int:
+    """An int with bit ``n`` set for each position ``n``."""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def set_bits(bits: int) -> List[int]:
+    """The positions set in a bitmap, lowest first."""
+    return [match.start() for match in _ONES.finditer(bin(bits)[:1:-1])]
+
+
+class Segment:
+    """Postings of one batch of candidates; later writes mask docs in ``dead``.
+
+    Docs are numbered by their position in ``ids``. A term maps to its
+    ``(level, docs)`` groups, highest level first. ``docs`` is a bitmap when
+    the group holds at least 1/``DENSE`` of the segment, and the positions
+    as packed 32-bit ints (``bytes``) otherwise, so neither takes more than
+    4 bytes a posting.
+    """
+    __slots__ = ('ids', 'terms', 'df', 'dead', 'cache')
+
+    def __init__(self, ids: array, terms: Dict[str, tuple], dead: Optional[set] = None):
+        # Sorted candidate IDs
+        self.ids = ids
+        self.terms = terms
+        self.df = {term: sum(docs.bit_count() if isinstance(docs, int) else len(docs) // 4 for _, docs in groups)
+                   for term, groups in terms.items()}
+        # Positions of replaced and deleted docs
+        self.dead = dead or set()
+        # Bitmaps of recently queried sparse groups, and of ``dead``
+        self.cache: 'OrderedDict[tuple, int]' = OrderedDict()
+
+    @classmethod
+    def build(cls, ids: Iterable[int], postings: Dict[str, Dict[int, List[int]]]) -> 'Segment':
+        """A segment from term -> {level: [candidate ID, ...]}."""
+        ids = array('i', sorted(ids))
+        where = {doc: position for position, doc in enumerate(ids)}
+        terms = {}
+        for term, levels in postings.items():
+            groups = []
+            for level in sorted(levels, reverse=True):
+                found = sorted(map(where.__getitem__, levels[level]))
+                if found:
+                    groups.append((level, bitmap(found, len(ids)) if len(found) * DENSE >= len(ids)
+                                   else array('i', found).tobytes()))
+            if groups:
+                terms[sys.intern(term)] = tuple(groups)
+        return cls(ids, terms)
+
+    @property
+    def live(self) -> int:
+        return len(self.ids) - len(self.dead)
+
+    def mask(self, doc: int) -> bool:
+        """Mask a candidate held by this segment; False if it holds none."""
+        position = bisect_left(self.ids, doc)
+        if position == len(self.ids) or self.ids[position] != doc or position in self.dead:
+            return False
+        self.dead.add(position)
+        self.cache.pop('dead', None)
+        return True
+
+    def _bitmap(self, key, docs) -> int:
+        if isinstance(docs, int):
+            return docs
+        bits = self.cache.get(key)
+        if bits is None:
+            bits = bitmap(memoryview(docs).cast('i') if isinstance(docs, bytes) else docs, len(self.ids))
+            self.cache[key] = bits
+            if len(self.cache) > BITMAP_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return bits
+
+    def search(self, weights: Dict[str, float], k: int, floor: float = 0.0) -> List[Tuple[float, int]]:
+        """Exact top ``k`` (score, candidate ID) of this segment for scaled term weights.
+
+        A best-first search over the docs matching any term. A node is a
+        bitmap of docs that agree on their levels for the first terms, with
+        the most any of them can score. Splitting it on the next term gives a
+        child per level and one for docs without the term; each child is
+        made only once its bound comes up. Past the last term a node's docs
+        score exactly its bound. Nothing that cannot beat ``floor``, the
+        K-th score of segments searched before, is expanded.
+        """
+        terms = []
+        for term, weight in weights.items():
+            groups = self.terms.get(term)
+            if groups:
+                levels = [(weight * level, self._bitmap((term, level), docs)) for level, docs in groups]
+                present = 0
+                for _, bits in levels:
+                    present |= bits
+                terms.append((levels[0][0], levels, present))
+        if not terms:
+            return []
+        terms.sort(key=lambda entry: entry[0], reverse=True)
+        root = 0
+        for _, _, present in terms:
+            root |= present
+        if self.dead:
+            root &= ~self._bitmap('dead', sorted(self.dead))
+
+        results = []
+        tiebreak = count()
+        # (-bound, tiebreak, depth, docs, level of the child to make next or
+        # -1 for a node, bound of the parent without term ``depth``)
+        heap = [(-sum(entry[0] for entry in terms), 0, 0, root, -1, 0.0)]
+        while heap and len(results) < k:
+            bound, _, depth, bits, level, base = heapq.heappop(heap)
+            if -bound <= floor:
+                break
+            if level < 0:
+                if depth == len(terms):
+                    while bits and len(results) < k:
+                        position = bits.bit_length() - 1
+                        bits ^= 1 << position
+                        results.append((-bound, self.ids[position]))
+                    continue
+                base = -bound - terms[depth][0]
+                heapq.heappush(heap, (bound, next(tiebreak), depth, bits, 0, base))
+                continue
+            _, levels, present = terms[depth]
+            if level < len(levels):
+                child = bits & levels[level][1]
+                following = base + levels[level + 1][0] if level + 1 < len(levels) else base
+                heapq.heappush(heap, (-following, next(tiebreak), depth, bits, level + 1, base))
+            else:
+                child = bits & ~present
+            if child:
+                heapq.heappush(heap, (bound, next(tiebreak), depth + 1, child, -1, 0.0))
+        return results
+
+    def dump(self) -> Dict:
+        return {
+            'ids': self.ids.tobytes(),
+            'dead': sorted(self.dead),
+            'terms': self.terms
+        }
+
+    @classmethod
+    def load(cls, data: Dict) -> 'Segment':
+        def ints(raw):
+            values = array('i')
+            values.frombytes(raw)
+            return values
+        return cls(ints(data['ids']), data['terms'], set(data['dead']))
+
+
+def merge_segments(segments: List[Segment]) -> Segment:
+    """One segment holding the live docs of ``segments``."""
+    ids = []
+    postings = defaultdict(lambda: defaultdict(list))
+    for segment in segments:
+        dead = segment.dead
+        ids.extend(doc for position, doc in enumerate(segment.ids) if position not in dead)
+        for term, groups in segment.terms.items():
+            levels = postings[term]
+            for level, docs in groups:
+                found = set_bits(docs) if isinstance(docs, int) else memoryview(docs).cast('i')
+                if dead:
+                    found = [position for position in found if position not in dead]
+                levels[level].extend(map(segment.ids.__getitem__, found))
+    return Segment.build(ids, postings)
+
+
+class CandidateIndex:
+    """Segmented BM25 index of candidate profiles."""
+
+    def __init__(self, max_segments: int = MAX_SEGMENTS):
+        self.max_segments = max_segments
+        self.lock = threading.RLock()
+        self.segments: List[Segment] = []
+        self.doc_count = 0
+        # Weighted length of all live docs, for the average in BM25's length norm
+        self.total_length = 0.0
+        # Last candidate_changes row applied, and the seqs below it not seen yet
+        self.seq = 0
+        self.gaps: List[int] = []
+
+    def _average_length(self) -> float:
+        return self.total_length / self.doc_count if self.doc_count else 1.0
+
+    def _mask(self, ids: Iterable[int]):
+        for doc in ids:
+            for segment in self.segments:
+                if segment.mask(doc):
+                    self.total_length = max(0.0, self.total_length - self._average_length())
+                    self.doc_count -= 1
+                    break
+
+    def upsert(self, candidates: List[Dict]):
+        """Index profiles (dicts with an ``id``), replacing earlier versions."""
+        analyzed = {candidate['id']: analyze(candidate) for candidate in candidates}
+        if not analyzed:
+            return
+        with self.lock:
+            self._mask(analyzed)
+            self.doc_count += len(analyzed)
+            self.total_length += sum(length for _, length in analyzed.values())
+            average = self._average_length()
+            postings = defaultdict(lambda: defaultdict(list))
+            for doc, (frequencies, length) in analyzed.items():
+                norm = K1 * (1 - B + B * length / average)
+                for term, frequency in frequencies.items():
+                    postings[term][_level(frequency * (K1 + 1) / (frequency + norm))].append(doc)
+            self.segments.append(Segment.build(analyzed, postings))
+            self._merge()
+
+    def remove(self, ids: Iterable[int]):
+        with self.lock:
+            self._mask(ids)
+            self._merge()
+
+    def compact(self):
+        """Merge all segments into one, the fastest layout to search."""
+        with self.lock:
+            if len(self.segments) > 1 or any(segment.dead for segment in self.segments):
+                self.segments = [merge_segments(self.segments)]
+
+    def _merge(self):
+        self.segments = [merge_segments([segment]) if len(segment.dead) > MAX_DEAD_RATIO * len(segment.ids)
+                         else segment for segment in self.segments]
+        self.segments = [segment for segment in self.segments if len(segment.ids)]
+        while len(self.segments) > self.max_segments:
+            self.segments.sort(key=lambda segment: segment.live, reverse=True)
+            self.segments.append(merge_segments([self.segments.pop(), self.segments.pop()]))
+
+    def search(self, weights: Dict[str, float], k: int = DEFAULT_LIMIT) -> List[Tuple[float, int]]:
+        """Top ``k`` (score, candidate ID) for query term weights, best first."""
+        with self.lock:
+            total = max(self.doc_count, 1)
+            scaled = {}
+            for term, weight in weights.items():
+                df = sum(segment.df.get(term, 0) for segment in self.segments)
+                if df:
+                    idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                    scaled[term] = weight * idf * (K1 + 1) / LEVELS
+            results: List[Tuple[float, int]] = []
+            # Largest segments first, so later ones start from a high K-th score
+            for segment in sorted(self.segments, key=lambda segment: segment.live, reverse=True):
+                floor = results[-1][0] if len(results) == k else 0.0
+                results = heapq.nlargest(k, results + segment.search(scaled, k, floor))
+        return results
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'candidates': self.doc_count,
+                'segments': [segment.live for segment in self.segments],
+                'masked': sum(len(segment.dead) for segment in self.segments),
+                'terms': len({term for segment in self.segments for term in segment.terms}),
+                'postings': sum(sum(segment.df.values()) for segment in self.segments),
+                'seq': self.seq
+            }
+
+    def save(self, path: str):
+        """Write a snapshot atomically."""
+        with self.lock:
+            data = marshal.dumps({
+                'version': SNAPSHOT_VERSION,
+                'seq': self.seq,
+                'gaps': list(self.gaps),
+                'doc_count': self.doc_count,
+                'total_length': self.total_length,
+                'segments': [segment.dump() for segment in self.segments]
+            })
+        # A file of its own, so concurrent saves never write into each other's
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.candidates-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str, max_segments: int = MAX_SEGMENTS) -> 'CandidateIndex':
+        with open(path, 'rb') as f:
+            data = marshal.loads(f.read())
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported candidate index snapshot version: {data.get('version')}")
+        index = cls(max_segments)
+        index.seq = data['seq']
+        index.gaps = data['gaps']
+        index.doc_count = data['doc_count']
+        index.total_length = data['total_length']
+        index.segments = [Segment.load(segment) for segment in data['segments']]
+        return index
+
+
+def normalize_candidate(row: Dict) -> Dict:
+    """Validate one imported profile; raises ValueError."""
+    if not isinstance(row, dict):
+        raise ValueError('Each candidate must be an object')
+    candidate = {}
+    for field, limit in TEXT_FIELDS.items():
+        value = row.get(field)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if len(value) > limit:
+            raise ValueError(f'{field} is longer than {limit} characters')
+        candidate[field] = value or None
+    years = row.get('years_experience')
+    if years not in (None, ''):
+        try:
+            candidate['years_experience'] = int(float(years))
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid years_experience: {years}')
+    skills = row.get('skills')
+    if isinstance(skills, str):
+        skills = _SKILL_SEPARATORS.split(skills)
+    if skills is not None:
+        if not isinstance(skills, list):
+            raise ValueError('skills must be a list or a comma-separated string')
+        candidate['skills'] = [str(skill).strip() for skill in skills if str(skill).strip()]
+    if not any(candidate.get(field) for field in ('external_id', 'email', 'first_name', 'current_title')):
+        raise ValueError('Each candidate needs an external_id, email, first_name or current_title')
+    return candidate
+
+
+def parse_candidate_rows(text: str, file_format: str = 'csv') -> List[Dict]:
+    """Parse a CSV (with header) or JSONL candidate file."""
+    if file_format == 'csv':
+        rows = list(csv.DictReader(io.StringIO(text)))
+    elif file_format == 'jsonl':
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        raise ValueError(f"Unsupported candidate format: {file_format}")
+    if not rows:
+        raise ValueError("Candidate file has no rows")
+    return [normalize_candidate(row) for row in rows]
+
+
+def import_candidates(rows: List[Dict], batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+    """Insert or update normalized profiles, matched on external_id, else email.
+
+    Each batch is one commit together with its change log rows.
+    """
+    created = updated = 0
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        external_ids = [row['external_id'] for row in batch if row.get('external_id')]
+        emails = [row['email'] for row in batch if row.get('email') and not row.get('external_id')]
+        by_external = {candidate.external_id: candidate for candidate in
+                       Candidate.query.filter(Candidate.external_id.in_(external_ids))} if external_ids else {}
+        by_email = {candidate.email: candidate for candidate in
+                    Candidate.query.filter(Candidate.email.in_(emails))} if emails else {}
+        touched = []
+        for row in batch:
+            if row.get('external_id'):
+                candidate = by_external.get(row['external_id'])
+            else:
+                candidate = by_email.get(row.get('email')) if row.get('email') else None
+            if candidate is None:
+                candidate = Candidate(skills=[])
+                db.session.add(candidate)
+                created += 1
+                if row.get('external_id'):
+                    by_external[row['external_id']] = candidate
+                elif row.get('email'):
+                    by_email[row['email']] = candidate
+            else:
+                updated += 1
+            for field, value in row.items():
+                setattr(candidate, field, value)
+            touched.append(candidate)
+        db.session.flush()
+        db.session.execute(insert(CandidateChange), [{'candidate_id': candidate.id, 'deleted': False}
+                                                     for candidate in {id(c): c for c in touched}.values()])
+        db.session.commit()
+    return {'created': created, 'updated': updated}
+
+
+def delete_candidate(candidate_id: int) -> bool:
+    candidate = db.session.get(Candidate, candidate_id)
+    if candidate is None:
+        return False
+    db.session.delete(candidate)
+    db.session.add(CandidateChange(candidate_id=candidate_id, deleted=True))
+    db.session.commit()
+    return True
+
+
+class CandidateSearch:
+    """A worker's index, kept in step with the change log, and the matching API over it."""
+
+    def __init__(self, path: Optional[str] = None, sync_interval: float = 2.0, snapshot_every: int = 10000,
+                 gap_timeout: float = SYNC_GAP_SECONDS, clock=time.monotonic):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.gap_timeout = gap_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.index: Optional[CandidateIndex] = None
+        self.last_sync: Optional[float] = None
+        self.unsaved = 0
+        # When each of the index's gaps was first missed
+        self.missing_since: Dict[int, float] = {}
+
+    def _load(self) -> CandidateIndex:
+        if self.path and os.path.exists(self.path):
+            try:
+                return CandidateIndex.load(self.path)
+            except Exception as e:
+                logger.error("Error loading candidate index snapshot: %s", e)
+        return CandidateIndex()
+
+    def _apply(self, changes) -> int:
+        ids = list(dict.fromkeys(change.candidate_id for change in changes))
+        found = {}
+        for offset in range(0, len(ids), 500):
+            for candidate in Candidate.query.filter(Candidate.id.in_(ids[offset:offset + 500])):
+                found[candidate.id] = candidate.to_dict()
+        self.index.upsert([found[doc] for doc in ids if doc in found])
+        self.index.remove([doc for doc in ids if doc not in found])
+        return len(changes)
+
+    def _fill_gaps(self, now: float) -> int:
+        """Apply changes that committed after later seqs were read; forget gaps older than the timeout."""
+        applied = 0
+        for offset in range(0, len(self.index.gaps), 500):
+            changes = db.session.execute(
+                select(CandidateChange.seq, CandidateChange.candidate_id)
+                .where(CandidateChange.seq.in_(self.index.gaps[offset:offset + 500]))
+                .order_by(CandidateChange.seq)
+            ).all()
+            if changes:
+                applied += self._apply(changes)
+                filled = {change.seq for change in changes}
+                self.index.gaps = [seq for seq in self.index.gaps if seq not in filled]
+        gaps = []
+        for seq in self.index.gaps:
+            since = self.missing_since.setdefault(seq, now)
+            if now - since < self.gap_timeout:
+                gaps.append(seq)
+        self.index.gaps = gaps
+        self.missing_since = {seq: self.missing_since[seq] for seq in gaps}
+        return applied
+
+    def sync(self, force: bool = False) -> int:
+        """Apply change log rows past the index's seq or in its gaps; must run in an app context."""
+        with self.lock:
+            if self.index is None:
+                self.index = self._load()
+            now = self.clock()
+            if not force and self.last_sync is not None and now - self.last_sync < self.sync_interval:
+                return 0
+            self.last_sync = now
+            applied = self._fill_gaps(now) if self.index.gaps else 0
+            while True:
+                changes = db.session.execute(
+                    select(CandidateChange.seq, CandidateChange.candidate_id)
+                    .where(CandidateChange.seq > self.index.seq)
+                    .order_by(CandidateChange.seq)
+                    .limit(SYNC_BATCH_SIZE)
+                ).all()
+                if not changes:
+                    break
+                applied += self._apply(changes)
+                expected = self.index.seq + 1
+                for change in changes:
+                    for seq in range(expected, change.seq):
+                        self.index.gaps.append(seq)
+                        self.missing_since[seq] = now
+                    expected = change.seq + 1
+                self.index.seq = changes[-1].seq
+            self.unsaved += applied
+            if self.path and self.unsaved >= self.snapshot_every:
+                self.save()
+            return applied
+
+    def save(self):
+        self.index.save(self.path)
+        self.unsaved = 0
+        logger.info("Saved candidate index snapshot at seq %s", self.index.seq)
+
+    def match(self, role: Optional[str], requirements=None, limit: int = DEFAULT_LIMIT) -> Dict:
+        """Top candidates for a role and its requirements, with their profiles and scores."""
+        self.sync()
+        weights = match_query(role, requirements)
+        started = time.perf_counter()
+        hits = self.index.search(weights, min(max(1, limit), MAX_LIMIT)) if weights else []
+        took = time.perf_counter() - started
+        profiles = {candidate.id: candidate for candidate in
+                    Candidate.query.filter(Candidate.id.in_([doc for _, doc in hits]))} if hits else {}
+        return {
+            'role': role,
+            'terms': sorted(weights),
+            'took_ms': round(took * 1000, 3),
+            'candidates': [dict(profiles[doc].to_dict(), score=round(score, 4))
+                           for score, doc in hits if doc in profiles]
+        }
+
+    def stats(self) -> Dict:
+        if self.index is None:
+            return {'loaded': False}
+        return dict(self.index.stats(), loaded=True, unsaved_changes=self.unsaved)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Helix candidate match index')
+    parser.add_argument('command', choices=['snapshot'])
+    parser.parse_args()
+
+    from app import app, candidate_search
+    if not candidate_search.path:
+        raise SystemExit('Set CANDIDATE_INDEX_PATH to write a snapshot')
+    with app.app_context():
+        candidate_search.sync(force=True)
+        candidate_search.index.compact()
+        candidate_search.save()
+        print(f"Indexed {candidate_search.index.doc_count} candidates")
@@ -0,0 +1,66 @@
+"""Chat turn logic shared by the Flask-SocketIO server (app.py) and the asyncio server (asgi_app.py).
+
+Both servers answer ``chat_message`` the same way and differ only in how they
+wait on the model and the database, so the steps that do no I/O live here:
+reading the event, turning the model's reply into an answer or a tool call,
+and the answers sent when the model's reply is not usable.
+"""
+import json
+import logging
+from typing import Dict, NamedTuple, Optional
+
+from llm_backend import parse_model_json
+from recruiting_tools import chat_prompt
+
+logger = logging.getLogger(__name__)
+
+# Sent when the model's reply is not JSON
+CLARIFY = "I'm here to help you with recruiting. Could you tell me what role you're looking to hire for?"
+# Sent when a chat reply has no text
+FOLLOW_UP = "Could you tell me more about what you're looking for?"
+# Sent when a tool's result has no message
+TOOL_DONE = "I've processed your request. Let me know if you need any adjustments."
+
+
+class ChatTurn:
+    """The fields of one ``chat_message`` event."""
+
+    def __init__(self, data: Dict):
+        self.data = data
+        self.message = data.get('message', '')
+        self.messages = data.get('messages', [])
+        self.persona = data.get('persona')
+        self.conversation_id = data.get('conversation_id')
+        self.company_id = data.get('company_id')
+        self.tone = data.get('tone', 'professional')
+        self.sequence_type = data.get('sequenceType', 'passive')
+
+    def prompt(self, company: Optional[Dict] = None) -> str:
+        return chat_prompt(self.message, self.messages, self.persona, company)
+
+    def tool_args(self, args: Dict) -> Dict:
+        """A tool call's arguments with the conversation context added."""
+        return dict(args, messages=self.messages, persona=self.persona, company_id=self.company_id)
+
+
+class ChatAction(NamedTuple):
+    """What to do with the model's reply: answer with ``reply``, call ``tool``, or neither."""
+    reply: Optional[str] = None
+    tool: Optional[str] = None
+    args: Optional[Dict] = None
+
+
+def next_action(turn: ChatTurn, text: str, tools) -> ChatAction:
+    """Read the model's reply to ``turn``; ``tools`` are the tool names this server offers."""
+    try:
+        parsed = parse_model_json(text)
+    except json.JSONDecodeError as e:
+        logger.error("Failed to parse LLM response: %s", e)
+        logger.error("Raw response: %s", text)
+        return ChatAction(reply=CLARIFY)
+    logger.info("Parsed response", extra={'action': parsed.get('action'), 'tool': parsed.get('tool')})
+    if parsed.get('action') == 'chat':
+        return ChatAction(reply=parsed.get('response', FOLLOW_UP))
+    if parsed.get('action') == 'tool' and parsed.get('tool') in tools:
+        return ChatAction(tool=parsed['tool'], args=turn.tool_args(parsed.get('args', {})))
+    return ChatAction()
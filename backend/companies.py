@@ -0,0 +1,186 @@
+"""Company profiles with a cached compact summary for generation prompts.
+
+A recruiter describes the company once, as a :class:`models.Company` profile
+(name, industry, size, description, website). It is summarized once into at
+most ``SUMMARY_MAX_WORDS`` words. Short descriptions are summarized locally;
+longer ones take one model call. The summary is stored on the row with a
+hash of the profile it was made from. Prompts then carry that summary
+instead of the full profile or the conversation turns that explained the
+company again.
+
+:class:`CompanyStore` keeps recently used contexts in an in-process LRU.
+Saving a changed profile clears its summary and evicts it, so the next use
+summarizes again. Other workers notice within ``ttl`` seconds.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from models import db, Company
+
+PROFILE_FIELDS = ('name', 'industry', 'size', 'description', 'website')
+FIELD_LIMITS = {'name': 200, 'industry': 100, 'size': 50, 'description': 5000, 'website': 300}
+SUMMARY_MAX_WORDS = 60
+# Fields a generation prompt needs; the full description stays in the DB
+CONTEXT_FIELDS = ('id', 'name', 'industry', 'size', 'website', 'summary')
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def company_key(name: str) -> str:
+    """Normalized company name: case, spacing and punctuation are ignored."""
+    return _NON_WORD.sub(' ', name.lower()).strip()
+
+
+def parse_company(data: Dict, partial: bool = False) -> Dict:
+    """Validated profile fields from a request body; raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    fields = {}
+    for field in PROFILE_FIELDS:
+        if field not in data:
+            continue
+        value = data[field]
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f'{field} must be a string')
+        value = (value or '').strip() or None
+        if value and len(value) > FIELD_LIMITS[field]:
+            raise ValueError(f'{field} is longer than {FIELD_LIMITS[field]} characters')
+        fields[field] = value
+    if not partial and not fields.get('name'):
+        raise ValueError('name is required')
+    if 'name' in fields and not fields['name']:
+        raise ValueError('name cannot be empty')
+    return fields
+
+
+def profile_hash(profile: Dict) -> str:
+    payload = json.dumps([profile.get(field) for field in PROFILE_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def local_summary(profile: Dict) -> Optional[str]:
+    """A summary built without the model when the description is already short, else None."""
+    description = ' '.join((profile.get('description') or '').split())
+    if len(description.split()) > SUMMARY_MAX_WORDS - 10:
+        return None
+    kind = ' '.join(part for part in (profile.get('size'), profile.get('industry')) if part)
+    summary = f"{profile['name']} is a {kind} company." if kind else f"{profile['name']}."
+    return f"{summary} {description}".strip()
+
+
+def clip_words(text: str, limit: int = SUMMARY_MAX_WORDS) -> str:
+    words = text.split()
+    return ' '.join(words[:limit]) + ('...' if len(words) > limit else '')
+
+
+class CompanyStore:
+    """Company contexts for prompts, summarized once per profile and cached in an LRU."""
+
+    def __init__(self, summarize: Callable[[Dict], str], capacity: int = 1024, ttl: float = 300,
+                 clock: Callable[[], float] = time.monotonic):
+        # Returns a compact summary of a profile dict, e.g. with one model call
+        self.summarize = summarize
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.cache: 'OrderedDict[int, tuple]' = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'local_summaries': 0, 'model_summaries': 0, 'invalidations': 0}
+
+    def save(self, data: Dict, company_id: Optional[int] = None) -> Company:
+        """Create or update a profile; a new profile with a known name updates that company.
+
+        Raises ValueError for invalid fields and KeyError for an unknown ``company_id``.
+        """
+        fields = parse_company(data, partial=company_id is not None)
+        if company_id is not None:
+            company = db.session.get(Company, company_id)
+            if company is None:
+                raise KeyError(f'Company {company_id} not found')
+        else:
+            company = Company.query.filter_by(key=company_key(fields['name'])).first()
+            if company is None:
+                company = Company(name=fields['name'], key=company_key(fields['name']))
+                db.session.add(company)
+        if 'name' in fields and company.id is not None and company_key(fields['name']) != company.key:
+            if Company.query.filter_by(key=company_key(fields['name'])).first() is not None:
+                raise ValueError(f"A company named {fields['name']} already exists")
+        for field, value in fields.items():
+            setattr(company, field, value)
+        company.key = company_key(company.name)
+        if company.summary_hash != profile_hash(self._profile(company)):
+            company.summary = company.summary_hash = None
+        db.session.commit()
+        self.invalidate(company.id)
+        return company
+
+    def delete(self, company_id: int) -> bool:
+        company = db.session.get(Company, company_id)
+        if company is None:
+            return False
+        db.session.delete(company)
+        db.session.commit()
+        self.invalidate(company_id)
+        return True
+
+    def invalidate(self, company_id: int):
+        with self.lock:
+            if self.cache.pop(company_id, None) is not None:
+                self.counters['invalidations'] += 1
+
+    @staticmethod
+    def _profile(company: Company) -> Dict:
+        return {field: getattr(company, field) for field in PROFILE_FIELDS}
+
+    def _ensure_summary(self, company: Company):
+        profile = self._profile(company)
+        digest = profile_hash(profile)
+        if company.summary and company.summary_hash == digest:
+            return
+        summary = local_summary(profile)
+        source = 'local_summaries'
+        if summary is None:
+            summary = clip_words(self.summarize(profile).strip())
+            source = 'model_summaries'
+        with self.lock:
+            self.counters[source] += 1
+        company.summary = summary
+        company.summary_hash = digest
+        db.session.commit()
+
+    def context(self, company_id: int) -> Optional[Dict]:
+        """The compact company context for prompts, or None for an unknown company."""
+        now = self.clock()
+        with self.lock:
+            cached = self.cache.get(company_id)
+            if cached is not None and now - cached[0] <= self.ttl:
+                self.cache.move_to_end(company_id)
+                self.counters['hits'] += 1
+                return cached[1]
+            self.counters['misses'] += 1
+        company = db.session.get(Company, company_id)
+        if company is None:
+            return None
+        self._ensure_summary(company)
+        context = {field: getattr(company, field) for field in CONTEXT_FIELDS}
+        with self.lock:
+            self.cache[company_id] = (now, context)
+            self.cache.move_to_end(company_id)
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+        return context
+
+    def list(self, query: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        companies = Company.query
+        if query:
+            companies = companies.filter(Company.key.like(f'%{company_key(query)}%'))
+        return [company.to_dict() for company in companies.order_by(Company.name).limit(limit)]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counters, cached=len(self.cache), capacity=self.capacity)
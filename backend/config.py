@@ -18,6 +18,138 @@ class Config:
     # Socket.IO configuration
     SOCKETIO_PING_TIMEOUT = 60
     SOCKETIO_PING_INTERVAL = 25
+    # 'json' or 'msgpack' (clients then need socket.io-msgpack-parser)
+    SOCKETIO_SERIALIZER = os.getenv('SOCKETIO_SERIALIZER', 'json')
+    # Polling responses above this size are gzip/deflate compressed; WebSocket
+    # frames use permessage-deflate whenever the client offers it
+    SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv('SOCKETIO_COMPRESSION_THRESHOLD', 1024))
+
+    # Multi-worker mode: message queue shared by all Socket.IO workers
+    # (redis://, amqp:// or local://host:port for the bundled broker)
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'helix')
+    PORT = int(os.getenv('PORT', 3002))
+
+    # Model backend: live, record, replay or synthetic (see llm_backend.py)
+    LLM_MODE = os.getenv('HELIX_LLM_MODE', 'live')
+    LLM_CASSETTE = os.getenv('HELIX_LLM_CASSETTE', os.path.join(os.path.dirname(__file__), 'cassettes', 'default.jsonl'))
+    LLM_LATENCY = os.getenv('HELIX_LLM_LATENCY', '')
+    LLM_SEED = int(os.getenv('HELIX_LLM_SEED')) if os.getenv('HELIX_LLM_SEED') else None
+    # 'error' or 'synthetic' when replay meets an unrecorded prompt
+    LLM_REPLAY_MISS = os.getenv('HELIX_LLM_REPLAY_MISS', 'error')
+
+    # Bulk campaign generation
+    CAMPAIGN_MAX_WORKERS = int(os.getenv('CAMPAIGN_MAX_WORKERS', 8))
+    CAMPAIGN_REQUESTS_PER_MINUTE = int(os.getenv('CAMPAIGN_REQUESTS_PER_MINUTE', 60))
+    CAMPAIGN_BATCH_SIZE = int(os.getenv('CAMPAIGN_BATCH_SIZE', 10))
+    # A running campaign without a heartbeat for this long may be resumed
+    CAMPAIGN_STALE_SECONDS = float(os.getenv('CAMPAIGN_STALE_SECONDS', 120))
+
+    # Only the last update_sequence_from_edit within this window is processed
+    EDIT_DEBOUNCE_SECONDS = float(os.getenv('EDIT_DEBOUNCE_SECONDS', 0.25))
+
+    # Conversation turns are written in batches of this size or every interval
+    CONVERSATION_BATCH_SIZE = int(os.getenv('CONVERSATION_BATCH_SIZE', 50))
+    CONVERSATION_FLUSH_SECONDS = float(os.getenv('CONVERSATION_FLUSH_SECONDS', 1.0))
+
+    # Threads the asyncio server uses for Flask-SQLAlchemy calls (pool_size + max_overflow)
+    ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 15))
+
+    # Cadence scheduler: due steps are checked every tick; each worker holds at
+    # most CADENCE_BATCH_SIZE steps due within the horizon in memory, and a
+    # claim older than the lease is retried
+    CADENCE_TICK_SECONDS = float(os.getenv('CADENCE_TICK_SECONDS', 1.0))
+    CADENCE_HORIZON_SECONDS = float(os.getenv('CADENCE_HORIZON_SECONDS', 300))
+    CADENCE_BATCH_SIZE = int(os.getenv('CADENCE_BATCH_SIZE', 500))
+    CADENCE_LEASE_SECONDS = float(os.getenv('CADENCE_LEASE_SECONDS', 600))
+
+    # Outbound delivery of due steps; without SMTP_HOST due steps are only logged
+    SMTP_HOST = os.getenv('SMTP_HOST')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+    SMTP_USERNAME = os.getenv('SMTP_USERNAME')
+    SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+    SMTP_SENDER = os.getenv('SMTP_SENDER', 'recruiting@localhost')
+    SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', 8))
+    SMTP_PER_DOMAIN = int(os.getenv('SMTP_PER_DOMAIN', 2))
+    DELIVERY_FLUSH_SECONDS = float(os.getenv('DELIVERY_FLUSH_SECONDS', 1.0))
+    # A queued delivery whose worker has not renewed its lease for this long is
+    # taken over by another worker
+    DELIVERY_LEASE_SECONDS = float(os.getenv('DELIVERY_LEASE_SECONDS', 600))
+
+    # Engagement events are counted in memory and written every interval; at
+    # most ENGAGEMENT_MAX_KEYS distinct counters are held between writes
+    ENGAGEMENT_FLUSH_SECONDS = float(os.getenv('ENGAGEMENT_FLUSH_SECONDS', 2.0))
+    ENGAGEMENT_MAX_KEYS = int(os.getenv('ENGAGEMENT_MAX_KEYS', 100000))
+    # Public URL of this server; when set, delivered messages carry a tracking pixel
+    TRACKING_BASE_URL = os.getenv('TRACKING_BASE_URL')
+    # When set, webhook posts must send it in the X-Webhook-Token header;
+    # without it replies and bounces are rejected, since they stop follow-ups
+    ENGAGEMENT_WEBHOOK_TOKEN = os.getenv('ENGAGEMENT_WEBHOOK_TOKEN')
+
+    # Sequence variants generated concurrently per request (1 disables); the
+    # best-scoring one is returned once one clears the threshold, the grace
+    # period after the first parsed variant ends or the budget runs out (see
+    # variants.py)
+    SEQUENCE_VARIANTS = int(os.getenv('SEQUENCE_VARIANTS', 1))
+    SEQUENCE_VARIANT_BUDGET_SECONDS = float(os.getenv('SEQUENCE_VARIANT_BUDGET_SECONDS', 8.0))
+    SEQUENCE_VARIANT_GRACE_SECONDS = float(os.getenv('SEQUENCE_VARIANT_GRACE_SECONDS', 1.0))
+    SEQUENCE_VARIANT_THRESHOLD = float(os.getenv('SEQUENCE_VARIANT_THRESHOLD', 0.9))
+
+    # Company summaries cached per worker; edits on other workers show up
+    # within the TTL
+    COMPANY_CACHE_SIZE = int(os.getenv('COMPANY_CACHE_SIZE', 1024))
+    COMPANY_CACHE_TTL_SECONDS = float(os.getenv('COMPANY_CACHE_TTL_SECONDS', 300))
+
+    # Candidate match index (see candidates.py): each worker loads the
+    # snapshot, applies newer changes at most every CANDIDATE_SYNC_SECONDS
+    # before a match and rewrites the snapshot every CANDIDATE_SNAPSHOT_EVERY
+    # changes. An empty path keeps the index in memory only
+    CANDIDATE_INDEX_PATH = os.getenv('CANDIDATE_INDEX_PATH', 'candidate_index.snapshot')
+    CANDIDATE_SYNC_SECONDS = float(os.getenv('CANDIDATE_SYNC_SECONDS', 2.0))
+    CANDIDATE_SNAPSHOT_EVERY = int(os.getenv('CANDIDATE_SNAPSHOT_EVERY', 10000))
+
+    # Context summaries are extracted locally (see extraction.py) and only
+    # asked of the model when a field the conversation mentions stays below
+    # EXTRACTION_MIN_CONFIDENCE. The clause model trained with
+    # `python extraction.py train` is loaded from EXTRACTION_MODEL_PATH; an
+    # empty path starts each worker with an untrained model
+    EXTRACTION_MODEL_PATH = os.getenv('EXTRACTION_MODEL_PATH', 'extraction_model.json')
+    EXTRACTION_MIN_CONFIDENCE = float(os.getenv('EXTRACTION_MIN_CONFIDENCE', 0.5))
+
+    # Speculative sequence generation (see speculation.py): 'sequence' starts
+    # once all required information was given, 'email' earlier, 'off' never.
+    # generate_sequence waits up to SPECULATION_WAIT_SECONDS for a running one
+    SPECULATION_TRIGGER = os.getenv('SPECULATION_TRIGGER', 'sequence')
+    SPECULATION_MAX_INFLIGHT = int(os.getenv('SPECULATION_MAX_INFLIGHT', 4))
+    SPECULATION_TTL_SECONDS = float(os.getenv('SPECULATION_TTL_SECONDS', 600))
+    SPECULATION_WAIT_SECONDS = float(os.getenv('SPECULATION_WAIT_SECONDS', 30))
+
+    # Tracing: 'none', 'console', 'file' or 'package.module:Exporter' (see
+    # tracing.py); the sample rate is the share of socket events traced
+    TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none')
+    TRACING_FILE = os.getenv('TRACING_FILE', 'traces.jsonl')
+    TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', 0.1))
+    TRACING_MAX_SPANS = int(os.getenv('TRACING_MAX_SPANS', 1000))
+
+    # Logging (see structured_logging.py): records are queued and written by a
+    # background thread to LOG_FILE (stderr when unset) as 'json' or 'text'
+    # lines. Fields are cut at LOG_MAX_FIELD_LENGTH characters and emails and
+    # phone numbers masked unless LOG_REDACT=false. Past LOG_SAMPLE_BURST
+    # records of one message per window only every LOG_SAMPLE_EVERY-th is kept
+    # (a burst of 0 keeps everything)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_FILE = os.getenv('LOG_FILE')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    LOG_MAX_FIELD_LENGTH = int(os.getenv('LOG_MAX_FIELD_LENGTH', 500))
+    LOG_REDACT = os.getenv('LOG_REDACT', 'true').lower() == 'true'
+    LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', 20))
+    LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', 100))
+    LOG_SAMPLE_WINDOW_SECONDS = float(os.getenv('LOG_SAMPLE_WINDOW_SECONDS', 60))
+
+    # Bearer token for the /api/admin profiling routes; unset disables them
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+# Tests run offline against the synthetic model backend and an in-memory
+# database unless the environment explicitly asks for something else.
+os.environ.setdefault('HELIX_LLM_MODE', 'synthetic')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+# The in-memory database is one connection shared by all threads, so tests
+# flush conversation turns explicitly instead of from a background thread
+os.environ.setdefault('CONVERSATION_FLUSH_SECONDS', '3600')
+os.environ.setdefault('CADENCE_TICK_SECONDS', '3600')
+os.environ.setdefault('DELIVERY_FLUSH_SECONDS', '3600')
+os.environ.setdefault('ENGAGEMENT_FLUSH_SECONDS', '3600')
+os.environ.setdefault('CANDIDATE_INDEX_PATH', '')
+os.environ.setdefault('EXTRACTION_MODEL_PATH', '')
+
+
+@pytest.fixture
+def app_context():
+    # Imported here so the defaults above are set before the app reads its config
+    from app import app
+    from models import db
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+def pytest_configure(config):
+    # Outside explicit benchmark runs, execute each benchmark body once as a
+    # smoke test instead of timing it
+    try:
+        benchmarking = (config.getoption('benchmark_only') or config.getoption('benchmark_save')
+                        or config.getoption('benchmark_compare'))
+    except ValueError:
+        return
+    if not benchmarking:
+        config.option.benchmark_disable = True
@@ -0,0 +1,185 @@
+"""Durable, append-only conversation history.
+
+A :class:`models.Conversation` row is the conversation header; every message
+is one :class:`models.ConversationTurn` row keyed by (conversation ID, turn
+number), so storing a turn is a single insert no matter how long the history
+is. Appends are buffered and written in batches, older turns are read with
+keyset pagination on the primary key, and a conversation resumes from its
+last few turns plus the cached context summary instead of the full history.
+
+Turn numbers are assigned in process, so all appends to one conversation must
+go through the same worker; the load balancer already pins clients to a
+worker (see ``scaling.py``).
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+
+from config import Config
+from models import db, Conversation, ConversationSummary, ConversationTurn
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_TAIL = 20
+MAX_PAGE_SIZE = 500
+
+
+class ConversationLog:
+    """Buffers turn appends and serves paginated and tail reads."""
+
+    def __init__(self, batch_size: int = 50, max_cached_conversations: int = 10000):
+        self.batch_size = batch_size
+        self.max_cached_conversations = max_cached_conversations
+        self.lock = threading.Lock()
+        self.pending: List[Dict] = []
+        # Next turn number per recently active conversation
+        self.next_turns: 'OrderedDict[int, int]' = OrderedDict()
+
+    def start(self, persona: str, messages: Iterable[Dict] = ()) -> Conversation:
+        """Create a conversation, seeding it with any messages already shown."""
+        conversation = Conversation(persona=persona or 'corporate_pro', messages=[])
+        db.session.add(conversation)
+        db.session.commit()
+        with self.lock:
+            self._remember(conversation.id, 1)
+        for message in messages:
+            self.append(conversation.id, message.get('role', 'assistant'), message.get('content', ''))
+        return conversation
+
+    def _remember(self, conversation_id: int, next_turn: int):
+        self.next_turns[conversation_id] = next_turn
+        self.next_turns.move_to_end(conversation_id)
+        if len(self.next_turns) > self.max_cached_conversations:
+            self.next_turns.popitem(last=False)
+
+    def _next_turn(self, conversation_id: int) -> int:
+        if conversation_id not in self.next_turns:
+            if db.session.get(Conversation, conversation_id) is None:
+                raise ValueError(f'Unknown conversation: {conversation_id}')
+            last = db.session.execute(
+                select(func.max(ConversationTurn.turn)).where(ConversationTurn.conversation_id == conversation_id)
+            ).scalar()
+            pending = [row['turn'] for row in self.pending if row['conversation_id'] == conversation_id]
+            self._remember(conversation_id, max([last or 0] + pending) + 1)
+        turn = self.next_turns[conversation_id]
+        self._remember(conversation_id, turn + 1)
+        return turn
+
+    def append(self, conversation_id: int, role: str, content: str) -> int:
+        """Queue one turn and return its number; full batches are written immediately.
+
+        Raises ValueError for a conversation that does not exist.
+        """
+        with self.lock:
+            turn = self._next_turn(conversation_id)
+            self.pending.append({'conversation_id': conversation_id, 'turn': turn,
+                                 'role': role, 'content': content or ''})
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+        return turn
+
+    def record(self, conversation_id: int, role: str, content: str) -> Optional[int]:
+        """:meth:`append` for chat handlers: a turn that cannot be logged is reported, never raised."""
+        try:
+            return self.append(conversation_id, role, content)
+        except Exception as e:
+            logger.error("Error logging a turn of conversation %s: %s", conversation_id, e)
+            db.session.rollback()
+            return None
+
+    def flush(self) -> int:
+        """Write all buffered turns in one multi-row insert.
+
+        If the batch fails, each conversation's turns are written on their own,
+        so only the conversations whose turns cannot be stored are dropped.
+        """
+        with self.lock:
+            rows, self.pending = self.pending, []
+        if not rows:
+            return 0
+        try:
+            db.session.execute(insert(ConversationTurn), rows)
+            db.session.commit()
+            return len(rows)
+        except Exception as e:
+            logger.warning("Error writing %d conversation turns, retrying per conversation: %s", len(rows), e)
+            db.session.rollback()
+        by_conversation: Dict[int, List[Dict]] = {}
+        for row in rows:
+            by_conversation.setdefault(row['conversation_id'], []).append(row)
+        written = 0
+        for conversation_id, turns in by_conversation.items():
+            try:
+                db.session.execute(insert(ConversationTurn), turns)
+                db.session.commit()
+                written += len(turns)
+            except Exception as e:
+                logger.error("Error writing %d turns of conversation %s: %s", len(turns), conversation_id, e)
+                db.session.rollback()
+                with self.lock:
+                    # Forget the cached turn number so it is re-read from the table
+                    self.next_turns.pop(conversation_id, None)
+        return written
+
+    def run_flusher(self, sleep, interval: float = 1.0):
+        """Flush on a fixed interval forever; run it as a background task."""
+        while True:
+            sleep(interval)
+            self.flush()
+
+    def page(self, conversation_id: int, before: Optional[int] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict], Optional[int]]:
+        """Turns older than ``before`` (newest page by default), oldest first.
+
+        Returns the turns and the ``before`` cursor of the next older page, or
+        None when the first turn has been reached.
+        """
+        self.flush()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = select(ConversationTurn.turn, ConversationTurn.role, ConversationTurn.content).where(
+            ConversationTurn.conversation_id == conversation_id)
+        if before is not None:
+            query = query.where(ConversationTurn.turn < before)
+        rows = db.session.execute(query.order_by(ConversationTurn.turn.desc()).limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        turns = [{'turn': turn, 'role': role, 'content': content} for turn, role, content in reversed(rows[:limit])]
+        return turns, (turns[0]['turn'] if has_more else None)
+
+    def cache_summary(self, conversation_id: int, summary: Dict):
+        """Store the latest context summary, covering every turn appended so far."""
+        self.flush()
+        through_turn = db.session.execute(
+            select(func.max(ConversationTurn.turn)).where(ConversationTurn.conversation_id == conversation_id)
+        ).scalar() or 0
+        cached = db.session.get(ConversationSummary, conversation_id)
+        if cached is None:
+            db.session.add(ConversationSummary(conversation_id=conversation_id, through_turn=through_turn,
+                                               summary=summary))
+        else:
+            cached.through_turn = through_turn
+            cached.summary = summary
+        db.session.commit()
+
+    def resume(self, conversation_id: int, tail: int = DEFAULT_TAIL) -> Optional[Dict]:
+        """Load a conversation's last ``tail`` turns and cached summary."""
+        conversation = db.session.get(Conversation, conversation_id)
+        if conversation is None:
+            return None
+        turns, before = self.page(conversation_id, limit=tail)
+        cached = db.session.get(ConversationSummary, conversation_id)
+        return {
+            'conversation_id': conversation.id,
+            'persona': conversation.persona,
+            'messages': turns,
+            'before': before,
+            'summary': cached.summary if cached else None,
+            'summary_through_turn': cached.through_turn if cached else None
+        }
+
+
+conversation_log = ConversationLog(batch_size=Config.CONVERSATION_BATCH_SIZE)
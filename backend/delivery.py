@@ -0,0 +1,465 @@
+"""Outbound SMTP delivery of scheduled sequence steps.
+
+:class:`Mailer` is the database side. It turns a due
+:class:`models.ScheduledStep` into a MIME message and a
+:class:`models.Delivery` row, then hands the message to a
+:class:`DeliveryPool`. It also writes delivery statuses back in batches.
+
+:class:`DeliveryPool` is the network side and never touches the database.
+Each worker thread owns one persistent SMTP connection and reuses it for many
+messages. When the server supports PIPELINING, MAIL, RCPT and DATA are written
+in one packet. Each recipient domain is limited to ``per_domain`` concurrent
+sends. Jobs for a saturated domain wait in a side queue, so they never hold a
+worker. Temporary failures (4xx replies and dropped connections) are retried
+with exponential backoff. Permanent ones (5xx) bounce.
+
+A queued or deferred delivery is leased to the worker holding its message:
+``claimed_by`` names the worker and ``claimed_at`` is renewed while the
+message is in memory. Only deliveries whose lease has expired, because their
+worker stopped, are queued again by another worker's :meth:`Mailer.recover`.
+"""
+import hashlib
+import heapq
+import html
+import logging
+import os
+import queue
+import re
+import smtplib
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import or_, select, update
+
+from export import parse_steps
+from models import db, Delivery, EmailSequence, ScheduledStep
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60.0
+DELIVERY_LEASE = 600.0
+PENDING = ('queued', 'deferred')
+
+_LINE_ENDINGS = re.compile(rb'\r\n|\r|\n')
+_LEADING_DOT = re.compile(rb'(?m)^\.')
+
+
+class DeliveryError(Exception):
+    """An SMTP failure; ``temporary`` ones are worth retrying."""
+
+    def __init__(self, code: Optional[int], message: str, temporary: bool):
+        super().__init__(message)
+        self.code = code
+        self.temporary = temporary
+
+
+def message_id(sequence_id: int, step: int, recipient: str, domain: str) -> str:
+    """Stable Message-ID, so follow-ups can thread onto earlier steps."""
+    digest = hashlib.sha1(recipient.lower().encode('utf-8')).hexdigest()[:16]
+    return f'helix.{sequence_id}.{step}.{digest}@{domain}'
+
+
+def render_message(sequence, step: int, recipient: str, sender: str,
+                   pixel_url: Optional[str] = None) -> EmailMessage:
+    """Build the MIME message for one step of a stored sequence.
+
+    With ``pixel_url`` the message also gets an HTML part that loads it, so
+    opens can be counted.
+    """
+    emails = parse_steps(sequence.content)
+    if not 1 <= step <= len(emails):
+        raise ValueError(f"Sequence {sequence.id} has no step {step}")
+    email = emails[step - 1]
+    domain = sender.rsplit('@', 1)[-1]
+    first_subject = emails[0].get('subject') or ''
+
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    message['Subject'] = email.get('subject') or (f'Re: {first_subject}' if first_subject else '')
+    message['Date'] = formatdate(localtime=False)
+    message['Message-ID'] = f'<{message_id(sequence.id, step, recipient, domain)}>'
+    if step > 1:
+        # Thread follow-ups under the first email
+        first = f'<{message_id(sequence.id, 1, recipient, domain)}>'
+        message['In-Reply-To'] = first
+        message['References'] = first
+    message['X-Helix-Sequence-Id'] = str(sequence.id)
+    message['X-Helix-Step'] = str(step)
+    message.set_content(email.get('body', ''))
+    if pixel_url:
+        paragraphs = ''.join('<p>' + html.escape(paragraph).replace('\n', '<br>') + '</p>'
+                             for paragraph in email.get('body', '').split('\n\n'))
+        message.add_alternative(f'<html><body>{paragraphs}<img src="{html.escape(pixel_url)}" width="1" '
+                                f'height="1" alt=""></body></html>', subtype='html')
+    return message
+
+
+def _dot_stuff(data: bytes) -> bytes:
+    data = _LEADING_DOT.sub(b'..', _LINE_ENDINGS.sub(b'\r\n', data))
+    return data if data.endswith(b'\r\n') else data + b'\r\n'
+
+
+class SMTPConnection:
+    """One persistent SMTP session, reopened after errors or ``max_messages`` sends."""
+
+    def __init__(self, host: str, port: int = 25, username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = False, timeout: float = 30, max_messages: int = 100):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.sent = 0
+
+    def open(self):
+        self.smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        self.smtp.ehlo()
+        if self.starttls:
+            self.smtp.starttls()
+            self.smtp.ehlo()
+        if self.username:
+            self.smtp.login(self.username, self.password or '')
+        self.sent = 0
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+            self.smtp = None
+
+    def send(self, sender: str, recipient: str, data: bytes):
+        """Send one message, raising :class:`DeliveryError` on failure."""
+        try:
+            if self.smtp is None or self.sent >= self.max_messages:
+                self.close()
+                self.open()
+            if self.smtp.has_extn('pipelining'):
+                self._send_pipelined(sender, recipient, data)
+            else:
+                self.smtp.sendmail(sender, [recipient], data)
+            self.sent += 1
+        except DeliveryError:
+            self._reset()
+            raise
+        except smtplib.SMTPRecipientsRefused as e:
+            code, reply = e.recipients[recipient]
+            self._reset()
+            raise DeliveryError(code, reply.decode('utf-8', 'replace'), temporary=400 <= code < 500)
+        except smtplib.SMTPResponseException as e:
+            self._reset()
+            raise DeliveryError(e.smtp_code, e.smtp_error.decode('utf-8', 'replace') if isinstance(
+                e.smtp_error, bytes) else str(e.smtp_error), temporary=400 <= e.smtp_code < 500)
+        except (smtplib.SMTPException, OSError) as e:
+            self.smtp = None
+            raise DeliveryError(None, str(e) or e.__class__.__name__, temporary=True)
+
+    def _send_pipelined(self, sender: str, recipient: str, data: bytes):
+        self.smtp.send(f'MAIL FROM:{smtplib.quoteaddr(sender)}\r\n'
+                       f'RCPT TO:{smtplib.quoteaddr(recipient)}\r\nDATA\r\n')
+        replies = [self.smtp.getreply() for _ in range(3)]
+        failed = next(((code, reply) for code, reply in replies[:2] if code not in (250, 251)), None)
+        if replies[2][0] == 354:
+            if failed:
+                # Servers may still accept DATA after a refused recipient; send an empty body to abort
+                self.smtp.send(b'.\r\n')
+                self.smtp.getreply()
+            else:
+                self.smtp.send(_dot_stuff(data) + b'.\r\n')
+                failed = next(((code, reply) for code, reply in [self.smtp.getreply()] if code != 250), None)
+        elif failed is None:
+            failed = replies[2]
+        if failed:
+            code, reply = failed
+            raise DeliveryError(code, reply.decode('utf-8', 'replace'), temporary=400 <= code < 500)
+
+    def _reset(self):
+        try:
+            self.smtp.rset()
+        except (smtplib.SMTPException, OSError, AttributeError):
+            self.smtp = None
+
+
+class DeliveryPool:
+    """Worker threads sending queued jobs over persistent SMTP connections.
+
+    A job is a dict with ``id``, ``sender``, ``recipient``, ``data`` (message
+    bytes) and optionally the ``attempts`` already made. Outcomes are collected for :meth:`drain_updates`.
+    """
+
+    def __init__(self, connect: Callable[[], SMTPConnection], size: int = 4, per_domain: int = 2,
+                 max_attempts: int = MAX_ATTEMPTS, retry_delay: float = RETRY_DELAY):
+        self.connect = connect
+        self.size = size
+        self.per_domain = per_domain
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.jobs: 'queue.Queue[Optional[Dict]]' = queue.Queue()
+        self.lock = threading.Condition()
+        self.active: Dict[str, int] = defaultdict(int)
+        self.waiting: Dict[str, deque] = defaultdict(deque)
+        self.retries: List = []
+        self.updates: List[Dict] = []
+        self.unfinished = 0
+        self.workers: List[threading.Thread] = []
+        self.running = False
+        self.counters = {'sent': 0, 'deferred': 0, 'bounced': 0, 'failed': 0}
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.workers = [threading.Thread(target=self._work, name=f'helix-smtp-{i}', daemon=True)
+                        for i in range(self.size)]
+        self.workers.append(threading.Thread(target=self._retry_timer, name='helix-smtp-retry', daemon=True))
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout: float = 10):
+        """Let queued work finish, then close every connection."""
+        self.join(timeout)
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        for _ in range(self.size):
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def submit(self, job: Dict):
+        """Queue a job without blocking."""
+        job.setdefault('attempts', 0)
+        with self.lock:
+            self.unfinished += 1
+        self.jobs.put(job)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted job is sent or given up on."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            while self.unfinished:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.lock.wait(remaining)
+        return True
+
+    def drain_updates(self) -> List[Dict]:
+        with self.lock:
+            updates, self.updates = self.updates, []
+        return updates
+
+    def _take_slot(self, job: Dict) -> bool:
+        domain = job['recipient'].rsplit('@', 1)[-1].lower()
+        with self.lock:
+            if self.active[domain] >= self.per_domain:
+                self.waiting[domain].append(job)
+                return False
+            self.active[domain] += 1
+            return True
+
+    def _release_slot(self, job: Dict):
+        domain = job['recipient'].rsplit('@', 1)[-1].lower()
+        with self.lock:
+            self.active[domain] -= 1
+            if self.waiting[domain]:
+                self.jobs.put(self.waiting[domain].popleft())
+            elif not self.active[domain]:
+                del self.active[domain]
+                self.waiting.pop(domain, None)
+
+    def _finish(self, job: Dict, status: str, error: Optional[DeliveryError] = None):
+        with self.lock:
+            self.counters[status] += 1
+            self.updates.append({
+                'id': job['id'],
+                'status': status,
+                'attempts': job['attempts'],
+                'smtp_code': error.code if error else 250,
+                'error': str(error) if error else None,
+                'sent_at': datetime.utcnow() if status == 'sent' else None
+            })
+            if status == 'deferred':
+                heapq.heappush(self.retries, (time.monotonic() + self.retry_delay * 2 ** (job['attempts'] - 1),
+                                              job['id'], job))
+            else:
+                self.unfinished -= 1
+            self.lock.notify_all()
+
+    def _work(self):
+        connection = self.connect()
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                if not self._take_slot(job):
+                    continue
+                try:
+                    job['attempts'] += 1
+                    connection.send(job['sender'], job['recipient'], job['data'])
+                except DeliveryError as e:
+                    if not e.temporary:
+                        self._finish(job, 'bounced', e)
+                    elif job['attempts'] >= self.max_attempts:
+                        self._finish(job, 'failed', e)
+                    else:
+                        self._finish(job, 'deferred', e)
+                except Exception as e:
+                    logger.error("Error delivering message %s: %s", job['id'], e)
+                    self._finish(job, 'failed', DeliveryError(None, str(e), temporary=False))
+                else:
+                    self._finish(job, 'sent')
+                finally:
+                    self._release_slot(job)
+        finally:
+            connection.close()
+
+    def _retry_timer(self):
+        with self.lock:
+            while self.running:
+                now = time.monotonic()
+                while self.retries and self.retries[0][0] <= now:
+                    self.jobs.put(heapq.heappop(self.retries)[2])
+                self.lock.wait(self.retries[0][0] - now if self.retries else None)
+
+
+class Mailer:
+    """Queues scheduled steps for delivery and records their outcome."""
+
+    def __init__(self, pool: DeliveryPool, sender: str, on_bounce: Optional[Callable[[Delivery], None]] = None,
+                 on_sent: Optional[Callable[[Delivery], None]] = None,
+                 pixel_url: Optional[Callable[[int, int, str], str]] = None, lease: float = DELIVERY_LEASE,
+                 owner: Optional[str] = None, clock: Callable[[], datetime] = datetime.utcnow):
+        self.pool = pool
+        self.sender = sender
+        self.on_bounce = on_bounce
+        self.on_sent = on_sent
+        # Tracking pixel URL for (sequence_id, step, recipient)
+        self.pixel_url = pixel_url
+        self.lease = timedelta(seconds=lease)
+        self.owner = owner or f'{os.uname().nodename}:{os.getpid()}:{id(self):x}'[:64]
+        self.clock = clock
+        self.renewed_at: Optional[datetime] = None
+
+    def send_step(self, step):
+        """Queue one scheduled step; a step already queued or sent is not queued again."""
+        delivery = db.session.execute(select(Delivery).where(Delivery.step_id == step.id)).scalar()
+        if delivery is not None and delivery.status in ('queued', 'deferred', 'sent'):
+            return delivery
+        return self._queue(step, delivery)
+
+    def _queue(self, step, delivery: Optional[Delivery] = None) -> Delivery:
+        sequence = db.session.get(EmailSequence, step.sequence_id)
+        if sequence is None:
+            raise ValueError(f"Sequence {step.sequence_id} not found")
+        message = render_message(sequence, step.step, step.recipient, self.sender,
+                                 self.pixel_url(step.sequence_id, step.step, step.recipient) if self.pixel_url else None)
+        if delivery is None:
+            delivery = Delivery(step_id=step.id, sequence_id=step.sequence_id, step=step.step,
+                                recipient=step.recipient, message_id=message['Message-ID'].strip('<>'))
+            db.session.add(delivery)
+        delivery.status = 'queued'
+        delivery.claimed_by = self.owner
+        delivery.claimed_at = self.clock()
+        db.session.commit()
+        self.pool.start()
+        self.pool.submit({'id': delivery.id, 'sender': self.sender, 'recipient': step.recipient,
+                          'data': bytes(message), 'attempts': delivery.attempts})
+        return delivery
+
+    def recover(self) -> int:
+        """Queue deliveries again whose worker stopped while they were in memory.
+
+        Deliveries are taken over with a conditional update, so of several
+        workers recovering at once only one queues each. A message may have
+        been sent just before its worker stopped, so this can send it twice.
+        """
+        now = self.clock()
+        claimed = db.session.execute(
+            update(Delivery)
+            .where(Delivery.status.in_(PENDING),
+                   or_(Delivery.claimed_at.is_(None), Delivery.claimed_at < now - self.lease))
+            .values(claimed_by=self.owner, claimed_at=now)
+            .returning(Delivery.id)
+        ).scalars().all()
+        db.session.commit()
+        if not claimed:
+            return 0
+        pending = db.session.execute(select(Delivery, ScheduledStep).join(
+            ScheduledStep, ScheduledStep.id == Delivery.step_id
+        ).where(Delivery.id.in_(claimed))).all()
+        for delivery, step in pending:
+            self._queue(step, delivery)
+        logger.warning("Queued %s interrupted deliveries again", len(pending))
+        return len(pending)
+
+    def renew(self) -> int:
+        """Extend the lease on every delivery this worker still holds."""
+        now = self.clock()
+        result = db.session.execute(update(Delivery).where(
+            Delivery.claimed_by == self.owner, Delivery.status.in_(PENDING)
+        ).values(claimed_at=now))
+        db.session.commit()
+        self.renewed_at = now
+        return result.rowcount
+
+    def flush(self) -> int:
+        """Write delivery outcomes reported since the last flush."""
+        updates = self.pool.drain_updates()
+        if not updates:
+            return 0
+        # Only the latest outcome of each delivery matters
+        latest = {}
+        for row in updates:
+            latest[row['id']] = {key: value for key, value in row.items() if value is not None or key == 'error'}
+        db.session.execute(update(Delivery), list(latest.values()))
+        db.session.commit()
+        callbacks = {'bounced': self.on_bounce, 'sent': self.on_sent}
+        final = [row['id'] for row in latest.values() if callbacks.get(row['status'])]
+        if final:
+            for delivery in db.session.execute(select(Delivery).where(Delivery.id.in_(final))).scalars():
+                callbacks[delivery.status](delivery)
+        return len(latest)
+
+    def run_flusher(self, sleep, interval: float = 1.0):
+        """Flush on a fixed interval forever.
+
+        Leases are renewed four times per lease, and once per lease the
+        deliveries of stopped workers are recovered.
+        """
+        recovered_at = None
+        while True:
+            sleep(interval)
+            try:
+                now = self.clock()
+                if self.renewed_at is None or now - self.renewed_at >= self.lease / 4:
+                    self.renew()
+                if recovered_at is None or now - recovered_at >= self.lease:
+                    self.recover()
+                    recovered_at = now
+                self.flush()
+            except Exception as e:
+                logger.error("Error writing delivery statuses: %s", e)
+                db.session.rollback()
+
+    def stats(self) -> Dict:
+        with self.pool.lock:
+            return {
+                'pool_size': self.pool.size,
+                'in_flight': self.pool.unfinished,
+                'retrying': len(self.pool.retries),
+                **self.pool.counters
+            }
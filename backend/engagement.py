@@ -0,0 +1,343 @@
+"""Recorded opens, clicks, replies and bounces of delivered steps.
+
+Events arrive from the tracking pixel in delivered messages and from the
+email provider's webhook, in bursts of thousands per second. Recording one
+only increments an in-memory counter under a lock, so ingestion never waits
+on the database. :meth:`EngagementBuffer.flush` runs on an interval, swaps
+the counters out and adds them to :class:`models.EngagementCounter` (per
+sequence and step) and :class:`models.PersonaEngagement` (per persona and
+day) with one bulk upsert each. Flushing is additive, so several workers can
+each flush their own buffer into the same rows.
+
+Opens are counted once per recipient and step, so the open rate compares
+with the model's estimate no matter how often a message is viewed: a flush
+records each recipient's first open in :class:`models.EngagementOpen` and
+counts only the opens it had not seen.
+
+Replies and bounces also stop the recipient's remaining follow-ups; that
+happens at flush time too, never on the ingestion path.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from analytics import dashboard, upsert_counts
+from models import db, EmailSequence, EngagementCounter, EngagementOpen, PersonaEngagement, SequenceMetrics
+
+logger = logging.getLogger(__name__)
+
+# Event type -> counter column
+EVENTS = {'delivered': 'delivered', 'open': 'opens', 'click': 'clicks', 'reply': 'replies', 'bounce': 'bounces'}
+COUNTERS = tuple(EVENTS.values())
+# Names email providers use for the same events
+ALIASES = {'delivery': 'delivered', 'opened': 'open', 'clicked': 'click', 'replied': 'reply',
+           'bounced': 'bounce', 'hard_bounce': 'bounce'}
+STOP_EVENTS = ('reply', 'bounce')
+# First opens inserted per statement; SQLite caps the bound parameters of one
+OPENS_PER_INSERT = 500
+
+# 43-byte transparent 1x1 GIF
+PIXEL = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+         b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+_MESSAGE_ID = re.compile(r'^<?helix\.(\d+)\.(\d+)\.')
+
+
+def _serializer(secret: str) -> URLSafeSerializer:
+    return URLSafeSerializer(secret, salt='helix-engagement')
+
+
+def tracking_token(secret: str, sequence_id: int, step: int, recipient: str) -> str:
+    """Signed token naming one delivered message, for its tracking pixel URL."""
+    return _serializer(secret).dumps([sequence_id, step, recipient])
+
+
+def read_token(secret: str, token: str) -> Tuple[int, int, str]:
+    try:
+        sequence_id, step, recipient = _serializer(secret).loads(token)
+    except (BadSignature, TypeError, ValueError):
+        raise ValueError('Invalid tracking token')
+    return int(sequence_id), int(step), str(recipient)
+
+
+def _timestamp(value) -> datetime:
+    if value in (None, ''):
+        return datetime.utcnow()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.utcfromtimestamp(value)
+    at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    # Stored times are naive UTC
+    return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+
+def parse_event(data) -> Dict:
+    """Normalize one webhook event.
+
+    An event names its message either with ``sequence_id`` and ``step`` or
+    with the ``message_id`` the message was sent with; ``recipient`` is
+    needed for replies and bounces to stop later follow-ups, and for opens,
+    which are counted once per recipient.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Event must be an object')
+    event_type = str(data.get('type') or data.get('event') or '').strip().lower()
+    event_type = ALIASES.get(event_type, event_type)
+    if event_type not in EVENTS:
+        raise ValueError(f"Unknown event type: {event_type or 'missing'}")
+    if data.get('sequence_id') is not None and data.get('step') is not None:
+        try:
+            sequence_id, step = int(data['sequence_id']), int(data['step'])
+        except (TypeError, ValueError):
+            raise ValueError('sequence_id and step must be numbers')
+    else:
+        match = _MESSAGE_ID.match(str(data.get('message_id') or '').strip())
+        if not match:
+            raise ValueError('Event needs sequence_id and step or a Helix message_id')
+        sequence_id, step = int(match.group(1)), int(match.group(2))
+    if step < 1:
+        raise ValueError('Step numbers start at 1')
+    recipient = str(data.get('recipient') or data.get('email') or '').strip() or None
+    if event_type == 'open' and not recipient:
+        raise ValueError('Open events need a recipient')
+    try:
+        at = _timestamp(data.get('timestamp'))
+    except (OverflowError, OSError, TypeError):
+        raise ValueError('Invalid timestamp')
+    return {'type': event_type, 'sequence_id': sequence_id, 'step': step, 'recipient': recipient, 'at': at}
+
+
+class EngagementBuffer:
+    """Counts events in memory and adds them to the counter tables on flush."""
+
+    def __init__(self, max_keys: int = 100000,
+                 on_stop: Optional[Callable[[int, str, str], None]] = None):
+        # Distinct counters held between flushes; events beyond it are dropped
+        self.max_keys = max_keys
+        self.on_stop = on_stop
+        self.lock = threading.Lock()
+        # (sequence_id, step, day, column) -> count
+        self.counts: Counter = Counter()
+        # (sequence_id, recipient) -> 'reply' or 'bounce'
+        self.stops: Dict[Tuple[int, str], str] = {}
+        # (sequence_id, step, recipient) -> day of the first open seen
+        self.opens: Dict[Tuple[int, int, str], date] = {}
+        self.counters = {'received': 0, 'dropped': 0, 'written': 0, 'unknown': 0, 'repeat_opens': 0}
+
+    def record(self, event_type: str, sequence_id: int, step: int, recipient: Optional[str] = None,
+               at: Optional[datetime] = None) -> bool:
+        """Count one event; False when it was dropped because the buffer is full.
+
+        Raises ValueError for an open without a recipient.
+        """
+        day = (at or datetime.utcnow()).date()
+        if event_type == 'open':
+            if not recipient:
+                raise ValueError('Open events need a recipient')
+            key, counts = (sequence_id, step, recipient), self.opens
+        else:
+            key, counts = (sequence_id, step, day, EVENTS[event_type]), self.counts
+        with self.lock:
+            self.counters['received'] += 1
+            if key in self.opens:
+                self.counters['repeat_opens'] += 1
+                return True
+            if key not in counts and len(self.counts) + len(self.opens) >= self.max_keys:
+                self.counters['dropped'] += 1
+                return False
+            if counts is self.opens:
+                self.opens[key] = day
+            else:
+                self.counts[key] += 1
+            if recipient and event_type in STOP_EVENTS:
+                self.stops.setdefault((sequence_id, recipient), event_type)
+        return True
+
+    def record_event(self, event: Dict) -> bool:
+        return self.record(event['type'], event['sequence_id'], event['step'], event['recipient'], event['at'])
+
+    def flush(self) -> int:
+        """Write all buffered counts; returns the number of events written.
+
+        Counts of a failed write are put back and retried on the next flush.
+        """
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            stops, self.stops = self.stops, {}
+            opens, self.opens = self.opens, {}
+        if not counts and not stops and not opens:
+            return 0
+        try:
+            written = self._write(counts, opens)
+        except Exception as e:
+            logger.error("Error writing %s engagement events: %s", sum(counts.values()) + len(opens), e)
+            db.session.rollback()
+            with self.lock:
+                self.counts.update(counts)
+                for key, reason in stops.items():
+                    self.stops.setdefault(key, reason)
+                for key, day in opens.items():
+                    self.opens.setdefault(key, day)
+            return 0
+        if self.on_stop:
+            for (sequence_id, recipient), reason in stops.items():
+                try:
+                    self.on_stop(sequence_id, recipient, reason)
+                except Exception as e:
+                    logger.error("Error stopping follow-ups for sequence %s: %s", sequence_id, e)
+                    db.session.rollback()
+        return written
+
+    def _write(self, counts: Counter, opens: Dict[Tuple[int, int, str], date]) -> int:
+        counts = Counter(counts)
+        personas = dict(db.session.execute(
+            select(EmailSequence.id, EmailSequence.persona)
+            .where(EmailSequence.id.in_({key[0] for key in counts} | {key[0] for key in opens}))
+        ).all())
+        connection = db.session.connection()
+        known = [key for key in opens if key[0] in personas]
+        first = first_opens(connection, known)
+        unknown = len(opens) - len(known)
+        for sequence_id, step, recipient in first:
+            counts[(sequence_id, step, opens[(sequence_id, step, recipient)], 'opens')] += 1
+        steps: Dict[tuple, Dict] = {}
+        days: Dict[tuple, Dict] = {}
+        written = 0
+        for (sequence_id, step, day, column), count in counts.items():
+            if sequence_id not in personas:
+                unknown += count
+                continue
+            written += count
+            row = steps.setdefault((sequence_id, step), dict(sequence_id=sequence_id, step=step,
+                                                             **dict.fromkeys(COUNTERS, 0)))
+            row[column] += count
+            persona = personas[sequence_id] or ''
+            row = days.setdefault((persona, day), dict(persona=persona, day=day, **dict.fromkeys(COUNTERS, 0)))
+            row[column] += count
+        upsert_counts(connection, EngagementCounter.__table__, ('sequence_id', 'step'), list(steps.values()))
+        upsert_counts(connection, PersonaEngagement.__table__, ('persona', 'day'), list(days.values()))
+        db.session.commit()
+        with self.lock:
+            self.counters['written'] += written
+            self.counters['unknown'] += unknown
+            self.counters['repeat_opens'] += len(known) - len(first)
+        if unknown:
+            logger.warning("Ignored %s engagement events for unknown sequences", unknown)
+        return written
+
+    def run_flusher(self, sleep, interval: float = 1.0):
+        """Flush on a fixed interval forever; run it as a background task."""
+        while True:
+            sleep(interval)
+            self.flush()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counters, pending=sum(self.counts.values()) + len(self.opens))
+
+
+def first_opens(connection, keys: List[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+    """Record (sequence_id, step, recipient) opens; returns those not recorded before."""
+    table = EngagementOpen.__table__
+    columns = (table.c.sequence_id, table.c.step, table.c.recipient)
+    dialect = {'postgresql': postgresql, 'sqlite': sqlite}.get(connection.dialect.name)
+    first = []
+    for start in range(0, len(keys), OPENS_PER_INSERT):
+        chunk = keys[start:start + OPENS_PER_INSERT]
+        if dialect is not None:
+            statement = dialect.insert(table).values([dict(zip(('sequence_id', 'step', 'recipient'), key))
+                                                      for key in chunk])
+            first += [tuple(row) for row in connection.execute(statement.on_conflict_do_nothing().returning(*columns))]
+            continue
+        seen = {tuple(row) for row in connection.execute(select(*columns).where(tuple_(*columns).in_(chunk)))}
+        new = [key for key in chunk if key not in seen]
+        if new:
+            connection.execute(table.insert(), [dict(zip(('sequence_id', 'step', 'recipient'), key)) for key in new])
+        first += new
+    return first
+
+
+def engagement_rates(counts) -> Dict:
+    """Percent of delivered messages opened, clicked and replied to, and of attempts bounced."""
+    delivered, bounces = counts['delivered'] or 0, counts['bounces'] or 0
+
+    def rate(count, total):
+        return round(100.0 * count / total, 1) if total else None
+    return {
+        'open_rate': rate(counts['opens'] or 0, delivered),
+        'click_rate': rate(counts['clicks'] or 0, delivered),
+        'response_rate': rate(counts['replies'] or 0, delivered),
+        'bounce_rate': rate(bounces, delivered + bounces),
+    }
+
+
+def _totals(row) -> Dict:
+    return {column: row[column] or 0 for column in COUNTERS}
+
+
+def sequence_engagement(sequence_id: int) -> Dict:
+    """Recorded counts and rates per step and overall, next to the model's estimates."""
+    rows = db.session.execute(
+        select(EngagementCounter).where(EngagementCounter.sequence_id == sequence_id)
+        .order_by(EngagementCounter.step)
+    ).scalars().all()
+    steps = []
+    for row in rows:
+        counts = {column: getattr(row, column) for column in COUNTERS}
+        steps.append(dict(step=row.step, **counts, **engagement_rates(counts)))
+    total = {column: sum(step[column] for step in steps) for column in COUNTERS}
+    metrics = db.session.get(SequenceMetrics, sequence_id)
+    return {
+        'sequence_id': sequence_id,
+        'steps': steps,
+        'actual': dict(total, **engagement_rates(total)),
+        'estimated': {'open_rate': metrics.open_rate if metrics else None,
+                      'response_rate': metrics.response_rate if metrics else None}
+    }
+
+
+def persona_engagement(filters: Optional[Dict] = None) -> List[Dict]:
+    """Recorded rates per persona next to the average estimated rates from the dashboard rollups.
+
+    ``filters`` may hold a persona and ``since`` and ``until`` dates. Events
+    are dated by when they happened and estimates by when the sequence was
+    generated.
+    """
+    filters = filters or {}
+    query = select(PersonaEngagement.persona, *[func.sum(getattr(PersonaEngagement, column)).label(column)
+                                                for column in COUNTERS])
+    if filters.get('persona'):
+        query = query.where(PersonaEngagement.persona == filters['persona'])
+    if filters.get('since'):
+        query = query.where(PersonaEngagement.day >= filters['since'])
+    if filters.get('until'):
+        query = query.where(PersonaEngagement.day < filters['until'])
+    actual = {row['persona'] or None: _totals(row) for row in
+              db.session.execute(query.group_by(PersonaEngagement.persona)).mappings()}
+    estimated = {group['persona']: group for group in dashboard(['persona'], {
+        name: filters[name] for name in ('persona', 'since', 'until') if filters.get(name)})}
+
+    groups = []
+    for persona in sorted(set(actual) | set(estimated), key=lambda name: name or ''):
+        counts = actual.get(persona, dict.fromkeys(COUNTERS, 0))
+        estimate = estimated.get(persona, {})
+        groups.append({
+            'persona': persona,
+            'actual': dict(counts, **engagement_rates(counts)),
+            'estimated': {'open_rate': estimate.get('open_rate'), 'response_rate': estimate.get('response_rate')}
+        })
+    return groups
+
+
+def parse_engagement_args(params: Dict) -> Dict:
+    filters = {'persona': params['persona']} if params.get('persona') else {}
+    for name in ('since', 'until'):
+        if params.get(name):
+            filters[name] = date.fromisoformat(params[name])
+    return filters
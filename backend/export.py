@@ -0,0 +1,192 @@
+"""Streaming bulk export of stored email sequences.
+
+Rows are read through a server-side cursor (``yield_per``) and serialized one
+at a time into response chunks, so memory use does not depend on how many
+sequences match the filters.
+"""
+import csv
+import io
+import json
+import logging
+import zipfile
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from models import db, EmailSequence
+
+logger = logging.getLogger(__name__)
+
+YIELD_PER = 500
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'eml': ('application/zip', 'zip'),
+}
+
+CSV_FIELDS = ['sequence_id', 'persona', 'tone', 'sequence_type', 'created_at', 'step', 'subject', 'body']
+
+
+def parse_filters(params: Dict) -> Dict:
+    """Pick the sequence listing filters out of query args or a JSON body; raises ValueError."""
+    filters = {}
+    for key in ('persona', 'tone', 'sequence_type', 'type', 'since', 'until'):
+        if params.get(key) and not isinstance(params[key], str):
+            raise ValueError(f"Filter {key} must be a string")
+    for key in ('persona', 'tone'):
+        if params.get(key):
+            filters[key] = params[key]
+    sequence_type = params.get('sequence_type') or params.get('type')
+    if sequence_type:
+        filters['sequence_type'] = sequence_type
+    for key in ('since', 'until'):
+        if params.get(key):
+            filters[key] = datetime.fromisoformat(params[key])
+    return filters
+
+
+def iter_sequences(filters: Dict, yield_per: int = YIELD_PER) -> Iterator:
+    """Stream matching sequence rows oldest first."""
+    query = select(
+        EmailSequence.id,
+        EmailSequence.content,
+        EmailSequence.persona,
+        EmailSequence.tone,
+        EmailSequence.sequence_type,
+        EmailSequence.created_at,
+    )
+    for key in ('persona', 'tone', 'sequence_type'):
+        if key in filters:
+            query = query.where(getattr(EmailSequence, key) == filters[key])
+    if 'since' in filters:
+        query = query.where(EmailSequence.created_at >= filters['since'])
+    if 'until' in filters:
+        query = query.where(EmailSequence.created_at < filters['until'])
+    query = query.order_by(EmailSequence.id).execution_options(yield_per=yield_per)
+    yield from db.session.execute(query)
+
+
+def parse_steps(content: str) -> List[Dict]:
+    """Turn stored sequence content into a list of subject/body steps."""
+    try:
+        steps = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return [{'subject': '', 'body': content}]
+    if isinstance(steps, dict):
+        steps = [steps]
+    if not isinstance(steps, list):
+        return [{'subject': '', 'body': content}]
+    return [step if isinstance(step, dict) else {'subject': '', 'body': str(step)} for step in steps]
+
+
+def to_csv(rows: Iterable) -> Iterator[str]:
+    """Serialize rows as CSV, one line per email step."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(CSV_FIELDS)
+    yield flush()
+    for row in rows:
+        created_at = row.created_at.isoformat() if row.created_at else ''
+        for step, email in enumerate(parse_steps(row.content), start=1):
+            writer.writerow([row.id, row.persona, row.tone, row.sequence_type, created_at,
+                             step, email.get('subject', ''), email.get('body', '')])
+        yield flush()
+
+
+def to_jsonl(rows: Iterable) -> Iterator[str]:
+    """Serialize rows as JSON Lines, one object per sequence."""
+    for row in rows:
+        yield json.dumps({
+            'id': row.id,
+            'persona': row.persona,
+            'tone': row.tone,
+            'sequence_type': row.sequence_type,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'steps': parse_steps(row.content),
+        }) + '\n'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def header_value(value) -> str:
+    """One line of header text; model output may hold line breaks the header must not carry."""
+    return ' '.join(str(value or '').split())
+
+
+def build_eml(row, step: int, email: Dict) -> bytes:
+    message = EmailMessage()
+    message['Subject'] = header_value(email.get('subject'))
+    message['X-Helix-Sequence-Id'] = str(row.id)
+    message['X-Helix-Step'] = str(step)
+    if row.persona:
+        message['X-Helix-Persona'] = header_value(row.persona)
+    message.set_content(str(email.get('body') or ''))
+    return bytes(message)
+
+
+def to_eml_zip(rows: Iterable) -> Iterator[bytes]:
+    """Serialize rows into a ZIP of ``.eml`` files, one per email step.
+
+    The archive is written to an unseekable sink, so zipfile uses data
+    descriptors and every entry can be flushed as soon as it is written.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for row in rows:
+            for step, email in enumerate(parse_steps(row.content), start=1):
+                archive.writestr(f'sequence-{row.id}/step-{step}.eml', build_eml(row, step, email))
+            yield sink.drain()
+    yield sink.drain()
+
+
+SERIALIZERS = {
+    'csv': to_csv,
+    'jsonl': to_jsonl,
+    'eml': to_eml_zip,
+}
+
+
+def export_response(params: Dict, export_format: Optional[str] = None) -> Response:
+    """Build a chunked download response for the sequences matching ``params``."""
+    export_format = export_format or params.get('format', 'csv')
+    if not isinstance(export_format, str) or export_format not in SERIALIZERS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    filters = parse_filters(params)
+    logger.info("Exporting sequences as %s", export_format, extra={'filters': filters})
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"sequences-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"
+    body = SERIALIZERS[export_format](iter_sequences(filters))
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
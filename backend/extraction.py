@@ -0,0 +1,835 @@
+"""Local extraction of the conversation context summary.
+
+``summarize_context`` used to spend a model call on every request to fill
+this schema:
+
+- ``role``: job title, e.g. ``Senior Backend Engineer``
+- ``company_type``: e.g. ``Series B fintech startup``
+- ``key_requirements``: list of skills and experience
+- ``location``: e.g. ``Hybrid, Berlin``
+- ``unique_selling_points``: list of reasons to join
+
+:class:`ContextExtractor` fills it locally. User turns are split into
+clauses. Each clause goes through rules: a title pattern for the role,
+vocabularies for company stage, industry and skills, and cue patterns for
+location, requirement lists and selling points. Every value carries a
+confidence.
+
+A small :class:`ClauseModel` (multinomial naive Bayes over words and word
+pairs) classifies clauses by field. It raises the confidence of values the
+rules found, adds requirement and selling-point clauses that no rule
+matched, and flags clauses that talk about a field the rules could not
+read. The model is trained from stored conversations and their cached
+summaries with ``python extraction.py train``. A worker also learns from
+every model summary it requests.
+
+The state of each conversation is kept between requests. A turn is read
+once, in well under a millisecond. The summary is served locally unless a
+field the conversation talks about has only low-confidence values. Only
+then is the model asked, and its answer is merged into the state, so the
+result always has the schema above.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llm_backend import parse_model_json
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('role', 'company_type', 'key_requirements', 'location', 'unique_selling_points')
+LIST_FIELDS = ('key_requirements', 'unique_selling_points')
+CLASSES = FIELDS + ('other',)
+MODEL_VERSION = 1
+
+# Confidence of values found by strong rules (an explicit cue or vocabulary
+# hit) and weak ones; below the threshold a summary asks the model
+STRONG = 0.9
+WEAK = 0.6
+DEFAULT_MIN_CONFIDENCE = 0.5
+# A later value replaces an earlier one unless it is this much less certain
+RECENCY_MARGIN = 0.15
+# The clause model only votes once it has seen this many clauses; it adds a
+# clause as a list value from this probability and flags a field from FLAG_PROBABILITY
+MIN_MODEL_DOCS = 200
+ADD_PROBABILITY = 0.8
+FLAG_PROBABILITY = 0.5
+MAX_ITEMS = 8
+MAX_ITEM_LENGTH = 120
+# Clauses kept per conversation to learn from a model summary
+MAX_CLAUSES = 50
+MAX_FEATURES = 50000
+
+CLAUSE_SPLIT = re.compile(r'(?<=[.!?])\s+|[;\n•]+|\s+-\s+')
+WORD = re.compile(r"[A-Za-z0-9][\w+#.'/-]*")
+FEATURE = re.compile(r"[a-z0-9+#]+")
+NOT_SPECIFIED = frozenset({'', 'n/a', 'na', 'none', 'null', 'unknown', 'not specified', 'not mentioned',
+                           'not provided', 'unspecified', 'tbd'})
+
+TITLE_NOUNS = frozenset({
+    'engineer', 'developer', 'manager', 'designer', 'scientist', 'analyst', 'architect', 'director', 'recruiter',
+    'consultant', 'lead', 'administrator', 'specialist', 'researcher', 'writer', 'marketer', 'officer', 'sre',
+    'cto', 'ceo', 'cfo', 'coo', 'vp', 'head', 'programmer', 'technician', 'strategist', 'coordinator',
+    'representative', 'executive', 'accountant', 'intern', 'owner', 'partner', 'advocate', 'tester',
+})
+# Title nouns followed by "of <area>", as in "Head of Data"
+OF_TITLES = frozenset({'head', 'vp', 'director', 'chief', 'manager'})
+# Words that end a title when reading back from its noun
+TITLE_STOPS = frozenset({
+    'a', 'an', 'the', 'our', 'my', 'your', 'their', 'his', 'her', 'we', 'i', 'you', 'they', 'us', 'for', 'as',
+    'is', 'are', 'be', 'to', 'of', 'with', 'and', 'or', 'at', 'in', 'on', 'who', 'that', 'this', 'hire', 'hiring',
+    'hired', 'need', 'needs', 'needed', 'want', 'wants', 'seeking', 'looking', 'find', 'recruit', 'recruiting',
+    'fill', 'great', 'talented', 'strong', 'experienced', 'amazing', 'passionate', 'skilled', 'good', 'excellent',
+    'motivated', 'rockstar', 'new', 'another', 'more', 'some', 'two', 'three', 'several', 'many', 'few', 'one',
+    'hands-on', 'ideal', 'perfect', 'awesome', 'best', 'top', 'exceptional', 'brilliant', 'smart', 'other',
+    'every', 'all', 'any', 'hiring', 'current', 'existing', 'future', 'fellow', 'about', 'like', 'also',
+})
+TITLE_ABBREVIATIONS = {'sr': 'Senior', 'sr.': 'Senior', 'jr': 'Junior', 'jr.': 'Junior', 'swe': 'Software Engineer'}
+ROLE_CUE = re.compile(r"\b(?:hir(?:e|ing)|looking for|seeking|recruit(?:ing)?(?: for)?|need(?:s|ed)?|fill(?:ing)?|"
+                      r"role(?: is|:)|position(?: is|:)|title(?: is|:)|opening for|search(?:ing)? for)\s+"
+                      r"(?:an?\s+|the\s+|our\s+|two\s+|several\s+)?$", re.I)
+
+STAGES = OrderedDict([
+    (re.compile(r'\bpre[- ]seed\b', re.I), 'pre-seed'),
+    (re.compile(r'\bseed[- ]stage\b|\bseed[- ]funded\b', re.I), 'seed-stage'),
+    (re.compile(r'\bseries ([a-f])\b', re.I), 'Series {}'),
+    (re.compile(r'\bearly[- ]stage\b', re.I), 'early-stage'),
+    (re.compile(r'\blate[- ]stage\b', re.I), 'late-stage'),
+    (re.compile(r'\b(?:vc|venture)[- ]backed\b', re.I), 'venture-backed'),
+    (re.compile(r'\bbootstrapped\b', re.I), 'bootstrapped'),
+    (re.compile(r'\bpublicly traded\b|\bpublic company\b', re.I), 'public'),
+    (re.compile(r'\bfortune (\d+)\b', re.I), 'Fortune {}'),
+    (re.compile(r'\b(?:yc|y combinator)[- ]backed\b', re.I), 'YC-backed'),
+])
+INDUSTRIES = {
+    'fintech': 'fintech', 'healthtech': 'healthtech', 'healthcare': 'healthcare', 'health': 'health',
+    'edtech': 'edtech', 'education': 'education', 'biotech': 'biotech', 'e-commerce': 'e-commerce',
+    'ecommerce': 'e-commerce', 'saas': 'SaaS', 'b2b': 'B2B', 'b2c': 'B2C', 'marketplace': 'marketplace',
+    'payments': 'payments', 'insurtech': 'insurtech', 'proptech': 'proptech', 'crypto': 'crypto',
+    'web3': 'web3', 'blockchain': 'blockchain', 'ai': 'AI', 'gaming': 'gaming', 'cybersecurity': 'cybersecurity',
+    'security': 'security', 'logistics': 'logistics', 'climate': 'climate', 'cleantech': 'cleantech',
+    'energy': 'energy', 'media': 'media', 'adtech': 'adtech', 'martech': 'martech', 'legaltech': 'legaltech',
+    'devtools': 'developer tools', 'robotics': 'robotics', 'automotive': 'automotive', 'aerospace': 'aerospace',
+    'telecom': 'telecom', 'retail': 'retail', 'banking': 'banking', 'insurance': 'insurance',
+    'consulting': 'consulting', 'govtech': 'govtech', 'hardware': 'hardware', 'software': 'software',
+    'analytics': 'analytics', 'mobility': 'mobility', 'travel': 'travel', 'foodtech': 'foodtech',
+}
+COMPANY_KINDS = {
+    'startup': 'startup', 'start-up': 'startup', 'scale-up': 'scale-up', 'scaleup': 'scale-up',
+    'enterprise': 'enterprise', 'agency': 'agency', 'consultancy': 'consultancy', 'corporation': 'corporation',
+    'nonprofit': 'nonprofit', 'non-profit': 'nonprofit', 'lab': 'lab', 'studio': 'studio', 'bank': 'bank',
+    'firm': 'firm', 'company': 'company', 'business': 'business', 'organization': 'organization',
+}
+# Kinds that say nothing on their own
+GENERIC_KINDS = frozenset({'company', 'business', 'organization', 'firm'})
+# Words that can start a stage, so the stage patterns only run when one is there
+STAGE_HINTS = frozenset({'pre-seed', 'seed', 'seed-stage', 'seed-funded', 'series', 'early-stage', 'early', 'late',
+                         'late-stage', 'vc-backed', 'vc', 'venture-backed', 'venture', 'bootstrapped', 'publicly',
+                         'public', 'fortune', 'yc', 'yc-backed', 'y'})
+
+WORK_MODE = re.compile(r'\b(fully remote|remote[- ]first|remote[- ]friendly|remote|hybrid|on[- ]?site|in[- ]office)\b',
+                       re.I)
+PLACE = re.compile(r"\b(?:based in|located in|offices? in|headquartered in|hq in|relocat\w* to|"
+                   r"(?:remote|hybrid|on[- ]?site|in[- ]office|work) (?:in|from|within)|near|"
+                   r"(?:company|startup|agency|firm|studio|lab|team|office) in)\s+"
+                   r"((?:the\s+)?[A-Z][\w.'-]*(?:(?:\s+|,\s*)(?:[A-Z][\w.'-]*|of|de))*)")
+TIMEZONE = re.compile(r"\b([A-Z]{2,4}|UTC\s?[+-]\s?\d{1,2}|European|Americas?|APAC)\s+time\s?zones?\b")
+WORK_MODE_NAMES = {'fully remote': 'Fully remote', 'remote-first': 'Remote-first', 'remote first': 'Remote-first',
+                   'remote-friendly': 'Remote-friendly', 'remote friendly': 'Remote-friendly', 'remote': 'Remote',
+                   'hybrid': 'Hybrid', 'onsite': 'On-site', 'on-site': 'On-site', 'on site': 'On-site',
+                   'in-office': 'In-office', 'in office': 'In-office'}
+
+SKILLS = {
+    'python': 'Python', 'golang': 'Go', 'rust': 'Rust', 'java': 'Java', 'kotlin': 'Kotlin', 'scala': 'Scala',
+    'c++': 'C++', 'c#': 'C#', '.net': '.NET', 'javascript': 'JavaScript', 'typescript': 'TypeScript',
+    'react': 'React', 'react native': 'React Native', 'node.js': 'Node.js', 'nodejs': 'Node.js', 'vue': 'Vue',
+    'angular': 'Angular', 'next.js': 'Next.js', 'django': 'Django', 'flask': 'Flask', 'fastapi': 'FastAPI',
+    'rails': 'Rails', 'ruby on rails': 'Ruby on Rails', 'ruby': 'Ruby', 'php': 'PHP', 'laravel': 'Laravel',
+    'swift': 'Swift', 'ios': 'iOS', 'android': 'Android', 'flutter': 'Flutter', 'elixir': 'Elixir',
+    'erlang': 'Erlang', 'haskell': 'Haskell', 'clojure': 'Clojure', 'sql': 'SQL', 'postgres': 'PostgreSQL',
+    'postgresql': 'PostgreSQL', 'mysql': 'MySQL', 'mongodb': 'MongoDB', 'redis': 'Redis', 'kafka': 'Kafka',
+    'spark': 'Spark', 'hadoop': 'Hadoop', 'airflow': 'Airflow', 'dbt': 'dbt', 'snowflake': 'Snowflake',
+    'bigquery': 'BigQuery', 'aws': 'AWS', 'gcp': 'GCP', 'azure': 'Azure', 'kubernetes': 'Kubernetes',
+    'k8s': 'Kubernetes', 'docker': 'Docker', 'terraform': 'Terraform', 'linux': 'Linux', 'graphql': 'GraphQL',
+    'grpc': 'gRPC', 'rest apis': 'REST APIs', 'microservices': 'microservices', 'ci/cd': 'CI/CD',
+    'devops': 'DevOps', 'machine learning': 'machine learning', 'deep learning': 'deep learning',
+    'pytorch': 'PyTorch', 'tensorflow': 'TensorFlow', 'nlp': 'NLP', 'llms': 'LLMs', 'llm': 'LLMs',
+    'computer vision': 'computer vision', 'data engineering': 'data engineering', 'data modeling': 'data modeling',
+    'distributed systems': 'distributed systems', 'system design': 'system design', 'embedded': 'embedded systems',
+    'figma': 'Figma', 'sketch': 'Sketch', 'product management': 'product management', 'leadership': 'leadership',
+    'mentoring': 'mentoring', 'communication': 'communication', 'stakeholder management': 'stakeholder management',
+    'statistics': 'statistics', 'a/b testing': 'A/B testing', 'excel': 'Excel', 'salesforce': 'Salesforce',
+    'security': 'security', 'networking': 'networking', 'solidity': 'Solidity', 'unity': 'Unity',
+}
+# Vocabulary terms with a slash; other slashes separate words ("python/django")
+SLASH_TERMS = frozenset(term for term in SKILLS if '/' in term)
+SLASH_PARTS = frozenset(part for term in SLASH_TERMS for part in term.split('/'))
+# First words of vocabulary phrases, so longer phrases are only tried where one can start
+PHRASE_STARTS = frozenset(term.split()[0] for vocabulary in (SKILLS, INDUSTRIES) for term in vocabulary if ' ' in term)
+# "Go" only counts capitalized and not as a verb
+GO_SKILL = re.compile(r"(?<![\w.])Go(?![\w+#])(?!\s+(?:to|ahead|for|through|over|back|live|out|with us)\b)")
+EXPERIENCE = re.compile(r"\b(\d+)\s*(\+|\s*-\s*\d+|\s*to\s*\d+)?\s*(?:years?|yrs?)\b(?:\s+of)?"
+                        r"(?:\s+(?:professional|industry|relevant|hands-on|production|[\w-]+(?=\s+experience)))?(?:\s+experience)?"
+                        r"(?:(?:\s+(?:with|in|building|on|as|doing)|(?<=\bof))\s+((?:an?\s+)?[\w+#./-]+(?:\s+[\w+#./-]+){0,3}?))?"
+                        r"(?=\s*(?:[,.;:!?)]|\band\b|\bor\b|$))", re.I)
+DEGREE = re.compile(r"\b(bachelor'?s|master'?s|ph\.?d\.?|bs|ms|bsc|msc|mba)\b(?:\s+degree)?"
+                    r"(?:\s+in\s+((?:[A-Za-z]+\s?){1,3}))?", re.I)
+REQUIREMENT_CUE = re.compile(r"\b(?:requirements?(?: are| include)?|must[- ]haves?(?: are)?|must have|should have|"
+                             r"qualifications|nice to have|looking for someone (?:with|who has|who knows)|"
+                             r"needs? to (?:have|know)|experience (?:with|in)|proficien\w+ (?:in|with)|"
+                             r"familiar(?:ity)? with|knowledge of|expertise in|skilled in|comfortable with|"
+                             r"background in|strong)\s*:?\s+(.+)", re.I)
+LIST_SPLIT = re.compile(r'\s*(?:,|/|\band\b|\bor\b|\bplus\b|&)\s*', re.I)
+
+# Concrete benefits, and vaguer selling points that count for less. These and
+# FIELD_CUES are matched against lowercased clauses, which is faster than re.I
+STRONG_POINTS = re.compile(
+    r'\b(?:equity|stock options|esop|rsus?|unlimited (?:pto|vacation|time off)|\d+ (?:days|weeks) (?:of )?'
+    r'(?:pto|vacation|holiday)|(?:4|four)[- ]day (?:work ?)?week|(?:competitive|top[- ]of[- ]market|above[- ]market|'
+    r'generous) (?:salary|pay|compensation|comp|package|benefits)|(?:learning|education|conference|home office) '
+    r'(?:budget|stipend|allowance)|(?:health|dental|medical) (?:insurance|coverage|benefits)|parental leave|'
+    r'sabbatical|visa sponsorship|relocation (?:package|support|assistance|budget)|well[- ]funded|profitable|'
+    r'raised \$?\d+|fast[- ]growing|hypergrowth|remote[- ]first|flexible (?:hours|schedule|working)|'
+    r'work[- ]life balance|async culture)\b')
+WEAK_POINTS = re.compile(
+    r'\b(?:mission|impact(?:ful)?|greenfield|ownership|autonomy|mentorship|growth opportunit\w+|career growth|'
+    r'small team|founding team|bonus|perks|benefits|cutting[- ]edge|state[- ]of[- ]the[- ]art|innovative|unique|'
+    r'exciting|challenging|interesting problems?|world[- ]class)\b')
+# A clause replacing something said earlier ("Actually, make it a Staff Engineer")
+CORRECTION = re.compile(r"\b(?:actually|instead|rather|make it|change (?:it|that|this) to|correction|scratch that|"
+                        r"(?:we|i) meant)\b", re.I)
+LEADING_FILLER = re.compile(r"^(?:and|also|plus|but|so|oh|well|we offer|we have|we provide|you(?:'ll| will) get|"
+                            r"there(?:'s| is)|it(?:'s| is))\s+", re.I)
+
+# Words showing a turn talks about a field, whether or not a value could be read
+FIELD_CUES = re.compile(
+    r"\b(?:(?P<role>role|position|title|hire|hiring|opening|vacancy)|"
+    r"(?P<company_type>company|startup|organization|business|we(?:'re| are) an?)|"
+    r"(?P<key_requirements>requirements?|experience|skills?|qualifications?|must|should know|background)|"
+    r"(?P<location>location|office|relocat\w+|time ?zones?|based|onsite|on-site|commute)|"
+    r"(?P<unique_selling_points>benefits?|perks?|offer|why join|stand out|special|unique))\b")
+TOKEN = re.compile(r"[a-z0-9.#+][a-z0-9+#./'-]*")
+
+
+def features(text: str) -> List[str]:
+    """Words and word pairs of a clause; numbers become ``<n>``."""
+    words = ['<n>' if word.isdigit() else word for word in FEATURE.findall(text.lower())]
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def clauses(text: str) -> List[str]:
+    return [clause.strip(' ,.:') for clause in CLAUSE_SPLIT.split(text or '') if clause and clause.strip(' ,.:')]
+
+
+def tokens(text: str) -> List[str]:
+    """Lowercase words of ``text``, keeping ``c++``, ``node.js`` and ``ci/cd`` whole."""
+    words = []
+    for word in TOKEN.findall(text.lower()):
+        word = word.rstrip(".'")
+        if '/' in word and word not in SLASH_TERMS:
+            words += [part for part in word.split('/') if part]
+        elif word:
+            words.append(word)
+    return words
+
+
+def lookup(words: List[str], vocabulary: Dict[str, str], plurals: bool = False) -> List[str]:
+    """Names of the vocabulary terms (up to three words) in ``words``, the longest at each position."""
+    found, index = [], 0
+    while index < len(words):
+        word = words[index]
+        size = 0
+        if word in PHRASE_STARTS:
+            for size in (3, 2):
+                phrase = ' '.join(words[index:index + size])
+                if phrase in vocabulary:
+                    found.append(vocabulary[phrase])
+                    break
+            else:
+                size = 0
+        if not size:
+            size = 1
+            if word in vocabulary:
+                found.append(vocabulary[word])
+            elif plurals and word.endswith('s') and word[:-1] in vocabulary:
+                found.append(vocabulary[word[:-1]])
+        index += size
+    return found
+
+
+def display_title(words: List[str]) -> str:
+    shown = []
+    for word in words:
+        lower = word.lower()
+        if lower in TITLE_ABBREVIATIONS:
+            shown.append(TITLE_ABBREVIATIONS[lower])
+        elif lower in ('vp', 'cto', 'ceo', 'cfo', 'coo', 'sre', 'qa', 'ml', 'ai', 'ui', 'ux', 'it'):
+            shown.append(word.upper())
+        elif lower in ('of', 'and'):
+            shown.append(lower)
+        elif word.islower():
+            shown.append(word.capitalize())
+        else:
+            shown.append(word)
+    return ' '.join(shown)
+
+
+def find_role(clause: str) -> Optional[Tuple[str, float]]:
+    """The job title a clause names, with a confidence."""
+    words = [(match.group(0).rstrip('.'), match.start(), match.end()) for match in WORD.finditer(clause)]
+    for index, (word, start, end) in enumerate(words):
+        lower = word.lower()
+        noun = lower[:-1] if lower.endswith('s') and lower[:-1] in TITLE_NOUNS else lower
+        if noun not in TITLE_NOUNS:
+            continue
+        # "Lead" and "Head" open titles as often as they end them
+        if noun in ('lead', 'head') and index + 1 < len(words) and words[index + 1][0].lower() != 'of':
+            if any(w.lower().rstrip('s') in TITLE_NOUNS for w, _, _ in words[index + 1:index + 4]):
+                continue
+        first, title = index, [word if noun == lower else word[:-1]]
+        while first > 0 and index - first < 4:
+            previous, _, previous_end = words[first - 1]
+            if previous.lower() in TITLE_STOPS or clause[previous_end:words[first][1]].strip():
+                break
+            first -= 1
+            title.insert(0, previous)
+        if noun in OF_TITLES and index + 2 < len(words) and words[index + 1][0].lower() == 'of':
+            title += ['of', words[index + 2][0]]
+            if index + 3 < len(words) and words[index + 3][0][0].isupper() and \
+                    not clause[words[index + 2][2]:words[index + 3][1]].strip():
+                title.append(words[index + 3][0])
+        modifiers = len(title) > 1
+        cue = ROLE_CUE.search(clause[:words[first][1]])
+        confidence = STRONG if cue else WEAK if modifiers else WEAK - 0.15
+        return display_title(title), confidence
+    return None
+
+
+def find_company_type(clause: str, words: List[str]) -> Optional[Tuple[str, float]]:
+    stages = []
+    if any(word in STAGE_HINTS for word in words):
+        for pattern, name in STAGES.items():
+            match = pattern.search(clause)
+            if match:
+                stages.append(name.format(*(group.upper() if len(group) == 1 else group for group in match.groups())))
+    industries = list(dict.fromkeys(lookup(words, INDUSTRIES)))
+    kinds = lookup(words, COMPANY_KINDS, plurals=True)
+    kind = next((kind for kind in kinds if kind not in GENERIC_KINDS), None)
+    if not (stages or industries or kind):
+        return None
+    name = ' '.join(stages + industries[:2] + [kind or (kinds[0] if kinds else 'company')])
+    confidence = STRONG if kind and (stages or industries) else WEAK + 0.1
+    return name[0].upper() + name[1:], confidence
+
+
+def find_location(clause: str) -> Optional[Tuple[str, float]]:
+    mode = WORK_MODE.search(clause)
+    place = PLACE.search(clause)
+    zone = TIMEZONE.search(clause)
+    parts = []
+    if mode:
+        parts.append(WORK_MODE_NAMES.get(mode.group(1).lower().replace('  ', ' '), mode.group(1).capitalize()))
+    if place:
+        where = re.sub(r'^the\s+', '', place.group(1).rstrip(',. '))
+        parts.append(where)
+    elif zone:
+        parts.append(f'{zone.group(1)} time zones')
+    if not parts:
+        return None
+    return ', '.join(parts), STRONG
+
+
+def find_requirements(clause: str, words: List[str]) -> List[Tuple[str, float]]:
+    found = []
+    for match in EXPERIENCE.finditer(clause) if any(word.startswith(('year', 'yr')) for word in words) else ():
+        years = match.group(1) + (match.group(2) or '').replace(' ', '')
+        area = match.group(3)
+        found.append((f'{years} years with {area}' if area else f'{years} years of experience', STRONG))
+    for match in DEGREE.finditer(clause):
+        degree = match.group(1)
+        subject = (match.group(2) or '').strip()
+        degree = {'bs': 'BS', 'ms': 'MS', 'bsc': 'BSc', 'msc': 'MSc', 'mba': 'MBA'}.get(
+            degree.lower(), 'PhD' if degree.lower().startswith('ph') else degree.capitalize())
+        found.append((f'{degree} in {subject}' if subject else f"{degree} degree", STRONG))
+    experience = ' '.join(value for value, _ in found)
+    skills = lookup(words, SKILLS)
+    if 'go' in words and GO_SKILL.search(clause):
+        skills.append('Go')
+    # Skills already named in an experience item are not listed again
+    found += [(skill, STRONG) for skill in dict.fromkeys(skills) if skill not in experience]
+    cue = REQUIREMENT_CUE.search(clause)
+    if cue:
+        for item in LIST_SPLIT.split(cue.group(1)):
+            item = item.strip(' .:')
+            if 0 < len(item.split()) <= 6 and item.lower() not in SLASH_PARTS and not lookup(tokens(item), SKILLS) \
+                    and not GO_SKILL.search(item) \
+                    and not EXPERIENCE.search(item) and not DEGREE.search(item):
+                found.append((item, WEAK + 0.15))
+    return found
+
+
+def find_selling_point(clause: str, lowered: str) -> Optional[Tuple[str, float]]:
+    if STRONG_POINTS.search(lowered):
+        confidence = STRONG
+    else:
+        cues = len(WEAK_POINTS.findall(lowered))
+        if not cues:
+            return None
+        # Each further vague cue makes the clause a likelier selling point
+        confidence = min(STRONG, WEAK + 0.1 * (cues - 1))
+    text = LEADING_FILLER.sub('', clause).strip()
+    text = text[0].upper() + text[1:] if text else text
+    return text[:MAX_ITEM_LENGTH].rstrip(), confidence
+
+
+def read_clause(clause: str) -> Dict[str, List[Tuple[str, float]]]:
+    """Rule values of one clause per field."""
+    words = tokens(clause)
+    found = {}
+    for field, value in (('role', find_role(clause)), ('company_type', find_company_type(clause, words)),
+                         ('location', find_location(clause)), ('unique_selling_points', find_selling_point(clause, clause.lower()))):
+        if value:
+            found[field] = [value]
+    requirements = find_requirements(clause, words)
+    if requirements:
+        found['key_requirements'] = requirements
+    return found
+
+
+def read_message(text: str) -> Dict[str, List[str]]:
+    """Rule values of one message per field: the likeliest for a single-valued field, all items of a list."""
+    found, best = {}, {}
+    for clause in clauses(text):
+        for field, values in read_clause(clause).items():
+            if field in LIST_FIELDS:
+                items = found.setdefault(field, [])
+                items += [value for value, _ in values if value not in items]
+            else:
+                for value, confidence in values:
+                    if confidence > best.get(field, 0.0):
+                        best[field] = confidence
+                        found[field] = [value]
+    return found
+
+
+class ClauseModel:
+    """Multinomial naive Bayes over clause words and word pairs, one class per field plus ``other``."""
+
+    def __init__(self, counts: Optional[Dict[str, Dict[str, int]]] = None, docs: Optional[Dict[str, int]] = None,
+                 max_features: int = MAX_FEATURES):
+        self.counts = {label: dict((counts or {}).get(label, {})) for label in CLASSES}
+        self.docs = {label: (docs or {}).get(label, 0) for label in CLASSES}
+        self.totals = {label: sum(self.counts[label].values()) for label in CLASSES}
+        self.vocabulary = set().union(*self.counts.values())
+        self.max_features = max_features
+        self.lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return sum(self.docs.values())
+
+    def learn(self, clause: str, label: str):
+        with self.lock:
+            self.docs[label] += 1
+            counts = self.counts[label]
+            for feature in features(clause):
+                if feature not in self.vocabulary:
+                    if len(self.vocabulary) >= self.max_features:
+                        continue
+                    self.vocabulary.add(feature)
+                counts[feature] = counts.get(feature, 0) + 1
+                self.totals[label] += 1
+
+    def predict(self, clause: str) -> Optional[Dict[str, float]]:
+        """Probability of each class; None until the model has seen enough clauses."""
+        size = self.size
+        if size < MIN_MODEL_DOCS:
+            return None
+        words = [feature for feature in features(clause) if feature in self.vocabulary]
+        if not words:
+            return None
+        vocabulary = len(self.vocabulary)
+        scores = {}
+        for label in CLASSES:
+            counts = self.counts[label]
+            denominator = math.log(self.totals[label] + vocabulary)
+            score = math.log((self.docs[label] + 1) / (size + len(CLASSES)))
+            for word in words:
+                score += math.log(counts.get(word, 0) + 1) - denominator
+            scores[label] = score
+        top = max(scores.values())
+        weights = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(weights.values())
+        return {label: weight / total for label, weight in weights.items()}
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {'version': MODEL_VERSION, 'docs': dict(self.docs),
+                    'counts': {label: dict(counts) for label, counts in self.counts.items()}}
+
+    def save(self, path: str, min_count: int = 2):
+        """Write the model atomically, dropping features seen fewer than ``min_count`` times."""
+        data = self.to_dict()
+        data['counts'] = {label: {feature: count for feature, count in counts.items() if count >= min_count}
+                          for label, counts in data['counts'].items()}
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(data, f)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ClauseModel':
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != MODEL_VERSION:
+            raise ValueError(f"Unsupported extraction model version: {data.get('version')}")
+        return cls(data['counts'], data['docs'])
+
+
+def value_tokens(value) -> List[set]:
+    values = value if isinstance(value, list) else [value]
+    return [set(FEATURE.findall(str(item).lower())) for item in values if item]
+
+
+def label_clause(clause: str, summary: Dict) -> str:
+    """The summary field a clause is about: the one whose value it covers best, or ``other``."""
+    words = set(FEATURE.findall(clause.lower()))
+    best, best_score = 'other', 0.5
+    for field in FIELDS:
+        for tokens in value_tokens(summary.get(field)):
+            if tokens:
+                score = len(tokens & words) / len(tokens)
+                if score > best_score:
+                    best, best_score = field, score
+    return best
+
+
+def training_examples(conversations: Iterable[Tuple[Dict, List[str]]]) -> Iterable[Tuple[str, str]]:
+    """(clause, label) pairs from summaries and the user turns they cover."""
+    for summary, turns in conversations:
+        summary = normalize_summary(summary)
+        for turn in turns:
+            for clause in clauses(turn):
+                yield clause, label_clause(clause, summary)
+
+
+def normalize_summary(raw) -> Dict:
+    """Coerce a model's summary into the schema: strings or None, and lists of strings."""
+    if not isinstance(raw, dict):
+        raise ValueError(f"Expected a JSON object, got {type(raw).__name__}")
+    summary = {}
+    for field in FIELDS:
+        value = raw.get(field)
+        if field in LIST_FIELDS:
+            if isinstance(value, str):
+                value = [item.strip() for item in re.split(r'[;,\n]', value)]
+            elif not isinstance(value, list):
+                value = [] if value is None else [str(value)]
+            items = []
+            for item in value:
+                item = str(item).strip()
+                if item.lower() not in NOT_SPECIFIED and item not in items:
+                    items.append(item[:MAX_ITEM_LENGTH])
+            summary[field] = items[:MAX_ITEMS]
+        else:
+            if isinstance(value, list):
+                value = ', '.join(str(item) for item in value if item)
+            value = str(value).strip() if value is not None else ''
+            summary[field] = value[:MAX_ITEM_LENGTH] if value.lower() not in NOT_SPECIFIED else None
+    return summary
+
+
+class _State:
+    """What has been read from one conversation so far."""
+
+    __slots__ = ('user_turns', 'last_turn', 'scalars', 'lists', 'uncertain', 'conflicts', 'clauses')
+
+    def __init__(self):
+        self.user_turns = 0
+        self.last_turn: Optional[str] = None
+        # field -> (value, confidence) and field -> {key: (value, confidence)}
+        self.scalars: Dict[str, Tuple[str, float]] = {}
+        self.lists: Dict[str, 'OrderedDict[str, Tuple[str, float]]'] = {field: OrderedDict() for field in LIST_FIELDS}
+        # Fields a turn talked about without a confident value
+        self.uncertain = set()
+        # Fields a later turn gave a different, less certain value for
+        self.conflicts = set()
+        self.clauses: List[str] = []
+
+    def set_scalar(self, field: str, value: str, confidence: float, correction: bool = False):
+        """Keep the newer value; one much less certain than the current one makes the field a conflict.
+
+        An explicit correction replaces the current value with its confidence.
+        """
+        current = self.scalars.get(field)
+        if current is None or confidence >= current[1] - RECENCY_MARGIN:
+            self.scalars[field] = (value, confidence)
+        elif current[0].lower() != value.lower():
+            if correction:
+                self.scalars[field] = (value, current[1])
+            else:
+                self.scalars[field] = (value, confidence)
+                self.conflicts.add(field)
+
+    def add_item(self, field: str, value: str, confidence: float):
+        items = self.lists[field]
+        key = value.lower()
+        if key in items:
+            confidence = max(confidence, items[key][1])
+        elif len(items) >= MAX_ITEMS:
+            return
+        items[key] = (value, confidence)
+
+    def confidence(self, field: str) -> Optional[float]:
+        if field in LIST_FIELDS:
+            items = self.lists[field]
+            return max(confidence for _, confidence in items.values()) if items else None
+        current = self.scalars.get(field)
+        return current[1] if current else None
+
+    def summary(self) -> Dict:
+        summary = {}
+        for field in FIELDS:
+            if field in LIST_FIELDS:
+                summary[field] = [value for value, _ in self.lists[field].values()]
+            else:
+                current = self.scalars.get(field)
+                summary[field] = current[0] if current else None
+        return summary
+
+
+class Extraction:
+    """A locally extracted summary and whether it is confident enough to serve."""
+
+    __slots__ = ('summary', 'confidence', 'uncertain', 'clauses', 'seconds')
+
+    def __init__(self, summary: Dict, confidence: float, uncertain: List[str], clauses: List[str], seconds: float):
+        self.summary = summary
+        self.confidence = confidence
+        self.uncertain = uncertain
+        self.clauses = clauses
+        self.seconds = seconds
+
+    @property
+    def confident(self) -> bool:
+        return not self.uncertain
+
+
+class ContextExtractor:
+    """Fills the context summary turn by turn and says when the model is still needed."""
+
+    def __init__(self, model: Optional[ClauseModel] = None, min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                 max_conversations: int = 10000, learn: bool = True):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.max_conversations = max_conversations
+        self.learn = learn
+        self.lock = threading.Lock()
+        self.states: 'OrderedDict[object, _State]' = OrderedDict()
+        self.counters = {'turns': 0, 'local': 0, 'fallbacks': 0, 'fallback_errors': 0, 'learned': 0}
+        self.turn_seconds = 0.0
+
+    def read_turn(self, state: _State, text: str):
+        """Apply one user turn to ``state``."""
+        for clause in clauses(text):
+            found = read_clause(clause)
+            probabilities = self.model.predict(clause) if self.model is not None else None
+            cues = {match.lastgroup for match in FIELD_CUES.finditer(clause.lower())}
+            correction = CORRECTION.search(clause) is not None
+            for field in FIELDS:
+                values = found.get(field)
+                p = probabilities.get(field, 0.0) if probabilities else 0.0
+                if values:
+                    for value, confidence in values:
+                        if p >= FLAG_PROBABILITY:
+                            confidence = max(confidence, min(STRONG, p))
+                        if field in LIST_FIELDS:
+                            state.add_item(field, value, confidence)
+                        else:
+                            state.set_scalar(field, value, confidence, correction)
+                elif field in LIST_FIELDS and p >= ADD_PROBABILITY:
+                    text = LEADING_FILLER.sub('', clause)
+                    state.add_item(field, text[:1].upper() + text[1:MAX_ITEM_LENGTH], p * STRONG)
+                elif p >= FLAG_PROBABILITY or field in cues:
+                    state.uncertain.add(field)
+            if len(state.clauses) < MAX_CLAUSES:
+                state.clauses.append(clause)
+
+    def _state(self, key, user_messages: List[str]) -> _State:
+        state = self.states.get(key) if key is not None else None
+        # A history that does not continue the turns read so far starts over; none at all keeps them
+        if state is None or user_messages and (state.user_turns > len(user_messages) or (
+                state.user_turns and user_messages[state.user_turns - 1] != state.last_turn)):
+            state = _State()
+        if key is not None:
+            self.states[key] = state
+            self.states.move_to_end(key)
+            while len(self.states) > self.max_conversations:
+                self.states.popitem(last=False)
+        return state
+
+    def _read(self, messages: List[Dict], key) -> _State:
+        user_messages = [message.get('content') or '' for message in messages or ()
+                         if message.get('role', 'user') == 'user']
+        state = self._state(key, user_messages)
+        if not user_messages:
+            return state
+        new_turns = user_messages[state.user_turns:]
+        started = time.perf_counter()
+        for text in new_turns:
+            self.read_turn(state, text)
+        self.turn_seconds += time.perf_counter() - started
+        self.counters['turns'] += len(new_turns)
+        state.user_turns = len(user_messages)
+        state.last_turn = user_messages[-1] if user_messages else None
+        return state
+
+    def observe(self, messages: List[Dict], key):
+        """Read the user turns of ``messages`` not read yet for ``key``, so a later summary finds them read."""
+        with self.lock:
+            self._read(messages, key)
+
+    def extract(self, messages: List[Dict], key=None) -> Extraction:
+        """Read the user turns of ``messages`` not read yet for ``key`` and summarize the conversation.
+
+        Without a key every turn is read again; without user turns, those read
+        for the key so far are summarized.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            state = self._read(messages, key)
+            uncertain = []
+            lowest = 1.0
+            for field in FIELDS:
+                confidence = self.confidence_of(state, field)
+                if confidence is not None:
+                    lowest = min(lowest, confidence)
+                    if confidence < self.min_confidence:
+                        uncertain.append(field)
+            seconds = time.perf_counter() - started
+            # A confident extraction is served as it is (see resolve otherwise)
+            self.counters['local'] += not uncertain
+            return Extraction(state.summary(), lowest, uncertain, list(state.clauses), seconds)
+
+    def confidence_of(self, state: _State, field: str) -> Optional[float]:
+        """Confidence of a field: of its value, None when never mentioned, and 0 when a turn talked
+        about it without a value or contradicted the earlier one."""
+        confidence = state.confidence(field)
+        if field in state.conflicts or (confidence is None and field in state.uncertain):
+            return 0.0
+        return confidence
+
+    def resolve(self, extraction: Extraction, text: str, key=None) -> Dict:
+        """Merge the model's summary ``text`` into the local one and learn from it.
+
+        Fields the model left empty keep their local values; unusable model
+        output leaves the local summary as it was.
+        """
+        try:
+            answer = normalize_summary(parse_model_json(text))
+        except (ValueError, TypeError) as e:
+            logger.warning("Unusable model summary, serving the local one: %s", e)
+            with self.lock:
+                self.counters['fallbacks'] += 1
+                self.counters['fallback_errors'] += 1
+            return extraction.summary
+        summary = {}
+        for field in FIELDS:
+            if field in LIST_FIELDS:
+                summary[field] = (answer[field] + [item for item in extraction.summary[field]
+                                                   if item not in answer[field]])[:MAX_ITEMS]
+            else:
+                summary[field] = answer[field] or extraction.summary[field]
+        with self.lock:
+            self.counters['fallbacks'] += 1
+            state = self.states.get(key) if key is not None else None
+            if state is not None:
+                for field in FIELDS:
+                    if field in LIST_FIELDS:
+                        for item in answer[field]:
+                            state.add_item(field, item, 1.0)
+                    elif answer[field]:
+                        state.scalars[field] = (answer[field], 1.0)
+                state.uncertain.clear()
+                state.conflicts.clear()
+        if self.learn and self.model is not None:
+            for clause in extraction.clauses:
+                self.model.learn(clause, label_clause(clause, answer))
+            with self.lock:
+                self.counters['learned'] += len(extraction.clauses)
+        return summary
+
+    def forget(self, key):
+        with self.lock:
+            self.states.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            counters = dict(self.counters)
+            summaries = counters['local'] + counters['fallbacks']
+            counters['local_rate'] = round(counters['local'] / summaries, 3) if summaries else 0.0
+            counters['avg_turn_us'] = round(self.turn_seconds / counters['turns'] * 1e6, 1) if counters['turns'] else 0.0
+            counters['conversations'] = len(self.states)
+            counters['model_clauses'] = self.model.size if self.model is not None else 0
+            return counters
+
+
+def load_model(path: Optional[str]) -> ClauseModel:
+    """The model stored at ``path``, or an empty one to learn from model summaries."""
+    if path and os.path.exists(path):
+        try:
+            return ClauseModel.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Error loading extraction model: %s", e)
+    return ClauseModel()
+
+
+def stored_conversations(batch_size: int = 500) -> Iterable[Tuple[Dict, List[str]]]:
+    """Cached summaries with the user turns they cover, from the database."""
+    from sqlalchemy import select
+    from models import db, ConversationSummary, ConversationTurn
+
+    query = select(ConversationSummary.summary, ConversationTurn.conversation_id, ConversationTurn.content).join(
+        ConversationTurn, ConversationTurn.conversation_id == ConversationSummary.conversation_id
+    ).where(ConversationTurn.role == 'user', ConversationTurn.turn <= ConversationSummary.through_turn).order_by(
+        ConversationTurn.conversation_id, ConversationTurn.turn)
+    current, summary, turns = None, None, []
+    for row in db.session.execute(query.execution_options(yield_per=batch_size)):
+        if row.conversation_id != current:
+            if turns:
+                yield summary, turns
+            current, summary, turns = row.conversation_id, row.summary, []
+        turns.append(row.content)
+    if turns:
+        yield summary, turns
+
+
+def train(conversations: Iterable[Tuple[Dict, List[str]]], model: Optional[ClauseModel] = None) -> ClauseModel:
+    model = model or ClauseModel()
+    for clause, label in training_examples(conversations):
+        model.learn(clause, label)
+    return model
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Helix context extraction model')
+    parser.add_argument('command', choices=['train'])
+    parser.add_argument('--out', help='model path (default EXTRACTION_MODEL_PATH)')
+    args = parser.parse_args()
+
+    from app import app
+    from config import Config
+    path = args.out or Config.EXTRACTION_MODEL_PATH
+    if not path:
+        raise SystemExit('Set EXTRACTION_MODEL_PATH or pass --out')
+    with app.app_context():
+        trained = train(stored_conversations())
+    trained.save(path)
+    print(f"Trained on {trained.size} clauses: {trained.docs}")
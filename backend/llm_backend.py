@@ -0,0 +1,341 @@
+"""Pluggable model backend for Gemini calls.
+
+``HELIX_LLM_MODE`` selects how ``generate_content`` is served:
+
+- ``live``: call Gemini (the default)
+- ``record``: call Gemini and append every prompt/response pair to the cassette
+- ``replay``: answer from the cassette, optionally with synthetic latency
+- ``synthetic``: generate schema-valid fake responses for each tool prompt
+
+Replay and synthetic modes need no API key or network, so every socket event
+and ``recruiting_graph`` can run offline for reproducible perf and regression
+runs. ``HELIX_LLM_LATENCY`` adds a delay per call, e.g. ``fixed:0.2``,
+``uniform:0.1,0.6``, ``normal:0.4,0.1`` or ``lognormal:-1.0,0.5`` (seconds).
+
+Every backend also has ``generate_content_async`` for the asyncio server; its
+synthetic latency is an ``asyncio.sleep`` so waits never hold a thread.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import google.generativeai as genai
+
+from config import Config
+from tracing import TracedModel, traced_loads, tracer
+
+logger = logging.getLogger(__name__)
+
+MODES = ('live', 'record', 'replay', 'synthetic')
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when a prompt was never recorded."""
+
+
+class ModelResponse:
+    """Minimal stand-in for a Gemini response."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def strip_code_fences(text: str) -> str:
+    """Remove a markdown code fence (```json ... ```) around model output."""
+    clean_text = text.strip()
+    if clean_text.startswith('```'):
+        clean_text = clean_text.split('```')[1]
+        if clean_text.startswith('json'):
+            clean_text = clean_text[4:]
+    return clean_text.strip()
+
+
+def parse_model_json(text: str):
+    """Parse JSON model output that may be wrapped in a code fence."""
+    return traced_loads(strip_code_fences(text))
+
+
+def prompt_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{prompt}".encode('utf-8')).hexdigest()
+
+
+class Latency:
+    """Per-call delay drawn from a configured distribution."""
+
+    def __init__(self, spec: Optional[str] = None, seed: Optional[int] = None):
+        self.spec = spec or ''
+        self.random = random.Random(seed)
+        kind, _, params = self.spec.partition(':')
+        values = [float(v) for v in params.split(',') if v.strip()]
+        samplers = {
+            '': lambda: 0.0,
+            'fixed': lambda: values[0],
+            'uniform': lambda: self.random.uniform(values[0], values[1]),
+            'normal': lambda: self.random.gauss(values[0], values[1]),
+            'lognormal': lambda: self.random.lognormvariate(values[0], values[1]),
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution: {self.spec}")
+        self._sample = samplers[kind]
+
+    def sample(self) -> float:
+        return max(0.0, self._sample())
+
+    def wait(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class Cassette:
+    """Append-only JSONL file of recorded prompt/response pairs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.responses: Dict[str, List[str]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.responses[entry['key']].append(entry['response'])
+
+    def append(self, model_name: str, prompt: str, response: str):
+        key = prompt_key(model_name, prompt)
+        entry = {'key': key, 'model': model_name, 'prompt': prompt, 'response': response}
+        with self.lock:
+            self.responses[key].append(response)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def lookup(self, model_name: str, prompt: str) -> Optional[str]:
+        """Return the recorded response, cycling through repeats of one prompt."""
+        key = prompt_key(model_name, prompt)
+        with self.lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                return None
+            index = self._cursor[key] % len(recorded)
+            self._cursor[key] += 1
+            return recorded[index]
+
+
+class LiveModel:
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt, **kwargs):
+        return self.model.generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return await self.model.generate_content_async(prompt, **kwargs)
+
+
+class RecordingModel:
+    def __init__(self, inner, cassette: Cassette):
+        self.model_name = inner.model_name
+        self.inner = inner
+        self.cassette = cassette
+
+    def generate_content(self, prompt, **kwargs):
+        response = self.inner.generate_content(prompt, **kwargs)
+        self.cassette.append(self.model_name, str(prompt), response.text)
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        response = await self.inner.generate_content_async(prompt, **kwargs)
+        self.cassette.append(self.model_name, str(prompt), response.text)
+        return response
+
+
+class SyntheticModel:
+    """Deterministic fake responses shaped like each tool's expected output."""
+
+    def __init__(self, model_name: str, latency: Optional[Latency] = None):
+        self.model_name = model_name
+        self.latency = latency or Latency()
+
+    def generate_content(self, prompt, **kwargs):
+        self.latency.wait()
+        return ModelResponse(synthesize(str(prompt)))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await self.latency.wait_async()
+        return ModelResponse(synthesize(str(prompt)))
+
+
+class ReplayModel:
+    def __init__(self, model_name: str, cassette: Cassette, latency: Optional[Latency] = None,
+                 on_miss: str = 'error'):
+        self.model_name = model_name
+        self.cassette = cassette
+        self.latency = latency or Latency()
+        self.on_miss = on_miss
+
+    def generate_content(self, prompt, **kwargs):
+        self.latency.wait()
+        return ModelResponse(self._lookup(prompt))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await self.latency.wait_async()
+        return ModelResponse(self._lookup(prompt))
+
+    def _lookup(self, prompt) -> str:
+        text = self.cassette.lookup(self.model_name, str(prompt))
+        if text is None:
+            if self.on_miss != 'synthetic':
+                raise CassetteMiss(f"No cassette entry for {self.model_name} prompt {prompt_key(self.model_name, str(prompt))[:12]}")
+            logger.warning("Cassette miss, serving a synthetic response")
+            text = synthesize(str(prompt))
+        return text
+
+
+def _role_from_prompt(prompt: str) -> str:
+    match = re.search(r"(?:for an? |role: ?)([A-Z][\w+/ -]{2,40}?)(?: position| role|[.,\n])", prompt)
+    return match.group(1).strip() if match else 'Software Engineer'
+
+
+def _sequence(prompt: str, steps: int = 3, template: bool = False) -> str:
+    role = _role_from_prompt(prompt)
+    greeting = '{{first_name | there}}' if template else 'there'
+    hook = ('{{#if github_top_repo}}I enjoyed reading {{github_top_repo}}.{{else}}Your work stood out to us.{{/if}}'
+            if template else 'Your work stood out to us.')
+    emails = [{
+        'subject': f"{role} opportunity at our company",
+        'body': f"Hi {greeting},\n\n{hook} We're hiring a {role} to help build our core platform.\n\n"
+                f"Would you be open to a 20 minute call this week?\n\nBest,\nThe Hiring Team"
+    }]
+    for step in range(2, steps + 1):
+        emails.append({
+            'subject': f"Following up ({step}/{steps}): {role}",
+            'body': f"Hi {greeting},\n\nFollowing up on the {role} role. Happy to share more about the team "
+                    f"and the problems you'd own.\n\nBest,\nThe Hiring Team"
+        })
+    return json.dumps(emails, indent=2)
+
+
+def _router(prompt: str) -> str:
+    match = re.search(r'User message: "(.*?)"\n', prompt, re.DOTALL)
+    message = (match.group(1) if match else '').lower()
+    if any(word in message for word in ('generate', 'sequence', 'write the emails', 'draft')):
+        return json.dumps({'action': 'tool', 'tool': 'generate_sequence', 'args': {'tone': 'professional'}})
+    return json.dumps({'action': 'chat',
+                       'response': "Thanks! Could you tell me more about the key requirements for this role?"})
+
+
+def _metrics(prompt: str) -> str:
+    digest = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16)
+    return json.dumps({
+        'open_rate': f"{40 + digest % 30}%",
+        'response_rate': f"{10 + digest % 25}%",
+        'sentiment': 'Positive',
+        'personalization_score': str(50 + digest % 50),
+        'quality_score': str(60 + digest % 40),
+    })
+
+
+def _suggestions(prompt: str) -> str:
+    return json.dumps({'suggestions': [
+        "Reference a specific project from the candidate's GitHub profile.",
+        "Shorten the first subject line to under 50 characters.",
+        "End each email with a concrete call-to-action and time slot.",
+    ]})
+
+
+def _summary(prompt: str) -> str:
+    return json.dumps({
+        'role': _role_from_prompt(prompt),
+        'company_type': 'Technology company',
+        'key_requirements': ['Relevant experience', 'Strong communication'],
+        'location': 'Not specified',
+        'unique_selling_points': ['Impactful work', 'Growth opportunities'],
+    })
+
+
+def _company_summary(prompt: str) -> str:
+    profile = json.loads(prompt.split('Company profile:\n', 1)[1])
+    description = ' '.join((profile.get('description') or '').split()[:30])
+    return f"{profile.get('name')} builds {profile.get('industry') or 'software'} products. {description}"
+
+
+def _step_count(prompt: str) -> int:
+    match = re.search(r'Create (\d+) (?:recruiting )?emails', prompt)
+    return int(match.group(1)) if match else 3
+
+
+# Ordered (marker, builder) pairs matched against the prompt text
+SYNTHETIC_RULES: List = [
+    ('"action": "chat" or "tool"', _router),
+    ('recruiting email performance analyst', _metrics),
+    ('recruiting coach reviewing', _suggestions),
+    ('extract key information about the role', _summary),
+    ('Summarize this hiring company', _company_summary),
+    ('reusable recruiting email sequence template', lambda p: _sequence(p, template=True)),
+    ('recruiting emails for a', lambda p: _sequence(p, steps=_step_count(p))),
+    ('Apply the following suggestion', _sequence),
+    ('Adjust the tone', _sequence),
+    ('recruiting outreach sequence', lambda p: _sequence(p, steps=2)),
+    ('sequence of recruiting emails', _sequence),
+    ('highly personalized recruiting emails', _sequence),
+    ('email sequence editor', _sequence),
+]
+
+
+def synthesize(prompt: str) -> str:
+    """Build a schema-valid fake response for a known tool prompt."""
+    for marker, builder in SYNTHETIC_RULES:
+        if marker in prompt:
+            return builder(prompt)
+    return "This is a synthetic response."
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def _cassette(path: str) -> Cassette:
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def requires_api_key(mode: Optional[str] = None) -> bool:
+    return (mode or Config.LLM_MODE) in ('live', 'record')
+
+
+def create_model(model_name: str, mode: Optional[str] = None):
+    """Return a model with ``generate_content(prompt)`` and ``generate_content_async(prompt)`` for the configured mode.
+
+    Calls are recorded as spans of the current trace.
+    """
+    mode = mode or Config.LLM_MODE
+    if mode not in MODES:
+        raise ValueError(f"Unknown LLM mode: {mode}")
+    latency = Latency(Config.LLM_LATENCY, seed=Config.LLM_SEED)
+    if mode == 'live':
+        model = LiveModel(model_name)
+    elif mode == 'record':
+        model = RecordingModel(LiveModel(model_name), _cassette(Config.LLM_CASSETTE))
+    elif mode == 'replay':
+        model = ReplayModel(model_name, _cassette(Config.LLM_CASSETTE), latency, on_miss=Config.LLM_REPLAY_MISS)
+    else:
+        model = SyntheticModel(model_name, latency)
+    return TracedModel(model, tracer)
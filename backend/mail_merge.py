@@ -0,0 +1,205 @@
+"""Local mail-merge rendering for per-candidate personalization.
+
+The LLM writes a sequence once with typed placeholders; this module compiles
+it into plain Python callables and fills it per candidate without any model
+call.
+
+Template syntax::
+
+    Hi {{first_name | there}},
+    {{#if github_top_repo}}I enjoyed reading {{github_top_repo}}.{{else}}Your work stood out.{{/if}}
+    Your experience with {{skills}} is a great fit.
+
+Placeholders must come from :data:`PLACEHOLDERS`; the type decides how a
+value is formatted, and the text after ``|`` replaces a missing value.
+"""
+import json
+import re
+from typing import Callable, Dict, List, Optional, Union
+
+from llm_backend import parse_model_json
+
+# Placeholder name -> (type, default fallback)
+PLACEHOLDERS = {
+    'first_name': ('text', 'there'),
+    'last_name': ('text', ''),
+    'full_name': ('text', 'there'),
+    'current_title': ('text', 'your current role'),
+    'current_company': ('text', 'your current company'),
+    'location': ('text', ''),
+    'years_experience': ('number', ''),
+    'skills': ('list', 'your skills'),
+    'github_url': ('url', ''),
+    'github_top_repo': ('text', ''),
+    'linkedin_url': ('url', ''),
+    'linkedin_headline': ('text', ''),
+    'recent_achievement': ('text', ''),
+}
+
+_TAG = re.compile(r'\{\{\s*(.*?)\s*\}\}', re.DOTALL)
+
+Renderer = Callable[[Dict], str]
+
+
+class TemplateError(ValueError):
+    """Raised when a template uses unknown placeholders or unbalanced sections."""
+
+
+def _is_missing(value) -> bool:
+    return value is None or value == '' or value == [] or value == ()
+
+
+def _format_text(value) -> str:
+    return str(value).strip()
+
+
+def _format_number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _format_list(value) -> str:
+    if isinstance(value, str):
+        items = [item.strip() for item in value.split(',') if item.strip()]
+    else:
+        items = [str(item).strip() for item in value if str(item).strip()]
+    if len(items) <= 1:
+        return ''.join(items)
+    return f"{', '.join(items[:-1])} and {items[-1]}"
+
+
+_FORMATTERS = {
+    'text': _format_text,
+    'url': _format_text,
+    'number': _format_number,
+    'list': _format_list,
+}
+
+
+def _compile_placeholder(expression: str) -> Renderer:
+    name, separator, fallback = expression.partition('|')
+    name = name.strip()
+    if name not in PLACEHOLDERS:
+        raise TemplateError(f"Unknown placeholder: {name}")
+    value_type, default = PLACEHOLDERS[name]
+    fallback = fallback.strip() if separator else default
+    formatter = _FORMATTERS[value_type]
+
+    def render(candidate: Dict) -> str:
+        value = candidate.get(name)
+        if _is_missing(value):
+            return fallback
+        return formatter(value) or fallback
+    return render
+
+
+def _join(parts: List[Union[str, Renderer]]) -> Renderer:
+    """Merge adjacent literals and return a single renderer for the parts."""
+    merged = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != '':
+            merged.append(part)
+    if not merged:
+        return lambda candidate: ''
+    if len(merged) == 1:
+        only = merged[0]
+        return (lambda candidate: only) if isinstance(only, str) else only
+    funcs = [(lambda candidate, text=part: text) if isinstance(part, str) else part for part in merged]
+    return lambda candidate: ''.join([func(candidate) for func in funcs])
+
+
+def compile_template(template: str) -> Renderer:
+    """Compile one template string into a ``render(candidate) -> str`` callable."""
+    # Each stack frame: [condition, then_parts, else_parts or None]
+    root: List = []
+    stack = []
+    current = root
+    position = 0
+    for match in _TAG.finditer(template):
+        current.append(template[position:match.start()])
+        position = match.end()
+        tag = match.group(1)
+        if tag.startswith('#if'):
+            condition = tag[3:].strip()
+            if condition not in PLACEHOLDERS:
+                raise TemplateError(f"Unknown placeholder in condition: {condition}")
+            frame = [condition, [], None]
+            stack.append((frame, current))
+            current = frame[1]
+        elif tag == 'else':
+            if not stack or stack[-1][0][2] is not None:
+                raise TemplateError("{{else}} without a matching {{#if}}")
+            frame = stack[-1][0]
+            frame[2] = []
+            current = frame[2]
+        elif tag == '/if':
+            if not stack:
+                raise TemplateError("{{/if}} without a matching {{#if}}")
+            (condition, then_parts, else_parts), current = stack.pop()
+            current.append(_compile_section(condition, _join(then_parts), _join(else_parts or [])))
+        else:
+            current.append(_compile_placeholder(tag))
+    if stack:
+        raise TemplateError(f"Unclosed {{{{#if {stack[-1][0][0]}}}}}")
+    current.append(template[position:])
+    return _join(root)
+
+
+def _compile_section(condition: str, then_render: Renderer, else_render: Renderer) -> Renderer:
+    def render(candidate: Dict) -> str:
+        if _is_missing(candidate.get(condition)):
+            return else_render(candidate)
+        return then_render(candidate)
+    return render
+
+
+class SequenceTemplate:
+    """A compiled multi-step sequence template."""
+
+    def __init__(self, steps: List[Dict]):
+        if not steps:
+            raise TemplateError("Sequence template has no steps")
+        if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+            raise TemplateError("Sequence template must be a list of steps with a subject and body")
+        for step in steps:
+            if not all(isinstance(step.get(field, ''), str) for field in ('subject', 'body')):
+                raise TemplateError("Step subjects and bodies must be text")
+        self.steps = steps
+        self._compiled = [
+            (compile_template(step.get('subject', '')), compile_template(step.get('body', '')))
+            for step in steps
+        ]
+
+    @classmethod
+    def from_text(cls, text: str) -> 'SequenceTemplate':
+        """Build from model output, tolerating markdown code fences."""
+        try:
+            steps = parse_model_json(text)
+        except json.JSONDecodeError as e:
+            raise TemplateError(f"Template is not valid JSON: {str(e)}")
+        if isinstance(steps, dict):
+            steps = [steps]
+        return cls(steps)
+
+    def render(self, candidate: Dict) -> List[Dict[str, str]]:
+        """Fill the template for one candidate."""
+        return [
+            {'subject': subject(candidate), 'body': body(candidate)}
+            for subject, body in self._compiled
+        ]
+
+    def render_many(self, candidates: List[Dict]) -> List[List[Dict[str, str]]]:
+        return [self.render(candidate) for candidate in candidates]
+
+
+def placeholder_guide(names: Optional[List[str]] = None) -> str:
+    """Describe the placeholder vocabulary for the template generation prompt."""
+    lines = []
+    for name in names or PLACEHOLDERS:
+        value_type, default = PLACEHOLDERS[name]
+        fallback = f' (falls back to "{default}")' if default else ''
+        lines.append(f"- {{{{{name}}}}}: {value_type}{fallback}")
+    return "\n".join(lines)
@@ -29,7 +29,8 @@ class Conversation(db.Model):
     __tablename__ = 'conversations'
     
     id = db.Column(db.Integer, primary_key=True)
-    messages = db.Column(db.JSON, nullable=False)
+    # Legacy whole-history blob; turns are appended to ConversationTurn instead
+    messages = db.Column(db.JSON, nullable=False, default=list)
     persona = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -39,4 +40,384 @@ class Conversation(db.Model):
             'messages': self.messages,
             'persona': self.persona,
             'created_at': self.created_at.isoformat()
-        } 
\ No newline at end of file
+        } 
+
+
+class ConversationTurn(db.Model):
+    """One message of a conversation; rows are only ever appended."""
+    __tablename__ = 'conversation_turns'
+
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), primary_key=True)
+    turn = db.Column(db.Integer, primary_key=True)
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'turn': self.turn,
+            'role': self.role,
+            'content': self.content
+        }
+
+
+class ConversationSummary(db.Model):
+    """Latest context summary of a conversation and the turn it covers."""
+    __tablename__ = 'conversation_summaries'
+
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), primary_key=True)
+    through_turn = db.Column(db.Integer, nullable=False)
+    summary = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+
+class SequenceBlob(db.Model):
+    """Sequence text keyed by its SHA-256; a full snapshot or a delta against ``base_hash``."""
+    __tablename__ = 'sequence_blobs'
+
+    hash = db.Column(db.String(64), primary_key=True)
+    base_hash = db.Column(db.String(64), db.ForeignKey('sequence_blobs.hash'), nullable=True)
+    # Deltas since the last full snapshot; 0 for a snapshot
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    data = db.Column(db.Text, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+
+
+class SequenceVersion(db.Model):
+    """One revision of a sequence and the revision it was derived from."""
+    __tablename__ = 'sequence_versions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    lineage_id = db.Column(db.Integer, nullable=True, index=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('sequence_versions.id'), nullable=True)
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), nullable=True, index=True)
+    number = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), db.ForeignKey('sequence_blobs.hash'), nullable=False)
+    source = db.Column(db.String(30), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Two workers numbering the same lineage at once cannot both commit
+    __table_args__ = (db.UniqueConstraint('lineage_id', 'number'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'lineage_id': self.lineage_id,
+            'parent_id': self.parent_id,
+            'sequence_id': self.sequence_id,
+            'number': self.number,
+            'content_hash': self.content_hash,
+            'source': self.source,
+            'created_at': self.created_at.isoformat()
+        }
+
+class SequenceMetrics(db.Model):
+    """Estimated metrics and suggestions of one generated sequence."""
+    __tablename__ = 'sequence_metrics'
+
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), primary_key=True)
+    # Percentages and 0-100 scores; None when the model gave no usable number
+    open_rate = db.Column(db.Float, nullable=True)
+    response_rate = db.Column(db.Float, nullable=True)
+    personalization_score = db.Column(db.Float, nullable=True)
+    quality_score = db.Column(db.Float, nullable=True)
+    sentiment = db.Column(db.String(20), nullable=True)
+    suggestions = db.Column(db.JSON, nullable=False, default=list)
+    suggestion_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    sequence = db.relationship('EmailSequence')
+
+    def to_dict(self):
+        return {
+            'sequence_id': self.sequence_id,
+            'open_rate': self.open_rate,
+            'response_rate': self.response_rate,
+            'personalization_score': self.personalization_score,
+            'quality_score': self.quality_score,
+            'sentiment': self.sentiment,
+            'suggestions': self.suggestions,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class MetricsRollup(db.Model):
+    """Daily totals per persona, tone and sequence type; averages are ``*_sum / *_count``."""
+    __tablename__ = 'metrics_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    # Missing dimensions are stored as '' so they can be part of the key
+    persona = db.Column(db.String(50), primary_key=True)
+    tone = db.Column(db.String(50), primary_key=True)
+    sequence_type = db.Column(db.String(50), primary_key=True)
+    sequences = db.Column(db.Integer, nullable=False, default=0)
+    scored = db.Column(db.Integer, nullable=False, default=0)
+    open_rate_sum = db.Column(db.Float, nullable=False, default=0)
+    open_rate_count = db.Column(db.Integer, nullable=False, default=0)
+    response_rate_sum = db.Column(db.Float, nullable=False, default=0)
+    response_rate_count = db.Column(db.Integer, nullable=False, default=0)
+    personalization_score_sum = db.Column(db.Float, nullable=False, default=0)
+    personalization_score_count = db.Column(db.Integer, nullable=False, default=0)
+    quality_score_sum = db.Column(db.Float, nullable=False, default=0)
+    quality_score_count = db.Column(db.Integer, nullable=False, default=0)
+    positive = db.Column(db.Integer, nullable=False, default=0)
+    neutral = db.Column(db.Integer, nullable=False, default=0)
+    negative = db.Column(db.Integer, nullable=False, default=0)
+    suggestions = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Campaign(db.Model):
+    """Bulk sequence generation job."""
+    __tablename__ = 'campaigns'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    completed_rows = db.Column(db.Integer, nullable=False, default=0)
+    failed_rows = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Renewed by the running worker; a running campaign without recent beats has crashed
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'total_rows': self.total_rows,
+            'completed_rows': self.completed_rows,
+            'failed_rows': self.failed_rows,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class CampaignRow(db.Model):
+    """One EmailConfig-like input row of a campaign and its outcome."""
+    __tablename__ = 'campaign_rows'
+
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), nullable=False, index=True)
+    row_index = db.Column(db.Integer, nullable=False)
+    config = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.UniqueConstraint('campaign_id', 'row_index'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'campaign_id': self.campaign_id,
+            'row_index': self.row_index,
+            'config': self.config,
+            'status': self.status,
+            'sequence_id': self.sequence_id,
+            'error': self.error,
+            'attempts': self.attempts
+        }
+
+
+class ScheduledStep(db.Model):
+    """One step of a sequence due to be sent to one recipient."""
+    __tablename__ = 'scheduled_steps'
+
+    id = db.Column(db.Integer, primary_key=True)
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), nullable=False)
+    recipient = db.Column(db.String(320), nullable=False)
+    step = db.Column(db.Integer, nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False)
+    # pending, claimed, sent, cancelled or failed
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('sequence_id', 'recipient', 'step'),
+        # The due queue: pending steps in due order
+        db.Index('ix_scheduled_steps_status_due', 'status', 'due_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sequence_id': self.sequence_id,
+            'recipient': self.recipient,
+            'step': self.step,
+            'due_at': self.due_at.isoformat(),
+            'status': self.status,
+            'attempts': self.attempts,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'error': self.error
+        }
+
+
+class Delivery(db.Model):
+    """Outbound SMTP delivery of one scheduled step."""
+    __tablename__ = 'deliveries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    step_id = db.Column(db.Integer, db.ForeignKey('scheduled_steps.id'), nullable=False, unique=True)
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), nullable=False, index=True)
+    step = db.Column(db.Integer, nullable=False)
+    recipient = db.Column(db.String(320), nullable=False)
+    message_id = db.Column(db.String(255), nullable=False)
+    # queued, deferred, sent, bounced or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    smtp_code = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    queued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    # Worker holding the message in memory, and when it last renewed that lease
+    claimed_by = db.Column(db.String(64), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'step_id': self.step_id,
+            'sequence_id': self.sequence_id,
+            'step': self.step,
+            'recipient': self.recipient,
+            'message_id': self.message_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'smtp_code': self.smtp_code,
+            'error': self.error,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
+class EngagementCounter(db.Model):
+    """Recorded delivery and engagement events for one step of a sequence."""
+    __tablename__ = 'engagement_counters'
+
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), primary_key=True)
+    step = db.Column(db.Integer, primary_key=True)
+    delivered = db.Column(db.Integer, nullable=False, default=0)
+    opens = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    replies = db.Column(db.Integer, nullable=False, default=0)
+    bounces = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EngagementOpen(db.Model):
+    """First open of one step by one recipient, so opens are counted once each."""
+    __tablename__ = 'engagement_opens'
+
+    sequence_id = db.Column(db.Integer, db.ForeignKey('email_sequences.id'), primary_key=True)
+    step = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(320), primary_key=True)
+
+
+class PersonaEngagement(db.Model):
+    """Daily engagement event totals per persona, by the day the events happened."""
+    __tablename__ = 'persona_engagement'
+
+    # Sequences without a persona are stored as ''
+    persona = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    delivered = db.Column(db.Integer, nullable=False, default=0)
+    opens = db.Column(db.Integer, nullable=False, default=0)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    replies = db.Column(db.Integer, nullable=False, default=0)
+    bounces = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Company(db.Model):
+    """A hiring company's profile and the compact summary generation prompts use."""
+    __tablename__ = 'companies'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    # Normalized name, so repeat recruiters find the same profile
+    key = db.Column(db.String(200), nullable=False, unique=True, index=True)
+    industry = db.Column(db.String(100), nullable=True)
+    size = db.Column(db.String(50), nullable=True)
+    description = db.Column(db.Text, nullable=True)
+    website = db.Column(db.String(300), nullable=True)
+    summary = db.Column(db.Text, nullable=True)
+    # Hash of the profile fields the summary was made from
+    summary_hash = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'industry': self.industry,
+            'size': self.size,
+            'description': self.description,
+            'website': self.website,
+            'summary': self.summary,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class Candidate(db.Model):
+    """A candidate profile; fields are named after the mail-merge placeholders."""
+    __tablename__ = 'candidates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # ID in the system the profile was imported from; re-imports update the row
+    external_id = db.Column(db.String(200), nullable=True, unique=True)
+    email = db.Column(db.String(320), nullable=True, index=True)
+    first_name = db.Column(db.String(100), nullable=True)
+    last_name = db.Column(db.String(100), nullable=True)
+    current_title = db.Column(db.String(200), nullable=True)
+    current_company = db.Column(db.String(200), nullable=True)
+    location = db.Column(db.String(200), nullable=True)
+    years_experience = db.Column(db.Integer, nullable=True)
+    skills = db.Column(db.JSON, nullable=False, default=list)
+    summary = db.Column(db.Text, nullable=True)
+    github_url = db.Column(db.String(300), nullable=True)
+    github_top_repo = db.Column(db.String(200), nullable=True)
+    linkedin_url = db.Column(db.String(300), nullable=True)
+    linkedin_headline = db.Column(db.String(300), nullable=True)
+    recent_achievement = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        full_name = ' '.join(part for part in (self.first_name, self.last_name) if part)
+        return {
+            'id': self.id,
+            'external_id': self.external_id,
+            'email': self.email,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'full_name': full_name or None,
+            'current_title': self.current_title,
+            'current_company': self.current_company,
+            'location': self.location,
+            'years_experience': self.years_experience,
+            'skills': self.skills or [],
+            'summary': self.summary,
+            'github_url': self.github_url,
+            'github_top_repo': self.github_top_repo,
+            'linkedin_url': self.linkedin_url,
+            'linkedin_headline': self.linkedin_headline,
+            'recent_achievement': self.recent_achievement
+        }
+
+
+class CandidateChange(db.Model):
+    """Append-only log of candidate writes; each worker's match index replays it past its last seq."""
+    __tablename__ = 'candidate_changes'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
@@ -0,0 +1,161 @@
+"""Socket.IO payload shaping and wire-size measurement.
+
+Clients negotiate a payload mode when they connect (``auth`` or query string
+``payload=structured``). Legacy clients get ``sequence_update.content`` as a
+pretty-printed JSON string; structured clients get the sequence itself under
+``sequence``, so it is encoded once by the Socket.IO serializer instead of
+being double-encoded and re-parsed.
+
+Run ``python payloads.py`` to print bytes per event for every mode.
+"""
+import json
+import zlib
+from typing import Dict, List, Optional
+
+from socketio import packet
+
+from llm_backend import parse_model_json
+
+LEGACY = 'legacy'
+STRUCTURED = 'structured'
+PAYLOAD_MODES = (LEGACY, STRUCTURED)
+
+SERIALIZERS = {
+    'json': 'default',
+    'msgpack': 'msgpack',
+}
+
+# Negotiated payload mode per connected client sid
+client_modes: Dict[str, str] = {}
+
+
+def negotiate_mode(sid: str, auth: Optional[Dict] = None, args: Optional[Dict] = None) -> str:
+    """Record the payload mode a client asked for on connect."""
+    requested = (auth or {}).get('payload') or (args or {}).get('payload')
+    mode = requested if requested in PAYLOAD_MODES else LEGACY
+    client_modes[sid] = mode
+    return mode
+
+
+def forget_client(sid: str):
+    client_modes.pop(sid, None)
+
+
+def parse_sequence(content) -> Optional[List]:
+    """Best-effort parse of model output or legacy content into a sequence."""
+    if isinstance(content, (list, dict)):
+        return content
+    try:
+        return parse_model_json(content or '')
+    except json.JSONDecodeError:
+        return None
+
+
+def sequence_update_payload(sid: str, sequence=None, content: Optional[str] = None, **fields) -> Dict:
+    """Build a ``sequence_update`` event body in the client's payload mode.
+
+    ``sequence`` is the parsed sequence when available; ``content`` is raw text
+    that could not be parsed and is always sent as-is.
+    """
+    if client_modes.get(sid) == STRUCTURED and sequence is not None:
+        return dict(fields, sequence=sequence)
+    if sequence is not None and content is None:
+        content = json.dumps(sequence, indent=2)
+    return dict(fields, content=content or '')
+
+
+def socketio_serializer(name: str) -> str:
+    """Map the configured serializer name to a python-socketio option."""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unsupported Socket.IO serializer: {name}")
+    return SERIALIZERS[name]
+
+
+# Every sync-flushed deflate block ends with this; permessage-deflate leaves it off the frame (RFC 7692 7.2.1)
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
+
+
+def _encode(event: str, data, serializer: str) -> bytes:
+    if serializer == 'msgpack':
+        from socketio.msgpack_packet import MsgPackPacket
+        encoded = MsgPackPacket(packet.EVENT, data=[event, data]).encode()
+    else:
+        encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    return encoded.encode('utf-8') if isinstance(encoded, str) else encoded
+
+
+def encoded_size(event: str, data, serializer: str = 'json') -> int:
+    """Bytes on the wire for one Socket.IO event packet."""
+    return len(_encode(event, data, serializer))
+
+
+def deflated_size(event: str, data, serializer: str = 'json') -> int:
+    """Approximate frame size after permessage-deflate (raw deflate, no context takeover)."""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    frame = compressor.compress(_encode(event, data, serializer)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    if frame.endswith(DEFLATE_TAIL):
+        frame = frame[:-len(DEFLATE_TAIL)]
+    return len(frame)
+
+
+def sample_events(steps: int = 3, turns: int = 12) -> Dict[str, Dict]:
+    """Representative payloads for the main events, keyed by mode."""
+    sequence = [
+        {
+            'subject': f'Step {i + 1}: Senior Backend Engineer at Acme',
+            'body': ("Hi there,\n\nI came across your work on distributed systems and thought of you "
+                     "for our Senior Backend Engineer role. You'd own our event pipeline in Go and "
+                     "Postgres, working with a team of eight engineers.\n\nWould you be open to a "
+                     "quick chat this week?\n\nBest,\nSam")
+        }
+        for i in range(steps)
+    ]
+    metrics = {'open_rate': '52%', 'response_rate': '24%', 'sentiment': 'Positive',
+               'personalization_score': '75', 'quality_score': '82'}
+    suggestions = ['Reference a specific open source project.', 'Shorten the first subject line.',
+                   'Add a concrete call-to-action with a time slot.']
+    history = [
+        {'role': 'user' if i % 2 == 0 else 'assistant',
+         'content': 'We are hiring a senior backend engineer with Go and Postgres experience for our '
+                    'payments platform; remote within US time zones.'}
+        for i in range(turns)
+    ]
+    summary = {'role': 'Senior Backend Engineer', 'company_type': 'Series B fintech',
+               'key_requirements': ['Go', 'Postgres', 'distributed systems'],
+               'location': 'Remote (US)', 'unique_selling_points': ['Ownership', 'Equity']}
+    return {
+        LEGACY: {
+            'chat_message': {'message': history[-1]['content'], 'messages': history, 'persona': 'tech_expert'},
+            'sequence_update': {'content': json.dumps(sequence, indent=2), 'metrics': metrics,
+                                'suggestions': suggestions},
+            'context_summary': summary,
+        },
+        STRUCTURED: {
+            'chat_message': {'message': history[-1]['content'], 'messages': history, 'persona': 'tech_expert'},
+            'sequence_update': {'sequence': sequence, 'metrics': metrics, 'suggestions': suggestions},
+            'context_summary': summary,
+        },
+    }
+
+
+def measure_event_sizes(steps: int = 3, turns: int = 12) -> List[Dict]:
+    """Bytes per event for each payload mode and serializer, raw and deflated."""
+    results = []
+    for mode, events in sample_events(steps, turns).items():
+        for serializer in SERIALIZERS:
+            for event, data in events.items():
+                results.append({
+                    'event': event,
+                    'mode': mode,
+                    'serializer': serializer,
+                    'bytes': encoded_size(event, data, serializer),
+                    'deflated_bytes': deflated_size(event, data, serializer),
+                })
+    return results
+
+
+if __name__ == '__main__':
+    print(f"{'event':<18}{'mode':<12}{'serializer':<12}{'bytes':>8}{'deflated':>10}")
+    for row in measure_event_sizes():
+        print(f"{row['event']:<18}{row['mode']:<12}{row['serializer']:<12}"
+              f"{row['bytes']:>8}{row['deflated_bytes']:>10}")
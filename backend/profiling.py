@@ -0,0 +1,266 @@
+"""On-demand CPU and memory profiling of a live worker.
+
+:class:`SamplingProfiler` samples the stack of every thread from a
+background thread, either for a time window or until a number of socket
+events have been handled. Stacks are counted in collapsed form (``a;b;c
+count`` per line), which flamegraph.pl, speedscope and inferno read
+directly. Sampling costs one ``sys._current_frames()`` walk per interval and
+nothing at all while no profile is running.
+
+:class:`MemoryTracker` wraps ``tracemalloc``: start tracing, take labelled
+snapshots, and list the top allocation sites of one snapshot or the growth
+between two. :func:`top_types` counts live objects by type, and registered
+gauges report the size of long-lived tables such as Socket.IO sessions.
+
+The admin routes in ``app.py`` expose these behind ``ADMIN_TOKEN``.
+"""
+import functools
+import gc
+import inspect
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_INTERVAL = 0.005
+# A profile stops after this long even if fewer events arrived
+MAX_SECONDS = 300
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse(frame, thread_name: str) -> str:
+    """One thread's stack, outermost frame first, as a collapsed-stack key."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Counts sampled stacks of all threads until a deadline or an event count is reached."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.stacks: Counter = Counter()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.deadline: Optional[float] = None
+        self.events_left: Optional[int] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.samples = 0
+        self.events = 0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds: Optional[float] = None, events: Optional[int] = None):
+        """Profile for ``seconds`` or until ``events`` more socket events finish, whichever comes first."""
+        if seconds is None and events is None:
+            raise ValueError('Give seconds or events')
+        if (seconds is not None and seconds <= 0) or (events is not None and events <= 0):
+            raise ValueError('seconds and events must be positive')
+        with self.lock:
+            if self.running:
+                raise ValueError('A profile is already running')
+            self.stacks = Counter()
+            self.samples = self.events = 0
+            self.deadline = self.clock() + min(seconds or MAX_SECONDS, MAX_SECONDS)
+            self.events_left = events
+            self.started_at, self.finished_at = datetime.utcnow(), None
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='helix-profiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def event_finished(self):
+        """Count one handled socket event; the profile stops when enough have finished."""
+        if self.events_left is None or not self.running:
+            return
+        with self.lock:
+            self.events += 1
+            if self.events_left is not None:
+                self.events_left -= 1
+                if self.events_left <= 0:
+                    self.stop_event.set()
+
+    def wrap_event(self, handler: Callable) -> Callable:
+        """Wrap a Socket.IO handler so it counts towards an event-bounded profile."""
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def counted_async(*args, **kwargs):
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    self.event_finished()
+            return counted_async
+
+        @functools.wraps(handler)
+        def counted(*args, **kwargs):
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.event_finished()
+        return counted
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.is_set() and self.clock() < self.deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sample = Counter(collapse(frame, names.get(ident, f'thread-{ident}'))
+                             for ident, frame in sys._current_frames().items() if ident != own)
+            with self.lock:
+                self.stacks.update(sample)
+                self.samples += 1
+            self.stop_event.wait(self.interval)
+        with self.lock:
+            self.finished_at = datetime.utcnow()
+
+    def collapsed(self) -> str:
+        """The profile in collapsed-stack format, most frequent stacks first."""
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def status(self) -> Dict:
+        with self.lock:
+            return {
+                'running': self.running,
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+                'samples': self.samples,
+                'events': self.events,
+                'events_left': self.events_left if self.running else None,
+                'stacks': len(self.stacks),
+                'interval': self.interval
+            }
+
+
+class MemoryTracker:
+    """Labelled ``tracemalloc`` snapshots, keeping the most recent few."""
+
+    def __init__(self, max_snapshots: int = 10):
+        self.max_snapshots = max_snapshots
+        self.lock = threading.Lock()
+        self.snapshots: 'OrderedDict[int, Dict]' = OrderedDict()
+        self.next_id = 1
+
+    def start(self, frames: int = 25):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        """Stop tracing and forget every snapshot."""
+        tracemalloc.stop()
+        with self.lock:
+            self.snapshots.clear()
+
+    def snapshot(self, label: str = '') -> Dict:
+        if not tracemalloc.is_tracing():
+            raise ValueError('Memory tracing is not started')
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            entry = {'id': self.next_id, 'label': label, 'taken_at': datetime.utcnow().isoformat(),
+                     'traced_bytes': current, 'peak_bytes': peak, 'snapshot': snapshot}
+            self.snapshots[self.next_id] = entry
+            self.next_id += 1
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return self._summary(entry)
+
+    def _get(self, snapshot_id: int) -> Dict:
+        with self.lock:
+            entry = self.snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(f'Snapshot {snapshot_id} not found')
+        return entry
+
+    @staticmethod
+    def _summary(entry: Dict) -> Dict:
+        return {key: value for key, value in entry.items() if key != 'snapshot'}
+
+    def list(self) -> List[Dict]:
+        with self.lock:
+            return [self._summary(entry) for entry in self.snapshots.values()]
+
+    def top(self, snapshot_id: int, limit: int = 20, group_by: str = 'lineno') -> Dict:
+        """Allocation sites holding the most memory in one snapshot."""
+        entry = self._get(snapshot_id)
+        stats = entry['snapshot'].statistics(group_by)
+        return dict(self._summary(entry), top=[{
+            'site': str(stat.traceback[0]) if stat.traceback else '?',
+            'size': stat.size,
+            'count': stat.count
+        } for stat in stats[:limit]])
+
+    def diff(self, from_id: int, to_id: int, limit: int = 20, group_by: str = 'lineno') -> Dict:
+        """Allocation sites that grew (or shrank) the most between two snapshots."""
+        before, after = self._get(from_id), self._get(to_id)
+        stats = after['snapshot'].compare_to(before['snapshot'], group_by)
+        return {
+            'from': self._summary(before),
+            'to': self._summary(after),
+            'size_diff': sum(stat.size_diff for stat in stats),
+            'top': [{
+                'site': str(stat.traceback[0]) if stat.traceback else '?',
+                'size': stat.size,
+                'size_diff': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff
+            } for stat in stats[:limit]]
+        }
+
+    def status(self) -> Dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {'tracing': tracing, 'traced_bytes': current, 'peak_bytes': peak, 'snapshots': self.list()}
+
+
+def top_types(limit: int = 20) -> List[Dict]:
+    """Live objects tracked by the garbage collector, counted by type."""
+    counts = Counter(f'{type(obj).__module__}.{type(obj).__qualname__}' for obj in gc.get_objects())
+    return [{'type': name, 'count': count} for name, count in counts.most_common(limit)]
+
+
+_gauges: Dict[str, Callable[[], int]] = {}
+
+
+def register_gauge(name: str, read: Callable[[], int]):
+    """Report ``read()`` with the object counts, e.g. the size of a session table."""
+    _gauges[name] = read
+
+
+def read_gauges() -> Dict[str, Optional[int]]:
+    values = {}
+    for name, read in _gauges.items():
+        try:
+            values[name] = read()
+        except Exception:
+            values[name] = None
+    return values
+
+
+profiler = SamplingProfiler()
+memory = MemoryTracker()
@@ -3,20 +3,22 @@ import google.generativeai as genai
 import json
 import os
 from dotenv import load_dotenv
+from llm_backend import create_model, requires_api_key
 
 # Load environment variables
 load_dotenv()
 
-# Configure the model globally
-api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=api_key)
+if requires_api_key():
+    # Configure the model globally
+    api_key = os.getenv("GOOGLE_API_KEY")
+    genai.configure(api_key=api_key)
 
-# List available models
-try:
-    for m in genai.list_models():
-        print(f"Available model: {m.name}")
-except Exception as e:
-    print(f"Error listing models: {str(e)}")
+    # List available models
+    try:
+        for m in genai.list_models():
+            print(f"Available model: {m.name}")
+    except Exception as e:
+        print(f"Error listing models: {str(e)}")
 
 class EmailConfig(TypedDict):
     role: str
@@ -24,26 +26,27 @@ class EmailConfig(TypedDict):
     company_info: str
     step_count: int
 
-def generate_email_sequence(config: EmailConfig) -> List[Dict[str, str]]:
+class SequenceGenerationError(Exception):
+    """The model answered, but not with an email sequence."""
+
+
+def request_email_sequence(config: EmailConfig) -> List[Dict[str, str]]:
     """
-    Generate a sequence of recruiting emails using Google's Generative AI.
-    
-    Args:
-        config: EmailConfig containing role, tone, company info, and step count
-        
-    Returns:
-        List of dictionaries containing email subjects and bodies
+    Generate a sequence of recruiting emails, raising when it cannot.
+
+    Model errors (quota, rate limits, timeouts) propagate, and an answer
+    without a JSON array of emails raises SequenceGenerationError, so
+    callers that retry (see campaigns.py) can tell a failure from a result.
     """
-    try:
-        # Initialize the model with safety settings
-        model = genai.GenerativeModel('models/gemini-1.5-pro')
-        
-        # Normalize tone and step count
-        tone = config["tone"].lower()
-        step_count = min(max(1, config["step_count"]), 5)
-        
-        # Create the prompt
-        prompt = f"""You are a professional recruiter. Create {step_count} recruiting emails for a {config['role']} position.
+    # Initialize the model with safety settings
+    model = create_model('models/gemini-1.5-pro')
+    
+    # Normalize tone and step count
+    tone = config["tone"].lower()
+    step_count = min(max(1, config["step_count"]), 5)
+    
+    # Create the prompt
+    prompt = f"""You are a professional recruiter. Create {step_count} recruiting emails for a {config['role']} position.
         Use this tone: {tone}
         Company Info: {config.get('company_info', 'A growing technology company')}
         
@@ -56,45 +59,52 @@ def generate_email_sequence(config: EmailConfig) -> List[Dict[str, str]]:
             {{"subject": "Following up - [Role] position", "body": "Follow up content here..."}}
         ]
         """
-        
-        # Generate the sequence
-        response = model.generate_content(prompt)
-        
-        if response.text:
+    
+    # Generate the sequence
+    response = model.generate_content(prompt)
+    text = response.text or ''
+    try:
+        sequence = json.loads(text)
+    except json.JSONDecodeError:
+        # If JSON parsing fails, try to extract JSON from the text
+        start_idx = text.find('[')
+        end_idx = text.rfind(']') + 1
+        sequence = None
+        if start_idx >= 0 and end_idx > start_idx:
             try:
-                # Try to parse the response as JSON
-                sequence = json.loads(response.text)
-                if isinstance(sequence, list) and len(sequence) > 0:
-                    return sequence
+                sequence = json.loads(text[start_idx:end_idx])
             except json.JSONDecodeError:
-                # If JSON parsing fails, try to extract JSON from the text
-                start_idx = response.text.find('[')
-                end_idx = response.text.rfind(']') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = response.text[start_idx:end_idx]
-                    try:
-                        sequence = json.loads(json_str)
-                        if isinstance(sequence, list) and len(sequence) > 0:
-                            return sequence
-                    except:
-                        pass
-        
-        # If all parsing attempts fail, return a fallback response
-        return [
-            {
-                "subject": f"Exciting {config['role']} Opportunity",
-                "body": f"We are looking for a talented {config['role']}. Would you be interested in learning more about this opportunity?"
-            }
-        ]
+                pass
+    if isinstance(sequence, list) and len(sequence) > 0:
+        return sequence
+    raise SequenceGenerationError(f"No email sequence in the model response for {config['role']}")
+
+
+def fallback_sequence(config: EmailConfig) -> List[Dict[str, str]]:
+    return [
+        {
+            "subject": f"Exciting {config['role']} Opportunity",
+            "body": f"We are looking for a talented {config['role']}. Would you be interested in learning more about this opportunity?"
+        }
+    ]
+
+
+def generate_email_sequence(config: EmailConfig) -> List[Dict[str, str]]:
+    """
+    Generate a sequence of recruiting emails using Google's Generative AI.
+    
+    Args:
+        config: EmailConfig containing role, tone, company info, and step count
         
+    Returns:
+        List of dictionaries containing email subjects and bodies; a single
+        placeholder email when generation fails
+    """
+    try:
+        return request_email_sequence(config)
     except Exception as e:
         print(f"Error generating sequence: {str(e)}")
-        return [
-            {
-                "subject": f"Exciting {config['role']} Opportunity",
-                "body": f"We are looking for a talented {config['role']}. Would you be interested in learning more about this opportunity?"
-            }
-        ]
+        return fallback_sequence(config)
 
 def run_graph(config: EmailConfig) -> List[Dict]:
     """Run the email sequence generation graph"""
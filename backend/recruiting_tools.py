@@ -0,0 +1,193 @@
+"""Prompts shared by the Flask-SocketIO server (app.py) and the asyncio server (asgi_app.py).
+
+Both servers must send the model exactly the same text, so the prompt builders
+live here instead of inline in the event handlers.
+"""
+import json
+
+TOOL_NAMES = ('generate_sequence', 'adjust_tone', 'summarize_context')
+
+# Returned when the model's metrics cannot be parsed
+DEFAULT_METRICS = {
+    "open_rate": "N/A",
+    "response_rate": "N/A",
+    "sentiment": "N/A",
+    "personalization_score": "N/A",
+    "quality_score": "N/A"
+}
+
+
+def metrics_prompt(sequence_data) -> str:
+    """Prompt asking the model to estimate performance metrics for a sequence."""
+    return f"""You are a recruiting email performance analyst.
+
+Analyze the following outreach sequence and estimate:
+
+1. Estimated open rate (%): Based on subject lines, tone, curiosity factor
+2. Estimated response rate (%): Based on call to action, personalization, clarity
+3. Sentiment: Positive / Neutral / Negative
+4. Personalization score (0-100): How tailored is this?
+5. Quality score (0-100): How likely is this to perform well overall?
+
+Consider these factors:
+- Subject line effectiveness
+- Message clarity and structure
+- Call-to-action strength
+- Personalization level
+- Overall professionalism
+- Value proposition clarity
+
+Respond in **strict JSON** like this:
+{{
+  "open_rate": "52%",
+  "response_rate": "24%",
+  "sentiment": "Positive",
+  "personalization_score": "75",
+  "quality_score": "82"
+}}
+
+Here is the sequence:
+{json.dumps(sequence_data, indent=2)}
+"""
+
+
+def suggestions_prompt(sequence) -> str:
+    """Prompt asking the model for three improvement suggestions."""
+    return f"""You are an AI recruiting coach reviewing an outreach sequence.
+
+Analyze the sequence and provide 3 actionable suggestions to improve it. Focus on:
+- Personalization (LinkedIn, GitHub, shared interests)
+- Subject line quality
+- Message clarity, tone, or engagement
+- Targeting the right candidate
+
+Respond in JSON as:
+{{
+  "suggestions": [
+    "Suggestion 1...",
+    "Suggestion 2...",
+    "Suggestion 3..."
+  ]
+}}
+
+Here is the sequence to analyze:
+{json.dumps(sequence, indent=2)}
+"""
+
+
+def company_line(company) -> str:
+    """Prompt line carrying a stored company summary (see companies.py), or nothing."""
+    if not company or not company.get('summary'):
+        return ''
+    return f"- Company: {company['summary']}\n"
+
+
+def sequence_prompt(messages, tone, sequence_type, company=None) -> str:
+    """Prompt generating a 2-3 step sequence from the conversation."""
+    return f"""Based on the following conversation, generate a recruiting outreach sequence.
+
+Context:
+- Messages: {messages}
+- Tone: {tone}
+- Sequence Type: {sequence_type}
+{company_line(company)}
+Generate a sequence of 2-3 emails. Return ONLY a JSON array of email steps, each with 'subject' and 'body' fields.
+Format the response exactly like this:
+[
+  {{
+    "subject": "Exciting Senior Backend Engineer opportunity at [Company]",
+    "body": "Email body here..."
+  }},
+  {{
+    "subject": "Following up: Senior Backend Engineer role",
+    "body": "Follow up email body here..."
+  }}
+]"""
+
+
+def tone_prompt(content, tone) -> str:
+    """Prompt rewriting a sequence in another tone."""
+    return f"""Adjust the tone of this sequence to be more {tone}:
+        {content}
+        
+        Return the adjusted sequence in the same JSON format."""
+
+
+def summary_prompt(messages) -> str:
+    """Prompt extracting role information from the conversation."""
+    return f"""Analyze this conversation and extract key information about the role:
+        {messages}
+        
+        Return a JSON object with these fields:
+        - role: The job title/role
+        - company_type: Type of company/environment
+        - key_requirements: Main skills and requirements
+        - location: Work location/setup if mentioned
+        - unique_selling_points: What makes this role special"""
+
+
+def company_summary_prompt(profile) -> str:
+    """Prompt condensing a company profile into a short summary for later prompts."""
+    return f"""Summarize this hiring company for a recruiting email writer in at most 50 words.
+Keep the industry, size, product, mission and anything that would attract candidates. Return only the summary text.
+
+Company profile:
+{json.dumps(profile, indent=2)}
+"""
+
+
+def chat_prompt(message, messages, persona, company=None) -> str:
+    """Prompt routing a chat message to a reply or a tool call."""
+    return f"""You are Helix, an AI recruiting assistant helping a user craft outreach messages.
+
+Your goal is to guide the user through:
+1. Understanding the role requirements:
+   - Job title and level
+   - Key skills and qualifications
+   - Company culture and environment
+   - Location and work setup
+
+2. Crafting personalized outreach:
+   - Help choose appropriate tone (professional, casual, founder, friendly)
+   - Suggest personalization strategies
+   - Recommend sequence length and cadence
+
+3. Iterative improvement:
+   - Offer specific suggestions for each message
+   - Help adjust tone and style
+   - Provide feedback on effectiveness
+
+Current context:
+- User message: "{message}"
+- Previous messages: {str(messages)}
+- Selected persona: {persona}
+{company_line(company)}
+Respond in this exact JSON format:
+{{
+    "action": "chat" or "tool",
+    "response": "your natural, friendly response if action is chat",
+    "tool": "tool name if action is tool (generate_sequence, adjust_tone, or summarize_context)",
+    "args": {{
+        "parameters if action is tool"
+    }}
+}}
+
+Remember to:
+- Be conversational and friendly
+- Ask clarifying questions when needed
+- Provide specific suggestions and examples
+- Guide the user step-by-step
+- Acknowledge and build upon previous context
+"""
+
+
+def apply_suggestion_prompt(suggestion, sequence) -> str:
+    """Prompt applying one suggestion to a sequence."""
+    return f"""You are an AI recruiting coach. Apply the following suggestion to improve this sequence:
+
+Suggestion: {suggestion}
+
+Current sequence:
+{json.dumps(sequence, indent=2)}
+
+Return ONLY the improved sequence in the same JSON format with the suggestion applied."""
@@ -4,14 +4,87 @@ from typing import List, Dict, Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
 import json
+from mail_merge import SequenceTemplate, TemplateError, placeholder_guide
+from llm_backend import create_model, requires_api_key
+from extraction import clauses, read_message
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Keywords showing each piece of required information was given
+REQUIRED_INFO_KEYWORDS = {
+    'role': ['engineer', 'developer', 'manager', 'director', 'lead', 'architect', 'designer', 'analyst', 'consultant'],
+    'company': ['company', 'startup', 'business', 'organization', 'firm', 'enterprise', 'mission', 'vision'],
+    'requirements': ['requirements', 'experience', 'skills', 'qualifications', 'needs', 'looking for', 'must have', 'should have'],
+    'unique_value': ['unique', 'exciting', 'challenging', 'innovative', 'cutting-edge', 'latest', 'new', 'different']
+}
+REQUIRED_INFO_LABELS = {
+    'role': 'Role information',
+    'company': 'Company information',
+    'requirements': 'Requirements information',
+    'unique_value': 'Unique value proposition'
+}
+# Context summary field (see extraction.py) holding each piece of required information
+REQUIRED_INFO_FIELDS = {
+    'role': 'role',
+    'company': 'company_type',
+    'requirements': 'key_requirements',
+    'unique_value': 'unique_selling_points'
+}
+# Narrower keywords for the switch to email generation
+EMAIL_CONTEXT_KEYWORDS = {
+    'role': ['engineer', 'developer', 'manager', 'director'],
+    'requirements': ['requirements', 'experience', 'skills'],
+    'company': ['company', 'startup', 'mission', 'product']
+}
+
+
+def required_info_in(message: str) -> List[str]:
+    """The kinds of required information a message mentions."""
+    message_lower = message.lower()
+    return [info_type for info_type, keywords in REQUIRED_INFO_KEYWORDS.items()
+            if any(word in message_lower for word in keywords)]
+
+
+def has_required_info(messages: List[Dict]) -> bool:
+    """Whether the conversation's messages, taken together, cover every kind of required information."""
+    found = set()
+    for msg in messages:
+        found.update(required_info_in(msg.get('content', '')))
+    return found == set(REQUIRED_INFO_KEYWORDS)
+
+
+def has_email_context(messages: List[Dict]) -> bool:
+    """Whether the conversation names a role plus requirements or company details."""
+    found = set()
+    for msg in messages:
+        content = msg.get('content', '').lower()
+        found.update(kind for kind, keywords in EMAIL_CONTEXT_KEYWORDS.items()
+                     if any(keyword in content for keyword in keywords))
+    return 'role' in found and ('requirements' in found or 'company' in found)
+
+
+def company_fields(company_context: Dict) -> Dict:
+    """Prompt fields for a company; a stored summary (see companies.py) stands in for the company info."""
+    fields = {
+        'company_name': company_context.get('name'),
+        'industry': company_context.get('industry'),
+        'company_size': company_context.get('size'),
+        'company_description': company_context.get('description'),
+        'website': company_context.get('website')
+    }
+    if company_context.get('summary'):
+        fields['company_info'] = company_context['summary']
+    return fields
+
+
 class HelixResponseHandler:
     def __init__(self, model_name: str = "models/gemini-1.5-flash"):
         # Initialize Gemini API
-        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-        self.model = genai.GenerativeModel(model_name)
+        if requires_api_key():
+            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+        self.model = create_model(model_name)
         self.turn_count = 0
         self.conversation_history = []
         self.required_info = {
@@ -69,17 +142,17 @@ class HelixResponseHandler:
 
     def get_persona_intro(self, persona: str) -> str:
         """Get the introduction message for the selected persona."""
-        logging.info(f"Getting persona introduction for {persona}")
+        logger.debug("Getting persona introduction for %s", persona)
         persona_data = self.persona_data.get(persona, self.persona_data['corporate_pro'])
         intro = persona_data['intro']
-        logging.info(f"Generated intro message: {intro}")
+        logger.debug("Generated intro message: %s", intro)
         return intro
 
     def load_prompt(self, prompt_file: str, context: Dict) -> str:
         """Load and format a prompt template."""
         try:
             prompt_path = os.path.join(os.path.dirname(__file__), 'prompts', prompt_file)
-            logging.info(f"Loading prompt from: {prompt_path}")
+            logger.debug("Loading prompt from: %s", prompt_path)
             
             with open(prompt_path, 'r') as f:
                 prompt_template = f.read()
@@ -88,10 +161,10 @@ class HelixResponseHandler:
             for key, value in context.items():
                 prompt_template = prompt_template.replace('{{' + key + '}}', str(value))
             
-            logging.info(f"Formatted prompt: {prompt_template}")
+            logger.debug("Formatted prompt: %s", prompt_template)
             return prompt_template
         except Exception as e:
-            logging.error(f"Error loading prompt: {str(e)}")
+            logger.error("Error loading prompt: %s", e)
             # Return a default prompt if template loading fails
             if 'persona' in context:
                 return f"You are a {context['persona']}. Please ask the next relevant question about the role, company, or requirements."
@@ -117,108 +190,102 @@ class HelixResponseHandler:
         return None
         
     def update_required_info(self, message: str):
-        """Update which information we've gathered from the conversation."""
-        message_lower = message.lower()
-        
-        # Role keywords
-        role_keywords = ['engineer', 'developer', 'manager', 'director', 'lead', 'architect', 'designer', 'analyst', 'consultant']
-        if any(word in message_lower for word in role_keywords):
-            self.required_info['role'] = message
-            logging.info("Role information detected")
-            
-        # Company keywords
-        company_keywords = ['company', 'startup', 'business', 'organization', 'firm', 'enterprise', 'mission', 'vision']
-        if any(word in message_lower for word in company_keywords):
-            self.required_info['company'] = message
-            logging.info("Company information detected")
-            
-        # Requirements keywords
-        requirements_keywords = ['requirements', 'experience', 'skills', 'qualifications', 'needs', 'looking for', 'must have', 'should have']
-        if any(word in message_lower for word in requirements_keywords):
-            self.required_info['requirements'] = message
-            logging.info("Requirements information detected")
-            
-        # Unique value proposition keywords
-        value_keywords = ['unique', 'exciting', 'challenging', 'innovative', 'cutting-edge', 'latest', 'new', 'different']
-        if any(word in message_lower for word in value_keywords):
-            self.required_info['unique_value'] = message
-            logging.info("Unique value proposition detected")
-            
-        logging.info(f"Updated required info status: {self.required_info}")
+        """Update which information we've gathered from the conversation.
+
+        Each piece holds the values extracted for it; when only a keyword
+        names it, the sentence with the keyword stands in.
+        """
+        found = read_message(message)
+        mentioned = required_info_in(message)
+        for info_type, field in REQUIRED_INFO_FIELDS.items():
+            values = found.get(field)
+            if not values and info_type in mentioned:
+                values = [clause for clause in clauses(message) if info_type in required_info_in(clause)] or [message]
+            if values:
+                self.required_info[info_type] = ', '.join(values)
+                logger.info("%s detected", REQUIRED_INFO_LABELS[info_type])
+        logger.debug("Updated required info status: %s", self.required_info)
         
     def should_generate_sequence(self) -> bool:
         """Check if we have enough information to generate a sequence."""
         return all(value is not None for value in self.required_info.values())
         
+    def build_generation_context(self, messages: List[Dict], persona: str, company_context: Optional[Dict] = None) -> Dict:
+        """Collect role, company and requirement details from the conversation for generation prompts."""
+        # Extract key information from conversation
+        role_info = ""
+        company_info = ""
+        requirements = ""
+        unique_value = ""
+        
+        for msg in messages:
+            if msg.get('role') == 'user':
+                content = msg.get('content', '').lower()
+                if any(keyword in content for keyword in ['engineer', 'developer', 'manager', 'director']):
+                    role_info = msg.get('content')
+                if any(keyword in content for keyword in ['company', 'startup', 'mission', 'product']):
+                    company_info = msg.get('content')
+                if any(keyword in content for keyword in ['requirements', 'experience', 'skills']):
+                    requirements = msg.get('content')
+                if any(keyword in content for keyword in ['unique', 'exciting', 'opportunity']):
+                    unique_value = msg.get('content')
+
+        # Get persona style
+        persona_style = self.persona_data.get(persona, self.persona_data['corporate_pro'])['style']
+        
+        # Create context for the prompt
+        context = {
+            'persona': persona,
+            'style': persona_style,
+            'role_info': role_info,
+            'company_info': company_info,
+            'requirements': requirements,
+            'unique_value': unique_value,
+            'history': self.format_history(messages)
+        }
+        
+        # Add company context if available
+        if company_context:
+            context.update(company_fields(company_context))
+        return context
+
     def generate_email_sequence(self, messages: List[Dict], persona: str, company_context: Optional[Dict] = None) -> str:
         """Generate the email sequence based on collected information."""
         try:
-            # Extract key information from conversation
-            role_info = ""
-            company_info = ""
-            requirements = ""
-            unique_value = ""
-            
-            for msg in messages:
-                if msg.get('role') == 'user':
-                    content = msg.get('content', '').lower()
-                    if any(keyword in content for keyword in ['engineer', 'developer', 'manager', 'director']):
-                        role_info = msg.get('content')
-                    if any(keyword in content for keyword in ['company', 'startup', 'mission', 'product']):
-                        company_info = msg.get('content')
-                    if any(keyword in content for keyword in ['requirements', 'experience', 'skills']):
-                        requirements = msg.get('content')
-                    if any(keyword in content for keyword in ['unique', 'exciting', 'opportunity']):
-                        unique_value = msg.get('content')
-
-            # Get persona style
-            persona_style = self.persona_data.get(persona, self.persona_data['corporate_pro'])['style']
-            
-            # Create context for the prompt
-            context = {
-                'persona': persona,
-                'style': persona_style,
-                'role_info': role_info,
-                'company_info': company_info,
-                'requirements': requirements,
-                'unique_value': unique_value,
-                'history': self.format_history(messages)
-            }
-            
-            # Add company context if available
-            if company_context:
-                context.update({
-                    'company_name': company_context.get('name'),
-                    'industry': company_context.get('industry'),
-                    'company_size': company_context.get('size'),
-                    'company_description': company_context.get('description'),
-                    'website': company_context.get('website')
-                })
-            
+            context = self.build_generation_context(messages, persona, company_context)
             prompt = self.load_prompt('generate_email_prompt.txt', context)
             response = self.model.generate_content(prompt)
             return response.text
         except Exception as e:
-            logging.error(f"Error generating sequence: {str(e)}")
+            logger.error("Error generating sequence: %s", e)
             return "Error generating sequence. Please try again."
+
+    def generate_sequence_template(self, messages: List[Dict], persona: str, company_context: Optional[Dict] = None) -> SequenceTemplate:
+        """Generate a reusable sequence template with candidate placeholders (one LLM call)."""
+        context = self.build_generation_context(messages, persona, company_context)
+        context['placeholders'] = placeholder_guide()
+        prompt = self.load_prompt('generate_template_prompt.txt', context)
+        response = self.model.generate_content(prompt)
+        return SequenceTemplate.from_text(response.text)
+
+    def personalize_for_candidates(self, template: SequenceTemplate, candidates: List[Dict], polish: bool = False, company_context: Optional[Dict] = None) -> List[List[Dict]]:
+        """Render a template for each candidate locally, optionally polishing each result with the LLM."""
+        rendered = template.render_many(candidates)
+        if not polish:
+            return rendered
+        polished = []
+        for sequence in rendered:
+            enhanced = self.enhance_personalization(json.dumps(sequence, indent=2), company_context)
+            try:
+                polished.append(SequenceTemplate.from_text(enhanced).steps)
+            except TemplateError:
+                # Keep the locally rendered version if the polish pass is unusable
+                polished.append(sequence)
+        return polished
             
     def should_generate_email(self) -> bool:
         """Determine if we should switch to email generation."""
-        # Check if we have enough context to generate an email
-        has_role = False
-        has_requirements = False
-        has_company_info = False
-        
-        for msg in self.conversation_history:
-            content = msg.get('content', '').lower()
-            if any(keyword in content for keyword in ['engineer', 'developer', 'manager', 'director']):
-                has_role = True
-            if any(keyword in content for keyword in ['requirements', 'experience', 'skills']):
-                has_requirements = True
-            if any(keyword in content for keyword in ['company', 'startup', 'mission', 'product']):
-                has_company_info = True
-                
-        return has_role and (has_requirements or has_company_info)
+        return has_email_context(self.conversation_history)
         
     def generate_response(self, messages: List[Dict], persona: str, company_context: Optional[Dict] = None) -> str:
         """Generate the next response or question in the conversation."""
@@ -226,7 +293,7 @@ class HelixResponseHandler:
         
         # If this is the first message, return the persona introduction
         if not messages or len(messages) == 1:
-            logging.info(f"Generating persona introduction for {persona}")
+            logger.debug("Generating persona introduction for %s", persona)
             return self.get_persona_intro(persona)
             
         # Update required info from the latest message
@@ -235,11 +302,11 @@ class HelixResponseHandler:
         # Get next question based on missing information
         next_question = self.get_next_question(persona)
         if next_question:
-            logging.info(f"Generating next question: {next_question}")
+            logger.debug("Generating next question: %s", next_question)
             return next_question
         
         # If we have all required info, acknowledge and prepare for sequence generation
-        logging.info("All required information gathered, preparing for sequence generation")
+        logger.info("All required information gathered, preparing for sequence generation")
         return "Thank you for providing all the details. I'll help you generate an engaging email sequence for this role."
 
     def reset(self):
@@ -258,7 +325,7 @@ class HelixResponseHandler:
             response = self.model.generate_content(prompt)
             return response.text
         except Exception as e:
-            logging.error(f"Error editing sequence: {str(e)}")
+            logger.error("Error editing sequence: %s", e)
             return f"Error editing sequence: {str(e)}"
 
     def handle_sequence_feedback(self, feedback: str) -> str:
@@ -297,18 +364,12 @@ class HelixResponseHandler:
 
             # Add company context if available
             if company_context:
-                context.update({
-                    'company_name': company_context.get('name'),
-                    'industry': company_context.get('industry'),
-                    'company_size': company_context.get('size'),
-                    'company_description': company_context.get('description'),
-                    'website': company_context.get('website')
-                })
+                context.update(company_fields(company_context))
 
             prompt = self.load_prompt('enhance_personalization_prompt.txt', context)
             
             response = self.model.generate_content(prompt)
             return response.text
         except Exception as e:
-            logging.error(f"Error enhancing personalization: {str(e)}")
+            logger.error("Error enhancing personalization: %s", e)
             return sequence  # Return original sequence if enhancement fails 
\ No newline at end of file
@@ -0,0 +1,332 @@
+"""Multi-worker Socket.IO deployment support.
+
+Each worker process runs its own ``SocketIO`` server; a shared message queue
+relays emits, room membership and disconnects between workers so an event
+like ``sequence_update`` reaches its client whichever worker produced it.
+
+Production deployments point ``SOCKETIO_MESSAGE_QUEUE`` at Redis
+(``redis://``) or any kombu broker (``amqp://`` ...). For local runs and tests
+``local://host:port`` uses the small fan-out broker in this module:
+
+    python scaling.py broker --port 6390
+    SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:6390 PORT=3002 python app.py
+    SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:6390 PORT=3003 python app.py
+    python scaling.py nginx --workers 2 --base-port 3002 > helix.conf
+
+The asyncio server (``asgi_app.py``) takes the same settings through
+``async_socketio_options`` and can share a queue with the Flask workers.
+
+The polling transport sends every request of a session to the worker that
+owns it, so the load balancer must pin clients to a worker (``ip_hash``).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from payloads import socketio_serializer
+
+logger = logging.getLogger(__name__)
+
+LOCAL_SCHEME = 'local://'
+DEFAULT_BROKER_PORT = 6390
+DEFAULT_CHANNEL = 'flask-socketio'
+
+_HEADER = struct.Struct('!I')
+
+
+def _encode_frame(message: Dict) -> bytes:
+    payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(len(payload)) + payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_frames(sock: socket.socket) -> Iterator[bytes]:
+    """Yield raw frame payloads until the peer closes the connection."""
+    while True:
+        header = _recv_exact(sock, _HEADER.size)
+        if header is None:
+            return
+        payload = _recv_exact(sock, _HEADER.unpack(header)[0])
+        if payload is None:
+            return
+        yield payload
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            for payload in _read_frames(self.request):
+                message = json.loads(payload)
+                if 'subscribe' in message:
+                    self.server.subscribe(message['subscribe'], self.request)
+                elif 'channel' in message:
+                    self.server.publish(message['channel'], _HEADER.pack(len(payload)) + payload)
+        except OSError:
+            pass
+        finally:
+            self.server.unsubscribe(self.request)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """Minimal pub/sub broker relaying frames to every channel subscriber.
+
+    Stands in for Redis when running several workers on one machine or in
+    tests; it keeps no history, so workers only see messages published while
+    they are subscribed.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_BROKER_PORT):
+        super().__init__((host, port), _BrokerHandler)
+        self.subscribers = defaultdict(set)
+        # One send lock per subscriber, so frames to it never interleave while
+        # a slow subscriber only holds up publishes that reach it
+        self.send_locks: Dict[socket.socket, threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{LOCAL_SCHEME}{host}:{port}"
+
+    def subscribe(self, channel: str, conn: socket.socket):
+        with self.lock:
+            self.subscribers[channel].add(conn)
+            self.send_locks.setdefault(conn, threading.Lock())
+
+    def unsubscribe(self, conn: socket.socket):
+        with self.lock:
+            for conns in self.subscribers.values():
+                conns.discard(conn)
+            self.send_locks.pop(conn, None)
+
+    def publish(self, channel: str, frame: bytes):
+        with self.lock:
+            targets = [(conn, self.send_locks[conn]) for conn in self.subscribers.get(channel, ())]
+        for conn, send_lock in targets:
+            try:
+                with send_lock:
+                    conn.sendall(frame)
+            except OSError as e:
+                logger.warning("Dropping local broker subscriber: %s", e)
+                self.unsubscribe(conn)
+                try:
+                    # Ends the subscriber's handler, so the worker reconnects
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def start(self) -> threading.Thread:
+        """Serve from a daemon thread and return it."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class LocalQueueManager(socketio.PubSubManager):
+    """Socket.IO client manager backed by a :class:`LocalBroker`."""
+    name = 'local'
+
+    def __init__(self, url: str = f'{LOCAL_SCHEME}127.0.0.1:{DEFAULT_BROKER_PORT}',
+                 channel: str = DEFAULT_CHANNEL, write_only: bool = False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_BROKER_PORT)
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection(self.address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _publish(self, data):
+        frame = _encode_frame({'channel': self.channel, 'data': data})
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect()
+                    self._publisher.sendall(frame)
+                    return
+                except OSError:
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                sock = self._connect()
+                sock.sendall(_encode_frame({'subscribe': self.channel}))
+                retry_sleep = 1
+                for payload in _read_frames(sock):
+                    yield json.loads(payload)['data']
+            except OSError as e:
+                logger.error("Lost connection to local broker %s: %s", self.address, e)
+            time.sleep(retry_sleep)
+            retry_sleep = min(retry_sleep * 2, 60)
+
+
+class AsyncLocalQueueManager(AsyncPubSubManager):
+    """asyncio counterpart of :class:`LocalQueueManager` for ``socketio.AsyncServer``."""
+    name = 'local'
+
+    def __init__(self, url: str = f'{LOCAL_SCHEME}127.0.0.1:{DEFAULT_BROKER_PORT}',
+                 channel: str = DEFAULT_CHANNEL, write_only: bool = False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_BROKER_PORT)
+        self._writer = None
+        self._publish_lock = asyncio.Lock()
+
+    async def _publish(self, data):
+        frame = _encode_frame({'channel': self.channel, 'data': data})
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        _, self._writer = await asyncio.open_connection(*self.address)
+                    self._writer.write(frame)
+                    await self._writer.drain()
+                    return
+                except OSError:
+                    self._writer = None
+                    if attempt:
+                        raise
+
+    async def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(*self.address)
+                writer.write(_encode_frame({'subscribe': self.channel}))
+                await writer.drain()
+                retry_sleep = 1
+                while True:
+                    header = await reader.readexactly(_HEADER.size)
+                    payload = await reader.readexactly(_HEADER.unpack(header)[0])
+                    yield json.loads(payload)['data']
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.error("Lost connection to local broker %s: %s", self.address, e)
+            await asyncio.sleep(retry_sleep)
+            retry_sleep = min(retry_sleep * 2, 60)
+
+
+def socketio_options(config) -> Dict:
+    """Build ``SocketIO`` keyword arguments for the configured deployment mode."""
+    options = {
+        'ping_timeout': config.SOCKETIO_PING_TIMEOUT,
+        'ping_interval': config.SOCKETIO_PING_INTERVAL,
+        'serializer': socketio_serializer(config.SOCKETIO_SERIALIZER),
+        'http_compression': True,
+        'compression_threshold': config.SOCKETIO_COMPRESSION_THRESHOLD,
+    }
+    url = config.SOCKETIO_MESSAGE_QUEUE
+    if url:
+        channel = config.SOCKETIO_CHANNEL
+        if url.startswith(LOCAL_SCHEME):
+            options['client_manager'] = LocalQueueManager(url, channel=channel)
+        else:
+            # Flask-SocketIO picks RedisManager/KombuManager from the URL scheme
+            options['message_queue'] = url
+            options['channel'] = channel
+        logger.info("Socket.IO multi-worker mode using message queue %s", urlparse(url).scheme)
+    return options
+
+
+def async_socketio_options(config) -> Dict:
+    """Build ``socketio.AsyncServer`` keyword arguments for the configured deployment mode."""
+    options = {
+        'ping_timeout': config.SOCKETIO_PING_TIMEOUT,
+        'ping_interval': config.SOCKETIO_PING_INTERVAL,
+        'serializer': socketio_serializer(config.SOCKETIO_SERIALIZER),
+        'http_compression': True,
+        'compression_threshold': config.SOCKETIO_COMPRESSION_THRESHOLD,
+    }
+    url = config.SOCKETIO_MESSAGE_QUEUE
+    if url:
+        channel = config.SOCKETIO_CHANNEL
+        scheme = urlparse(url).scheme
+        if url.startswith(LOCAL_SCHEME):
+            options['client_manager'] = AsyncLocalQueueManager(url, channel=channel)
+        elif scheme in ('redis', 'rediss', 'unix'):
+            options['client_manager'] = socketio.AsyncRedisManager(url, channel=channel)
+        elif scheme.startswith('amqp'):
+            options['client_manager'] = socketio.AsyncAioPikaManager(url, channel=channel)
+        else:
+            raise ValueError(f"Unsupported message queue for the asyncio server: {url}")
+        logger.info("Async Socket.IO multi-worker mode using message queue %s", scheme)
+    return options
+
+
+def nginx_config(ports: List[int], host: str = '127.0.0.1', listen: int = 80) -> str:
+    """Render an nginx site that pins each client to one worker."""
+    servers = "\n".join(f"    server {host}:{port};" for port in ports)
+    return f"""upstream helix_workers {{
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen {listen};
+
+    location / {{
+        proxy_pass http://helix_workers;
+        proxy_http_version 1.1;
+        proxy_set_header Host $host;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+        proxy_read_timeout 120s;
+    }}
+}}
+"""
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Helix multi-worker helpers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    broker_cmd = commands.add_parser('broker', help='run the local message queue broker')
+    broker_cmd.add_argument('--host', default='127.0.0.1')
+    broker_cmd.add_argument('--port', type=int, default=DEFAULT_BROKER_PORT)
+    nginx_cmd = commands.add_parser('nginx', help='print a sticky-session nginx config')
+    nginx_cmd.add_argument('--workers', type=int, default=2)
+    nginx_cmd.add_argument('--base-port', type=int, default=3002)
+    nginx_cmd.add_argument('--listen', type=int, default=80)
+    args = parser.parse_args()
+
+    if args.command == 'broker':
+        logging.basicConfig(level=logging.INFO)
+        broker = LocalBroker(args.host, args.port)
+        logger.info("Local broker listening on %s", broker.url)
+        broker.serve_forever()
+    else:
+        ports = [args.base_port + i for i in range(args.workers)]
+        print(nginx_config(ports, listen=args.listen))
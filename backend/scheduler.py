@@ -0,0 +1,218 @@
+"""Cadence scheduling of follow-up steps.
+
+Enrolling a recipient in a sequence writes one :class:`models.ScheduledStep`
+per email step, due at offsets taken from the sequence type's cadence. The
+``(status, due_at)`` index on that table is the durable priority queue: a
+B-tree gives O(log n) inserts and ordered range scans over millions of
+pending steps. Each worker keeps only a window of it in memory, a heap of
+``(due_at, id)`` for steps due within ``horizon`` and capped at
+``batch_size``, so memory does not grow with the number of pending steps.
+
+Firing is idempotent. A step is claimed with a conditional update from
+``pending`` to ``claimed``, and only the worker whose update matched sends it.
+A claim older than ``lease`` belongs to a worker that crashed mid-send, so it
+returns to ``pending``; every worker checks for such claims once per lease. Delivery is therefore at least once, and senders get
+the step ID as an idempotency key. A reply cancels the recipient's remaining
+pending steps; any stale heap entries for them then fail their claim.
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from export import parse_steps
+from models import db, ScheduledStep
+
+logger = logging.getLogger(__name__)
+
+# Days to wait before each step, counted from the previous one
+CADENCES = {
+    'passive': (0, 4, 7, 7, 14),
+    'aggressive': (0, 2, 2, 3, 4),
+}
+DEFAULT_CADENCE = 'passive'
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(minutes=5)
+STATUSES = ('pending', 'claimed', 'sent', 'cancelled', 'failed')
+
+
+def cadence_offsets(sequence_type: Optional[str], steps: int) -> List[timedelta]:
+    """When each step is due relative to enrollment; long sequences repeat the last gap."""
+    gaps = CADENCES.get((sequence_type or '').lower(), CADENCES[DEFAULT_CADENCE])
+    offsets, total = [], 0
+    for step in range(steps):
+        total += gaps[min(step, len(gaps) - 1)]
+        offsets.append(timedelta(days=total))
+    return offsets
+
+
+class CadenceScheduler:
+    """Fires due steps through ``send(step)`` from an in-memory window of the due queue."""
+
+    def __init__(self, send: Callable[[ScheduledStep], None], horizon: float = 300, batch_size: int = 500,
+                 lease: float = 600, refresh: float = 10, clock: Callable[[], datetime] = datetime.utcnow):
+        self.send = send
+        self.horizon = timedelta(seconds=horizon)
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease)
+        # Re-read the window at least this often to see other workers' enrollments
+        self.refresh = timedelta(seconds=refresh)
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.heap: List = []
+        # Every pending step due up to this time is in the heap; None forces a reload
+        self.loaded_until: Optional[datetime] = None
+        self.loaded_at: Optional[datetime] = None
+        self.recovered_at: Optional[datetime] = None
+        self.counters = {'fired': 0, 'skipped': 0, 'retried': 0, 'failed': 0, 'cancelled': 0}
+
+    def _invalidate(self, due_at: datetime):
+        with self.lock:
+            if self.loaded_until is not None and due_at <= self.loaded_until:
+                self.loaded_until = None
+
+    def enroll(self, sequence, recipients: Iterable[str], start_at: Optional[datetime] = None) -> int:
+        """Schedule every step of ``sequence`` for each recipient; enrolling twice is a no-op.
+
+        Times are naive UTC; an aware ``start_at`` is converted.
+        """
+        start = start_at or self.clock()
+        if start.tzinfo is not None:
+            start = start.astimezone(timezone.utc).replace(tzinfo=None)
+        offsets = cadence_offsets(sequence.sequence_type, len(parse_steps(sequence.content)))
+        rows = [{'sequence_id': sequence.id, 'recipient': recipient, 'step': number, 'due_at': start + offset,
+                 'status': 'pending', 'attempts': 0}
+                for recipient in dict.fromkeys(recipients) for number, offset in enumerate(offsets, 1)]
+        if not rows:
+            return 0
+        dialect = {'postgresql': postgresql, 'sqlite': sqlite}.get(db.session.get_bind().dialect.name)
+        statement = dialect.insert(ScheduledStep).on_conflict_do_nothing() if dialect else insert(ScheduledStep)
+        db.session.execute(statement, rows)
+        db.session.commit()
+        self._invalidate(start)
+        return len(rows)
+
+    def cancel(self, sequence_id: int, recipient: str, reason: str = 'reply') -> int:
+        """Cancel a recipient's pending steps, e.g. when they reply."""
+        result = db.session.execute(update(ScheduledStep).where(
+            ScheduledStep.sequence_id == sequence_id,
+            ScheduledStep.recipient == recipient,
+            ScheduledStep.status == 'pending'
+        ).values(status='cancelled', error=reason))
+        db.session.commit()
+        with self.lock:
+            self.counters['cancelled'] += result.rowcount
+        return result.rowcount
+
+    def recover(self) -> int:
+        """Return steps claimed by a crashed worker to the queue."""
+        result = db.session.execute(update(ScheduledStep).where(
+            ScheduledStep.status == 'claimed',
+            ScheduledStep.claimed_at < self.clock() - self.lease
+        ).values(status='pending', claimed_at=None))
+        db.session.commit()
+        if result.rowcount:
+            logger.warning("Recovered %s steps from an interrupted send", result.rowcount)
+        return result.rowcount
+
+    def _refill(self, now: datetime):
+        until = now + self.horizon
+        rows = db.session.execute(
+            select(ScheduledStep.due_at, ScheduledStep.id)
+            .where(ScheduledStep.status == 'pending', ScheduledStep.due_at <= until)
+            .order_by(ScheduledStep.due_at, ScheduledStep.id)
+            .limit(self.batch_size)
+        ).all()
+        # Rows come back sorted, which is already a valid heap
+        self.heap = [tuple(row) for row in rows]
+        self.loaded_until = rows[-1].due_at if len(rows) == self.batch_size else until
+        self.loaded_at = now
+
+    def _claim(self, ids: List[int], now: datetime) -> List[ScheduledStep]:
+        result = db.session.execute(
+            update(ScheduledStep)
+            .where(ScheduledStep.id.in_(ids), ScheduledStep.status == 'pending')
+            .values(status='claimed', claimed_at=now, attempts=ScheduledStep.attempts + 1)
+            .returning(ScheduledStep.id)
+        )
+        claimed = [row.id for row in result]
+        db.session.commit()
+        if not claimed:
+            return []
+        return db.session.execute(
+            select(ScheduledStep).where(ScheduledStep.id.in_(claimed)).order_by(ScheduledStep.due_at)
+        ).scalars().all()
+
+    def _fire(self, step: ScheduledStep, now: datetime) -> str:
+        try:
+            self.send(step)
+        except Exception as e:
+            logger.error("Error sending step %s: %s", step.id, e)
+            step.error = str(e)
+            if step.attempts >= MAX_ATTEMPTS:
+                step.status = 'failed'
+            else:
+                step.status = 'pending'
+                step.due_at = now + RETRY_DELAY * 2 ** (step.attempts - 1)
+        else:
+            step.status = 'sent'
+            step.sent_at = now
+            step.error = None
+        db.session.commit()
+        return {'sent': 'fired', 'pending': 'retried'}.get(step.status, step.status)
+
+    def tick(self) -> int:
+        """Claim and send every step now due; returns the number sent."""
+        with self.lock:
+            now = self.clock()
+            if self.recovered_at is None or now - self.recovered_at >= self.lease:
+                self.recover()
+                self.recovered_at = now
+            if self.loaded_until is None or now >= self.loaded_until or now - self.loaded_at >= self.refresh:
+                self._refill(now)
+            ids = []
+            while self.heap and self.heap[0][0] <= now:
+                ids.append(heapq.heappop(self.heap)[1])
+        if not ids:
+            return 0
+        # Sending happens outside the lock so enrollments and cancels never wait on it
+        steps = self._claim(ids, now)
+        outcomes = [self._fire(step, now) for step in steps]
+        with self.lock:
+            self.counters['skipped'] += len(ids) - len(steps)
+            for outcome in outcomes:
+                self.counters[outcome] += 1
+            if 'retried' in outcomes:
+                self.loaded_until = None
+        return outcomes.count('fired')
+
+    def run(self, sleep, interval: float = 1.0):
+        """Tick on a fixed interval forever; run it as a background task."""
+        while True:
+            sleep(interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error("Error running cadence scheduler: %s", e)
+                db.session.rollback()
+
+    def steps(self, sequence_id: int, recipient: Optional[str] = None, limit: int = 500) -> List[Dict]:
+        query = select(ScheduledStep).where(ScheduledStep.sequence_id == sequence_id)
+        if recipient:
+            query = query.where(ScheduledStep.recipient == recipient)
+        query = query.order_by(ScheduledStep.recipient, ScheduledStep.step).limit(max(1, min(limit, 1000)))
+        return [step.to_dict() for step in db.session.execute(query).scalars()]
+
+    def stats(self) -> Dict:
+        counts = dict(db.session.execute(
+            select(ScheduledStep.status, func.count()).group_by(ScheduledStep.status)).all())
+        with self.lock:
+            return {
+                'steps': {status: counts.get(status, 0) for status in STATUSES},
+                'in_memory': len(self.heap),
+                **self.counters
+            }
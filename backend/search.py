@@ -0,0 +1,246 @@
+"""Full-text search over the subjects and bodies of stored sequences.
+
+Each email step of a sequence is one search document. Postgres keeps them in
+``sequence_search_docs`` with a generated, weighted ``tsvector`` column under
+a GIN index; SQLite uses an FTS5 virtual table. Documents are written in the
+same transaction as the ``EmailSequence`` insert and removed with its delete,
+so the index is always up to date without rescans. Other databases fall back
+to an unindexed ``LIKE``.
+
+Queries use web-search syntax on both backends: words are ANDed, ``"exact
+phrases"`` are quoted, ``OR`` between terms and ``-word`` to exclude.
+
+    python search.py reindex     # backfill documents for existing rows
+"""
+import argparse
+import logging
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+
+from export import iter_sequences, parse_steps
+from models import EmailSequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+POSTGRES_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sequence_search_docs (
+        sequence_id INTEGER NOT NULL REFERENCES email_sequences(id) ON DELETE CASCADE,
+        step INTEGER NOT NULL,
+        persona VARCHAR(50),
+        tone VARCHAR(50),
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', subject), 'A') || setweight(to_tsvector('english', body), 'B')
+        ) STORED,
+        PRIMARY KEY (sequence_id, step)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_sequence_search_document ON sequence_search_docs USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_sequence_search_persona_tone ON sequence_search_docs (persona, tone)",
+]
+
+SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS sequence_search USING fts5(
+        subject, body, persona UNINDEXED, tone UNINDEXED, sequence_id UNINDEXED, step UNINDEXED,
+        tokenize = 'porter unicode61'
+    )""",
+]
+
+_QUERY_TERMS = re.compile(r'(-?)"([^"]*)"|(\S+)')
+
+
+def create_search_schema(connection):
+    """Create the search table and indexes for the connection's database."""
+    schema = {'postgresql': POSTGRES_SCHEMA, 'sqlite': SQLITE_SCHEMA}.get(connection.dialect.name, [])
+    for statement in schema:
+        connection.execute(text(statement))
+
+
+def search_documents(sequence_id: int, content: str, persona: Optional[str], tone: Optional[str]) -> List[Dict]:
+    return [{
+        'sequence_id': sequence_id,
+        'step': step,
+        'persona': persona,
+        'tone': tone,
+        'subject': str(email.get('subject') or ''),
+        'body': str(email.get('body') or ''),
+    } for step, email in enumerate(parse_steps(content), 1)]
+
+
+def index_sequence(connection, sequence_id: int, content: str, persona: Optional[str], tone: Optional[str]):
+    """Add one sequence's emails to the index on ``connection``."""
+    documents = search_documents(sequence_id, content, persona, tone)
+    if not documents:
+        return
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            "INSERT INTO sequence_search_docs (sequence_id, step, persona, tone, subject, body) "
+            "VALUES (:sequence_id, :step, :persona, :tone, :subject, :body) ON CONFLICT DO NOTHING"), documents)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text(
+            "INSERT INTO sequence_search (subject, body, persona, tone, sequence_id, step) "
+            "VALUES (:subject, :body, :persona, :tone, :sequence_id, :step)"), documents)
+
+
+def unindex_sequence(connection, sequence_id: int):
+    """Remove one sequence's emails from the index on ``connection``."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("DELETE FROM sequence_search_docs WHERE sequence_id = :sequence_id"),
+                           {'sequence_id': sequence_id})
+    elif connection.dialect.name == 'sqlite':
+        # sequence_id is unindexed, so this reads the whole table; deletes are rare
+        connection.execute(text("DELETE FROM sequence_search WHERE sequence_id = :sequence_id"),
+                           {'sequence_id': sequence_id})
+
+
+@event.listens_for(EmailSequence.__table__, 'after_create')
+def _create_with_sequences(target, connection, **kw):
+    create_search_schema(connection)
+
+
+@event.listens_for(EmailSequence, 'after_insert')
+def _index_after_insert(mapper, connection, target):
+    index_sequence(connection, target.id, target.content, target.persona, target.tone)
+
+
+@event.listens_for(EmailSequence, 'after_delete')
+def _unindex_after_delete(mapper, connection, target):
+    unindex_sequence(connection, target.id)
+
+
+def fts5_query(query: str) -> str:
+    """Translate web-search syntax into an FTS5 MATCH expression of quoted strings."""
+    include, exclude = [], []
+    pending_or = False
+    for negated, phrase, word in _QUERY_TERMS.findall(query):
+        if word == 'OR':
+            pending_or = bool(include)
+            continue
+        if word.startswith('-') and len(word) > 1:
+            negated, word = '-', word[1:]
+        term = (phrase if phrase else word).replace('"', '""').strip()
+        if not term:
+            continue
+        quoted = f'"{term}"'
+        if negated:
+            exclude.append(quoted)
+        elif pending_or:
+            include[-1] = f'{include[-1]} OR {quoted}'
+        else:
+            include.append(quoted)
+        pending_or = False
+    if not include:
+        raise ValueError("Search query needs at least one term to match")
+    expression = ' AND '.join(f'({group})' if ' OR ' in group else group for group in include)
+    for term in exclude:
+        expression = f'{expression} NOT {term}'
+    return expression
+
+
+def _filters(filters: Dict, column_prefix: str = '') -> str:
+    return ''.join(f" AND {column_prefix}{key} = :{key}" for key in ('persona', 'tone') if filters.get(key))
+
+
+def _postgres_search(connection, query: str, filters: Dict, limit: int, offset: int):
+    # Rank and paginate first; headlines are only built for the returned page
+    return connection.execute(text(f"""
+        SELECT hits.sequence_id, hits.step, hits.persona, hits.tone, hits.rank,
+               ts_headline('english', hits.subject, hits.query, :subject_options) AS subject,
+               ts_headline('english', hits.body, hits.query, :snippet_options) AS snippet
+        FROM (
+            SELECT d.sequence_id, d.step, d.persona, d.tone, d.subject, d.body, q.query,
+                   ts_rank_cd(d.document, q.query) AS rank
+            FROM sequence_search_docs d, websearch_to_tsquery('english', :query) AS q(query)
+            WHERE d.document @@ q.query{_filters(filters, 'd.')}
+            ORDER BY rank DESC, d.sequence_id DESC
+            LIMIT :limit OFFSET :offset
+        ) hits
+        ORDER BY hits.rank DESC, hits.sequence_id DESC
+    """), dict(filters, query=query, limit=limit, offset=offset,
+               subject_options=f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, HighlightAll=true',
+               snippet_options=f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=10, '
+                               f'MaxFragments=2, FragmentDelimiter=" … "')).all()
+
+
+def _sqlite_search(connection, query: str, filters: Dict, limit: int, offset: int):
+    return connection.execute(text(f"""
+        SELECT sequence_id, step, persona, tone, -bm25(sequence_search, 2.0, 1.0) AS rank,
+               highlight(sequence_search, 0, :start, :end) AS subject,
+               snippet(sequence_search, 1, :start, :end, ' … ', 24) AS snippet
+        FROM sequence_search
+        WHERE sequence_search MATCH :query{_filters(filters)}
+        ORDER BY bm25(sequence_search, 2.0, 1.0), sequence_id DESC
+        LIMIT :limit OFFSET :offset
+    """), dict(filters, query=fts5_query(query), limit=limit, offset=offset,
+               start=HIGHLIGHT_START, end=HIGHLIGHT_END)).all()
+
+
+def _fallback_search(connection, query: str, filters: Dict, limit: int, offset: int):
+    terms = [term for _, phrase, word in _QUERY_TERMS.findall(query) for term in [phrase or word]
+             if term and term != 'OR' and not term.startswith('-')]
+    if not terms:
+        raise ValueError("Search query needs at least one term to match")
+    conditions = ''.join(f" AND lower(content) LIKE :term{i}" for i in range(len(terms)))
+    rows = connection.execute(text(f"""
+        SELECT id AS sequence_id, 1 AS step, persona, tone, 0 AS rank, '' AS subject,
+               substr(content, 1, 200) AS snippet
+        FROM email_sequences WHERE 1 = 1{conditions}{_filters(filters)}
+        ORDER BY id DESC LIMIT :limit OFFSET :offset
+    """), dict(filters, limit=limit, offset=offset,
+               **{f'term{i}': f'%{term.lower()}%' for i, term in enumerate(terms)})).all()
+    return rows
+
+
+def search_sequences(connection, query: str, filters: Optional[Dict] = None,
+                     limit: int = DEFAULT_LIMIT, offset: int = 0) -> List[Dict]:
+    """Best matching emails first, with highlighted subject and body snippet."""
+    query = (query or '').strip()
+    if not query:
+        raise ValueError("Search query is required")
+    filters = {key: value for key, value in (filters or {}).items() if key in ('persona', 'tone') and value}
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    offset = max(0, int(offset))
+    backend = {'postgresql': _postgres_search, 'sqlite': _sqlite_search}.get(
+        connection.dialect.name, _fallback_search)
+    return [{
+        'sequence_id': row.sequence_id,
+        'step': row.step,
+        'persona': row.persona,
+        'tone': row.tone,
+        'rank': round(float(row.rank), 4),
+        'subject': row.subject,
+        'snippet': row.snippet,
+    } for row in backend(connection, query, filters, limit, offset)]
+
+
+def reindex(connection, yield_per: int = 500) -> int:
+    """Rebuild the index from ``email_sequences``; returns the number of sequences."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("TRUNCATE sequence_search_docs"))
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(text("DELETE FROM sequence_search"))
+    count = 0
+    for row in iter_sequences({}, yield_per=yield_per):
+        index_sequence(connection, row.id, row.content, row.persona, row.tone)
+        count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Helix sequence search index')
+    parser.add_argument('command', choices=['reindex'])
+    parser.parse_args()
+
+    from app import app
+    from models import db
+    with app.app_context():
+        indexed = reindex(db.session.connection())
+        db.session.commit()
+        print(f"Indexed {indexed} sequences")
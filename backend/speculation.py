@@ -0,0 +1,177 @@
+"""Speculative sequence generation.
+
+Generating a sequence takes three model calls (the sequence, its
+suggestions and its metrics), and users usually ask for it right after the
+conversation has covered the role, company and requirements. As soon as a
+``chat_message`` passes the readiness check, :class:`Speculator` starts that
+generation in the background, keyed on a hash of the conversation state that
+determines the result: the user's turns, tone, sequence type and company. When
+``generate_sequence`` arrives with the same state the result is served at
+once (or as soon as the still-running generation finishes); any other state
+discards it. Only served results are stored.
+
+Each client has at most one speculation, so a new message that changes the
+state discards the previous one. Hits, misses and the model calls spent on
+discarded results are counted so the trigger can be tuned:
+
+- ``sequence``: every kind of required information was given (the default)
+- ``email``: a role plus requirements or company details (starts earlier)
+- ``off``: never speculate
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from response_handler import has_email_context, has_required_info
+
+logger = logging.getLogger(__name__)
+
+# Sequence, suggestions and metrics
+CALLS_PER_GENERATION = 3
+TRIGGERS = {
+    'sequence': has_required_info,
+    'email': has_email_context,
+}
+
+
+def state_key(messages: List[Dict], tone: str, sequence_type: str, company: Optional[Dict] = None) -> str:
+    """Hash of the conversation state a generated sequence depends on.
+
+    Assistant turns are left out: the client only has the reply to a message
+    after the speculation for it has started.
+    """
+    user_turns = [message.get('content', '') for message in messages or [] if message.get('role') == 'user']
+    payload = json.dumps([user_turns, tone, sequence_type, company], ensure_ascii=False, separators=(',', ':'),
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Speculation:
+    def __init__(self, key: str, started: float):
+        self.key = key
+        self.started = started
+        self.done = threading.Event()
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.discarded = False
+
+
+class Speculator:
+    """Runs at most one background generation per client and serves it on a matching request."""
+
+    def __init__(self, generate: Callable[[List[Dict], str, str, Optional[Dict]], Dict], spawn: Callable[[Callable], None],
+                 trigger: str = 'sequence', ttl: float = 600, max_inflight: int = 4,
+                 clock: Callable[[], float] = time.monotonic):
+        self.generate = generate
+        # Runs a function in the background, e.g. socketio.start_background_task
+        self.spawn = spawn
+        self.trigger = trigger
+        self.ttl = ttl
+        self.max_inflight = max_inflight
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Speculation] = {}
+        self.counters = {'started': 0, 'skipped': 0, 'hits': 0, 'misses': 0, 'discarded': 0,
+                         'failed': 0, 'wasted_calls': 0}
+        self.saved_seconds = 0.0
+
+    def ready(self, messages: List[Dict]) -> bool:
+        check = TRIGGERS.get(self.trigger)
+        return check is not None and check(messages or [])
+
+    def consider(self, sid: str, messages: List[Dict], tone: str, sequence_type: str,
+                 company: Optional[Dict] = None) -> bool:
+        """Start generating for this client if the conversation is ready; True when started."""
+        if not self.ready(messages):
+            return False
+        key = state_key(messages, tone, sequence_type, company)
+        now = self.clock()
+        with self.lock:
+            self._expire(now)
+            current = self.entries.get(sid)
+            if current is not None:
+                if current.key == key:
+                    return False
+                self._discard(sid)
+            if sum(not entry.done.is_set() for entry in self.entries.values()) >= self.max_inflight:
+                self.counters['skipped'] += 1
+                return False
+            entry = self.entries[sid] = Speculation(key, now)
+            self.counters['started'] += 1
+        self.spawn(lambda: self._run(entry, list(messages), tone, sequence_type, company))
+        return True
+
+    def _run(self, entry: Speculation, messages: List[Dict], tone: str, sequence_type: str,
+             company: Optional[Dict]):
+        try:
+            entry.result = self.generate(messages, tone, sequence_type, company)
+        except Exception as e:
+            logger.error("Error in speculative generation: %s", e)
+            entry.error = str(e)
+        with self.lock:
+            if entry.error:
+                self.counters['failed'] += 1
+            if entry.discarded:
+                self.counters['wasted_calls'] += CALLS_PER_GENERATION
+            entry.done.set()
+
+    def _discard(self, sid: str):
+        entry = self.entries.pop(sid)
+        entry.discarded = True
+        self.counters['discarded'] += 1
+        # A running generation adds its calls when it finishes
+        if entry.done.is_set():
+            self.counters['wasted_calls'] += CALLS_PER_GENERATION
+
+    def _expire(self, now: float):
+        for sid in [sid for sid, entry in self.entries.items() if now - entry.started > self.ttl]:
+            self._discard(sid)
+
+    def take(self, sid: str, messages: List[Dict], tone: str, sequence_type: str,
+             company: Optional[Dict] = None, timeout: float = 30) -> Optional[Dict]:
+        """The speculative result for exactly this state, waiting up to ``timeout`` if it is still running."""
+        key = state_key(messages, tone, sequence_type, company)
+        with self.lock:
+            self._expire(self.clock())
+            entry = self.entries.get(sid)
+            if entry is None or entry.key != key:
+                if entry is not None:
+                    self._discard(sid)
+                self.counters['misses'] += 1
+                return None
+            del self.entries[sid]
+        finished = entry.done.wait(timeout)
+        with self.lock:
+            if not finished or entry.error:
+                entry.discarded = True
+                self.counters['misses'] += 1
+                if finished:
+                    self.counters['wasted_calls'] += CALLS_PER_GENERATION
+                return None
+            self.counters['hits'] += 1
+            self.saved_seconds += max(0.0, self.clock() - entry.started)
+        return entry.result
+
+    def forget(self, sid: str):
+        """Discard a disconnected client's speculation."""
+        with self.lock:
+            if sid in self.entries:
+                self._discard(sid)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            served = self.counters['hits'] + self.counters['misses']
+            return dict(
+                self.counters,
+                trigger=self.trigger,
+                pending=len(self.entries),
+                hit_rate=round(self.counters['hits'] / served, 3) if served else None,
+                wasted_call_rate=(round(self.counters['wasted_calls'] /
+                                        (self.counters['started'] * CALLS_PER_GENERATION), 3)
+                                  if self.counters['started'] else None),
+                # Upper bound: time from speculation start to the request it served
+                saved_seconds=round(self.saved_seconds, 3)
+            )
@@ -0,0 +1,285 @@
+"""Structured logging that never blocks the request path.
+
+:func:`configure_logging` puts one :class:`QueueHandler` on the root logger.
+It drops sampled-out records and queues the rest without waiting. A
+``logging.handlers.QueueListener`` thread then formats and writes them.
+Log calls pass their values as arguments (``logger.info('Parsed %s',
+sequence)``), so a handler thread pays for a queue put and never for
+``str()`` of a payload, a prompt or a model response.
+
+Records are written as one JSON object per line:
+
+    {"ts": 1760866200.123, "level": "INFO", "logger": "app", "msg": "Received chat message", "chars": 64}
+
+Values passed through ``extra`` become top-level fields. The message and
+every field are cut to ``LOG_MAX_FIELD_LENGTH`` characters. Email addresses
+and phone numbers are masked, and candidate fields such as ``email`` or
+``last_name`` are dropped from structured values entirely.
+
+:class:`Sampler` keys records on their unformatted message, so every
+``Received chat message`` line counts as the same message whatever its
+arguments. Past ``burst`` records of one message per window it keeps only
+every ``every``-th. The next kept record carries the number skipped as
+``sampled_out``. Warnings and errors are never sampled.
+
+A full queue drops records instead of blocking; :meth:`LogPipeline.stats`
+counts them next to the records and bytes written.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import reprlib
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE = re.compile(r'(?<![\w.])(?:\+\d{1,3}[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]?\d{4}(?![\w.])')
+# Candidate fields (see models.Candidate) dropped from structured values
+PII_KEYS = frozenset({'email', 'recipient', 'first_name', 'last_name', 'full_name', 'phone', 'linkedin_url'})
+REDACTED = '[redacted]'
+
+# Items kept per list or dict in a structured value, and how deep it is followed
+MAX_ITEMS = 20
+MAX_DEPTH = 4
+
+
+def clip(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f'{text[:limit]}...[+{len(text) - limit} chars]'
+
+
+def redact(text: str) -> str:
+    """Mask email addresses and phone numbers."""
+    if '@' in text:
+        text = EMAIL.sub('[email]', text)
+    return PHONE.sub('[phone]', text)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as JSON lines (or ``key=value`` text) with capped, redacted fields."""
+
+    def __init__(self, output: str = 'json', max_field_length: int = 500, redact_pii: bool = True):
+        if output not in ('json', 'text'):
+            raise ValueError(f"Unknown log format: {output}")
+        super().__init__()
+        self.output = output
+        self.max_field_length = max_field_length
+        self.redact_pii = redact_pii
+        # Bounded repr for non-string message arguments, so a large dict is never rendered in full
+        self.repr = reprlib.Repr()
+        self.repr.maxstring = self.repr.maxother = max_field_length
+        self.repr.maxlevel = MAX_DEPTH
+        self.repr.maxdict = self.repr.maxlist = self.repr.maxtuple = self.repr.maxset = MAX_ITEMS
+
+    def text(self, text: str) -> str:
+        text = clip(text, self.max_field_length)
+        return redact(text) if self.redact_pii else text
+
+    def value(self, value, depth: int = 0):
+        """A JSON-safe copy of ``value`` with capped strings, lists and dicts."""
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            return self.text(value)
+        if depth >= MAX_DEPTH:
+            return self.text(self.repr.repr(value))
+        if isinstance(value, dict):
+            items = list(value.items())
+            kept = {str(key): REDACTED if self.redact_pii and key in PII_KEYS else self.value(item, depth + 1)
+                    for key, item in items[:MAX_ITEMS]}
+            if len(items) > MAX_ITEMS:
+                kept['...'] = f'+{len(items) - MAX_ITEMS} keys'
+            return kept
+        if isinstance(value, (list, tuple, set, frozenset)):
+            items = list(value)
+            kept = [self.value(item, depth + 1) for item in items[:MAX_ITEMS]]
+            if len(items) > MAX_ITEMS:
+                kept.append(f'...+{len(items) - MAX_ITEMS} items')
+            return kept
+        return self.text(str(value))
+
+    def message(self, record: logging.LogRecord) -> str:
+        msg = str(record.msg)
+        if isinstance(record.args, dict):
+            msg = msg % record.args
+        elif record.args:
+            args = tuple(clip(arg, self.max_field_length) if isinstance(arg, str)
+                         else arg if isinstance(arg, (int, float)) else self.repr.repr(arg)
+                         for arg in record.args)
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f'{msg} {args}'
+        return self.text(msg)
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'ts': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+                 'msg': self.message(record)}
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = REDACTED if self.redact_pii and key in PII_KEYS else self.value(value)
+        if record.exc_info:
+            # Tracebacks name files and lines, not data, so they get a longer cap; the end is kept
+            exc, limit = self.formatException(record.exc_info), self.max_field_length * 8
+            entry['exc'] = exc if len(exc) <= limit else f'[{len(exc) - limit} chars]...{exc[-limit:]}'
+        if self.output == 'json':
+            return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+        fields = ' '.join(f'{key}={json.dumps(value, ensure_ascii=False, default=str)}'
+                          for key, value in entry.items() if key not in ('ts', 'level', 'logger', 'msg', 'exc'))
+        when = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+        line = f"{when} {record.levelname} {record.name}: {entry['msg']}{' ' + fields if fields else ''}"
+        return f"{line}\n{entry['exc']}" if 'exc' in entry else line
+
+
+class Sampler(logging.Filter):
+    """Keeps the first ``burst`` records of each message per window, then one in ``every``.
+
+    ``every=0`` drops everything past the burst until the window ends.
+    """
+
+    def __init__(self, burst: int = 20, every: int = 100, window: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, max_keys: int = 10000):
+        super().__init__()
+        self.burst = burst
+        self.every = every
+        self.window = window
+        self.clock = clock
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.started = clock()
+        self.counts: Dict = {}
+        # Records skipped per message since one was last kept; survives window resets
+        self.skipped: Dict = {}
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        with self.lock:
+            now = self.clock()
+            if now - self.started >= self.window or len(self.counts) >= self.max_keys:
+                self.started = now
+                self.counts.clear()
+            count = self.counts.get(key, 0) + 1
+            self.counts[key] = count
+            if count <= self.burst or (self.every and (count - self.burst) % self.every == 0):
+                skipped = self.skipped.pop(key, 0)
+                if skipped:
+                    record.sampled_out = skipped
+                return True
+            if key in self.skipped or len(self.skipped) < self.max_keys:
+                self.skipped[key] = self.skipped.get(key, 0) + 1
+            self.sampled_out += 1
+            return False
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted and drops them when the queue is full.
+
+    The standard handler formats every record before queueing it, on the
+    calling thread. Here only dicts, lists and sets among the arguments are
+    copied, shallowly, so that later changes to them don't show up in the line.
+    """
+
+    def __init__(self, log_queue: queue.Queue, on_drop: Callable[[], None]):
+        super().__init__(log_queue)
+        self.on_drop = on_drop
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and isinstance(record.args, tuple):
+            record.args = tuple(arg.copy() if isinstance(arg, (dict, list, set)) else arg for arg in record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.on_drop()
+
+
+class CountingHandler(logging.StreamHandler):
+    """Writes formatted records to a stream and counts records and bytes."""
+
+    def __init__(self, stream=None):
+        super().__init__(stream if stream is not None else sys.stderr)
+        self.records = 0
+        self.bytes = 0
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        self.records += 1
+        self.bytes += len(text.encode('utf-8', 'replace')) + len(self.terminator)
+        return text
+
+
+class LogPipeline:
+    """The root logger's queue handler and the listener thread writing its records."""
+
+    def __init__(self, sink: CountingHandler, queue_size: int = 10000, sampler: Optional[Sampler] = None):
+        self.sink = sink
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.handler = QueueHandler(self.queue, self._dropped)
+        self.sampler = sampler
+        if sampler is not None:
+            self.handler.addFilter(sampler)
+        self.listener = logging.handlers.QueueListener(self.queue, sink, respect_handler_level=True)
+        self.logger: Optional[logging.Logger] = None
+
+    def _dropped(self):
+        with self.lock:
+            self.dropped += 1
+
+    def install(self, logger: Optional[logging.Logger] = None, level=logging.INFO):
+        """Route ``logger`` (the root logger by default) through the queue."""
+        self.logger = logger or logging.getLogger()
+        self.logger.setLevel(level)
+        self.logger.addHandler(self.handler)
+        self.listener.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Write what is queued and stop the listener."""
+        if self.logger is None:
+            return
+        self.logger.removeHandler(self.handler)
+        self.logger = None
+        self.listener.stop()
+        try:
+            self.sink.flush()
+        except (OSError, ValueError):
+            # The stream may already be closed at interpreter exit
+            pass
+
+    def stats(self) -> Dict:
+        records = self.sink.records
+        return {
+            'records': records,
+            'bytes': self.sink.bytes,
+            'avg_bytes': round(self.sink.bytes / records, 1) if records else 0,
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped,
+            'sampled_out': self.sampler.sampled_out if self.sampler else 0,
+        }
+
+
+def configure_logging(config) -> LogPipeline:
+    """Install the pipeline described by ``config`` (see ``LOG_*`` in config.py)."""
+    stream = open(config.LOG_FILE, 'a', encoding='utf-8') if config.LOG_FILE else None
+    sink = CountingHandler(stream)
+    sink.setFormatter(StructuredFormatter(config.LOG_FORMAT, config.LOG_MAX_FIELD_LENGTH, config.LOG_REDACT))
+    sampler = Sampler(config.LOG_SAMPLE_BURST, config.LOG_SAMPLE_EVERY, config.LOG_SAMPLE_WINDOW_SECONDS)
+    pipeline = LogPipeline(sink, config.LOG_QUEUE_SIZE, sampler)
+    return pipeline.install(level=config.LOG_LEVEL.upper())
@@ -0,0 +1,217 @@
+"""Per-client supersession, debouncing and cancellation of editing requests.
+
+The workspace fires ``update_sequence_from_edit``, ``apply_suggestion`` and
+``adjust_tone`` in quick succession. Each event opens a :class:`Ticket` for
+its (client, kind); opening a newer ticket of the same kind supersedes the
+older one:
+
+- model calls made through a stale ticket are skipped, and a result that
+  arrives after supersession is discarded instead of emitted;
+- on the asyncio server the older handler task is cancelled outright, so its
+  in-flight model call stops as well;
+- a disconnect supersedes every ticket of that client.
+
+Only ``SUPERSEDED_KINDS`` supersede each other. Other work of a client, like
+``chat_message`` and ``generate_sequence``, opens a ticket of its own per
+request, so it runs alongside the client's other requests and is still
+stopped on disconnect.
+
+Edit events are debounced: the handler waits ``EDIT_DEBOUNCE_SECONDS`` and
+only the last edit of a burst is processed.
+
+LLM time saved is estimated from a running average of model call latency.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+SUPERSEDED_KINDS = ('update_sequence_from_edit', 'apply_suggestion', 'adjust_tone')
+
+
+class Superseded(Exception):
+    """Raised inside a request that a newer request or a disconnect made obsolete."""
+
+
+class RequestStats:
+    """Thread-safe counters of superseded work and the LLM time it saved."""
+
+    def __init__(self, smoothing: float = 0.2):
+        self.lock = threading.Lock()
+        self.smoothing = smoothing
+        self.by_kind: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.skipped_calls = 0
+        self.cancelled_calls = 0
+        self.discarded_results = 0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+        self.call_seconds: Optional[float] = None
+
+    def count(self, kind: str, outcome: str):
+        with self.lock:
+            self.by_kind[kind][outcome] += 1
+
+    def observe_call(self, seconds: float):
+        with self.lock:
+            if self.call_seconds is None:
+                self.call_seconds = seconds
+            else:
+                self.call_seconds += self.smoothing * (seconds - self.call_seconds)
+
+    def skipped(self):
+        """A model call was never made because its request was superseded."""
+        with self.lock:
+            self.skipped_calls += 1
+            self.saved_seconds += self.call_seconds or 0.0
+
+    def cancelled(self, elapsed: float):
+        """An in-flight model call was cancelled after ``elapsed`` seconds."""
+        with self.lock:
+            self.cancelled_calls += 1
+            self.saved_seconds += max(0.0, (self.call_seconds or 0.0) - elapsed)
+
+    def discarded(self, elapsed: float):
+        """A model call finished for a request that was already superseded."""
+        with self.lock:
+            self.discarded_results += 1
+            self.wasted_seconds += elapsed
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'by_kind': {kind: dict(outcomes) for kind, outcomes in self.by_kind.items()},
+                'skipped_calls': self.skipped_calls,
+                'cancelled_calls': self.cancelled_calls,
+                'discarded_results': self.discarded_results,
+                'llm_seconds_saved': round(self.saved_seconds, 3),
+                'llm_seconds_wasted': round(self.wasted_seconds, 3),
+                'avg_call_seconds': round(self.call_seconds, 3) if self.call_seconds is not None else None,
+            }
+
+
+class Ticket:
+    """One request of a client; stale once a newer ticket of the same kind opens.
+
+    Used as a context manager, it swallows :class:`Superseded` so handlers can
+    ``return`` an acknowledgement after the ``with`` block.
+    """
+
+    def __init__(self, tracker: 'RequestTracker', key: Tuple, generation: int):
+        self.tracker = tracker
+        self.key = key
+        self.generation = generation
+
+    @property
+    def sid(self) -> str:
+        return self.key[0]
+
+    @property
+    def current(self) -> bool:
+        return self.tracker.generations.get(self.key) == self.generation
+
+    def check(self):
+        if not self.current:
+            raise Superseded(f"{self.key[1]} superseded for client {self.key[0]}")
+
+    def call(self, model, prompt, **kwargs):
+        """``model.generate_content`` unless this request is already stale."""
+        if not self.current:
+            self.tracker.stats.skipped()
+            self.check()
+        started = time.perf_counter()
+        response = model.generate_content(prompt, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.tracker.stats.observe_call(elapsed)
+        if not self.current:
+            self.tracker.stats.discarded(elapsed)
+            self.check()
+        return response
+
+    async def call_async(self, model, prompt, **kwargs):
+        """``model.generate_content_async``; cancellation is counted as time saved."""
+        if not self.current:
+            self.tracker.stats.skipped()
+            self.check()
+        started = time.perf_counter()
+        try:
+            response = await model.generate_content_async(prompt, **kwargs)
+        except asyncio.CancelledError:
+            self.tracker.stats.cancelled(time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        self.tracker.stats.observe_call(elapsed)
+        if not self.current:
+            self.tracker.stats.discarded(elapsed)
+            self.check()
+        return response
+
+    def debounce(self, sleep, seconds: float):
+        """Wait out the debounce window; raises if a newer request arrived meanwhile."""
+        if seconds:
+            sleep(seconds)
+        self.check()
+
+    async def debounce_async(self, seconds: float):
+        if seconds:
+            await asyncio.sleep(seconds)
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracker.finish(self)
+        return exc_type is not None and issubclass(exc_type, Superseded)
+
+
+class RequestTracker:
+    """Latest request generation per (client sid, request kind)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = RequestStats()
+        # Keyed by (sid, kind), plus the generation for kinds that are not superseded
+        self.generations: Dict[Tuple, int] = {}
+        self.tasks: Dict[Tuple, asyncio.Task] = {}
+        self._counter = itertools.count(1)
+
+    def begin(self, sid: str, kind: str, task: Optional[asyncio.Task] = None) -> Ticket:
+        """Open a ticket, superseding (and cancelling) the previous one of this kind."""
+        with self.lock:
+            generation = next(self._counter)
+            key = (sid, kind) if kind in SUPERSEDED_KINDS else (sid, kind, generation)
+            superseded = key in self.generations
+            self.generations[key] = generation
+            previous_task = self.tasks.pop(key, None)
+            if task is not None:
+                self.tasks[key] = task
+        self.stats.count(kind, 'started')
+        if superseded:
+            self.stats.count(kind, 'superseded')
+        if previous_task is not None and previous_task is not task:
+            previous_task.cancel()
+        return Ticket(self, key, generation)
+
+    def finish(self, ticket: Ticket):
+        with self.lock:
+            if self.generations.get(ticket.key) == ticket.generation:
+                del self.generations[ticket.key]
+                self.tasks.pop(ticket.key, None)
+
+    def forget(self, sid: str):
+        """Supersede every open request of a disconnected client."""
+        with self.lock:
+            keys = [key for key in self.generations if key[0] == sid]
+            tasks = [self.tasks.pop(key) for key in keys if key in self.tasks]
+            for key in keys:
+                del self.generations[key]
+        for key in keys:
+            self.stats.count(key[1], 'disconnected')
+        for task in tasks:
+            task.cancel()
+
+
+# Shared by app.py and asgi_app.py so the stats endpoint covers both servers
+inflight = RequestTracker()
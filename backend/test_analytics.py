@@ -0,0 +1,87 @@
+from datetime import date, datetime
+
+from sqlalchemy import event, select
+
+from analytics import dashboard, parse_metrics, parse_score, rebuild
+from app import app, socketio
+from models import db, EmailSequence, MetricsRollup, SequenceMetrics
+
+
+def add_sequence(persona, tone, metrics, day=datetime(2024, 3, 1), suggestions=('Shorter',)):
+    sequence = EmailSequence(content='[]', persona=persona, tone=tone, sequence_type='passive', created_at=day)
+    db.session.add(sequence)
+    db.session.add(SequenceMetrics(sequence=sequence, **parse_metrics(metrics, list(suggestions))))
+    db.session.commit()
+    return sequence.id
+
+
+def test_metric_strings_become_numbers():
+    assert parse_score('52%') == 52.0
+    assert parse_score('75') == 75.0
+    assert parse_score(88.5) == 88.5
+    assert parse_score('N/A') is None
+    assert parse_score('250%') == 100.0
+    row = parse_metrics({'open_rate': '40%', 'sentiment': 'Positive', 'quality_score': 'N/A'}, ['a', 'b'])
+    assert row == dict(row, open_rate=40.0, response_rate=None, quality_score=None, sentiment='positive',
+                       suggestion_count=2)
+
+
+def test_rollups_are_updated_on_insert_and_dashboard_reads_only_them(app_context):
+    add_sequence('rollup_a', 'casual', {'open_rate': '40%', 'quality_score': '70', 'sentiment': 'Positive'})
+    add_sequence('rollup_a', 'casual', {'open_rate': '60%', 'quality_score': '90', 'sentiment': 'Neutral'})
+    add_sequence('rollup_a', 'formal', {'open_rate': 'N/A', 'quality_score': '50'}, day=datetime(2024, 3, 2))
+    add_sequence('rollup_b', 'casual', {'open_rate': '10%'})
+
+    statements = []
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        groups = dashboard(['persona', 'tone'], {'since': date(2024, 3, 1), 'until': date(2024, 3, 3)})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert all('email_sequences' not in statement and 'sequence_metrics' not in statement
+               for statement in statements)
+
+    casual = next(group for group in groups if group['persona'] == 'rollup_a' and group['tone'] == 'casual')
+    assert casual['sequences'] == casual['scored'] == 2
+    assert casual['open_rate'] == 50.0 and casual['quality_score'] == 80.0
+    assert casual['response_rate'] is None
+    assert casual['sentiment'] == {'positive': 1, 'neutral': 1, 'negative': 0}
+    assert casual['suggestions_per_sequence'] == 1.0
+
+    by_day = dashboard(['day'], {'persona': 'rollup_a'})
+    assert [(group['day'], group['sequences']) for group in by_day] == [('2024-03-01', 2), ('2024-03-02', 1)]
+    assert by_day[1]['open_rate'] is None and by_day[1]['quality_score'] == 50.0
+
+
+def rollup_rows(persona):
+    rows = db.session.execute(select(MetricsRollup).where(MetricsRollup.persona == persona)).scalars().all()
+    return [{column.name: getattr(row, column.name) for column in MetricsRollup.__table__.columns} for row in rows]
+
+
+def test_rebuild_matches_incremental_rollups(app_context):
+    add_sequence('rollup_rebuild', 'casual', {'open_rate': '30%', 'sentiment': 'Negative'})
+    add_sequence('rollup_rebuild', 'casual', {'response_rate': '12%'}, suggestions=())
+    incremental = rollup_rows('rollup_rebuild')
+    db.session.expunge_all()
+    rebuild()
+    assert rollup_rows('rollup_rebuild') == incremental
+
+
+def test_generated_sequences_store_metrics_and_feed_dashboard_api():
+    client = socketio.test_client(app)
+    client.emit('generate_sequence', {'messages': [], 'tone': 'rollup_tone', 'persona': 'tech_expert'})
+    update = [event['args'][0] for event in client.get_received() if event['name'] == 'sequence_update'][0]
+
+    with app.app_context():
+        stored = db.session.execute(select(SequenceMetrics).order_by(SequenceMetrics.sequence_id.desc())
+                                    ).scalars().first()
+        assert stored.open_rate == parse_score(update['metrics']['open_rate'])
+        assert stored.suggestion_count == len(update['suggestions'])
+
+    http = app.test_client()
+    groups = http.get('/api/dashboard?group_by=tone,persona&tone=rollup_tone').get_json()['groups']
+    assert groups == [dict(groups[0], tone='rollup_tone', persona='tech_expert', sequences=1, scored=1,
+                           open_rate=stored.open_rate)]
+    assert http.get('/api/dashboard?group_by=content').status_code == 400
@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import recruiting_graph
+from campaigns import CampaignRunner, RateLimiter, claim_campaign, create_campaign, parse_campaign_rows
+from llm_backend import create_model
+from models import db, Campaign, CampaignRow, EmailSequence
+
+CSV = """role,tone,company_info,step_count,persona
+Backend Engineer,casual,Fintech startup,2,startup_founder
+Data Scientist,,,,
+Product Manager,professional,Series B SaaS,9,corporate_pro
+"""
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+class FakeModel:
+    def __init__(self, fail_roles=()):
+        self.calls = []
+        self.fail_roles = set(fail_roles)
+        self.lock = threading.Lock()
+
+    def __call__(self, config):
+        with self.lock:
+            self.calls.append(config['role'])
+        if config['role'] in self.fail_roles:
+            raise RuntimeError('quota exceeded')
+        return [{'subject': f"{config['role']} step {i}", 'body': 'Hi'} for i in range(config['step_count'])]
+
+
+def test_parse_campaign_rows_fills_defaults():
+    rows = parse_campaign_rows(CSV)
+    assert rows[0]['step_count'] == 2
+    assert rows[1]['tone'] == 'professional'
+    assert rows[1]['company_info'] == 'Not provided'
+    assert rows[2]['step_count'] == 5
+
+    jsonl = '{"role": "SRE"}\n\n{"role": "Designer", "tone": "friendly"}\n'
+    assert [row['role'] for row in parse_campaign_rows(jsonl, 'jsonl')] == ['SRE', 'Designer']
+
+
+def test_parse_campaign_rows_requires_role():
+    with pytest.raises(ValueError):
+        parse_campaign_rows('role,tone\n,casual\n')
+
+
+def test_campaign_persists_sequences_and_reports_progress(app):
+    campaign = create_campaign(parse_campaign_rows(CSV))
+    events = []
+    model = FakeModel()
+
+    summary = CampaignRunner(campaign.id, generate=model, emit=lambda e, d: events.append((e, d)),
+                             max_workers=3, requests_per_minute=0, batch_size=2).run()
+
+    assert summary['status'] == 'completed'
+    assert summary['completed_rows'] == 3
+    assert summary['rows_per_minute'] > 0
+    assert sorted(model.calls) == ['Backend Engineer', 'Data Scientist', 'Product Manager']
+    progress = [d for e, d in events if e == 'campaign_progress']
+    assert sorted(d['row_index'] for d in progress) == [0, 1, 2]
+    assert events[-1][0] == 'campaign_complete'
+
+    row = CampaignRow.query.filter_by(campaign_id=campaign.id, row_index=0).one()
+    stored = db.session.get(EmailSequence, row.sequence_id)
+    assert stored.persona == 'startup_founder'
+    assert len(json.loads(stored.content)) == 2
+
+
+def test_resume_only_generates_unfinished_rows(app):
+    campaign = create_campaign(parse_campaign_rows(CSV))
+    first = FakeModel(fail_roles={'Data Scientist'})
+    summary = CampaignRunner(campaign.id, generate=first, requests_per_minute=0).run()
+    assert summary['status'] == 'completed_with_errors'
+    assert summary['failed_rows'] == 1
+
+    # Simulate a crash mid-run: one row was left pending
+    row = CampaignRow.query.filter_by(campaign_id=campaign.id, row_index=2).one()
+    row.status = 'pending'
+    db.session.commit()
+
+    second = FakeModel()
+    summary = CampaignRunner(campaign.id, generate=second, requests_per_minute=0).run()
+    assert sorted(second.calls) == ['Data Scientist', 'Product Manager']
+    assert summary['status'] == 'completed'
+    assert EmailSequence.query.count() == 4
+    assert db.session.get(Campaign, campaign.id).failed_rows == 0
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def test_model_errors_fail_rows_for_resume_with_the_default_generator(app, monkeypatch):
+    campaign = create_campaign(parse_campaign_rows(CSV))
+
+    class ExhaustedModel:
+        def generate_content(self, prompt, **kwargs):
+            raise QuotaExceeded('429 Resource has been exhausted')
+    monkeypatch.setattr(recruiting_graph, 'create_model', lambda name: ExhaustedModel())
+    summary = CampaignRunner(campaign.id, requests_per_minute=0).run()
+    assert summary['status'] == 'completed_with_errors' and summary['failed_rows'] == 3
+    assert EmailSequence.query.count() == 0
+
+    # An answer without a sequence fails too, instead of storing a placeholder
+    class RefusingModel:
+        def generate_content(self, prompt, **kwargs):
+            return type('Response', (), {'text': 'I cannot help with that.'})()
+    monkeypatch.setattr(recruiting_graph, 'create_model', lambda name: RefusingModel())
+    with pytest.raises(recruiting_graph.SequenceGenerationError):
+        recruiting_graph.request_email_sequence(parse_campaign_rows(CSV)[0])
+    assert len(recruiting_graph.generate_email_sequence(parse_campaign_rows(CSV)[0])) == 1
+
+    # The synthetic backend answers once the quota is back
+    monkeypatch.setattr(recruiting_graph, 'create_model', create_model)
+    summary = CampaignRunner(campaign.id, requests_per_minute=0).run()
+    assert summary['status'] == 'completed' and summary['completed_rows'] == 3
+    row = CampaignRow.query.filter_by(campaign_id=campaign.id, row_index=0).one()
+    assert len(json.loads(db.session.get(EmailSequence, row.sequence_id).content)) == 2
+
+
+def test_a_running_campaign_is_claimed_once(app):
+    campaign = create_campaign(parse_campaign_rows(CSV))
+    assert claim_campaign(campaign.id)
+    assert not claim_campaign(campaign.id)
+
+    # A runner that stopped beating crashed; its campaign can be resumed
+    campaign.heartbeat_at = datetime.utcnow() - timedelta(minutes=5)
+    db.session.commit()
+    assert claim_campaign(campaign.id)
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(per_minute=1200, burst=1)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    # One token up front, then one every 50ms
+    assert time.monotonic() - start >= 0.14
@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import random
+
+import pytest
+
+from ai import RecruitingAI
+from app import app, candidate_search
+from models import db, Candidate, CandidateChange
+from candidates import (K1, LEVELS, CandidateIndex, CandidateSearch, match_query, normalize_candidate,
+                        parse_candidate_rows, set_bits, tokenize)
+
+TITLES = ['Senior Backend Engineer', 'Frontend Developer', 'Data Scientist', 'Product Manager',
+          'Site Reliability Engineer', 'Founding Engineer']
+SKILLS = ['python', 'go', 'rust', 'react', 'typescript', 'postgres', 'aws', 'kubernetes', 'pytorch', 'c++']
+
+
+def profile(doc, rng):
+    return {'id': doc, 'current_title': rng.choice(TITLES), 'skills': rng.sample(SKILLS, 3),
+            'summary': ' '.join(rng.choices(SKILLS + ['team', 'shipping', 'mentor', 'payments'], k=12))}
+
+
+def brute_force(index, weights, k):
+    """Top k by scoring every posting of every segment."""
+    total = index.doc_count
+    scores = {}
+    for term, weight in weights.items():
+        df = sum(segment.df.get(term, 0) for segment in index.segments)
+        if not df:
+            continue
+        scaled = weight * math.log(1 + (total - df + 0.5) / (df + 0.5)) * (K1 + 1) / LEVELS
+        for segment in index.segments:
+            for level, docs in segment.terms.get(term, ()):
+                found = set_bits(docs) if isinstance(docs, int) else memoryview(docs).cast('i')
+                for position in found:
+                    if position not in segment.dead:
+                        doc = segment.ids[position]
+                        scores[doc] = scores.get(doc, 0.0) + scaled * level
+    return sorted(scores.values(), reverse=True)[:k]
+
+
+def test_tokens_queries_and_rows():
+    assert tokenize('Senior C++ and Node.js engineers, 5 years') == ['senior', 'c++', 'node.js', 'engineer']
+    assert match_query('backend engineer', ['Python', 'engineering']) == \
+        {'backend': 2, 'engineer': 2, 'python': 1, 'engineering': 1}
+    assert normalize_candidate({'email': ' a@b.co ', 'skills': 'go; rust|sql', 'years_experience': '7.0'}) == \
+        {'email': 'a@b.co', 'skills': ['go', 'rust', 'sql'], 'years_experience': 7}
+    with pytest.raises(ValueError):
+        normalize_candidate({'location': 'Berlin'})
+    with pytest.raises(ValueError):
+        normalize_candidate({'email': 'a@b.co', 'years_experience': 'many'})
+    rows = parse_candidate_rows('external_id,first_name,skills\nc1,Ada,"python,go"\n')
+    assert rows == [{'external_id': 'c1', 'first_name': 'Ada', 'skills': ['python', 'go']}]
+    assert parse_candidate_rows('{"email": "x@y.z"}\n\n', 'jsonl') == [{'email': 'x@y.z'}]
+
+
+def test_index_is_exact_through_updates_merges_and_snapshots(tmp_path):
+    rng = random.Random(4)
+    index = CandidateIndex(max_segments=3)
+    for start in range(1, 2001, 400):
+        index.upsert([profile(doc, rng) for doc in range(start, start + 400)])
+    index.upsert([profile(doc, rng) for doc in rng.sample(range(1, 2001), 300)])
+    index.remove(rng.sample(range(1, 2001), 100))
+    assert len(index.segments) <= 3 and index.doc_count == 1900
+
+    queries = [match_query('senior backend engineer', 'python postgres aws kubernetes'),
+               match_query('founding engineer', 'rust'), match_query('data scientist', ['pytorch']),
+               match_query(None, 'unknownterm')]
+    for weights in queries:
+        found = index.search(weights, 10)
+        assert [round(score, 9) for score, _ in found] == [round(score, 9) for score in brute_force(index, weights, 10)]
+
+    path = str(tmp_path / 'candidates.snapshot')
+    index.seq, index.gaps = 42, [40]
+    index.save(path)
+    index.save(path)
+    loaded = CandidateIndex.load(path)
+    assert loaded.seq == 42 and loaded.gaps == [40] and loaded.stats() == index.stats()
+    assert os.listdir(tmp_path) == ['candidates.snapshot']
+    for weights in queries:
+        assert loaded.search(weights, 10) == index.search(weights, 10)
+
+    # Compaction drops masked postings, which also leave the document frequencies
+    index.compact()
+    assert len(index.segments) == 1 and index.stats()['masked'] == 0
+    for weights in queries:
+        found = index.search(weights, 10)
+        assert [round(score, 9) for score, _ in found] == [round(score, 9) for score in brute_force(index, weights, 10)]
+
+
+def test_sync_applies_the_change_log_incrementally():
+    client = app.test_client()
+    search = CandidateSearch(sync_interval=3600)
+    with app.app_context():
+        search.sync(force=True)
+        client.post('/api/candidates/import', json={'candidates': [
+            {'external_id': 'sync-1', 'first_name': 'Lin', 'current_title': 'Zig Compiler Engineer'}]})
+        assert search.sync() == 0
+        assert search.sync(force=True) == 1
+        assert search.match('compiler engineer', 'zig')['candidates'][0]['external_id'] == 'sync-1'
+
+
+
+def test_sync_picks_up_seqs_that_commit_out_of_order():
+    now = [0.0]
+    search = CandidateSearch(sync_interval=0, gap_timeout=60, clock=lambda: now[0])
+    with app.app_context():
+        search.sync(force=True)
+        late, early = Candidate(external_id='gap-1', current_title='Elixir Engineer', skills=[]), \
+            Candidate(external_id='gap-2', current_title='Erlang Engineer', skills=[])
+        db.session.add_all([late, early])
+        db.session.flush()
+        # The write that took the lower seq commits after the one that took the higher seq
+        seq = search.index.seq
+        db.session.add(CandidateChange(seq=seq + 2, candidate_id=early.id))
+        db.session.commit()
+        assert search.sync() == 1 and search.index.gaps == [seq + 1]
+
+        db.session.add(CandidateChange(seq=seq + 1, candidate_id=late.id))
+        db.session.commit()
+        assert search.sync() == 1 and search.index.gaps == []
+        assert search.match('elixir engineer')['candidates'][0]['external_id'] == 'gap-1'
+
+        # A seq whose write rolled back is given up after the timeout
+        db.session.add(CandidateChange(seq=seq + 4, candidate_id=early.id))
+        db.session.commit()
+        search.sync()
+        now[0] = 61
+        assert search.sync() == 0 and search.index.gaps == []
+
+def test_import_match_and_personalize():
+    client = app.test_client()
+    rows = '\n'.join(json.dumps(row) for row in [
+        {'external_id': 'm-1', 'first_name': 'Maya', 'current_title': 'Senior Backend Engineer',
+         'skills': ['Elixir', 'Postgres'], 'github_top_repo': 'ledger-rs'},
+        {'external_id': 'm-2', 'first_name': 'Omar', 'current_title': 'Frontend Developer', 'skills': 'react'},
+        {'email': 'kai@example.com', 'first_name': 'Kai', 'current_title': 'Backend Engineer',
+         'skills': 'elixir'},
+    ])
+    created = client.post('/api/candidates/import', json={'content': rows, 'format': 'jsonl'})
+    assert created.status_code == 201 and created.get_json()['created'] == 3
+    again = client.post('/api/candidates/import', json={'candidates': [
+        {'external_id': 'm-1', 'first_name': 'Maya', 'current_title': 'Senior Backend Engineer',
+         'skills': ['Elixir', 'Postgres', 'Phoenix']}]})
+    assert again.get_json() == {'created': 0, 'updated': 1, 'indexed': 1}
+    assert client.post('/api/candidates/import', json={'candidates': [{'location': 'Oslo'}]}).status_code == 400
+
+    message = 'We are hiring a senior backend engineer who knows Elixir and Phoenix.'
+    matched = client.post('/api/candidates/match', json={'message': message}).get_json()
+    assert matched['role'] == RecruitingAI._extract_role_info(message)
+    assert [c['first_name'] for c in matched['candidates'][:2]] == ['Maya', 'Kai']
+    assert matched['took_ms'] < 1000 and matched['candidates'][0]['score'] > matched['candidates'][1]['score']
+    assert client.post('/api/candidates/match', json={}).status_code == 400
+
+    maya = matched['candidates'][0]['id']
+    rendered = client.post('/api/sequences/render', json={
+        'template': [{'subject': 'Hi {{first_name}}', 'body': 'Loved {{github_top_repo}}.'}],
+        'candidate_ids': [maya]}).get_json()
+    assert rendered['sequences'] == [[{'subject': 'Hi Maya', 'body': 'Loved ledger-rs.'}]]
+
+    assert client.delete(f'/api/candidates/{maya}').status_code == 204
+    assert client.get(f'/api/candidates/{maya}').status_code == 404
+    after = client.post('/api/candidates/match', json={'role': 'backend engineer', 'requirements': 'elixir'})
+    assert maya not in [c['id'] for c in after.get_json()['candidates']]
+    stats = client.get('/api/candidates/stats').get_json()
+    assert stats['loaded'] and stats['candidates'] == candidate_search.index.doc_count
@@ -0,0 +1,97 @@
+import pytest
+
+import app as app_module
+from app import app, socketio
+from companies import SUMMARY_MAX_WORDS, CompanyStore, company_key, local_summary, parse_company
+from recruiting_tools import sequence_prompt
+from response_handler import company_fields
+
+LONG_DESCRIPTION = ' '.join(['Ledgerly builds real-time payment rails for marketplaces in forty countries.'] * 12)
+
+
+class Summarizer:
+    def __init__(self):
+        self.profiles = []
+
+    def __call__(self, profile):
+        self.profiles.append(profile)
+        return f"{profile['name']} runs payment rails. " + 'word ' * 100
+
+
+@pytest.fixture
+def store():
+    with app.app_context():
+        yield CompanyStore(Summarizer(), capacity=2)
+
+
+def test_parsing_and_local_summaries():
+    assert company_key('  Ledgerly, Inc. ') == company_key('ledgerly inc') == 'ledgerly inc'
+    with pytest.raises(ValueError):
+        parse_company({'industry': 'Fintech'})
+    with pytest.raises(ValueError):
+        parse_company({'name': 'Acme', 'size': 42})
+    assert parse_company({'description': ''}, partial=True) == {'description': None}
+    assert local_summary({'name': 'Acme', 'size': 'Series B', 'industry': 'fintech', 'description': 'We pay.'}) == \
+        'Acme is a Series B fintech company. We pay.'
+    assert local_summary({'name': 'Acme', 'description': LONG_DESCRIPTION}) is None
+
+
+def test_summary_is_made_once_and_cached(store):
+    company = store.save({'name': 'Ledgerly Summary', 'industry': 'Fintech', 'description': LONG_DESCRIPTION})
+    first = store.context(company.id)
+    assert first['summary'].startswith('Ledgerly Summary runs payment rails.')
+    assert len(first['summary'].split()) == SUMMARY_MAX_WORDS
+    assert 'description' not in first
+    assert store.context(company.id) is first
+    assert store.stats()['hits'] == 1 and store.stats()['model_summaries'] == 1
+
+    # Another worker reads the stored summary without summarizing again
+    other = CompanyStore(Summarizer())
+    assert other.context(company.id)['summary'] == first['summary']
+    assert other.summarize.profiles == [] and store.context(10 ** 6) is None
+
+
+def test_edits_invalidate_the_summary(store):
+    company = store.save({'name': 'Acme Edits', 'description': 'We make rockets.'})
+    assert store.context(company.id)['summary'] == 'Acme Edits. We make rockets.'
+    same = store.save({'name': 'Acme Edits', 'description': 'We make rockets.'})
+    assert same.id == company.id and same.summary == 'Acme Edits. We make rockets.'
+    assert store.stats()['invalidations'] == 1
+
+    assert store.save({'industry': 'space'}, company.id).summary is None
+    assert store.context(company.id)['summary'] == 'Acme Edits is a space company. We make rockets.'
+    assert store.stats()['local_summaries'] == 2 and store.summarize.profiles == []
+    with pytest.raises(KeyError):
+        store.save({'industry': 'x'}, 10 ** 6)
+
+
+def test_prompts_use_the_summary():
+    company = {'id': 1, 'name': 'Acme', 'summary': 'Acme builds rockets.'}
+    assert '- Company: Acme builds rockets.\n' in sequence_prompt([], 'casual', 'passive', company)
+    assert 'Company:' not in sequence_prompt([], 'casual', 'passive')
+    assert company_fields(company)['company_info'] == 'Acme builds rockets.'
+    assert 'company_info' not in company_fields({'name': 'Acme'})
+
+
+def test_company_routes_and_generation_prompt(monkeypatch):
+    client = app.test_client()
+    assert client.post('/api/companies', json={'industry': 'x'}).status_code == 400
+    created = client.post('/api/companies', json={'name': 'Orbital Routes', 'description': 'Satellites.'})
+    assert created.status_code == 201
+    company_id = created.get_json()['id']
+    assert client.get(f'/api/companies/{company_id}').get_json()['summary'] == 'Orbital Routes. Satellites.'
+    updated = client.put(f'/api/companies/{company_id}', json={'description': 'Launch services.'})
+    assert updated.get_json()['summary'] is None
+    assert client.put('/api/companies/999999', json={}).status_code == 404
+    assert any(c['id'] == company_id for c in client.get('/api/companies?q=orbital').get_json())
+
+    prompts = []
+    generate = app_module.model.generate_content
+    monkeypatch.setattr(app_module.model, 'generate_content', lambda prompt, **kwargs: prompts.append(prompt)
+                        or generate(prompt, **kwargs))
+    socket = socketio.test_client(app)
+    socket.emit('generate_sequence', {'messages': [], 'tone': 'casual', 'company_id': company_id})
+    assert '- Company: Orbital Routes. Launch services.' in prompts[0]
+    socket.disconnect()
+    assert client.delete(f'/api/companies/{company_id}').status_code == 204
+    assert client.get(f'/api/companies/{company_id}').status_code == 404
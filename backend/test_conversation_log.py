@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy import event, func, select
+
+from app import app, socketio
+from conversation_log import ConversationLog
+from models import db, ConversationTurn
+
+
+def _stored_turns(conversation_id):
+    return db.session.execute(
+        select(func.count()).where(ConversationTurn.conversation_id == conversation_id)
+    ).scalar()
+
+
+def test_appends_are_batched(app_context):
+    log = ConversationLog(batch_size=4)
+    conversation = log.start('tech_expert')
+    turns = [log.append(conversation.id, 'user', f'message {i}') for i in range(3)]
+    assert turns == [1, 2, 3]
+    assert _stored_turns(conversation.id) == 0
+
+    log.append(conversation.id, 'assistant', 'reply')
+    assert _stored_turns(conversation.id) == 4
+
+
+def test_keyset_pagination_walks_back_to_first_turn(app_context):
+    log = ConversationLog(batch_size=100)
+    conversation = log.start('tech_expert')
+    for i in range(25):
+        log.append(conversation.id, 'user', f'message {i}')
+
+    pages, before = [], None
+    while True:
+        turns, before = log.page(conversation.id, before=before, limit=10)
+        pages.append([turn['turn'] for turn in turns])
+        if before is None:
+            break
+    assert pages == [list(range(16, 26)), list(range(6, 16)), list(range(1, 6))]
+
+
+def test_turn_numbers_continue_after_restart(app_context):
+    log = ConversationLog()
+    conversation = log.start('tech_expert', [{'role': 'assistant', 'content': 'Hi'}])
+    log.flush()
+    restarted = ConversationLog()
+    assert restarted.append(conversation.id, 'user', 'Back again') == 2
+
+
+
+def test_a_failed_batch_drops_only_the_conversations_that_cannot_be_written(app_context):
+    log, other_worker = ConversationLog(), ConversationLog()
+    pinned, clashing = log.start('tech_expert'), log.start('tech_expert')
+    log.append(pinned.id, 'user', 'Kept')
+    log.append(clashing.id, 'user', 'Lost')
+    # Another worker already stored turn 1 of the second conversation
+    other_worker.append(clashing.id, 'user', 'Stored first')
+    other_worker.flush()
+
+    assert log.flush() == 1
+    assert _stored_turns(pinned.id) == 1 and _stored_turns(clashing.id) == 1
+    assert log.append(clashing.id, 'user', 'Next') == 2
+
+    with pytest.raises(ValueError):
+        log.append(10 ** 9, 'user', 'Nobody')
+
+def test_resume_loads_tail_and_cached_summary_of_long_conversation(app_context):
+    log = ConversationLog(batch_size=200)
+    conversation = log.start('tech_expert')
+    for i in range(1000):
+        log.append(conversation.id, 'user' if i % 2 == 0 else 'assistant', f'turn {i}')
+    log.cache_summary(conversation.id, {'role': 'Data Engineer'})
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        state = log.resume(conversation.id, tail=20)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert [turn['turn'] for turn in state['messages']] == list(range(981, 1001))
+    assert state['before'] == 981
+    assert state['summary'] == {'role': 'Data Engineer'}
+    assert state['summary_through_turn'] == 1000
+
+    # Only the tail is read, through the primary key
+    [(statement, parameters)] = [(statement, parameters) for statement, parameters in statements
+                                 if 'conversation_turns' in statement]
+    assert 'LIMIT' in statement and 21 in parameters
+    plan = ' '.join(row[-1] for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}',
+                                                                              parameters))
+    assert 'SEARCH conversation_turns USING' in plan and 'SCAN conversation_turns' not in plan
+
+
+def test_socket_conversation_is_logged_and_resumed():
+    client = socketio.test_client(app)
+    client.emit('start_conversation', {'persona': 'tech_expert',
+                                       'messages': [{'role': 'assistant', 'content': 'What role?'}]})
+    started = [event for event in client.get_received() if event['name'] == 'conversation_started']
+    conversation_id = started[0]['args'][0]['conversation_id']
+
+    client.emit('chat_message', {'message': 'A Go engineer', 'messages': [], 'conversation_id': conversation_id})
+    client.emit('summarize_context', {'messages': [], 'conversation_id': conversation_id})
+    client.get_received()
+
+    client.emit('start_conversation', {'conversation_id': conversation_id})
+    resumed = [event for event in client.get_received() if event['name'] == 'conversation_resumed'][0]['args'][0]
+    assert [turn['role'] for turn in resumed['messages']] == ['assistant', 'user', 'assistant']
+    assert resumed['summary']['role']
+
+    response = app.test_client().get(f'/api/conversations/{conversation_id}/turns?limit=2')
+    assert [turn['turn'] for turn in response.get_json()['turns']] == [2, 3]
+    assert response.get_json()['before'] == 2
+
+
+def test_chat_with_an_unknown_conversation_still_gets_a_reply():
+    client = socketio.test_client(app)
+    client.emit('chat_message', {'message': 'A Go engineer', 'messages': [], 'conversation_id': 10 ** 9})
+    names = [event['name'] for event in client.get_received()]
+    assert 'chat_message' in names
+    assert 'error' not in names
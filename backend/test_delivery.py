@@ -0,0 +1,175 @@
+import json
+import socket
+from datetime import datetime, timedelta
+from email import message_from_bytes
+
+import pytest
+from sqlalchemy import select
+
+pytest.importorskip('aiosmtpd')
+from aiosmtpd.controller import Controller
+
+from app import app
+from benchmarks.smtp import RecordingHandler
+from delivery import DeliveryPool, Mailer, SMTPConnection, render_message
+from models import db, Delivery, EmailSequence, ScheduledStep
+from scheduler import CadenceScheduler
+
+SENDER = 'recruiter@helix.test'
+# Earlier than any other test's steps, so ticks only fire this module's enrollments
+EPOCH = datetime(2000, 1, 1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    def start(**options):
+        handler = RecordingHandler(**options)
+        port = free_port()
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        started.append(controller)
+        return handler, port
+    started = []
+    yield start
+    for controller in started:
+        controller.stop()
+
+
+def make_pool(port, **options):
+    options.setdefault('retry_delay', 0.01)
+    return DeliveryPool(lambda: SMTPConnection('127.0.0.1', port), **options)
+
+
+def job(i, recipient):
+    return {'id': i, 'sender': SENDER, 'recipient': recipient,
+            'data': f'Subject: Hi {i}\r\n\r\nHello\r\n.leading dot\r\n'.encode()}
+
+
+def make_sequence(steps=2):
+    sequence = EmailSequence(content=json.dumps([{'subject': 'Backend role at Acme' if i == 0 else '',
+                                                  'body': f'Body {i + 1}'} for i in range(steps)]),
+                             persona='tech_expert', tone='casual', sequence_type='aggressive')
+    db.session.add(sequence)
+    db.session.commit()
+    return sequence
+
+
+def test_follow_ups_are_threaded_under_the_first_email():
+    sequence = EmailSequence(id=7, content=json.dumps([{'subject': 'Backend role', 'body': 'Hi'},
+                                                       {'subject': '', 'body': 'Following up'}]))
+    first = render_message(sequence, 1, 'ada@example.com', SENDER)
+    follow_up = render_message(sequence, 2, 'ada@example.com', SENDER)
+    assert follow_up['Subject'] == 'Re: Backend role'
+    assert follow_up['In-Reply-To'] == first['Message-ID']
+    assert follow_up.get_content().strip() == 'Following up'
+    with pytest.raises(ValueError):
+        render_message(sequence, 3, 'ada@example.com', SENDER)
+
+
+def test_pool_reuses_pipelined_connections(smtp_server):
+    handler, port = smtp_server()
+    pool = make_pool(port, size=2, per_domain=2)
+    pool.start()
+    for i in range(30):
+        pool.submit(job(i, f'c{i}@example.com'))
+    assert pool.join(10)
+    pool.stop()
+
+    assert len(handler.messages) == 30
+    assert handler.sessions <= 2
+    body = message_from_bytes(handler.messages[0][1]).get_payload()
+    assert '.leading dot' in body and '..leading' not in body
+    assert pool.counters['sent'] == 30
+
+
+def test_per_domain_limit_holds_while_other_domains_proceed(smtp_server):
+    handler, port = smtp_server(latency=0.02)
+    pool = make_pool(port, size=6, per_domain=1)
+    pool.start()
+    for i in range(12):
+        pool.submit(job(i, f'c{i}@{"busy" if i < 8 else f"other{i}"}.example.com'))
+    assert pool.join(10)
+    pool.stop()
+    assert handler.peak['busy.example.com'] == 1
+    assert len(handler.messages) == 12
+
+
+def test_temporary_failures_retry_and_permanent_ones_bounce(smtp_server):
+    handler, port = smtp_server(replies={
+        'later@example.com': ['451 Try again later', '451 Try again later'],
+        'never@example.com': ['550 No such user'],
+        'flaky@example.com': ['421 Busy'] * 5,
+    })
+    pool = make_pool(port, size=2, max_attempts=5)
+    pool.start()
+    for i, recipient in enumerate(['later@example.com', 'never@example.com', 'flaky@example.com']):
+        pool.submit(job(i, recipient))
+    assert pool.join(10)
+    pool.stop()
+
+    final = {update['id']: update for update in pool.drain_updates() if update['status'] != 'deferred'}
+    assert final[0]['status'] == 'sent' and final[0]['attempts'] == 3
+    assert final[1]['status'] == 'bounced' and final[1]['smtp_code'] == 550
+    assert final[2]['status'] == 'failed' and final[2]['attempts'] == 5
+
+
+def test_scheduled_steps_are_delivered_once_and_status_written(app_context, smtp_server):
+    handler, port = smtp_server(replies={'gone@example.com': ['550 No such user']})
+    sequence = make_sequence()
+    mailer = Mailer(make_pool(port), SENDER)
+    scheduler = CadenceScheduler(mailer.send_step, clock=lambda: EPOCH)
+    mailer.on_bounce = lambda delivery: scheduler.cancel(delivery.sequence_id, delivery.recipient, 'bounce')
+    scheduler.enroll(sequence, ['ada@example.com', 'gone@example.com'])
+    scheduler.tick()
+    step = db.session.execute(select(ScheduledStep).where(
+        ScheduledStep.sequence_id == sequence.id, ScheduledStep.recipient == 'ada@example.com')).scalar()
+    assert mailer.send_step(step).status == 'queued'
+    assert mailer.pool.join(10)
+    mailer.flush()
+    mailer.pool.stop()
+
+    deliveries = {delivery.recipient: delivery for delivery in db.session.execute(
+        select(Delivery).where(Delivery.sequence_id == sequence.id)).scalars()}
+    assert deliveries['ada@example.com'].status == 'sent'
+    assert deliveries['ada@example.com'].sent_at is not None
+    assert deliveries['gone@example.com'].status == 'bounced'
+    assert [recipient for recipient, _ in handler.messages] == ['ada@example.com']
+    follow_ups = db.session.execute(select(ScheduledStep.recipient, ScheduledStep.status).where(
+        ScheduledStep.sequence_id == sequence.id, ScheduledStep.step == 2)).all()
+    assert dict(follow_ups) == {'ada@example.com': 'pending', 'gone@example.com': 'cancelled'}
+
+    response = app.test_client().get(f'/api/sequences/{sequence.id}/deliveries')
+    assert {delivery['status'] for delivery in response.get_json()['deliveries']} == {'sent', 'bounced'}
+
+
+def test_interrupted_deliveries_are_queued_again(app_context, smtp_server):
+    handler, port = smtp_server()
+    sequence = make_sequence(steps=1)
+    crashed = Mailer(make_pool(port), SENDER)
+    scheduler = CadenceScheduler(crashed.send_step, clock=lambda: EPOCH)
+    # The pool never starts, as if the process died with the job in memory
+    crashed.pool.start = lambda: None
+    scheduler.enroll(sequence, ['lost@example.com'])
+    scheduler.tick()
+
+    # While the crashed worker's lease runs, no other worker sends the message
+    assert Mailer(make_pool(port), SENDER).recover() == 0
+    delivery = db.session.execute(select(Delivery).where(Delivery.sequence_id == sequence.id)).scalar()
+    assert delivery.claimed_by == crashed.owner
+    crashed.renew()
+
+    restarted = Mailer(make_pool(port), SENDER, clock=lambda: datetime.utcnow() + timedelta(seconds=601))
+    assert restarted.recover() == 1
+    assert restarted.recover() == 0
+    assert restarted.pool.join(10)
+    restarted.flush()
+    restarted.pool.stop()
+    delivery = db.session.execute(select(Delivery).where(Delivery.sequence_id == sequence.id)).scalar()
+    assert delivery.status == 'sent'
+    assert [recipient for recipient, _ in handler.messages] == ['lost@example.com']
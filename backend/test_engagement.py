@@ -0,0 +1,156 @@
+import json
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import event, select
+
+from analytics import parse_metrics
+import app as app_module
+from app import app, cadence_scheduler, engagement
+from delivery import message_id, render_message
+from engagement import PIXEL, EngagementBuffer, parse_event, read_token, tracking_token
+from models import db, EmailSequence, EngagementCounter, PersonaEngagement, ScheduledStep, SequenceMetrics
+
+SECRET = 'test-secret'
+DAY = datetime(2024, 5, 1, 12)
+
+
+def make_sequence(persona, metrics=None):
+    sequence = EmailSequence(content=json.dumps([{'subject': 'Backend role', 'body': 'Hi\n\nBye'},
+                                                 {'subject': '', 'body': 'Following up'}]),
+                             persona=persona, tone='casual', sequence_type='passive')
+    db.session.add(sequence)
+    if metrics:
+        db.session.add(SequenceMetrics(sequence=sequence, **parse_metrics(metrics)))
+    db.session.commit()
+    return sequence.id
+
+
+def counters(sequence_id):
+    return {row.step: (row.delivered, row.opens, row.clicks, row.replies, row.bounces)
+            for row in db.session.execute(select(EngagementCounter).where(
+                EngagementCounter.sequence_id == sequence_id)).scalars()}
+
+
+def test_events_are_normalized_from_ids_or_message_ids():
+    event = parse_event({'event': 'opened', 'message_id': f"<{message_id(12, 2, 'a@x.com', 'helix.test')}>",
+                         'recipient': 'a@x.com', 'timestamp': '2024-05-01T12:00:00+02:00'})
+    assert (event['type'], event['sequence_id'], event['step'], event['at']) == ('open', 12, 2,
+                                                                                  datetime(2024, 5, 1, 10))
+    assert parse_event({'type': 'reply', 'sequence_id': '3', 'step': 1, 'email': 'a@x.com'})['recipient'] == 'a@x.com'
+    for bad in ({'type': 'spam', 'sequence_id': 1, 'step': 1}, {'type': 'click'},
+                {'type': 'click', 'sequence_id': 1, 'step': 0}, {'type': 'click', 'sequence_id': [], 'step': 1},
+                {'type': 'open', 'sequence_id': 1, 'step': 1}, []):
+        with pytest.raises(ValueError):
+            parse_event(bad)
+
+    token = tracking_token(SECRET, 12, 2, 'a@x.com')
+    assert read_token(SECRET, token) == (12, 2, 'a@x.com')
+    with pytest.raises(ValueError):
+        read_token('other-secret', token)
+
+
+def test_recording_never_touches_the_database(app_context):
+    buffer = EngagementBuffer()
+    statements = []
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        for i in range(5000):
+            buffer.record('click', 1, 1 + i % 3, at=DAY)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert statements == []
+    assert len(buffer.counts) == 3 and buffer.stats()['pending'] == 5000
+
+    full = EngagementBuffer(max_keys=1)
+    assert full.record('click', 1, 1) and full.record('click', 1, 1)
+    assert not full.record('click', 1, 2)
+    assert full.stats()['dropped'] == 1
+
+
+def test_flush_adds_counts_per_step_and_persona(app_context):
+    first, second = make_sequence('engaged_a'), make_sequence('engaged_a')
+    stopped = []
+    buffer = EngagementBuffer(on_stop=lambda *args: stopped.append(args))
+    for _ in range(4):
+        buffer.record('delivered', first, 1, at=DAY)
+    buffer.record('open', first, 1, 'a@x.com', at=DAY)
+    buffer.record('reply', first, 1, 'a@x.com', at=DAY)
+    buffer.record('bounce', second, 2, 'b@x.com', at=datetime(2024, 5, 2))
+    buffer.record('open', 10 ** 9, 1, 'a@x.com', at=DAY)
+    assert buffer.flush() == 7
+    # A repeat open of the same step by the same recipient is not counted again
+    buffer.record('open', first, 1, 'a@x.com', at=DAY)
+    buffer.record('open', first, 1, 'c@x.com', at=DAY)
+    buffer.record('open', first, 1, 'c@x.com', at=DAY)
+    assert buffer.flush() == 1
+    assert buffer.stats()['repeat_opens'] == 2
+
+    assert counters(first) == {1: (4, 2, 0, 1, 0)}
+    assert counters(second) == {2: (0, 0, 0, 0, 1)}
+    days = {row.day: (row.delivered, row.opens, row.replies, row.bounces) for row in db.session.execute(
+        select(PersonaEngagement).where(PersonaEngagement.persona == 'engaged_a')).scalars()}
+    assert days == {date(2024, 5, 1): (4, 2, 1, 0), date(2024, 5, 2): (0, 0, 0, 1)}
+    assert sorted(stopped) == [(first, 'a@x.com', 'reply'), (second, 'b@x.com', 'bounce')]
+    assert buffer.stats()['unknown'] == 1
+
+
+def test_failed_writes_keep_counts_for_the_next_flush(app_context, monkeypatch):
+    sequence_id = make_sequence('engaged_retry')
+    buffer = EngagementBuffer()
+    buffer.record('click', sequence_id, 1, at=DAY)
+    write = buffer._write
+    monkeypatch.setattr(buffer, '_write', lambda *args: (_ for _ in ()).throw(RuntimeError('database down')))
+    assert buffer.flush() == 0
+    monkeypatch.setattr(buffer, '_write', write)
+    assert buffer.flush() == 1
+    assert counters(sequence_id) == {1: (0, 0, 1, 0, 0)}
+
+
+def test_pixel_and_webhook_feed_actual_rates_next_to_estimates(app_context, monkeypatch):
+    sequence_id = make_sequence('engaged_http', {'open_rate': '40%', 'response_rate': '10%'})
+    cadence_scheduler.enroll(db.session.get(EmailSequence, sequence_id), ['ada@x.com'])
+    http = app.test_client()
+    # Without a token anyone could post replies and cancel follow-ups
+    reply = {'type': 'reply', 'sequence_id': sequence_id, 'step': 1, 'recipient': 'ada@x.com'}
+    response = http.post('/api/engagement/events', json=reply)
+    assert response.get_json()['accepted'] == 0 and response.get_json()['rejected'] == 1
+    monkeypatch.setattr(app_module.Config, 'ENGAGEMENT_WEBHOOK_TOKEN', 'hook-secret')
+    assert http.post('/api/engagement/events', json=reply).status_code == 401
+
+    events = [{'type': 'delivered', 'sequence_id': sequence_id, 'step': 1}] * 4 + [
+        {'type': 'reply', 'sequence_id': sequence_id, 'step': 1, 'recipient': 'ada@x.com'},
+        {'type': 'open'}]
+    response = http.post('/api/engagement/events', json={'events': events},
+                         headers={'X-Webhook-Token': 'hook-secret'})
+    assert response.status_code == 202
+    assert response.get_json()['accepted'] == 5 and response.get_json()['errors'][0]['index'] == 5
+
+    token = tracking_token(app.config['SECRET_KEY'], sequence_id, 1, 'ada@x.com')
+    for path in (f'/t/{token}.gif', f'/t/{token}.gif', '/t/forged.gif'):
+        pixel = http.get(path)
+        assert pixel.data == PIXEL and pixel.mimetype == 'image/gif'
+    engagement.flush()
+
+    report = http.get(f'/api/sequences/{sequence_id}/engagement').get_json()
+    assert report['steps'][0]['opens'] == 1
+    assert report['actual']['open_rate'] == 25.0 and report['actual']['response_rate'] == 25.0
+    assert report['estimated'] == {'open_rate': 40.0, 'response_rate': 10.0}
+    pending = db.session.execute(select(ScheduledStep.status).where(
+        ScheduledStep.sequence_id == sequence_id)).scalars().all()
+    assert set(pending) == {'cancelled'}
+
+    groups = http.get('/api/engagement?persona=engaged_http').get_json()['groups']
+    assert groups == [{'persona': 'engaged_http',
+                       'actual': dict(groups[0]['actual'], delivered=4, opens=1, open_rate=25.0),
+                       'estimated': {'open_rate': 40.0, 'response_rate': 10.0}}]
+
+
+def test_delivered_messages_carry_the_tracking_pixel():
+    sequence = EmailSequence(id=7, content=json.dumps([{'subject': 'Hi', 'body': 'Line <1>\n\nLine 2'}]))
+    message = render_message(sequence, 1, 'ada@x.com', 'r@helix.test', pixel_url='https://helix.test/t/abc.gif')
+    html = message.get_body(('html',)).get_content()
+    assert '<img src="https://helix.test/t/abc.gif"' in html and '<p>Line &lt;1&gt;</p>' in html
+    assert message.get_body(('plain',)).get_content().startswith('Line <1>')
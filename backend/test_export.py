@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import datetime
+from email import message_from_bytes
+
+import pytest
+from flask import Flask, request
+
+from export import export_response
+from models import db, EmailSequence
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    @app.route('/export')
+    def export():
+        return export_response(request.args)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            EmailSequence(
+                content=json.dumps([
+                    {'subject': f'Role {i}', 'body': f'Hi, role {i}'},
+                    {'subject': f'Following up {i}', 'body': 'Any thoughts?'}
+                ]),
+                persona='tech_expert' if i % 2 else 'startup_founder',
+                tone='casual',
+                sequence_type='passive',
+                created_at=datetime(2024, 1, 1 + i)
+            )
+            for i in range(10)
+        ])
+        db.session.commit()
+        yield app.test_client()
+
+
+def test_csv_export_has_one_row_per_step(client):
+    response = client.get('/export?format=csv&persona=tech_expert')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 10
+    assert {row['persona'] for row in rows} == {'tech_expert'}
+    assert rows[0]['subject'] == 'Role 1'
+    assert rows[1]['step'] == '2'
+
+
+def test_jsonl_export_filters_by_date_range(client):
+    response = client.get('/export?format=jsonl&since=2024-01-03&until=2024-01-05')
+    lines = response.get_data(as_text=True).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['steps'][0]['subject'] for record in records] == ['Role 2', 'Role 3']
+
+
+def test_eml_export_is_a_valid_zip(client):
+    response = client.get('/export?format=eml&type=passive')
+    assert response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+    names = archive.namelist()
+    assert len(names) == 20
+    message = message_from_bytes(archive.read('sequence-1/step-1.eml'))
+    assert message['Subject'] == 'Role 0'
+    assert message['X-Helix-Step'] == '1'
+
+
+def test_export_streams_in_chunks(client):
+    response = client.get('/export?format=jsonl', buffered=False)
+    chunks = list(response.response)
+    response.close()
+    assert len(chunks) == 10
+
+
+def test_unparsable_content_is_exported_as_body(client):
+    with client.application.app_context():
+        db.session.add(EmailSequence(content='plain text draft', persona='corporate_pro'))
+        db.session.commit()
+    response = client.get('/export?format=jsonl&persona=corporate_pro')
+    record = json.loads(response.get_data(as_text=True))
+    assert record['steps'] == [{'subject': '', 'body': 'plain text draft'}]
+
+
+def test_unknown_format_is_rejected(client):
+    with client.application.test_request_context():
+        with pytest.raises(ValueError):
+            export_response({'format': 'xlsx'})
+
+
+@pytest.mark.parametrize('export_format', ['xlsx', ['csv'], {'csv': 1}])
+def test_magic_action_download_rejects_bad_formats(export_format):
+    from app import app
+    response = app.test_client().post('/api/magic_action', json={'action': 'download', 'format': export_format})
+    assert response.status_code == 400
+
+
+def test_header_values_are_one_line(client):
+    with client.application.app_context():
+        db.session.add(EmailSequence(content=json.dumps([{'subject': 'Hello\r\nBcc: everyone@example.com',
+                                                          'body': ['not', 'text']}]),
+                                     persona='line\nbreak'))
+        db.session.commit()
+    response = client.get('/export?format=eml&persona=line%0Abreak')
+    archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+    [name] = archive.namelist()
+    message = message_from_bytes(archive.read(name))
+    assert message['Subject'] == 'Hello Bcc: everyone@example.com'
+    assert message['Bcc'] is None and message['X-Helix-Persona'] == 'line break'
+
+
+@pytest.mark.parametrize('params', [{'persona': ['tech_expert']}, {'since': 20240101}, {'type': {'a': 1}}])
+def test_filters_must_be_strings(client, params):
+    with client.application.test_request_context():
+        with pytest.raises(ValueError):
+            export_response(dict(params, format='jsonl'))
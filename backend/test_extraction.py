@@ -0,0 +1,161 @@
+import json
+
+import pytest
+
+import app as app_module
+from app import app, socketio
+from conversation_log import ConversationLog
+from extraction import (MIN_MODEL_DOCS, ClauseModel, ContextExtractor, label_clause, load_model, normalize_summary,
+                        read_message, stored_conversations, train)
+from models import db
+from response_handler import HelixResponseHandler
+
+CONVERSATION = [
+    "We're hiring a Senior Backend Engineer for our Series B fintech startup.",
+    "Must have 5+ years with Go and PostgreSQL, plus experience with Kubernetes and CI/CD.",
+    "Hybrid, Berlin office 3 days a week.",
+    "We offer equity, unlimited PTO and a learning budget.",
+]
+SUMMARY = {
+    'role': 'Senior Backend Engineer',
+    'company_type': 'Series B fintech startup',
+    'key_requirements': ['5+ years with Go', 'PostgreSQL', 'Kubernetes', 'CI/CD'],
+    'location': 'Hybrid',
+    'unique_selling_points': ['Equity, unlimited PTO and a learning budget'],
+}
+
+
+def user_turns(*texts):
+    return [{'role': 'user', 'content': text} for text in texts]
+
+
+def test_rules_fill_the_summary_schema():
+    extractor = ContextExtractor()
+    extraction = extractor.extract(user_turns(*CONVERSATION))
+    assert extraction.confident and extraction.summary == SUMMARY
+
+    assert read_message('Our company is a small agency in New York') == \
+        {'company_type': ['Agency'], 'location': ['New York']}
+    assert read_message('Requirements: 3 years experience in Go, Python/Django') == \
+        {'key_requirements': ['3 years with Go', 'Python', 'Django']}
+
+    # The model's JSON is coerced into the same schema
+    assert normalize_summary({'role': ' Designer ', 'location': 'Not specified', 'key_requirements': 'Figma',
+                              'unique_selling_points': ['N/A', 'Equity'], 'extra': 1}) == {
+        'role': 'Designer', 'company_type': None, 'key_requirements': ['Figma'], 'location': None,
+        'unique_selling_points': ['Equity']}
+    with pytest.raises(ValueError):
+        normalize_summary(['not', 'a', 'summary'])
+
+
+def test_turns_are_read_once_per_conversation():
+    extractor = ContextExtractor()
+    history = []
+    for text in CONVERSATION:
+        history += user_turns(text) + [{'role': 'assistant', 'content': 'Tell me more about the company.'}]
+        extraction = extractor.extract(history, key='c1')
+    assert extraction.summary == SUMMARY
+    assert extractor.stats()['turns'] == len(CONVERSATION) and extractor.stats()['local'] == len(CONVERSATION)
+
+    # Without messages the turns read so far are summarized; a different history starts over
+    assert extractor.extract([], key='c1').summary == SUMMARY
+    assert extractor.extract(user_turns('A Staff Designer'), key='c1').summary['role'] == 'Staff Designer'
+    assert extractor.extract([], key='c1').summary['company_type'] is None
+
+    extractor.forget('c1')
+    assert extractor.stats()['conversations'] == 0
+
+
+def test_later_turns_correct_or_contradict_earlier_values():
+    extractor = ContextExtractor()
+    hiring = user_turns('We are hiring a Senior Backend Engineer for our fintech startup.')
+    corrected = extractor.extract(hiring + user_turns('Actually make it a Staff Engineer role.'))
+    assert corrected.confident and corrected.summary['role'] == 'Staff Engineer'
+
+    # A different, less certain value is not served without asking the model
+    contradicted = extractor.extract(hiring + user_turns("It's for a designer"))
+    assert contradicted.uncertain == ['role']
+
+    assert read_message('5+ years of Python') == {'key_requirements': ['5+ years with Python']}
+
+
+def test_uncertain_fields_fall_back_to_the_model_and_are_learned():
+    model = ClauseModel()
+    extractor = ContextExtractor(model)
+    messages = user_turns("We're hiring for our data team", 'Remote, EU time zones')
+    extraction = extractor.extract(messages, key='c2')
+    assert not extraction.confident and extraction.uncertain == ['role']
+    assert extraction.summary['location'] == 'Remote, EU time zones'
+
+    answer = '```json\n' + json.dumps({'role': 'Data Engineer', 'company_type': 'Not specified',
+                                        'key_requirements': [], 'location': 'Remote (EU)',
+                                        'unique_selling_points': []}) + '\n```'
+    summary = extractor.resolve(extraction, answer, key='c2')
+    assert summary['role'] == 'Data Engineer' and summary['location'] == 'Remote (EU)'
+    assert summary['company_type'] is None
+    # The model's values now belong to the conversation, so the next summary is local
+    assert extractor.extract(messages, key='c2').confident
+    assert model.docs['location'] == 1 and model.docs['other'] == 1 and extractor.stats()['learned'] == 2
+
+    # Unusable model output keeps the local summary
+    assert extractor.resolve(extraction, 'not json') == extraction.summary
+    assert extractor.stats()['fallback_errors'] == 1
+
+
+def test_model_trained_from_stored_conversations(tmp_path):
+    with app.app_context():
+        log = ConversationLog(batch_size=100)
+        conversation = log.start('tech_expert')
+        for text in CONVERSATION:
+            log.append(conversation.id, 'user', text)
+            log.append(conversation.id, 'assistant', 'Noted.')
+        log.cache_summary(conversation.id, SUMMARY)
+        stored = [(summary, turns) for summary, turns in stored_conversations() if summary == SUMMARY]
+        db.session.remove()
+    assert stored == [(SUMMARY, CONVERSATION)]
+    assert label_clause('Hybrid, Berlin office 3 days a week', SUMMARY) == 'location'
+
+    model = train(stored * (MIN_MODEL_DOCS // 4))
+    assert model.predict('We offer equity and a learning budget')['unique_selling_points'] > 0.5
+    model.save(str(tmp_path / 'model.json'))
+    assert load_model(str(tmp_path / 'model.json')).docs == model.docs
+    assert load_model(str(tmp_path / 'missing.json')).size == 0
+
+
+def test_socket_summary_skips_the_model_when_confident(monkeypatch):
+    prompts = []
+    generate = app_module.model.generate_content
+    monkeypatch.setattr(app_module.model, 'generate_content',
+                        lambda prompt, **kwargs: prompts.append(prompt) or generate(prompt, **kwargs))
+    client = socketio.test_client(app)
+    messages = []
+    for text in CONVERSATION[:2]:
+        client.emit('chat_message', {'message': text, 'messages': messages, 'persona': 'tech_expert'})
+        messages = messages + user_turns(text)
+    chats = len(prompts)
+    client.emit('summarize_context', {'messages': messages})
+    [summary] = [event['args'][0] for event in client.get_received() if event['name'] == 'context_summary']
+    assert summary['role'] == 'Senior Backend Engineer' and summary['location'] is None
+    assert len(prompts) == chats
+
+    # A conversation whose role the rules can't read asks the model
+    client.emit('summarize_context', {'messages': user_turns("We're hiring for our data team")})
+    [summary] = [event['args'][0] for event in client.get_received() if event['name'] == 'context_summary']
+    assert len(prompts) == chats + 1
+    assert summary['key_requirements'] == ['Relevant experience', 'Strong communication']
+    client.disconnect()
+    stats = app.test_client().get('/api/requests/stats').get_json()['extraction']
+    assert stats['fallbacks'] >= 1 and stats['local'] >= 1
+
+
+def test_required_info_holds_extracted_values():
+    handler = HelixResponseHandler()
+    handler.update_required_info(CONVERSATION[0])
+    handler.update_required_info('Requirements: strong communication and 3 years experience in sales')
+    handler.update_required_info('What makes it unique is the team')
+    assert handler.required_info == {
+        'role': 'Senior Backend Engineer',
+        'company': 'Series B fintech startup',
+        'requirements': '3 years with sales, communication',
+        'unique_value': 'What makes it unique is the team',
+    }
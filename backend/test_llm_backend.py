@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from llm_backend import (Cassette, CassetteMiss, Latency, ModelResponse, RecordingModel,
+                         ReplayModel, SyntheticModel)
+from app import app, socketio
+from recruiting_graph import generate_email_sequence
+
+
+class EchoModel:
+    model_name = 'echo'
+
+    def generate_content(self, prompt, **kwargs):
+        return ModelResponse(f"echo: {prompt}")
+
+
+@pytest.fixture
+def socket_client():
+    return socketio.test_client(app)
+
+
+def _events(client, name):
+    return [event['args'][0] for event in client.get_received() if event['name'] == name]
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / 'cassette.jsonl')
+    recorder = RecordingModel(EchoModel(), Cassette(path))
+    assert recorder.generate_content('hello').text == 'echo: hello'
+
+    replay = ReplayModel('echo', Cassette(path))
+    assert replay.generate_content('hello').text == 'echo: hello'
+    with pytest.raises(CassetteMiss):
+        replay.generate_content('never recorded')
+
+    fallback = ReplayModel('echo', Cassette(path), on_miss='synthetic')
+    assert fallback.generate_content('never recorded').text
+
+
+@pytest.mark.parametrize('spec, low, high', [
+    ('', 0, 0),
+    ('fixed:0.25', 0.25, 0.25),
+    ('uniform:0.1,0.2', 0.1, 0.2),
+    ('lognormal:-3,0.1', 0.0, 1.0),
+])
+def test_latency_distributions(spec, low, high):
+    latency = Latency(spec, seed=7)
+    samples = [latency.sample() for _ in range(50)]
+    assert all(low <= sample <= high for sample in samples)
+
+
+def test_synthetic_recruiting_graph_respects_step_count():
+    sequence = generate_email_sequence({'role': 'Data Engineer', 'tone': 'casual',
+                                        'company_info': 'Fintech', 'step_count': 4})
+    assert len(sequence) == 4
+    assert all(email['subject'] and email['body'] for email in sequence)
+
+
+def test_synthetic_metrics_and_suggestions_parse():
+    model = SyntheticModel('test')
+    metrics = json.loads(model.generate_content('You are a recruiting email performance analyst.').text)
+    assert set(metrics) == {'open_rate', 'response_rate', 'sentiment', 'personalization_score', 'quality_score'}
+    suggestions = json.loads(model.generate_content('You are an AI recruiting coach reviewing a sequence').text)
+    assert len(suggestions['suggestions']) == 3
+
+
+def test_generate_sequence_event_offline(socket_client):
+    socket_client.get_received()
+    socket_client.emit('generate_sequence', {'messages': [], 'tone': 'casual', 'persona': 'tech_expert'})
+    update = _events(socket_client, 'sequence_update')[0]
+    assert len(json.loads(update['content'])) == 2
+    assert update['metrics']['quality_score'] != 'N/A'
+    assert len(update['suggestions']) == 3
+
+
+def test_chat_message_routes_to_tool_offline(socket_client):
+    socket_client.get_received()
+    socket_client.emit('chat_message', {'message': 'Please generate the sequence', 'messages': [],
+                                        'persona': 'corporate_pro'})
+    reply = _events(socket_client, 'chat_message')[0]
+    assert reply['content'] == "I've generated a sequence based on our conversation."
+
+
+def test_sequence_editing_events_offline(socket_client):
+    sequence = [{'subject': 'Hi', 'body': 'Hello'}]
+    socket_client.get_received()
+    socket_client.emit('apply_suggestion', {'sequence': sequence, 'suggestion': 'Shorter subject'})
+    socket_client.emit('adjust_tone', {'content': json.dumps(sequence), 'tone': 'friendly'})
+    socket_client.emit('summarize_context', {'messages': [{'role': 'user', 'content': 'Hiring a Go engineer'}]})
+    received = socket_client.get_received()
+    assert [event['name'] for event in received] == ['sequence_update', 'sequence_update', 'context_summary']
+    assert 'role' in received[2]['args'][0]
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from app import app
+from mail_merge import SequenceTemplate, TemplateError, compile_template
+
+TEMPLATE = [
+    {
+        'subject': '{{first_name | Hi}}, a Staff Engineer role at Acme',
+        'body': (
+            'Hi {{first_name}},\n\n'
+            '{{#if github_top_repo}}I enjoyed reading {{github_top_repo}}.{{else}}Your work stood out.{{/if}} '
+            'Your experience with {{skills}} over {{years_experience}} years at {{current_company}} is a great fit.'
+        )
+    },
+    {
+        'subject': 'Following up',
+        'body': 'Still keen to chat, {{first_name}}?'
+    }
+]
+
+CANDIDATE = {
+    'first_name': 'Ada',
+    'skills': ['Python', 'Rust', 'Go'],
+    'years_experience': 7.0,
+    'current_company': 'Initech',
+    'github_top_repo': 'fastqueue'
+}
+
+
+def test_render_fills_typed_placeholders():
+    steps = SequenceTemplate(TEMPLATE).render(CANDIDATE)
+    assert steps[0]['subject'] == 'Ada, a Staff Engineer role at Acme'
+    assert steps[0]['body'] == (
+        'Hi Ada,\n\nI enjoyed reading fastqueue. Your experience with Python, Rust and Go '
+        'over 7 years at Initech is a great fit.'
+    )
+    assert steps[1]['body'] == 'Still keen to chat, Ada?'
+
+
+def test_missing_fields_use_fallbacks_and_else_sections():
+    steps = SequenceTemplate(TEMPLATE).render({'skills': 'Kotlin'})
+    assert steps[0]['subject'] == 'Hi, a Staff Engineer role at Acme'
+    assert steps[0]['body'].startswith('Hi there,\n\nYour work stood out. Your experience with Kotlin')
+    assert 'at your current company' in steps[0]['body']
+
+
+@pytest.mark.parametrize('template', [
+    'Hi {{favourite_color}}',
+    '{{#if github_url}}unclosed',
+    'stray {{/if}}',
+    '{{#if github_url}}a{{else}}b{{else}}c{{/if}}',
+])
+def test_invalid_templates_are_rejected(template):
+    with pytest.raises(TemplateError):
+        compile_template(template)
+
+
+def test_from_text_accepts_fenced_model_output():
+    text = '```json\n' + json.dumps(TEMPLATE) + '\n```'
+    template = SequenceTemplate.from_text(text)
+    assert len(template.render({})) == 2
+
+
+@pytest.mark.parametrize('body', [
+    {'template': ['not a step'], 'candidates': [{}]},
+    {'template': [{'subject': 'Hi', 'body': ['not', 'text']}], 'candidates': [{}]},
+    {'template': {'subject': 'Hi'}, 'candidates': [{}]},
+    {'template': [{'subject': 'Hi', 'body': 'Hello'}], 'candidates': ['Ada']},
+    {'template': [{'subject': 'Hi', 'body': 'Hello'}], 'candidate_ids': ['one']},
+])
+def test_render_endpoint_rejects_malformed_input(body):
+    response = app.test_client().post('/api/sequences/render', json=body)
+    assert response.status_code == 400
+
+
+def test_template_endpoint_generates_once_and_renders_per_candidate():
+    client = app.test_client()
+    response = client.post('/api/sequences/template', json={
+        'messages': [{'role': 'user', 'content': "We're hiring a Staff Engineer for our payments startup."}],
+        'persona': 'tech_expert',
+        'candidates': [{'first_name': 'Ada', 'github_top_repo': 'fastqueue'}, {}]
+    })
+    assert response.status_code == 200
+    result = response.get_json()
+    assert '{{first_name | there}}' in result['template'][0]['body']
+    ada, unknown = result['sequences']
+    assert ada[0]['body'].startswith('Hi Ada,\n\nI enjoyed reading fastqueue.')
+    assert unknown[0]['body'].startswith('Hi there,\n\nYour work stood out to us.')
+    assert len(ada) == len(result['template'])
+
+    polished = client.post('/api/sequences/template', json={'candidates': [{'first_name': 'Ada'}], 'polish': True})
+    assert len(polished.get_json()['sequences']) == 1
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from payloads import (LEGACY, STRUCTURED, client_modes, deflated_size, encoded_size, forget_client, negotiate_mode,
+                      parse_sequence, sequence_update_payload, socketio_serializer)
+
+SEQUENCE = [{'subject': 'Backend role at Acme', 'body': 'Hi there'}]
+
+
+def test_mode_comes_from_auth_then_query_args():
+    assert negotiate_mode('s1', {'payload': 'structured'}) == STRUCTURED
+    assert negotiate_mode('s2', None, {'payload': 'structured'}) == STRUCTURED
+    assert negotiate_mode('s3', {'payload': 'legacy'}, {'payload': 'structured'}) == LEGACY
+    assert negotiate_mode('s4', {'payload': 'xml'}) == LEGACY
+    assert negotiate_mode('s5') == LEGACY
+    assert client_modes['s1'] == STRUCTURED
+
+    for sid in ('s1', 's2', 's3', 's4', 's5'):
+        forget_client(sid)
+    forget_client('never-connected')
+    assert not {'s1', 's2', 's3', 's4', 's5'} & set(client_modes)
+
+
+def test_sequence_update_in_each_mode():
+    negotiate_mode('structured', {'payload': 'structured'})
+    negotiate_mode('legacy')
+    assert sequence_update_payload('structured', sequence=SEQUENCE, content='ignored', version_id=3) == \
+        {'sequence': SEQUENCE, 'version_id': 3}
+    assert sequence_update_payload('legacy', sequence=SEQUENCE, version_id=3) == \
+        {'content': json.dumps(SEQUENCE, indent=2), 'version_id': 3}
+    # Text that could not be parsed goes out as is, whatever the mode
+    assert sequence_update_payload('structured', content='not json') == {'content': 'not json'}
+    assert sequence_update_payload('legacy') == {'content': ''}
+    forget_client('structured')
+    forget_client('legacy')
+
+
+def test_parse_sequence():
+    assert parse_sequence(SEQUENCE) is SEQUENCE
+    assert parse_sequence('```json\n' + json.dumps(SEQUENCE) + '\n```') == SEQUENCE
+    assert parse_sequence('Here is your sequence') is None
+    assert parse_sequence(None) is None
+
+
+def test_sizes():
+    data = {'content': 'Hi there. ' * 50}
+    raw = encoded_size('sequence_update', data)
+    deflated = deflated_size('sequence_update', data)
+    assert deflated < raw
+    assert socketio_serializer('json') == 'default'
+    with pytest.raises(ValueError):
+        socketio_serializer('pickle')
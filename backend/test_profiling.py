@@ -0,0 +1,139 @@
+import sys
+import threading
+
+import pytest
+
+import app as app_module
+from app import app, socketio
+from profiling import MemoryTracker, SamplingProfiler, collapse, profiler, top_types
+
+HEADERS = {'Authorization': 'Bearer admin-secret'}
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'ADMIN_TOKEN', 'admin-secret')
+    yield app.test_client()
+    profiler.stop()
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_collapsed_stacks_put_the_outermost_frame_first():
+    def inner():
+        return collapse(sys._getframe(), 'MainThread')
+    stack = inner()
+    frames = stack.split(';')
+    assert frames[0] == 'MainThread'
+    assert frames[-1].startswith('inner (test_profiling.py:')
+    assert frames[-2].startswith('test_collapsed_stacks_put_the_outermost_frame_first (')
+
+
+def test_time_window_profile_samples_other_threads():
+    sampler = SamplingProfiler(interval=0.001)
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name='busy-worker')
+    worker.start()
+    try:
+        sampler.start(seconds=0.2)
+        with pytest.raises(ValueError):
+            sampler.start(seconds=1)
+        sampler.thread.join(5)
+    finally:
+        stop.set()
+        worker.join()
+
+    status = sampler.status()
+    assert not status['running'] and status['samples'] > 5 and status['finished_at']
+    lines = sampler.collapsed().splitlines()
+    busy = [line for line in lines if line.startswith('busy-worker;') and 'busy_loop (test_profiling.py:' in line]
+    assert busy
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert not any(line.startswith('helix-profiler;') for line in lines)
+
+
+def test_event_bounded_profile_stops_after_n_events():
+    sampler = SamplingProfiler(interval=0.001)
+    handler = sampler.wrap_event(lambda data: data)
+    sampler.start(events=3)
+    for i in range(3):
+        assert handler(i) == i
+    sampler.thread.join(5)
+    assert sampler.status()['events'] == 3 and not sampler.running
+    with pytest.raises(ValueError):
+        sampler.start()
+
+
+def test_snapshots_and_diffs_show_where_memory_grew():
+    tracker = MemoryTracker(max_snapshots=2)
+    tracker.start()
+    try:
+        first = tracker.snapshot('before')
+        held = [bytearray(1024) for _ in range(2000)]
+        second = tracker.snapshot('after')
+        diff = tracker.diff(first['id'], second['id'], limit=5)
+        assert diff['size_diff'] > 1024 * 2000
+        assert 'test_profiling.py' in diff['top'][0]['site'] and diff['top'][0]['count_diff'] >= 2000
+        assert tracker.top(second['id'], limit=3)['top'][0]['size'] > 0
+        tracker.snapshot('third')
+        assert [entry['label'] for entry in tracker.list()] == ['after', 'third']
+        with pytest.raises(KeyError):
+            tracker.top(first['id'])
+        del held
+    finally:
+        tracker.stop()
+    with pytest.raises(ValueError):
+        tracker.snapshot()
+
+
+def test_top_types_counts_live_objects():
+    class Marker:
+        pass
+    markers = [Marker() for _ in range(5000)]
+    names = {entry['type']: entry['count'] for entry in top_types(200)}
+    assert names[f'{__name__}.{Marker.__qualname__}'] >= 5000
+    del markers
+
+
+def test_admin_routes_are_guarded(monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(app_module.Config, 'ADMIN_TOKEN', None)
+    assert client.get('/api/admin/objects').status_code == 404
+    monkeypatch.setattr(app_module.Config, 'ADMIN_TOKEN', 'admin-secret')
+    assert client.get('/api/admin/objects').status_code == 401
+    assert client.get('/api/admin/objects', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/api/admin/objects', headers=HEADERS)
+    assert response.status_code == 200 and 'socketio_sessions' in response.get_json()['gauges']
+
+
+def test_admin_profile_of_socket_events_downloads_collapsed_stacks(admin):
+    assert admin.post('/api/admin/profile', json={}, headers=HEADERS).status_code == 400
+    response = admin.post('/api/admin/profile', json={'events': 2}, headers=HEADERS)
+    assert response.status_code == 202 and response.get_json()['running']
+    client = socketio.test_client(app)
+    client.emit('test_connection', {})
+    client.emit('generate_sequence', {'messages': [], 'tone': 'casual', 'persona': 'tech_expert'})
+    profiler.thread.join(5)
+
+    status = admin.get('/api/admin/profile', headers=HEADERS).get_json()
+    assert not status['running'] and status['events'] >= 2
+    download = admin.get('/api/admin/profile/collapsed', headers=HEADERS)
+    assert download.mimetype == 'text/plain' and 'attachment' in download.headers['Content-Disposition']
+    assert download.data.decode().strip()
+
+
+def test_admin_memory_routes(admin):
+    assert admin.post('/api/admin/memory/snapshots', headers=HEADERS).status_code == 400
+    try:
+        assert admin.post('/api/admin/memory', json={'frames': 5}, headers=HEADERS).get_json()['tracing']
+        first = admin.post('/api/admin/memory/snapshots', json={'label': 'a'}, headers=HEADERS).get_json()
+        second = admin.post('/api/admin/memory/snapshots', json={'label': 'b'}, headers=HEADERS).get_json()
+        diff = admin.get(f"/api/admin/memory/diff?from={first['id']}&to={second['id']}", headers=HEADERS)
+        assert diff.status_code == 200 and diff.get_json()['from']['label'] == 'a'
+        assert admin.get('/api/admin/memory/snapshots/999', headers=HEADERS).status_code == 404
+        assert admin.get('/api/admin/memory/diff?from=1', headers=HEADERS).status_code == 400
+    finally:
+        assert not admin.delete('/api/admin/memory', headers=HEADERS).get_json()['tracing']
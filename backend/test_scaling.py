@@ -0,0 +1,177 @@
+import multiprocessing
+import socket
+import threading
+import time
+from collections import Counter
+
+import pytest
+import socketio
+from flask import Flask
+from flask_socketio import SocketIO
+
+from scaling import LocalBroker, LocalQueueManager, nginx_config
+
+# Seconds of blocking work per relayed event. Each worker only runs one at a
+# time, like a blocking Gemini call on an eventlet hub, so throughput can only
+# grow by spreading the work over workers.
+WORK_SECONDS = 0.02
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _run_worker(port, queue_url):
+    app = Flask(__name__)
+    sio = SocketIO(app, async_mode='threading', client_manager=LocalQueueManager(queue_url))
+    hub = threading.Lock()
+
+    @sio.on('relay')
+    def relay(data):
+        with hub:
+            time.sleep(WORK_SECONDS)
+        sio.emit('sequence_update', {'content': data['content'], 'worker': port}, to=data['to'])
+
+    sio.run(app, port=port, allow_unsafe_werkzeug=True, log_output=False)
+
+
+def _connect(port, timeout=10):
+    client = socketio.Client()
+    deadline = time.time() + timeout
+    while True:
+        try:
+            client.connect(f'http://127.0.0.1:{port}', transports=['polling'], wait_timeout=5)
+            return client
+        except socketio.exceptions.ConnectionError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+@pytest.fixture
+def broker():
+    broker = LocalBroker(port=0)
+    broker.start()
+    yield broker
+    broker.shutdown()
+    broker.server_close()
+
+
+@pytest.fixture
+def cluster(broker):
+    processes = []
+
+    def start(workers):
+        ports = [_free_port() for _ in range(workers)]
+        for port in ports:
+            process = multiprocessing.Process(target=_run_worker, args=(port, broker.url), daemon=True)
+            process.start()
+            processes.append(process)
+        return ports
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.join()
+
+
+def _relay_across_workers(ports, clients_per_worker=2, events_per_client=10):
+    """Fan clients out over the workers and relay events across workers; count the events each worker ran."""
+    clients = [_connect(port) for port in ports for _ in range(clients_per_worker)]
+    # Give every worker's listener time to subscribe to the broker
+    time.sleep(0.5)
+    received = threading.Semaphore(0)
+    workers = Counter()
+    lock = threading.Lock()
+
+    def on_update(data):
+        with lock:
+            workers[data['worker']] += 1
+        received.release()
+
+    for client in clients:
+        client.on('sequence_update', on_update)
+
+    total = len(clients) * events_per_client
+    for i, client in enumerate(clients):
+        # Address the client that sits on the next worker over
+        target = clients[(i + clients_per_worker) % len(clients)]
+        for n in range(events_per_client):
+            client.emit('relay', {'to': target.get_sid(), 'content': f'{i}-{n}'})
+    for _ in range(total):
+        assert received.acquire(timeout=30), 'sequence_update was not delivered'
+
+    for client in clients:
+        client.disconnect()
+    return workers
+
+
+def test_sequence_update_reaches_client_on_other_worker(cluster):
+    sender_port, receiver_port = cluster(2)
+    sender = _connect(sender_port)
+    receiver = _connect(receiver_port)
+    time.sleep(0.5)
+    delivered = threading.Event()
+    payloads = []
+    receiver.on('sequence_update', lambda data: (payloads.append(data), delivered.set()))
+
+    sender.emit('relay', {'to': receiver.get_sid(), 'content': '[]'})
+
+    assert delivered.wait(10)
+    assert payloads == [{'content': '[]', 'worker': sender_port}]
+    sender.disconnect()
+    receiver.disconnect()
+
+
+def test_blocking_work_is_split_evenly_across_workers(cluster):
+    # Each worker runs one relay at a time, so an even split is what lets
+    # throughput grow with the worker count
+    ports = cluster(2)
+    assert _relay_across_workers(ports) == {port: 20 for port in ports}
+
+
+class FakeConnection:
+    def __init__(self, fail=False):
+        self.frames = []
+        self.fail = fail
+        self.closed = False
+
+    def sendall(self, frame):
+        if self.fail:
+            raise ConnectionResetError('gone')
+        self.frames.append(frame)
+
+    def shutdown(self, how):
+        self.closed = True
+
+
+def test_broker_sends_outside_its_lock_and_drops_failed_subscribers(broker):
+    slow, healthy, gone = FakeConnection(), FakeConnection(), FakeConnection(fail=True)
+    for conn in (slow, healthy, gone):
+        broker.subscribe('channel', conn)
+
+    # A subscriber mid-send only holds up publishes to itself
+    with broker.send_locks[slow]:
+        publisher = threading.Thread(target=broker.publish, args=('channel', b'frame'))
+        publisher.start()
+        publisher.join(0.5)
+        assert publisher.is_alive()
+        # ...and never the broker-wide lock
+        subscriber = threading.Thread(target=broker.subscribe, args=('other', FakeConnection()))
+        subscriber.start()
+        subscriber.join(5)
+        assert not subscriber.is_alive()
+    publisher.join(5)
+
+    assert slow.frames == healthy.frames == [b'frame']
+    assert gone.closed and gone not in broker.subscribers['channel'] and gone not in broker.send_locks
+
+
+def test_nginx_config_pins_clients_to_workers():
+    config = nginx_config([3002, 3003])
+    assert 'ip_hash;' in config
+    assert 'server 127.0.0.1:3002;' in config
+    assert 'server 127.0.0.1:3003;' in config
+    assert 'proxy_set_header Upgrade $http_upgrade;' in config
@@ -0,0 +1,195 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+import app as app_module
+from app import app
+from models import db, EmailSequence, ScheduledStep
+from scheduler import MAX_ATTEMPTS, CadenceScheduler, cadence_offsets
+
+START = datetime(2024, 5, 6, 9, 0)
+
+
+class Clock:
+    def __init__(self, now=START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta)
+
+
+class Outbox:
+    def __init__(self, fail=0):
+        self.sent = []
+        self.fail = fail
+
+    def __call__(self, step):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError('SMTP unavailable')
+        self.sent.append((step.recipient, step.step))
+
+
+@pytest.fixture
+def app_context(app_context):
+    # Steps other tests left pending would otherwise fire on these ticks
+    db.session.execute(update(ScheduledStep).where(ScheduledStep.status == 'pending').values(status='cancelled'))
+    db.session.commit()
+
+
+def make_sequence(sequence_type='passive', steps=3):
+    sequence = EmailSequence(content=json.dumps([{'subject': f'Step {i}', 'body': 'Hi'} for i in range(steps)]),
+                             persona='tech_expert', tone='casual', sequence_type=sequence_type)
+    db.session.add(sequence)
+    db.session.commit()
+    return sequence
+
+
+def make_scheduler(outbox, clock, **options):
+    return CadenceScheduler(outbox, clock=clock, **options)
+
+
+def test_cadence_follows_sequence_type():
+    assert [offset.days for offset in cadence_offsets('passive', 5)] == [0, 4, 11, 18, 32]
+    assert [offset.days for offset in cadence_offsets('Aggressive', 3)] == [0, 2, 4]
+    assert [offset.days for offset in cadence_offsets('aggressive', 7)] == [0, 2, 4, 7, 11, 15, 19]
+    assert [offset.days for offset in cadence_offsets(None, 2)] == [0, 4]
+
+
+def test_steps_fire_in_due_order_once_each(app_context):
+    sequence = make_sequence('aggressive')
+    clock, outbox = Clock(), Outbox()
+    scheduler = make_scheduler(outbox, clock)
+    assert scheduler.enroll(sequence, ['a@example.com', 'b@example.com']) == 6
+    assert scheduler.enroll(sequence, ['a@example.com']) == 3
+
+    assert scheduler.tick() == 2
+    assert scheduler.tick() == 0
+    clock.advance(days=2)
+    scheduler.tick()
+    clock.advance(days=2)
+    scheduler.tick()
+    assert outbox.sent == [('a@example.com', 1), ('b@example.com', 1), ('a@example.com', 2),
+                           ('b@example.com', 2), ('a@example.com', 3), ('b@example.com', 3)]
+
+
+def test_concurrent_workers_never_send_a_step_twice(app_context):
+    sequence = make_sequence()
+    clock, outbox = Clock(), Outbox()
+    first, second = make_scheduler(outbox, clock), make_scheduler(outbox, clock)
+    first.enroll(sequence, [f'c{i}@example.com' for i in range(20)])
+    # Both workers load the same window before either claims anything
+    first._refill(clock())
+    second._refill(clock())
+    first.tick()
+    second.tick()
+    assert len(outbox.sent) == len(set(outbox.sent)) == 20
+    assert second.counters['skipped'] == 20
+
+
+def test_reply_cancels_remaining_follow_ups(app_context):
+    sequence = make_sequence()
+    clock, outbox = Clock(), Outbox()
+    scheduler = make_scheduler(outbox, clock)
+    scheduler.enroll(sequence, ['reply@example.com', 'quiet@example.com'])
+    scheduler.tick()
+    assert scheduler.cancel(sequence.id, 'reply@example.com') == 2
+
+    clock.advance(days=30)
+    scheduler.tick()
+    assert [sent for sent in outbox.sent if sent[0] == 'reply@example.com'] == [('reply@example.com', 1)]
+    assert len([sent for sent in outbox.sent if sent[0] == 'quiet@example.com']) == 3
+
+
+def test_restart_recovers_due_and_interrupted_steps(app_context):
+    sequence = make_sequence()
+    clock = Clock()
+    crashed = make_scheduler(Outbox(), clock)
+    crashed.enroll(sequence, ['d@example.com', 'e@example.com'])
+    # A worker claimed one step and died before sending it
+    db.session.execute(update(ScheduledStep).where(
+        ScheduledStep.sequence_id == sequence.id, ScheduledStep.recipient == 'd@example.com',
+        ScheduledStep.step == 1).values(status='claimed', claimed_at=START))
+
+    clock.advance(hours=1)
+    outbox = Outbox()
+    restarted = make_scheduler(outbox, clock, lease=600)
+    restarted.tick()
+    assert sorted(outbox.sent) == [('d@example.com', 1), ('e@example.com', 1)]
+
+    # A running worker also takes back claims that go stale after it started
+    db.session.execute(update(ScheduledStep).where(
+        ScheduledStep.sequence_id == sequence.id, ScheduledStep.recipient == 'e@example.com',
+        ScheduledStep.step == 2).values(status='claimed', claimed_at=clock.now))
+    clock.advance(days=4)
+    restarted.tick()
+    assert ('e@example.com', 2) in outbox.sent
+
+
+def test_failed_sends_are_retried_with_backoff_then_given_up(app_context):
+    sequence = make_sequence(steps=1)
+    clock, outbox = Clock(), Outbox(fail=MAX_ATTEMPTS)
+    scheduler = make_scheduler(outbox, clock)
+    scheduler.enroll(sequence, ['f@example.com'])
+    for _ in range(MAX_ATTEMPTS):
+        scheduler.tick()
+        clock.advance(days=1)
+    step = db.session.execute(db.select(ScheduledStep).where(ScheduledStep.sequence_id == sequence.id)).scalar()
+    assert step.status == 'failed' and step.attempts == MAX_ATTEMPTS
+    assert scheduler.counters['retried'] == MAX_ATTEMPTS - 1
+
+
+def test_memory_holds_only_a_bounded_window(app_context):
+    sequence = make_sequence(steps=5)
+    clock, outbox = Clock(), Outbox()
+    scheduler = make_scheduler(outbox, clock, batch_size=100)
+    scheduler.enroll(sequence, [f'bulk{i}@example.com' for i in range(2000)])
+    scheduler.tick()
+    assert len(scheduler.heap) <= 100
+    for _ in range(25):
+        scheduler.tick()
+    assert len(outbox.sent) == 2000
+    assert scheduler.stats()['steps']['pending'] >= 8000
+
+
+def test_enroll_reply_and_schedule_api():
+    with app.app_context():
+        sequence_id = make_sequence('aggressive', steps=2).id
+    client = app.test_client()
+    response = client.post(f'/api/sequences/{sequence_id}/enroll',
+                           json={'recipients': ['g@example.com'], 'start_at': '2030-01-01T09:00:00'})
+    assert response.status_code == 202 and response.get_json()['scheduled_steps'] == 2
+    steps = client.get(f'/api/sequences/{sequence_id}/schedule').get_json()['steps']
+    assert [step['due_at'] for step in steps] == ['2030-01-01T09:00:00', '2030-01-03T09:00:00']
+
+    cancelled = client.post(f'/api/sequences/{sequence_id}/replies', json={'recipient': 'g@example.com'})
+    assert cancelled.get_json()['cancelled_steps'] == 2
+
+    # An offset is converted to UTC, which is what due times are stored in
+    response = client.post(f'/api/sequences/{sequence_id}/enroll',
+                           json={'recipients': ['h@example.com'], 'start_at': '2030-01-01T09:00:00+02:00'})
+    assert response.status_code == 202
+    steps = client.get(f'/api/sequences/{sequence_id}/schedule?recipient=h@example.com').get_json()['steps']
+    assert steps[0]['due_at'] == '2030-01-01T07:00:00'
+    assert client.post('/api/sequences/999999/enroll', json={'recipients': ['x@example.com']}).status_code == 404
+    assert client.post(f'/api/sequences/{sequence_id}/enroll', json={'recipients': []}).status_code == 400
+
+
+def test_steps_stay_pending_without_smtp(app_context, monkeypatch):
+    monkeypatch.setattr(app_module, 'mailer', None)
+    monkeypatch.setattr(app_module, '_cadence_runner', [])
+    app_module.start_cadence_scheduler()
+    assert app_module._cadence_runner == []
+
+    clock = Clock()
+    scheduler = make_scheduler(app_module.dispatch_step, clock)
+    sequence = make_sequence(steps=1)
+    scheduler.enroll(sequence, ['i@example.com'], start_at=START)
+    scheduler.tick()
+    [step] = scheduler.steps(sequence.id)
+    assert step['status'] == 'pending' and step['error'] == 'SMTP is not configured'
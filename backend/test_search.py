@@ -0,0 +1,103 @@
+import json
+
+import pytest
+from sqlalchemy import event, insert, text
+
+from app import app
+from models import db, EmailSequence
+from search import fts5_query, index_sequence, reindex, search_sequences
+
+
+def make_sequence(subject, body):
+    return json.dumps([{'subject': subject, 'body': body},
+                       {'subject': 'Following up', 'body': 'Just checking in on my last note.'}], indent=2)
+
+
+def add_sequence(subject, body, persona='tech_expert', tone='casual'):
+    sequence = EmailSequence(content=make_sequence(subject, body), persona=persona, tone=tone,
+                             sequence_type='outreach')
+    db.session.add(sequence)
+    db.session.commit()
+    return sequence.id
+
+
+def test_web_search_syntax_becomes_quoted_fts5_terms():
+    assert fts5_query('kubernetes "staff engineer"') == '"kubernetes" AND "staff engineer"'
+    assert fts5_query('rust OR golang -java') == '("rust" OR "golang") NOT "java"'
+    assert fts5_query('NEAR( "x*') == '"NEAR(" AND """x*"'
+    with pytest.raises(ValueError):
+        fts5_query('-java')
+
+
+def test_inserted_sequences_are_searchable_with_ranking_and_highlights(app_context):
+    in_subject = add_sequence('Zephyrine platform role', 'We are hiring for our data team.')
+    in_body = add_sequence('A new opportunity', 'Our zephyrine platform needs a lead.')
+    add_sequence('Zephyrine sales role', 'Quota carrying position.', persona='corporate_pro', tone='formal')
+
+    results = search_sequences(db.session.connection(), 'zephyrine platform')
+    assert [result['sequence_id'] for result in results] == [in_subject, in_body]
+    assert results[0]['rank'] > results[1]['rank']
+    assert results[0]['subject'] == '<mark>Zephyrine</mark> <mark>platform</mark> role'
+    assert '<mark>zephyrine</mark> <mark>platform</mark>' in results[1]['snippet']
+    assert results[0]['step'] == 1
+
+    formal = search_sequences(db.session.connection(), 'zephyrine', {'persona': 'corporate_pro', 'tone': 'formal'})
+    assert [result['persona'] for result in formal] == ['corporate_pro']
+    assert search_sequences(db.session.connection(), 'zephyrine -platform -quota') == []
+
+
+def test_core_inserts_are_indexed_explicitly_and_reindex_backfills(app_context):
+    connection = db.session.connection()
+    content = make_sequence('Quillwort infrastructure', 'Terraform and AWS.')
+    sequence_id = connection.execute(insert(EmailSequence.__table__).values(
+        content=content, persona='tech_expert', tone='casual')).inserted_primary_key[0]
+    assert search_sequences(connection, 'quillwort') == []
+
+    index_sequence(connection, sequence_id, content, 'tech_expert', 'casual')
+    assert [result['sequence_id'] for result in search_sequences(connection, 'quillwort')] == [sequence_id]
+
+    total = db.session.execute(text('SELECT count(*) FROM email_sequences')).scalar()
+    assert reindex(connection) == total
+    assert [result['sequence_id'] for result in search_sequences(connection, 'quillwort')] == [sequence_id]
+
+
+def test_deleted_sequences_leave_the_index(app_context):
+    sequence_id = add_sequence('Axolotl platform engineer', 'Terraform.')
+    assert [result['sequence_id'] for result in search_sequences(db.session.connection(), 'axolotl')] == [sequence_id]
+    db.session.delete(db.session.get(EmailSequence, sequence_id))
+    db.session.commit()
+    assert search_sequences(db.session.connection(), 'axolotl') == []
+
+
+def test_query_reads_the_index_instead_of_scanning_the_corpus(app_context):
+    db.session.add_all([EmailSequence(content=make_sequence(f'Compiler role {i}', f'Filler about team {i}.'),
+                                      persona='tech_expert', tone='casual') for i in range(5000)])
+    db.session.commit()
+    needle = add_sequence('Marmoset compiler engineer', 'LLVM backends.')
+
+    connection = db.session.connection()
+    statements = []
+    def capture(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        results = search_sequences(connection, 'marmoset compiler')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert [result['sequence_id'] for result in results] == [needle]
+
+    [(statement, parameters)] = statements
+    plan = ' '.join(row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters))
+    assert 'VIRTUAL TABLE INDEX' in plan and 'email_sequences' not in plan
+
+
+def test_search_api():
+    with app.app_context():
+        sequence_id = add_sequence('Halcyonite analytics lead', 'Looker and dbt.', tone='enthusiastic')
+
+    client = app.test_client()
+    response = client.get('/api/sequences/search?q=halcyonite&tone=enthusiastic&limit=5')
+    assert response.status_code == 200
+    assert [result['sequence_id'] for result in response.get_json()['results']] == [sequence_id]
+    assert client.get('/api/sequences/search?q=halcyonite&tone=formal').get_json()['count'] == 0
+    assert client.get('/api/sequences/search?q=').status_code == 400
@@ -0,0 +1,124 @@
+import threading
+
+import app as app_module
+from app import app, socketio
+from speculation import CALLS_PER_GENERATION, Speculator, state_key
+
+READY = [
+    {'role': 'user', 'content': 'We need a senior backend engineer at our fintech startup.'},
+    {'role': 'assistant', 'content': 'What should candidates bring?'},
+    {'role': 'user', 'content': 'Five years of Python experience; the work is challenging and new.'},
+]
+
+
+class Generator:
+    def __init__(self, block=False):
+        self.calls = []
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, messages, tone, sequence_type, company=None):
+        self.calls.append((len(messages), tone, sequence_type))
+        self.release.wait(5)
+        return {'sequence': {'tone': tone}, 'suggestions': [], 'metrics': {}}
+
+
+def run_in_thread(threads):
+    def spawn(run):
+        thread = threading.Thread(target=run)
+        threads.append(thread)
+        thread.start()
+    return spawn
+
+
+def test_state_key_ignores_assistant_turns():
+    key = state_key(READY, 'casual', 'passive')
+    assert key == state_key([READY[0], READY[2]], 'casual', 'passive')
+    assert key != state_key(READY, 'formal', 'passive')
+    assert key != state_key(READY + [{'role': 'user', 'content': 'Remote is fine.'}], 'casual', 'passive')
+
+
+def test_matching_request_is_served_the_speculative_result():
+    generate, threads = Generator(block=True), []
+    speculator = Speculator(generate, run_in_thread(threads))
+    assert not speculator.consider('sid', READY[:1], 'casual', 'passive')
+    assert speculator.consider('sid', READY, 'casual', 'passive')
+    assert not speculator.consider('sid', READY, 'casual', 'passive')
+
+    # The request arrives while the generation is still running and waits for it
+    generate.release.set()
+    result = speculator.take('sid', READY + [{'role': 'assistant', 'content': 'Got it.'}], 'casual', 'passive')
+    assert result['sequence'] == {'tone': 'casual'}
+    assert len(generate.calls) == 1
+    stats = speculator.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 0 and stats['hit_rate'] == 1.0 and stats['wasted_calls'] == 0
+
+
+def test_changed_context_discards_the_speculation_and_counts_its_calls():
+    generate, threads = Generator(), []
+    speculator = Speculator(generate, run_in_thread(threads))
+    speculator.consider('sid', READY, 'casual', 'passive')
+    threads[0].join()
+    speculator.consider('sid', READY + [{'role': 'user', 'content': 'Also a mentor.'}], 'casual', 'passive')
+    threads[1].join()
+    assert speculator.take('sid', READY, 'formal', 'passive') is None
+    assert speculator.take('sid', READY, 'formal', 'passive') is None
+
+    stats = speculator.stats()
+    assert stats['started'] == 2 and stats['discarded'] == 2 and stats['misses'] == 2
+    assert stats['wasted_calls'] == 2 * CALLS_PER_GENERATION and stats['wasted_call_rate'] == 1.0
+    assert stats['pending'] == 0
+
+
+def test_trigger_inflight_cap_and_expiry():
+    now = [0.0]
+    generate, threads = Generator(block=True), []
+    speculator = Speculator(generate, run_in_thread(threads), trigger='email', ttl=60, max_inflight=1,
+                            clock=lambda: now[0])
+    early = [{'role': 'user', 'content': 'Hiring a developer with Go experience.'}]
+    assert speculator.consider('a', early, 'casual', 'passive')
+    assert not speculator.consider('b', early, 'casual', 'passive')
+    assert speculator.stats()['skipped'] == 1
+
+    now[0] = 61
+    generate.release.set()
+    assert speculator.take('a', early, 'casual', 'passive') is None
+    threads[0].join()
+    assert speculator.stats()['discarded'] == 1 and speculator.stats()['wasted_calls'] == CALLS_PER_GENERATION
+
+    assert not Speculator(generate, run_in_thread(threads), trigger='off').consider('a', READY, 'casual', 'passive')
+
+
+def test_chat_then_generate_serves_and_stores_the_speculative_sequence(monkeypatch):
+    calls = []
+    generate = app_module.speculator.generate
+    monkeypatch.setattr(app_module.speculator, 'generate', lambda *args: calls.append(args) or generate(*args))
+    before = app_module.speculator.stats()['hits']
+    client = socketio.test_client(app)
+    client.emit('chat_message', {'message': READY[2]['content'], 'messages': READY, 'persona': 'tech_expert',
+                                 'tone': 'casual', 'sequenceType': 'passive'})
+    client.get_received()
+    client.emit('generate_sequence', {'messages': READY + [{'role': 'assistant', 'content': 'Ready.'}],
+                                      'tone': 'casual', 'sequenceType': 'passive', 'persona': 'tech_expert'})
+
+    [update] = [event for event in client.get_received() if event['name'] == 'sequence_update']
+    assert update['args'][0]['version_id']
+    assert len(calls) == 1
+    stats = app.test_client().get('/api/requests/stats').get_json()['speculation']
+    assert stats['hits'] == before + 1
+    client.disconnect()
+
+
+def test_chat_router_tool_serves_the_speculative_sequence(monkeypatch):
+    calls = []
+    generate = app_module.speculator.generate
+    monkeypatch.setattr(app_module.speculator, 'generate', lambda *args: calls.append(args) or generate(*args))
+    before = app_module.speculator.stats()['hits']
+    client = socketio.test_client(app)
+    client.emit('chat_message', {'message': 'Please generate the sequence now.', 'messages': READY,
+                                 'persona': 'tech_expert', 'tone': 'professional', 'sequenceType': 'passive'})
+    assert [event['name'] for event in client.get_received()] == ['connection_status', 'chat_message']
+    assert len(calls) == 1
+    assert app_module.speculator.stats()['hits'] == before + 1
+    client.disconnect()
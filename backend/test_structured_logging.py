@@ -0,0 +1,114 @@
+import io
+import json
+import logging
+import threading
+
+import app as app_module
+from app import app, socketio
+from structured_logging import CountingHandler, LogPipeline, Sampler, StructuredFormatter, redact
+
+
+def record(msg, *args, level=logging.INFO, name='test', **extra):
+    entry = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+class Thready:
+    """Remembers which threads rendered it."""
+
+    def __init__(self):
+        self.threads = []
+
+    def __repr__(self):
+        self.threads.append(threading.current_thread().name)
+        return 'thready'
+
+
+def test_fields_are_capped_and_redacted():
+    formatter = StructuredFormatter(max_field_length=20)
+    assert redact('mail ada@example.com or +1 (415) 555-0100 on 2026-10-19') == \
+        'mail [email] or [phone] on 2026-10-19'
+
+    line = json.loads(formatter.format(record(
+        'Parsed %s for %s', {'email': 'ada@example.com', 'steps': list(range(30))}, 'x' * 50,
+        candidate={'first_name': 'Ada', 'title': 'Engineer', 'notes': 'y' * 40}, email='ada@example.com', turns=3)))
+    assert line['level'] == 'INFO' and line['logger'] == 'test' and line['turns'] == 3
+    assert line['msg'].startswith('Parsed {') and 'ada@' not in line['msg'] and line['msg'].endswith(' chars]')
+    assert line['email'] == '[redacted]'
+    assert line['candidate'] == {'first_name': '[redacted]', 'title': 'Engineer',
+                                 'notes': 'y' * 20 + '...[+20 chars]'}
+
+    steps = json.loads(formatter.format(record('steps', steps=list(range(30)))))['steps']
+    assert steps[:20] == list(range(20)) and steps[20] == '...+10 items'
+
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        failed = record('failed', level=logging.ERROR)
+        failed.exc_info = __import__('sys').exc_info()
+    assert 'ValueError: boom' in json.loads(formatter.format(failed))['exc']
+
+    text = StructuredFormatter('text').format(record('Stored %s', 'sequence', sequence_id=7))
+    assert text.endswith(' INFO test: Stored sequence sequence_id=7')
+
+
+def test_sampler_keeps_a_burst_then_one_in_every():
+    now = [0.0]
+    sampler = Sampler(burst=2, every=3, window=10, clock=lambda: now[0])
+    kept = [n for n in range(1, 10) if sampler.filter(record('Received %s', n))]
+    assert kept == [1, 2, 5, 8]
+    assert sampler.filter(record('Other message'))
+    assert sampler.filter(record('Received %s', 0, level=logging.WARNING))
+    assert sampler.sampled_out == 5
+
+    # A new window starts with a full burst; the first record kept reports what was skipped
+    sampler.filter(record('Received %s', 10))
+    now[0] = 10
+    resumed = record('Received %s', 11)
+    assert sampler.filter(resumed) and resumed.sampled_out == 2
+
+
+def test_pipeline_formats_off_the_calling_thread_and_never_blocks():
+    stream = io.StringIO()
+    sink = CountingHandler(stream)
+    sink.setFormatter(StructuredFormatter())
+    pipeline = LogPipeline(sink, queue_size=2)
+    logger = logging.getLogger('test.pipeline')
+    logger.propagate = False
+    pipeline.install(logger)
+
+    value, payload = Thready(), {'step': 1}
+    logger.info('Rendered %s %s', value, payload)
+    payload['step'] = 2
+    logger.debug('Not written %s', value)
+    pipeline.stop()
+    assert value.threads and threading.current_thread().name not in value.threads
+    [line] = stream.getvalue().splitlines()
+    assert json.loads(line)['msg'] == "Rendered thready {'step': 1}"
+    stats = pipeline.stats()
+    assert stats['records'] == 1 and stats['bytes'] == len(line) + 1 and stats['dropped'] == 0
+
+    # Without a listener draining it, the queue fills up and further records are dropped
+    blocked = LogPipeline(CountingHandler(io.StringIO()), queue_size=2)
+    logger.addHandler(blocked.handler)
+    for n in range(5):
+        logger.info('Queued %s', n)
+    logger.removeHandler(blocked.handler)
+    assert blocked.stats()['queued'] == 2 and blocked.stats()['dropped'] == 3
+
+
+def test_chat_messages_are_logged_without_their_content(caplog, monkeypatch):
+    message = 'Hiring a senior backend engineer, reach me at sam@example.com'
+    client = socketio.test_client(app)
+    with caplog.at_level(logging.INFO):
+        client.emit('chat_message', {'message': message, 'messages': [{'role': 'user', 'content': message}],
+                                     'persona': 'tech_expert'})
+    client.disconnect()
+    assert not [entry for entry in caplog.records if 'sam@example.com' in entry.getMessage()]
+    [received] = [entry for entry in caplog.records if entry.getMessage() == 'Received chat message']
+    assert received.chars == len(message) and received.turns == 1
+
+    monkeypatch.setattr(app_module.Config, 'ADMIN_TOKEN', 'admin-secret')
+    stats = app.test_client().get('/api/admin/logging', headers={'Authorization': 'Bearer admin-secret'}).get_json()
+    assert set(stats) == {'records', 'bytes', 'avg_bytes', 'queued', 'dropped', 'sampled_out'}
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+
+import pytest
+
+import asgi_app
+from app import app, socketio
+from llm_backend import Latency, ModelResponse, SyntheticModel
+from supersession import RequestTracker, Superseded
+
+
+class GatedModel:
+    """Blocks each call until the test releases it."""
+    model_name = 'gated'
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        return ModelResponse('[]')
+
+
+class EmitRecorder:
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, event, data=None, to=None, **kwargs):
+        self.events.append((event, data, to))
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = EmitRecorder()
+    monkeypatch.setattr(asgi_app.sio, 'emit', recorder)
+    return recorder
+
+
+def test_newer_request_discards_older_result():
+    tracker = RequestTracker()
+    model = GatedModel()
+    outcome = {}
+
+    def older():
+        with tracker.begin('sid', 'adjust_tone') as ticket:
+            ticket.call(model, 'first')
+            outcome['older'] = 'emitted'
+
+    thread = threading.Thread(target=older)
+    thread.start()
+    model.started.wait(5)
+    with tracker.begin('sid', 'adjust_tone') as ticket:
+        model.release.set()
+        thread.join(5)
+        ticket.call(model, 'second')
+
+    assert 'older' not in outcome
+    stats = tracker.stats.as_dict()
+    assert stats['by_kind']['adjust_tone'] == {'started': 2, 'superseded': 1}
+    assert stats['discarded_results'] == 1
+
+
+def test_stale_ticket_skips_follow_up_calls():
+    tracker = RequestTracker()
+    tracker.stats.observe_call(2.0)
+    ticket = tracker.begin('sid', 'apply_suggestion')
+    tracker.begin('sid', 'apply_suggestion')
+    with pytest.raises(Superseded):
+        ticket.call(GatedModel(), 'metrics')
+    assert tracker.stats.as_dict()['llm_seconds_saved'] == 2.0
+
+
+def test_other_clients_and_kinds_are_independent():
+    tracker = RequestTracker()
+    ticket = tracker.begin('a', 'adjust_tone')
+    tracker.begin('b', 'adjust_tone')
+    tracker.begin('a', 'apply_suggestion')
+    assert ticket.current
+
+
+def test_disconnect_supersedes_open_requests():
+    tracker = RequestTracker()
+    ticket = tracker.begin('sid', 'apply_suggestion')
+    tracker.forget('sid')
+    assert not ticket.current
+    assert tracker.stats.as_dict()['by_kind']['apply_suggestion']['disconnected'] == 1
+
+
+def test_async_supersession_cancels_in_flight_call(monkeypatch, recorder):
+    monkeypatch.setattr(asgi_app, 'model', SyntheticModel('test', Latency('fixed:0.3')))
+    sequence = [{'subject': 'Hi', 'body': 'Hello'}]
+    stats = asgi_app.inflight.stats
+
+    async def run():
+        older = asyncio.create_task(asgi_app.handle_suggestion_application('sid-cancel', {'sequence': sequence}))
+        await asyncio.sleep(0.05)
+        newer = asyncio.create_task(asgi_app.handle_suggestion_application('sid-cancel', {'sequence': sequence}))
+        await newer
+        return older
+
+    cancelled_before = stats.cancelled_calls
+    older = asyncio.run(run())
+    assert older.cancelled()
+    assert stats.cancelled_calls == cancelled_before + 1
+    assert [event for event, data, to in recorder.events] == ['sequence_update']
+
+
+def test_edit_burst_is_debounced(monkeypatch, recorder):
+    monkeypatch.setattr(asgi_app.Config, 'EDIT_DEBOUNCE_SECONDS', 0.05)
+
+    async def run():
+        return await asyncio.gather(*(
+            asgi_app.handle_sequence_edit('sid-edit', {'sequence': [{'subject': str(i), 'body': ''}]})
+            for i in range(5)))
+
+    acks = asyncio.run(run())
+    assert [ack['status'] for ack in acks] == ['superseded'] * 4 + ['success']
+    assert len(recorder.events) == 1
+    assert recorder.events[0][1]['content'].count('"4"') == 1
+
+
+def test_request_stats_endpoint():
+    client = socketio.test_client(app)
+    client.emit('update_sequence_from_edit', {'sequence': []})
+    response = app.test_client().get('/api/requests/stats')
+    assert response.status_code == 200
+    assert response.get_json()['by_kind']['update_sequence_from_edit']['started'] >= 1
+
+
+def test_chat_and_generation_run_alongside_but_stop_on_disconnect():
+    tracker = RequestTracker()
+    first, second = tracker.begin('sid', 'chat_message'), tracker.begin('sid', 'chat_message')
+    generation = tracker.begin('sid', 'generate_sequence')
+    assert first.current and second.current and generation.current
+    tracker.forget('sid')
+    assert not (first.current or second.current or generation.current)
+    assert tracker.stats.as_dict()['by_kind']['chat_message'] == {'started': 2, 'disconnected': 2}
+
+
+def test_disconnect_cancels_async_generation(monkeypatch, recorder):
+    monkeypatch.setattr(asgi_app, 'model', SyntheticModel('test', Latency('fixed:0.3')))
+
+    async def run():
+        generation = asyncio.create_task(asgi_app.handle_sequence_generation_event('sid-gone', {'messages': []}))
+        chat = asyncio.create_task(asgi_app.handle_message('sid-gone', {'message': 'Generate the sequence'}))
+        await asyncio.sleep(0.05)
+        await asgi_app.disconnect('sid-gone')
+        await asyncio.gather(generation, chat, return_exceptions=True)
+        return generation, chat
+
+    generation, chat = asyncio.run(run())
+    assert generation.cancelled() and chat.cancelled()
+    assert recorder.events == []
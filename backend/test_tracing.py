@@ -0,0 +1,163 @@
+import io
+import json
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import tracing
+from app import app, socketio
+from llm_backend import ModelResponse
+from tracing import ConsoleExporter, FileExporter, TracedModel, Tracer, create_exporter
+
+
+class MemoryExporter:
+    def __init__(self):
+        self.batches = []
+
+    def export(self, spans):
+        self.batches.append(spans)
+
+    @property
+    def spans(self):
+        return [span for batch in self.batches for span in batch]
+
+
+class Usage:
+    prompt_token_count = 12
+    candidates_token_count = 34
+
+
+class FakeModel:
+    model_name = 'fake-model'
+
+    def generate_content(self, prompt, **kwargs):
+        response = ModelResponse('{"ok": true}')
+        if prompt == 'usage':
+            response.usage_metadata = Usage()
+        return response
+
+
+def test_child_spans_are_exported_with_their_root():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    with tracer.span('socket chat_message', root=True, **{'socket.event': 'chat_message'}) as root:
+        with tracer.span('llm.generate_content'):
+            pass
+        with pytest.raises(ValueError):
+            with tracer.span('json.parse'):
+                raise ValueError('bad json')
+        assert exporter.batches == []
+
+    [batch] = exporter.batches
+    assert [span['name'] for span in batch] == ['llm.generate_content', 'json.parse', 'socket chat_message']
+    assert {span['trace_id'] for span in batch} == {root.trace_id}
+    assert batch[0]['parent_id'] == batch[1]['parent_id'] == root.span_id
+    assert batch[1]['status'] == 'error' and batch[1]['error'] == 'ValueError: bad json'
+    assert batch[2]['parent_id'] is None and batch[2]['duration_ms'] >= 0
+
+
+def test_unsampled_roots_skip_their_whole_trace():
+    exporter = MemoryExporter()
+    draws = iter([0.7, 0.2])
+    tracer = Tracer(exporter, sample_rate=0.5, rng=lambda: next(draws))
+    with tracer.span('socket one', root=True) as root:
+        assert not root.sampled
+        with tracer.span('llm.generate_content') as child:
+            assert not child.sampled
+    with tracer.span('socket two', root=True):
+        pass
+    assert [span['name'] for span in exporter.spans] == ['socket two']
+    assert tracer.stats()['sampled'] == tracer.stats()['unsampled'] == 1
+
+    capped = Tracer(exporter, max_spans=2)
+    with capped.span('root'):
+        for _ in range(5):
+            with capped.span('db.statement'):
+                pass
+    assert capped.stats()['dropped'] == 3
+
+
+def test_bound_work_continues_the_trace_on_other_threads():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    with tracer.span('socket generate_sequence', root=True) as root:
+        def work():
+            with tracer.span('llm.generate_content'):
+                pass
+        thread = threading.Thread(target=tracer.bind(work, 'campaign.row'))
+        thread.start()
+        thread.join()
+
+    task, parent = exporter.batches
+    assert [span['name'] for span in task] == ['llm.generate_content', 'campaign.row']
+    assert task[1]['trace_id'] == root.trace_id and task[1]['parent_id'] == root.span_id
+    assert parent[-1]['span_id'] == root.span_id
+
+
+def test_model_calls_record_model_and_token_counts():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    model = TracedModel(FakeModel(), tracer)
+    with tracer.span('root'):
+        model.generate_content('usage')
+        model.generate_content('x' * 40)
+    measured, estimated = exporter.spans[:2]
+    assert measured['attributes'] == {'llm.model': 'fake-model', 'llm.prompt_tokens': 12, 'llm.output_tokens': 34}
+    assert estimated['attributes']['llm.prompt_tokens'] == 10 and estimated['attributes']['llm.tokens_estimated']
+
+
+def test_sql_statements_inside_a_trace_become_spans():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    engine = create_engine('sqlite://')
+    tracer.instrument(engine)
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        with tracer.span('root'):
+            connection.execute(text('SELECT 2'))
+            with pytest.raises(Exception):
+                connection.execute(text('SELECT * FROM missing'))
+    statements = [span for span in exporter.spans if span['name'] == 'db.statement']
+    assert [span['attributes']['db.statement'] for span in statements] == ['SELECT 2', 'SELECT * FROM missing']
+    assert statements[0]['attributes']['db.system'] == 'sqlite'
+    assert statements[1]['status'] == 'error'
+
+
+def test_socket_events_trace_model_calls_parsing_and_writes(monkeypatch):
+    exporter = MemoryExporter()
+    monkeypatch.setattr(tracing.tracer, 'exporter', exporter)
+    monkeypatch.setattr(tracing.tracer, 'sample_rate', 1.0)
+    client = socketio.test_client(app)
+    client.emit('generate_sequence', {'messages': [], 'tone': 'casual', 'persona': 'tech_expert'})
+
+    [trace] = [batch for batch in exporter.batches if batch[-1]['name'] == 'socket generate_sequence']
+    root = trace[-1]
+    assert root['attributes']['socket.event'] == 'generate_sequence' and root['attributes']['socket.sid']
+    names = [span['name'] for span in trace]
+    assert names.count('llm.generate_content') == 3
+    assert 'json.parse' in names
+    assert any(span['attributes'].get('db.operation') == 'INSERT' for span in trace)
+    assert all(span['trace_id'] == root['trace_id'] for span in trace)
+
+
+def test_exporters(tmp_path):
+    spans = [{'trace_id': 'a' * 32, 'span_id': 'c', 'parent_id': 'b', 'name': 'db.statement', 'start': 2,
+              'duration_ms': 1.0, 'status': 'ok', 'error': None,
+              'attributes': {'db.statement': 'SELECT\n  1'}},
+             {'trace_id': 'a' * 32, 'span_id': 'b', 'parent_id': None, 'name': 'socket chat_message',
+              'start': 1, 'duration_ms': 5.0, 'status': 'ok', 'error': None, 'attributes': {}}]
+    stream = io.StringIO()
+    ConsoleExporter(stream).export(spans)
+    assert stream.getvalue() == '[aaaaaaaa] socket chat_message 5.0ms\n[aaaaaaaa]   db.statement 1.0ms  SELECT 1\n'
+
+    path = tmp_path / 'traces.jsonl'
+    exporter = create_exporter('file', str(path))
+    assert isinstance(exporter, FileExporter)
+    exporter.export(spans)
+    assert [json.loads(line)['span_id'] for line in path.read_text().splitlines()] == ['c', 'b']
+
+    assert create_exporter('none') is None
+    assert isinstance(create_exporter('test_tracing:MemoryExporter'), MemoryExporter)
+    with pytest.raises(ValueError):
+        create_exporter('zipkin')
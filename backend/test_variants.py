@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import app as app_module
+from app import app, socketio
+from supersession import RequestTracker, Superseded
+from variants import VariantStats, pick_variant, pick_variant_async, score_sequence, variant, variant_prompt
+
+BODY = ("Hi Sam, I read your write-up on scaling Postgres and it matches what our platform team is "
+        "working on right now. We are hiring a senior backend engineer to own billing services, with "
+        "real ownership and a small team that ships every week. Would you be open to a short call on "
+        "Thursday to hear more?")
+GOOD = [{'subject': 'Backend engineer role at Ledgerly', 'body': BODY},
+        {'subject': 'Following up on the Ledgerly role', 'body': BODY}]
+WEAK = [{'subject': 'Exciting opportunity at [Company]', 'body': 'Hi [Name], interested?'}]
+
+
+def test_scores_reward_complete_sequences():
+    assert score_sequence(GOOD) == 1.0
+    assert 0 < score_sequence(WEAK) <= 0.5
+    duplicated = [GOOD[0], dict(GOOD[0])]
+    assert score_sequence(duplicated) == 0.5
+    assert score_sequence({'subject': 'x'}) == score_sequence([]) == 0.0
+
+
+def test_variants_vary_temperature_and_instructions():
+    assert variant(0) == (None, '') and variant_prompt('Prompt', 0) == 'Prompt'
+    assert variant_prompt('Prompt', 1).startswith('Prompt\n\n') and variant(1)[0] == 0.3
+    assert variant(5)[0] != variant(0)[0]
+
+
+def fake_generate(delays, outputs):
+    def generate(prompt, temperature):
+        index = next(i for i in range(len(delays)) if variant(i)[0] == temperature)
+        time.sleep(delays[index])
+        if isinstance(outputs[index], Exception):
+            raise outputs[index]
+        return outputs[index]
+    return generate
+
+
+def test_threshold_stops_early_and_abandons_slower_variants():
+    stats = VariantStats()
+    generate = fake_generate([0.0, 0.05, 2.0], [json.dumps(WEAK), json.dumps(GOOD), json.dumps(GOOD)])
+    started = time.monotonic()
+    sequence, info = pick_variant(generate, 'Prompt', 3, budget=5, threshold=0.9, grace=5, stats=stats)
+    assert time.monotonic() - started < 1.5
+    assert sequence == GOOD and info['chosen'] == 1 and info['stopped'] == 'threshold'
+    assert info['received'] == 2 and info['cancelled'] == 1 and info['first_score'] < info['score']
+    assert stats.as_dict()['threshold_stops'] == 1 and stats.as_dict()['avg_chosen_score'] == 1.0
+
+
+def test_budget_returns_the_best_so_far_but_waits_for_a_first_parse():
+    generate = fake_generate([0.2, 0.0, 2.0], ['```json\n' + json.dumps(WEAK) + '\n```', 'not json',
+                                               json.dumps(GOOD)])
+    sequence, info = pick_variant(generate, 'Prompt', 3, budget=0.05, threshold=0.9, grace=5)
+    assert sequence == WEAK and info['stopped'] == 'budget' and info['failed'] == 1
+    assert info['seconds'] >= 0.2
+
+    failing = fake_generate([0.0, 0.0], [ValueError('quota'), 'not json'])
+    with pytest.raises(ValueError):
+        pick_variant(failing, 'Prompt', 2, budget=1, threshold=0.9, grace=1)
+
+
+def test_grace_period_after_the_first_parse_ends_the_wait():
+    generate = fake_generate([0.0, 2.0, 2.0], [json.dumps(WEAK), json.dumps(GOOD), json.dumps(GOOD)])
+    sequence, info = pick_variant(generate, 'Prompt', 3, budget=5, threshold=0.9, grace=0.05)
+    assert sequence == WEAK and info['stopped'] == 'grace'
+    assert info['received'] == 1 and info['cancelled'] == 2
+
+
+def test_check_abandons_the_remaining_variants():
+    class Stale(Exception):
+        pass
+
+    def check():
+        raise Stale()
+
+    generate = fake_generate([0.0, 2.0], [json.dumps(WEAK), json.dumps(GOOD)])
+    with pytest.raises(Stale):
+        pick_variant(generate, 'Prompt', 2, budget=5, threshold=0.9, grace=5, check=check)
+
+
+def test_async_variants_cancel_late_calls():
+    cancelled = []
+
+    async def generate(prompt, temperature):
+        try:
+            await asyncio.sleep(0 if temperature is None else 5)
+        except asyncio.CancelledError:
+            cancelled.append(temperature)
+            raise
+        return json.dumps(GOOD)
+
+    sequence, info = asyncio.run(pick_variant_async(generate, 'Prompt', 3, budget=5, threshold=0.9, grace=5))
+    assert sequence == GOOD and info['stopped'] == 'threshold' and info['cancelled'] == 2
+    assert sorted(cancelled) == [0.3, 0.9]
+
+
+def test_generate_sequence_event_uses_variants(monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'SEQUENCE_VARIANTS', 3)
+    before = app_module.variant_stats.as_dict()['runs']
+    client = socketio.test_client(app)
+    client.emit('generate_sequence', {'messages': [], 'tone': 'casual', 'persona': 'tech_expert'})
+    [update] = [event for event in client.get_received() if event['name'] == 'sequence_update']
+    assert update['args'][0]['version_id']
+    stats = app.test_client().get('/api/requests/stats').get_json()['variants']
+    assert stats['runs'] == before + 1 and stats['requested'] >= 3
+    client.disconnect()
+
+
+def test_a_superseded_sequence_request_stops_its_variants(monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'SEQUENCE_VARIANTS', 3)
+    tracker = RequestTracker()
+    ticket = tracker.begin('sid', 'adjust_tone')
+    tracker.begin('sid', 'adjust_tone')
+    with pytest.raises(Superseded):
+        app_module.generate_sequence_content([], 'casual', 'passive', ticket=ticket)
+    assert tracker.stats.as_dict()['skipped_calls'] == 3
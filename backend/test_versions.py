@@ -0,0 +1,118 @@
+import json
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import versions
+from app import app, socketio
+from models import db, SequenceBlob, SequenceVersion
+from versions import (SNAPSHOT_INTERVAL, apply_delta, canonical_content, content_hash, get_version,
+                      list_versions, make_delta, record_version)
+
+
+def make_sequence(steps=3, marker=''):
+    return [{'subject': f'Step {i + 1}: Senior Backend Engineer',
+             'body': f'Hi there,{marker}\n\n' + 'We build payment rails in Go and Postgres. ' * 20 + '\n\nBest,\nSam'}
+            for i in range(steps)]
+
+
+@pytest.fixture
+def app_context(app_context):
+    yield
+    versions._content_cache.clear()
+
+
+def test_delta_round_trip():
+    base = canonical_content(make_sequence())
+    target = base.replace('Step 2', 'Second step').replace('Sam', 'Alex')
+    assert apply_delta(base, make_delta(base, target)) == target
+
+
+def test_identical_content_is_stored_once(app_context):
+    sequence = make_sequence(marker=' dedup')
+    first = record_version(sequence, 'generate')
+    second = record_version(sequence, 'generate')
+    assert first.id != second.id
+    assert first.content_hash == second.content_hash
+    blobs = db.session.execute(
+        select(func.count()).where(SequenceBlob.hash == content_hash(canonical_content(sequence)))).scalar()
+    assert blobs == 1
+    assert record_version(sequence, 'edit', parent_id=first.id).id == first.id
+
+
+def test_small_edit_stores_small_delta(app_context):
+    sequence = make_sequence(marker=' delta')
+    root = record_version(sequence, 'generate')
+    sequence[1]['subject'] = 'Quick question about Go'
+    child = record_version(sequence, 'edit', parent_id=root.id)
+
+    history = {version['id']: version for version in list_versions(version_id=child.id)}
+    assert history[root.id]['snapshot']
+    assert not history[child.id]['snapshot']
+    assert history[child.id]['stored_bytes'] < len(canonical_content(sequence)) // 20
+    assert child.lineage_id == root.lineage_id and child.number == 2
+
+
+
+def test_concurrent_branch_takes_the_next_free_number(app_context, monkeypatch):
+    sequence = make_sequence(marker=' race')
+    root = record_version(sequence, 'generate')
+    execute = db.session.execute
+    raced = []
+
+    def racing(statement, *args, **kwargs):
+        result = execute(statement, *args, **kwargs)
+        if not raced and 'max' in str(statement):
+            # Another worker commits number 2 of the lineage right after this one read the maximum
+            raced.append(execute(insert(SequenceVersion).values(
+                lineage_id=root.lineage_id, parent_id=root.id, number=2, content_hash=root.content_hash,
+                source='edit')).inserted_primary_key[0])
+            db.session.commit()
+        return result
+
+    monkeypatch.setattr(db.session, 'execute', racing)
+    sequence[0]['subject'] = 'A different first subject'
+    child = record_version(sequence, 'edit', parent_id=root.id)
+    assert child.number == 3
+    assert [entry['number'] for entry in list_versions(version_id=root.id)] == [1, 2, 3]
+
+def test_every_version_reconstructs_with_periodic_snapshots(app_context):
+    sequence = make_sequence(marker=' chain')
+    expected = {}
+    version = record_version(sequence, 'generate')
+    expected[version.id] = canonical_content(sequence)
+    for i in range(SNAPSHOT_INTERVAL * 2):
+        sequence[i % 3]['body'] += f' Edit {i}.'
+        version = record_version(sequence, 'edit', parent_id=version.id)
+        expected[version.id] = canonical_content(sequence)
+
+    versions._content_cache.clear()
+    for version_id, text in expected.items():
+        assert get_version(version_id)['content'] == text
+    history = list_versions(version_id=version.id)
+    assert [entry['number'] for entry in history] == list(range(1, len(expected) + 1))
+    assert sum(entry['snapshot'] for entry in history) == 3
+
+
+def test_socket_edits_chain_versions_and_diff_api():
+    client = socketio.test_client(app)
+    client.emit('generate_sequence', {'messages': [], 'tone': 'casual'})
+    update = [event['args'][0] for event in client.get_received() if event['name'] == 'sequence_update'][0]
+    root_id = update['version_id']
+
+    client.emit('apply_suggestion', {'sequence': update['content'], 'suggestion': 'Shorter', 'version_id': root_id})
+    edited = json.loads(update['content'])
+    edited[0]['subject'] = 'A new subject line'
+    client.emit('update_sequence_from_edit', {'sequence': edited, 'version_id': root_id})
+    updates = [event['args'][0] for event in client.get_received() if event['name'] == 'sequence_update']
+    edit_id = updates[-1]['version_id']
+
+    http = app.test_client()
+    history = http.get(f'/api/versions/{edit_id}/history').get_json()['versions']
+    assert history[0]['id'] == root_id
+    assert history[-1] == dict(history[-1], id=edit_id, parent_id=root_id, source='edit')
+
+    diff = http.get(f'/api/versions/diff?from={root_id}&to={edit_id}').get_json()
+    assert '+    "subject": "A new subject line",' in diff['diff']
+    assert diff['added_lines'] == diff['removed_lines'] == 1
+    assert http.get('/api/versions/diff?from=1&to=999999').status_code == 400
@@ -0,0 +1,386 @@
+"""Request tracing across socket events, model calls and database statements.
+
+Each received Socket.IO event opens a root span; every ``generate_content``
+call, model JSON parse and SQL statement made while handling it becomes a
+child span, so a slow ``chat_message`` can be broken down into its routing
+call, tool call, suggestions, metrics and commit. The current span lives in
+a context variable, which asyncio tasks inherit on their own; work handed to
+threads is wrapped with :meth:`Tracer.bind` to continue the same trace.
+
+Sampling is decided once per root (head-based): an unsampled event stores a
+no-op span, so its descendants cost one context variable lookup. Spans of a
+trace are buffered and handed to the exporter together when the root (or a
+bound background task) finishes.
+
+``TRACING_EXPORTER`` selects the exporter:
+
+- ``none``: tracing is off (the default)
+- ``console``: an indented tree per trace on stderr
+- ``file``: one JSON object per span appended to ``TRACING_FILE``
+- ``package.module:Class``: any class with ``export(spans)``
+"""
+import functools
+import importlib
+import inspect
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL statement text kept on a span
+MAX_STATEMENT_LENGTH = 500
+
+
+class Span:
+    """One timed operation of a trace."""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start', 'duration',
+                 'status', 'error', 'buffer', 'local_root', '_started')
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict,
+                 buffer: List, local_root: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.status = 'ok'
+        self.error: Optional[str] = None
+        # Finished spans of this thread or task, exported when its local root ends
+        self.buffer = buffer
+        self.local_root = local_root
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = 'error'
+        self.error = f'{type(error).__name__}: {error}'
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+
+class _NoopSpan:
+    """Stands in for spans of unsampled traces."""
+
+    sampled = False
+
+    def set(self, key, value):
+        pass
+
+    def record_error(self, error):
+        pass
+
+
+NOOP = _NoopSpan()
+
+_current: ContextVar = ContextVar('helix_span', default=None)
+
+
+def current_span():
+    return _current.get()
+
+
+class _SpanContext:
+    def __init__(self, tracer: 'Tracer', span):
+        self.tracer = tracer
+        self.span = span
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        if exc is not None:
+            self.span.record_error(exc)
+        self.tracer.end(self.span)
+        return False
+
+
+class _NoopContext:
+    def __enter__(self):
+        return NOOP
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_CONTEXT = _NoopContext()
+
+
+class Tracer:
+    """Creates spans and hands finished traces to an exporter."""
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0, max_spans: int = 1000,
+                 rng: Callable[[], float] = random.random):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        # Spans kept per thread of a trace; the rest are dropped and counted
+        self.max_spans = max_spans
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.counters = {'sampled': 0, 'unsampled': 0, 'exported': 0, 'dropped': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start(self, name: str, root: bool = False, remote: bool = False, **attributes):
+        """Start a span without making it current; finish it with :meth:`end`.
+
+        ``root`` starts a new trace. ``remote`` continues the current trace in
+        a new local root, e.g. on another thread.
+        """
+        if self.exporter is None:
+            return NOOP
+        parent = None if root else _current.get()
+        if parent is NOOP:
+            return NOOP
+        if parent is None:
+            sampled = self.rng() < self.sample_rate
+            with self.lock:
+                self.counters['sampled' if sampled else 'unsampled'] += 1
+            if not sampled:
+                return NOOP
+            return Span(name, f'{random.getrandbits(128):032x}', None, attributes, [], local_root=True)
+        if remote:
+            return Span(name, parent.trace_id, parent.span_id, attributes, [], local_root=True)
+        return Span(name, parent.trace_id, parent.span_id, attributes, parent.buffer, local_root=False)
+
+    def end(self, span):
+        if span is NOOP:
+            return
+        span.finish()
+        if not span.local_root:
+            if len(span.buffer) < self.max_spans:
+                span.buffer.append(span)
+            else:
+                with self.lock:
+                    self.counters['dropped'] += 1
+            return
+        spans = span.buffer + [span]
+        span.buffer = []
+        try:
+            self.exporter.export([finished.to_dict() for finished in spans])
+        except Exception as e:
+            logger.error("Error exporting trace %s: %s", span.trace_id, e)
+            return
+        with self.lock:
+            self.counters['exported'] += len(spans)
+
+    def span(self, name: str, root: bool = False, remote: bool = False, **attributes):
+        """Context manager running its block as the current span."""
+        if self.exporter is None:
+            return _NOOP_CONTEXT
+        span = self.start(name, root=root, remote=remote, **attributes)
+        if span is NOOP and _current.get() is NOOP:
+            return _NOOP_CONTEXT
+        return _SpanContext(self, span)
+
+    def bind(self, fn: Callable, name: str, **attributes) -> Callable:
+        """Wrap ``fn`` to run on another thread as a span in the caller's trace."""
+        if self.exporter is None:
+            return fn
+        parent = _current.get()
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            token = _current.set(parent)
+            try:
+                with self.span(name, remote=True, **attributes):
+                    return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+        return run
+
+    def wrap_event(self, event: str, handler: Callable, sid: Callable[..., Optional[str]] = lambda *args: None):
+        """Wrap a Socket.IO handler so each received event is the root span of a trace."""
+        name = f'socket {event}'
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def traced_async(*args, **kwargs):
+                with self.span(name, root=True, **{'socket.event': event, 'socket.sid': sid(*args)}):
+                    return await handler(*args, **kwargs)
+            return traced_async
+
+        @functools.wraps(handler)
+        def traced(*args, **kwargs):
+            with self.span(name, root=True, **{'socket.event': event, 'socket.sid': sid(*args)}):
+                return handler(*args, **kwargs)
+        return traced
+
+    def instrument(self, engine):
+        """Record every SQL statement run on ``engine`` inside a sampled trace as a span."""
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, executemany):
+            if not isinstance(_current.get(), Span):
+                return
+            context._helix_span = self.start('db.statement', **{
+                'db.system': conn.dialect.name,
+                'db.operation': statement.split(None, 1)[0].upper() if statement.strip() else '',
+                'db.statement': statement[:MAX_STATEMENT_LENGTH],
+                'db.executemany': executemany
+            })
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, executemany):
+            span = getattr(context, '_helix_span', None)
+            if span is not None:
+                context._helix_span = None
+                self.end(span)
+
+        @event.listens_for(engine, 'handle_error')
+        def failed(exception_context):
+            context = exception_context.execution_context
+            span = getattr(context, '_helix_span', None) if context is not None else None
+            if span is not None:
+                context._helix_span = None
+                span.record_error(exception_context.original_exception)
+                self.end(span)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counters, exporter=type(self.exporter).__name__ if self.exporter else None,
+                        sample_rate=self.sample_rate)
+
+
+def _usage(span, prompt, response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None and getattr(usage, 'prompt_token_count', None) is not None:
+        span.set('llm.prompt_tokens', usage.prompt_token_count)
+        span.set('llm.output_tokens', usage.candidates_token_count)
+        return
+    # Offline backends report no usage; about four characters per token
+    try:
+        text = response.text
+    except Exception:
+        text = ''
+    span.set('llm.prompt_tokens', (len(str(prompt)) + 3) // 4)
+    span.set('llm.output_tokens', (len(text) + 3) // 4)
+    span.set('llm.tokens_estimated', True)
+
+
+class TracedModel:
+    """Model wrapper that records each ``generate_content`` call as a span."""
+
+    def __init__(self, inner, tracer: Tracer):
+        self.inner = inner
+        self.tracer = tracer
+        self.model_name = inner.model_name
+
+    def generate_content(self, prompt, **kwargs):
+        with self.tracer.span('llm.generate_content', **{'llm.model': self.model_name}) as span:
+            response = self.inner.generate_content(prompt, **kwargs)
+            if span.sampled:
+                _usage(span, prompt, response)
+            return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        with self.tracer.span('llm.generate_content', **{'llm.model': self.model_name}) as span:
+            response = await self.inner.generate_content_async(prompt, **kwargs)
+            if span.sampled:
+                _usage(span, prompt, response)
+            return response
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class ConsoleExporter:
+    """Writes each trace as an indented tree of spans."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.lock = threading.Lock()
+
+    def export(self, spans: List[Dict]):
+        children: Dict[Optional[str], List[Dict]] = {}
+        ids = {span['span_id'] for span in spans}
+        for span in sorted(spans, key=lambda span: span['start']):
+            # A bound task's root hangs off a span exported with another batch
+            children.setdefault(span['parent_id'] if span['parent_id'] in ids else None, []).append(span)
+        lines = []
+
+        def walk(parent_id, depth):
+            for span in children.get(parent_id, []):
+                attributes = ' '.join(f'{key}={value}' for key, value in span['attributes'].items()
+                                      if key != 'db.statement')
+                if 'db.statement' in span['attributes']:
+                    attributes += ' ' + ' '.join(span['attributes']['db.statement'].split())[:120]
+                error = f" ERROR {span['error']}" if span['error'] else ''
+                lines.append(f"[{span['trace_id'][:8]}] {'  ' * depth}{span['name']} "
+                             f"{span['duration_ms']:.1f}ms {attributes}{error}".rstrip())
+                walk(span['span_id'], depth + 1)
+        walk(None, 0)
+        with self.lock:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+
+class FileExporter:
+    """Appends one JSON object per span to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans: List[Dict]):
+        data = ''.join(json.dumps(span, default=str) + '\n' for span in spans)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+
+
+def create_exporter(name: Optional[str], path: Optional[str] = None):
+    """Exporter for a ``TRACING_EXPORTER`` value; None turns tracing off."""
+    name = (name or 'none').strip()
+    if name.lower() in ('', 'none', 'off'):
+        return None
+    if name.lower() == 'console':
+        return ConsoleExporter()
+    if name.lower() == 'file':
+        return FileExporter(path or 'traces.jsonl')
+    if ':' not in name:
+        raise ValueError(f"Unknown tracing exporter: {name}")
+    module, _, attribute = name.partition(':')
+    return getattr(importlib.import_module(module), attribute)()
+
+
+def traced_loads(text: str):
+    """``json.loads`` recorded as a ``json.parse`` span."""
+    with tracer.span('json.parse', **{'json.bytes': len(text)}):
+        return json.loads(text)
+
+
+tracer = Tracer(create_exporter(Config.TRACING_EXPORTER, Config.TRACING_FILE), sample_rate=Config.TRACING_SAMPLE_RATE,
+                max_spans=Config.TRACING_MAX_SPANS)
@@ -0,0 +1,274 @@
+"""Multi-variant sequence generation ranked by a local scorer.
+
+With ``SEQUENCE_VARIANTS`` above 1, the sequence prompt is sent that many
+times at once. Each variant has its own temperature and a short extra
+instruction. Variants are parsed and scored by :func:`score_sequence` as
+they arrive, which costs microseconds. The best one is returned when the
+first of these happens:
+
+- a variant scores at least the quality threshold;
+- the grace period has passed since the first variant parsed;
+- the time budget runs out and at least one variant parsed;
+- every call has returned.
+
+Variants still running at that point are cancelled (asyncio server) or
+abandoned with their results discarded (threaded server). So once a variant
+parses, the request waits at most the grace period longer, and never past
+the budget. Until one variant parses, neither ends the wait, and a request
+whose calls all fail takes as long as its slowest call.
+"""
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from llm_backend import parse_model_json
+from tracing import tracer
+
+# (temperature, extra instruction); the first variant is the unchanged prompt
+# at the model's default temperature
+VARIANTS: List[Tuple[Optional[float], str]] = [
+    (None, ''),
+    (0.3, 'Keep every email under 120 words.'),
+    (0.9, 'Open each email with what makes this role unique.'),
+    (0.6, 'End each email with one clear question for the candidate.'),
+    (1.0, 'Make the first subject line specific to the role and company.'),
+]
+# Bracketed placeholders the model forgot to fill, e.g. [Company] or [Name]
+UNFILLED = re.compile(r'\[[A-Z][^\]\n]{0,30}\]')
+SUBJECT_MAX_CHARS = 60
+BODY_WORDS = (40, 200)
+
+
+def variant(index: int) -> Tuple[Optional[float], str]:
+    """Temperature and instruction of the ``index``-th variant; cycles past the defined ones."""
+    temperature, instruction = VARIANTS[index % len(VARIANTS)]
+    if index >= len(VARIANTS):
+        temperature = round(min(1.0, (temperature or 0.7) + 0.05 * (index // len(VARIANTS))), 2)
+    return temperature, instruction
+
+
+def variant_prompt(prompt: str, index: int) -> str:
+    instruction = variant(index)[1]
+    return f"{prompt}\n\n{instruction}" if instruction else prompt
+
+
+def score_sequence(sequence) -> float:
+    """Heuristic quality of a parsed sequence from 0 to 1.
+
+    Checks the shape (2-3 emails with a subject and body each), subject
+    length, body length, a question inviting a reply and unfilled
+    placeholders, and scales by the share of distinct subjects.
+    """
+    if not isinstance(sequence, list) or not sequence:
+        return 0.0
+    emails = [email for email in sequence if isinstance(email, dict)]
+    if not emails:
+        return 0.0
+    checks = []
+    for email in emails:
+        subject = str(email.get('subject') or '')
+        body = str(email.get('body') or '')
+        words = len(body.split())
+        checks += [
+            0 < len(subject) <= SUBJECT_MAX_CHARS,
+            BODY_WORDS[0] <= words <= BODY_WORDS[1],
+            '?' in body,
+            not UNFILLED.search(subject) and not UNFILLED.search(body),
+        ]
+    shape = 1.0 if 2 <= len(emails) <= 3 and len(emails) == len(sequence) else 0.5
+    distinct = len({str(email.get('subject') or '').strip().lower() for email in emails}) / len(emails)
+    return round((0.2 * shape + 0.8 * sum(checks) / len(checks)) * distinct, 3)
+
+
+class VariantStats:
+    """Counters showing whether extra variants pay for themselves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.requested = 0
+        self.received = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.threshold_stops = 0
+        self.grace_stops = 0
+        self.budget_stops = 0
+        self.seconds = 0.0
+        self.first_score = 0.0
+        self.chosen_score = 0.0
+
+    def record(self, info: Dict):
+        with self.lock:
+            self.runs += 1
+            self.requested += info['requested']
+            self.received += info['received']
+            self.failed += info['failed']
+            self.cancelled += info['cancelled']
+            self.threshold_stops += info['stopped'] == 'threshold'
+            self.grace_stops += info['stopped'] == 'grace'
+            self.budget_stops += info['stopped'] == 'budget'
+            self.seconds += info['seconds']
+            self.first_score += info['first_score']
+            self.chosen_score += info['score']
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            runs = self.runs or 1
+            return {
+                'runs': self.runs,
+                'requested': self.requested,
+                'received': self.received,
+                'failed': self.failed,
+                'cancelled': self.cancelled,
+                'threshold_stops': self.threshold_stops,
+                'grace_stops': self.grace_stops,
+                'budget_stops': self.budget_stops,
+                'avg_seconds': round(self.seconds / runs, 3),
+                # What a single call would have returned vs what was served
+                'avg_first_score': round(self.first_score / runs, 3),
+                'avg_chosen_score': round(self.chosen_score / runs, 3),
+            }
+
+
+class _Selection:
+    """Best variant so far; shared by the threaded and asyncio runners."""
+
+    def __init__(self, requested: int, threshold: float, budget: float, grace: float,
+                 clock: Callable[[], float]):
+        self.requested = requested
+        self.threshold = threshold
+        self.grace = grace
+        self.clock = clock
+        self.started = clock()
+        self.deadline = self.started + budget
+        # When the wait ends; set once the first variant parses
+        self.stop_at: Optional[float] = None
+        self.best: Optional[Tuple[float, int, object]] = None
+        self.first_score: Optional[float] = None
+        self.received = 0
+        self.failed = 0
+
+    def add(self, index: int, text: Optional[str]) -> bool:
+        """Score one arrived variant (``None`` if its call failed); True once the threshold is met."""
+        try:
+            if text is None:
+                raise ValueError('call failed')
+            sequence = parse_model_json(text)
+        except Exception:
+            self.failed += 1
+            return False
+        self.received += 1
+        if self.stop_at is None:
+            self.stop_at = min(self.deadline, self.clock() + self.grace)
+        score = score_sequence(sequence)
+        if self.first_score is None:
+            self.first_score = score
+        if self.best is None or score > self.best[0]:
+            self.best = (score, index, sequence)
+        return score >= self.threshold
+
+    def timeout(self) -> Optional[float]:
+        """Seconds left to wait for more variants; ``None`` (no limit) until one parses."""
+        return None if self.stop_at is None else max(0.0, self.stop_at - self.clock())
+
+    def expired(self) -> Optional[str]:
+        """Why the wait is over (``'grace'`` or ``'budget'``), or ``None`` to keep waiting."""
+        if self.stop_at is None or self.clock() < self.stop_at:
+            return None
+        return 'budget' if self.stop_at >= self.deadline else 'grace'
+
+    def result(self, stopped: str, cancelled: int, stats: Optional[VariantStats]) -> Tuple[object, Dict]:
+        if self.best is None:
+            raise ValueError(f'None of {self.requested} sequence variants could be parsed')
+        score, index, sequence = self.best
+        info = {
+            'requested': self.requested,
+            'received': self.received,
+            'failed': self.failed,
+            'cancelled': cancelled,
+            'chosen': index,
+            'temperature': variant(index)[0],
+            'score': score,
+            'first_score': self.first_score,
+            'stopped': stopped,
+            'seconds': round(self.clock() - self.started, 3),
+        }
+        if stats is not None:
+            stats.record(info)
+        return sequence, info
+
+
+def pick_variant(generate: Callable[[str, Optional[float]], str], prompt: str, k: int, budget: float,
+                 threshold: float, grace: float, stats: Optional[VariantStats] = None,
+                 check: Optional[Callable[[], None]] = None,
+                 clock: Callable[[], float] = time.monotonic) -> Tuple[object, Dict]:
+    """Run ``generate(prompt, temperature)`` for ``k`` variants on threads; return (sequence, info).
+
+    ``check`` runs whenever a call returns; whatever it raises abandons the
+    remaining calls and propagates. Raises ValueError when no variant parses.
+    """
+    selection = _Selection(k, threshold, budget, grace, clock)
+    pool = ThreadPoolExecutor(max_workers=k, thread_name_prefix='helix-variant')
+    futures = {}
+    for index in range(k):
+        call = tracer.bind(generate, 'sequence.variant', **{'variant.index': index})
+        futures[pool.submit(call, variant_prompt(prompt, index), variant(index)[0])] = index
+    pending = set(futures)
+    stopped = 'all'
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=selection.timeout(), return_when=FIRST_COMPLETED)
+            met = False
+            for future in done:
+                error = future.exception()
+                met = selection.add(futures[future], None if error else future.result()) or met
+            if check:
+                check()
+            if met:
+                stopped = 'threshold'
+                break
+            expired = selection.expired() if pending else None
+            if expired:
+                stopped = expired
+                break
+    finally:
+        # Running calls cannot be interrupted; their results are dropped
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return selection.result(stopped, len(pending), stats)
+
+
+async def pick_variant_async(generate: Callable[[str, Optional[float]], Awaitable[str]], prompt: str, k: int,
+                             budget: float, threshold: float, grace: float, stats: Optional[VariantStats] = None,
+                             clock: Callable[[], float] = time.monotonic) -> Tuple[object, Dict]:
+    """:func:`pick_variant` for the asyncio server; late variants are cancelled."""
+    selection = _Selection(k, threshold, budget, grace, clock)
+    tasks = {asyncio.ensure_future(generate(variant_prompt(prompt, index), variant(index)[0])): index
+             for index in range(k)}
+    pending = set(tasks)
+    stopped = 'all'
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=selection.timeout(), return_when=FIRST_COMPLETED)
+            met = False
+            for task in done:
+                error = task.exception()
+                met = selection.add(tasks[task], None if error else task.result()) or met
+            if met:
+                stopped = 'threshold'
+                break
+            expired = selection.expired() if pending else None
+            if expired:
+                stopped = expired
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+    return selection.result(stopped, len(pending), stats)
+
+
+variant_stats = VariantStats()
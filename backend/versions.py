@@ -0,0 +1,215 @@
+"""Content-addressed version history for sequences.
+
+Every sequence produced by generation, ``apply_suggestion``, ``adjust_tone``
+or an edit becomes a :class:`models.SequenceVersion` pointing at its parent.
+Content lives in :class:`models.SequenceBlob` rows keyed by the SHA-256 of
+the canonical text, so identical output is stored once. A new blob is stored
+as a token-level delta against its parent's content; every
+``SNAPSHOT_INTERVAL`` deltas a full snapshot is written instead, so rebuilding
+any version applies at most that many deltas.
+
+A delta is a JSON list of ops over the parent's tokens: ``[start, end]``
+copies a token range and a string inserts new text.
+"""
+import difflib
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, SequenceBlob, SequenceVersion
+
+SNAPSHOT_INTERVAL = 10
+CONTENT_CACHE_SIZE = 256
+SOURCES = ('generate', 'apply_suggestion', 'adjust_tone', 'edit')
+# Attempts at taking the next number of a lineage that other writers are also extending
+RECORD_ATTEMPTS = 5
+
+_TOKENS = re.compile(r'\s+|\w+|[^\w\s]')
+
+_content_cache: 'OrderedDict[str, str]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def canonical_content(sequence) -> str:
+    """The stored text of a sequence, matching ``EmailSequence.content``."""
+    if isinstance(sequence, str):
+        return sequence
+    return json.dumps(sequence, indent=2)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKENS.findall(text)
+
+
+def make_delta(base: str, target: str) -> List:
+    """Ops that rebuild ``target`` from the tokens of ``base``."""
+    base_tokens = tokenize(base)
+    target_tokens = tokenize(target)
+    matcher = difflib.SequenceMatcher(None, base_tokens, target_tokens, autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(target_tokens[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: List) -> str:
+    tokens = tokenize(base)
+    return ''.join(''.join(tokens[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def _cache(digest: str, text: str):
+    with _cache_lock:
+        _content_cache[digest] = text
+        _content_cache.move_to_end(digest)
+        if len(_content_cache) > CONTENT_CACHE_SIZE:
+            _content_cache.popitem(last=False)
+
+
+def load_content(digest: str) -> str:
+    """Rebuild a blob's text from the nearest full snapshot."""
+    with _cache_lock:
+        if digest in _content_cache:
+            return _content_cache[digest]
+    chain = []
+    blob = db.session.get(SequenceBlob, digest)
+    if blob is None:
+        raise KeyError(f"Unknown content hash {digest}")
+    while blob.base_hash is not None:
+        with _cache_lock:
+            cached = _content_cache.get(blob.base_hash)
+        chain.append(blob)
+        if cached is not None:
+            text = cached
+            break
+        blob = db.session.get(SequenceBlob, blob.base_hash)
+    else:
+        text = blob.data
+    for delta in reversed(chain):
+        text = apply_delta(text, json.loads(delta.data))
+    _cache(digest, text)
+    return text
+
+
+def store_blob(text: str, base_hash: Optional[str] = None) -> SequenceBlob:
+    """Store ``text`` once, as a delta against ``base_hash`` when that is smaller."""
+    digest = content_hash(text)
+    blob = db.session.get(SequenceBlob, digest)
+    if blob is not None:
+        return blob
+    base = db.session.get(SequenceBlob, base_hash) if base_hash else None
+    if base is not None and base.depth + 1 < SNAPSHOT_INTERVAL:
+        data = json.dumps(make_delta(load_content(base.hash), text), separators=(',', ':'))
+        if len(data) < len(text):
+            blob = SequenceBlob(hash=digest, base_hash=base.hash, depth=base.depth + 1, data=data, size=len(data))
+    if blob is None:
+        blob = SequenceBlob(hash=digest, base_hash=None, depth=0, data=text, size=len(text))
+    db.session.add(blob)
+    _cache(digest, text)
+    return blob
+
+
+def record_version(sequence, source: str, parent_id: Optional[int] = None,
+                   sequence_id: Optional[int] = None) -> SequenceVersion:
+    """Add a version; returns the parent itself when the content did not change.
+
+    Numbers are unique per lineage. A writer that loses the race for the next
+    number rolls back and reads the number again.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown version source: {source}")
+    text = canonical_content(sequence)
+    for attempt in range(RECORD_ATTEMPTS):
+        try:
+            return _add_version(text, source, parent_id, sequence_id)
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == RECORD_ATTEMPTS - 1:
+                raise
+
+
+def _add_version(text: str, source: str, parent_id: Optional[int], sequence_id: Optional[int]) -> SequenceVersion:
+    parent = db.session.get(SequenceVersion, parent_id) if parent_id else None
+    if parent is not None and parent.content_hash == content_hash(text):
+        return parent
+
+    blob = store_blob(text, parent.content_hash if parent else None)
+    version = SequenceVersion(parent_id=parent.id if parent else None, content_hash=blob.hash, source=source,
+                              sequence_id=sequence_id or (parent.sequence_id if parent else None))
+    if parent is None:
+        version.number = 1
+        db.session.add(version)
+        db.session.flush()
+        version.lineage_id = version.id
+    else:
+        version.lineage_id = parent.lineage_id
+        version.number = db.session.execute(
+            select(func.max(SequenceVersion.number)).where(SequenceVersion.lineage_id == parent.lineage_id)
+        ).scalar() + 1
+        db.session.add(version)
+    db.session.commit()
+    return version
+
+
+def list_versions(version_id: int = None, sequence_id: int = None) -> List[Dict]:
+    """Metadata of every version in a lineage, oldest first, without content."""
+    if sequence_id is not None:
+        lineage = select(SequenceVersion.lineage_id).where(SequenceVersion.sequence_id == sequence_id)
+    else:
+        lineage = select(SequenceVersion.lineage_id).where(SequenceVersion.id == version_id)
+    rows = db.session.execute(
+        select(SequenceVersion.id, SequenceVersion.parent_id, SequenceVersion.number, SequenceVersion.source,
+               SequenceVersion.content_hash, SequenceVersion.created_at, SequenceBlob.size, SequenceBlob.depth)
+        .join(SequenceBlob, SequenceBlob.hash == SequenceVersion.content_hash)
+        .where(SequenceVersion.lineage_id.in_(lineage.scalar_subquery()))
+        .order_by(SequenceVersion.id)
+    ).all()
+    return [{
+        'id': row.id,
+        'parent_id': row.parent_id,
+        'number': row.number,
+        'source': row.source,
+        'content_hash': row.content_hash,
+        'stored_bytes': row.size,
+        'snapshot': row.depth == 0,
+        'created_at': row.created_at.isoformat()
+    } for row in rows]
+
+
+def get_version(version_id: int) -> Optional[Dict]:
+    version = db.session.get(SequenceVersion, version_id)
+    if version is None:
+        return None
+    return dict(version.to_dict(), content=load_content(version.content_hash))
+
+
+def diff_versions(from_id: int, to_id: int) -> Dict:
+    """Unified line diff between the contents of two versions."""
+    versions = {version_id: db.session.get(SequenceVersion, version_id) for version_id in (from_id, to_id)}
+    missing = [str(version_id) for version_id, version in versions.items() if version is None]
+    if missing:
+        raise ValueError(f"Unknown version: {', '.join(missing)}")
+    old = load_content(versions[from_id].content_hash)
+    new = load_content(versions[to_id].content_hash)
+    diff = list(difflib.unified_diff(old.splitlines(), new.splitlines(),
+                                     f'version {from_id}', f'version {to_id}', lineterm=''))
+    return {
+        'from': from_id,
+        'to': to_id,
+        'identical': old == new,
+        'diff': '\n'.join(diff),
+        'added_lines': sum(1 for line in diff if line.startswith('+') and not line.startswith('+++')),
+        'removed_lines': sum(1 for line in diff if line.startswith('-') and not line.startswith('---'))
+    }
@@ -10,6 +10,14 @@ interface Message {
   content: string;
 }
 
+interface ResumedConversation {
+  conversation_id: number;
+  persona: string;
+  messages: Message[];
+}
+
+const CONVERSATION_KEY = 'helix_conversation_id';
+
 interface Persona {
   id: string;
   name: string;
@@ -89,6 +97,8 @@ const App: React.FC = () => {
   const [showChat, setShowChat] = useState(false);
   const [metrics, setMetrics] = useState<Metrics | undefined>(undefined);
   const [suggestions, setSuggestions] = useState<string[] | undefined>(undefined);
+  const [conversationId, setConversationId] = useState<number | null>(null);
+  const [versionId, setVersionId] = useState<number | null>(null);
 
   useEffect(() => {
     const newSocket = io('http://localhost:3002', {
@@ -99,7 +109,8 @@ const App: React.FC = () => {
       timeout: 60000,
       transports: ['websocket', 'polling'],
       withCredentials: true,
-      forceNew: true
+      forceNew: true,
+      auth: { payload: 'structured' }
     });
     setSocket(newSocket);
 
@@ -107,6 +118,23 @@ const App: React.FC = () => {
       console.log('Connected to server');
       setError(null);
       newSocket.emit('test_connection', { message: 'Test connection' });
+      const storedConversation = localStorage.getItem(CONVERSATION_KEY);
+      if (storedConversation) {
+        newSocket.emit('start_conversation', { conversation_id: Number(storedConversation) });
+      }
+    });
+
+    newSocket.on('conversation_started', (data: { conversation_id: number }) => {
+      setConversationId(data.conversation_id);
+      localStorage.setItem(CONVERSATION_KEY, String(data.conversation_id));
+    });
+
+    newSocket.on('conversation_resumed', (data: ResumedConversation) => {
+      console.log('Resumed conversation:', data.conversation_id);
+      setConversationId(data.conversation_id);
+      setSelectedPersona(data.persona);
+      setMessages(data.messages.map(({ role, content }) => ({ role, content })));
+      setShowChat(true);
     });
 
     newSocket.on('connect_error', (error) => {
@@ -124,9 +152,12 @@ const App: React.FC = () => {
       setMessages(prev => [...prev, message]);
     });
 
-    newSocket.on('sequence_update', (data: { content: string; metrics: Metrics; suggestions: string[] }) => {
+    newSocket.on('sequence_update', (data: { content?: string; sequence?: unknown; metrics: Metrics; suggestions: string[]; version_id?: number | null }) => {
       console.log('Received sequence update:', data);
-      setContent(data.content);
+      setContent(data.sequence !== undefined ? JSON.stringify(data.sequence, null, 2) : data.content ?? '');
+      if (data.version_id) {
+        setVersionId(data.version_id);
+      }
       setMetrics(data.metrics);
       setSuggestions(data.suggestions);
     });
@@ -188,6 +219,7 @@ const App: React.FC = () => {
       
       const initialMessage = getInitialMessage(selectedPersonaObj);
       setMessages([initialMessage]);
+      socket?.emit('start_conversation', { persona, messages: [initialMessage] });
 
       socket?.emit('chat_message', {
         message: '',
@@ -206,6 +238,7 @@ const App: React.FC = () => {
       
       const initialMessage = getInitialMessage(newPersona);
       setMessages([initialMessage]);
+      socket?.emit('start_conversation', { persona: newPersona.id, messages: [initialMessage] });
 
       socket?.emit('chat_message', {
         message: '',
@@ -232,6 +265,10 @@ const App: React.FC = () => {
       message,
       messages: [...messages, newMessage],
       persona: selectedPersona,
+      // Lets the server start generating the sequence before it is requested
+      tone: selectedTone,
+      sequenceType,
+      conversation_id: conversationId,
       sequence_generated: content !== '' // Track if sequence has been generated
     });
   };
@@ -250,6 +287,7 @@ const App: React.FC = () => {
     socket.emit('adjust_tone', { 
       content,
       tone,
+      version_id: versionId,
       sequenceType,
       roleInfo: messages 
     });
@@ -367,6 +405,7 @@ const App: React.FC = () => {
               currentPersona={currentPersona}
               metrics={metrics}
               suggestions={suggestions}
+              versionId={versionId}
             />
           )}
         </Container>
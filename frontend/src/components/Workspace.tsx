@@ -25,6 +25,7 @@ interface WorkspaceProps {
   onGenerateSequence: () => void;
   personas: any[];
   currentPersona: any;
+  versionId?: number | null;
   metrics?: {
     open_rate: string;
     response_rate: string;
@@ -52,7 +53,8 @@ const Workspace: React.FC<WorkspaceProps> = ({
   personas,
   currentPersona,
   metrics,
-  suggestions
+  suggestions,
+  versionId
 }) => {
   const [error, setError] = useState<string | null>(null);
   const [socket, setSocket] = useState<Socket | null>(null);
@@ -88,7 +90,8 @@ const Workspace: React.FC<WorkspaceProps> = ({
       if (socket?.connected) {
         socket.emit('apply_suggestion', {
           suggestion,
-          sequence: content
+          sequence: content,
+          version_id: versionId
         });
       } else {
         setError('Not connected to server');